@@ -1,21 +1,37 @@
 from dataclasses import dataclass
 from typing import List
 from pathlib import Path
+import time
+import uuid
+
+_import_start = time.perf_counter()
 
 from aiops_rag_databricksapp.config import AIConfigSettings, AIConfig
 settings = AIConfig()
 _ = settings.activate_LLM_environment
 
 from aiops_rag_databricksapp.store import VectorStore
+from aiops_rag_databricksapp.sharding import ShardedVectorStore
+from aiops_rag_databricksapp.ann import ANNConfig
 from aiops_rag_databricksapp.ingest import DocumentProcessor
+from aiops_rag_databricksapp.pipeline import IngestPipeline
+from aiops_rag_databricksapp.dedup import NearDuplicateFilter
 from aiops_rag_databricksapp.rag_graph import RAGGraphBuilder
+from aiops_rag_databricksapp.semantic_cache import SemanticCache
+from aiops_rag_databricksapp.context import ContextPacker
 from aiops_rag_databricksapp.rag_node import RAGNodes
 from aiops_rag_databricksapp.rag_react_node import ReActRAGNodes
-
-from langchain_openai import ChatOpenAI
+from aiops_rag_databricksapp.router import QueryRouter
+from aiops_rag_databricksapp.memory import ConversationMemory, SessionCheckpointer
+from aiops_rag_databricksapp.tools import ToolPolicy
+from aiops_rag_databricksapp.scheduler import RequestScheduler
+from aiops_rag_databricksapp.lifecycle import StartupProfile, import_runtime
+from aiops_rag_databricksapp.metrics import REGISTRY, configure_trace_log, serve_metrics
 
 import streamlit as st
 
+_import_seconds = time.perf_counter() - _import_start
+
 import os, sys, time
 
 # Page configuration
@@ -33,40 +49,192 @@ def init_session_state():
         st.session_state.initialized = False
     if 'history' not in st.session_state:
         st.session_state.history = []
+    if 'thread_id' not in st.session_state:
+        st.session_state.thread_id = uuid.uuid4().hex
 
 @st.cache_resource
 def initialize_rag():
     """Initialize the RAG system (cached)"""
     try:
-        # Initialize components
-        config = AIConfig()
-        llm = ChatOpenAI(model=config.llm_model)
-        doc_processor = DocumentProcessor(
-            chunk_size=config.settings.chunk_size,
-            chunk_overlap=config.settings.chunk_overlap
-        )
-        vector_store = VectorStore()
+        profile = StartupProfile()
+        profile.record("import", _import_seconds)
+        with profile.phase("import"):
+            import_runtime()
+            from langchain_openai import ChatOpenAI
         
-        # Use default URLs
-        urls = config.settings.default_urls
+        with profile.phase("config"):
+            # Initialize components
+            config = AIConfig()
+            # Shared admission control for each model's provider rate limits
+            llm_scheduler = RequestScheduler(
+                name="llm",
+                requests_per_minute=config.settings.llm_requests_per_minute,
+                tokens_per_minute=config.settings.llm_tokens_per_minute,
+                burst_seconds=config.settings.rate_limit_burst_seconds,
+                background_reserve=config.settings.rate_limit_background_reserve,
+                max_queue=config.settings.rate_limit_max_queue,
+                interactive_max_wait=config.settings.rate_limit_max_wait,
+                max_retries=config.settings.rate_limit_max_retries,
+            ) if config.settings.rate_limit_enabled else None
+            embedding_scheduler = RequestScheduler(
+                name="embedding",
+                requests_per_minute=config.settings.embedding_requests_per_minute,
+                tokens_per_minute=config.settings.embedding_tokens_per_minute,
+                burst_seconds=config.settings.rate_limit_burst_seconds,
+                background_reserve=config.settings.rate_limit_background_reserve,
+                max_queue=config.settings.rate_limit_max_queue,
+                interactive_max_wait=config.settings.rate_limit_max_wait,
+                max_retries=config.settings.rate_limit_max_retries,
+            ) if config.settings.rate_limit_enabled else None
+            llm = ChatOpenAI(
+                model=config.llm_model,
+                stream_usage=True,
+                **(llm_scheduler.client_kwargs() if llm_scheduler else {}),
+            )
+            doc_processor = DocumentProcessor(
+                chunk_size=config.settings.chunk_size,
+                chunk_overlap=config.settings.chunk_overlap,
+                data_dir=config.settings.data_dir or None,
+                max_workers=config.settings.loader_max_workers,
+                per_host_limit=config.settings.loader_per_host_limit,
+                url_timeout=config.settings.url_timeout,
+                url_retries=config.settings.url_retries,
+                pdf_workers=config.settings.pdf_workers,
+                splitter_mode=config.settings.text_splitter,
+                length_unit=config.settings.chunk_length_unit,
+                tokenizer_model=config.settings.llm_model,
+            )
+            vector_store = VectorStore(
+                embedding_model=config.settings.embedding_model,
+                embedding_cache_path=config.settings.embedding_cache_path or None,
+                embedding_cache_max_mb=config.settings.embedding_cache_max_mb,
+                embedding_cache_dtype=config.settings.embedding_cache_dtype,
+                retrieval_mode=config.settings.retrieval_mode,
+                retrieval_k=config.settings.retrieval_k,
+                retrieval_fetch_k=config.settings.retrieval_fetch_k,
+                retrieval_mmr_lambda=config.settings.retrieval_mmr_lambda,
+                retrieval_source_cap=config.settings.retrieval_source_cap,
+                retrieval_score_threshold=config.settings.retrieval_score_threshold,
+                query_batch_size=config.settings.query_batch_size,
+                query_batch_wait_ms=config.settings.query_batch_wait_ms,
+                query_batch_in_flight=config.settings.query_batch_in_flight,
+                scheduler=embedding_scheduler,
+                ann=ANNConfig(
+                    index_type=config.settings.index_type,
+                    storage=config.settings.index_storage,
+                    nlist=config.settings.ivf_nlist,
+                    nprobe=config.settings.ivf_nprobe,
+                    pq_m=config.settings.pq_m,
+                    pq_bits=config.settings.pq_bits,
+                    hnsw_m=config.settings.hnsw_m,
+                    ef_construction=config.settings.hnsw_ef_construction,
+                    ef_search=config.settings.hnsw_ef_search,
+                    train_size=config.settings.index_train_size,
+                ),
+            )
+            if config.settings.sharding_enabled:
+                # One independently built and loaded index per source group
+                vector_store = ShardedVectorStore(template=vector_store, max_workers=config.settings.shard_workers)
+            index_dir = Path(config.settings.index_dir)
         
-        # Process documents
-        documents = doc_processor.process_urls(urls)
+        with profile.phase("index_load"):
+            if vector_store.index_exists(index_dir):
+                # Memory-mapped load of the persisted index
+                manifest = vector_store.load_vectorstore(index_dir)
+            else:
+                # Use default URLs
+                urls = config.settings.default_urls
+                
+                # Stream documents into the vector store and persist it
+                IngestPipeline(
+                    processor=doc_processor,
+                    store=vector_store,
+                    embed_batch_size=config.settings.embed_batch_size,
+                    queue_size=config.settings.ingest_queue_size,
+                    dedup=NearDuplicateFilter(
+                        threshold=config.settings.dedup_threshold,
+                        num_perm=config.settings.dedup_num_perm,
+                    ) if config.settings.dedup_enabled else None,
+                ).run(urls)
+                manifest = vector_store.save_vectorstore(
+                    index_dir, corpus_version=config.settings.corpus_version or None
+                )
         
-        # Create vector store
-        vector_store.create_vectorstore(documents)
+        with profile.phase("graph_compile"):
+            # Semantic answer cache, invalidated when the corpus version changes
+            semantic_cache = SemanticCache(
+                embeddings=vector_store.embedding,
+                threshold=config.settings.semantic_cache_threshold,
+                ttl_seconds=config.settings.semantic_cache_ttl_seconds,
+                max_entries=config.settings.semantic_cache_max_entries,
+                corpus_version=manifest['corpus_version'],
+            ) if config.settings.semantic_cache_enabled else None
+            
+            # Low-confidence and open-domain questions escalate to the ReAct agent
+            router = QueryRouter(
+                min_top_score=config.settings.route_min_top_score,
+                confident_score=config.settings.route_confident_score,
+                min_term_overlap=config.settings.route_min_term_overlap,
+            ) if config.settings.routing_enabled else None
+            agent = ReActRAGNodes(
+                retriever=vector_store.get_retriever(),
+                llm=llm,
+                tool_policies={
+                    name: ToolPolicy(timeout=config.settings.tool_timeout_seconds)
+                    for name in ("retriever", "wikipedia")
+                },
+                max_steps=config.settings.agent_max_steps,
+                time_budget=config.settings.agent_time_budget,
+            ) if router is not None else None
+            
+            # Follow-ups are condensed against a bounded, summarized memory kept per browser session
+            memory = ConversationMemory(
+                llm=llm,
+                model=config.settings.llm_model,
+                summary_token_budget=config.settings.memory_summary_token_budget,
+                history_token_budget=config.settings.memory_history_token_budget,
+                reuse_overlap=config.settings.memory_reuse_overlap,
+            ) if config.settings.memory_enabled else None
+            
+            # Build graph once; every session reuses the compiled graph
+            graph_builder = RAGGraphBuilder(
+                retriever=vector_store.get_retriever(),
+                llm=llm,
+                cache=semantic_cache,
+                packer=ContextPacker(
+                    model=config.settings.llm_model,
+                    token_budget=config.settings.context_token_budget,
+                    duplicate_threshold=config.settings.context_duplicate_threshold,
+                ),
+                router=router,
+                agent=agent,
+                memory=memory,
+                checkpointer=SessionCheckpointer(
+                    max_sessions=config.settings.memory_max_sessions
+                ) if memory is not None else None,
+            )
+            graph_builder.build()
         
-        # Build graph
-        graph_builder = RAGGraphBuilder(
-            retriever=vector_store.get_retriever(),
-            llm=llm
-        )
-        graph_builder.build()
+        with profile.phase("warm_up"):
+            graph_builder.warm_up()
+        
+        if semantic_cache is not None:
+            REGISTRY.register_collector("semantic_cache", semantic_cache.stats)
+        REGISTRY.register_collector("embedding_cache", vector_store.embedding_cache_stats)
+        if getattr(vector_store, "dispatcher", None) is not None:
+            REGISTRY.register_collector("query_batching", vector_store.dispatcher.stats)
+        for scheduler in (llm_scheduler, embedding_scheduler):
+            if scheduler is not None:
+                REGISTRY.register_collector(f"{scheduler.name}_scheduler", scheduler.stats)
+        if config.settings.metrics_port:
+            serve_metrics(config.settings.metrics_port)
+        if config.settings.trace_log_path:
+            configure_trace_log(config.settings.trace_log_path)
         
-        return graph_builder, len(documents)
+        return graph_builder, manifest['num_vectors'], profile
     except Exception as e:
         st.error(f"Failed to initialize: {str(e)}")
-        return None, 0
+        return None, 0, None
     
 st.title("🔍 Agentic RAG Document Search")
 st.markdown("Ask questions about the loaded documents")
@@ -76,11 +244,13 @@ def main():
     # Initialize system
     if not st.session_state.initialized:
         with st.spinner("Loading system..."):
-            rag_system, num_chunks = initialize_rag()
+            rag_system, num_chunks, profile = initialize_rag()
             if rag_system:
                 st.session_state.rag_system = rag_system
                 st.session_state.initialized = True
                 st.success(f"✅ System ready! ({num_chunks} document chunks loaded)")
+                with st.expander(f"🚀 Startup breakdown ({profile.total:.2f}s)"):
+                    st.code(profile.report())
                 
     st.markdown("---")
 
@@ -92,40 +262,84 @@ def main():
         )
         submit = st.form_submit_button("🔍 Search")
 
+    if st.session_state.rag_system and st.session_state.rag_system.memory is not None:
+        if st.button("🧹 New conversation"):
+            st.session_state.rag_system.forget(st.session_state.thread_id)
+            st.session_state.thread_id = uuid.uuid4().hex
+            st.session_state.history = []
 
     # Process search
     if submit and question:
         if st.session_state.rag_system:
+            # Stream sources, then answer tokens as they are generated
+            st.markdown("### 💡 Answer")
+            answer_placeholder = st.empty()
+            sources_container = st.container()
+            answer = ""
+            result = None
+            
             with st.spinner("Searching..."):
-                start_time = time.time()
-                
-                # Get answer
-                result = st.session_state.rag_system.run(question)
-                
-                elapsed_time = time.time() - start_time
-                
-                # Add to history
-                st.session_state.history.append({
-                    'question': question,
-                    'answer': result['answer'],
-                    'time': elapsed_time
-                })
-                
-                # Display answer
-                st.markdown("### 💡 Answer")
-                st.success(result['answer'])
-                
-                # Show retrieved docs in expander
-                with st.expander("📄 Source Documents"):
-                    for i, doc in enumerate(result['retrieved_docs'], 1):
-                        st.text_area(
-                            f"Document {i}",
-                            doc.page_content[:300] + "...",
-                            height=100,
-                            disabled=True
-                        )
-                
-                st.caption(f"⏱️ Response time: {elapsed_time:.2f} seconds")
+                thread_id = st.session_state.thread_id if st.session_state.rag_system.memory is not None else None
+                for event in st.session_state.rag_system.stream(question, thread_id=thread_id):
+                    if event["type"] == "sources":
+                        # Show retrieved docs in expander
+                        with sources_container.expander("📄 Source Documents"):
+                            for i, doc in enumerate(event['retrieved_docs'], 1):
+                                # Exact span of the chunk within its source, when the splitter recorded it
+                                span = (
+                                    f" [{doc.metadata['start_index']}:{doc.metadata['end_index']}]"
+                                    if 'end_index' in doc.metadata else ""
+                                )
+                                st.text_area(
+                                    f"Document {i} — {doc.metadata.get('source', 'unknown')}{span}",
+                                    doc.page_content[:300] + "...",
+                                    height=100,
+                                    disabled=True
+                                )
+                    elif event["type"] == "token":
+                        answer += event["content"]
+                        answer_placeholder.markdown(answer + "▌")
+                    elif event["type"] == "done":
+                        result = event
+            
+            answer_placeholder.success(result['answer'])
+            
+            # Add to history
+            st.session_state.history.append({
+                'question': question,
+                'answer': result['answer'],
+                'chunk_ids': result['chunk_ids'],
+                'time': result['total_time']
+            })
+            
+            st.caption(
+                f"⏱️ First token: {result['time_to_first_token']:.2f} seconds | "
+                f"Response time: {result['total_time']:.2f} seconds"
+                + (" | ⚡ served from semantic cache" if result['cached'] else "")
+                + (f" | 🧭 route: {result['route']}" if result['route'] else "")
+                + (f" | 🔎 searched for: {result['query']}" if result['query'] and result['query'] != question else "")
+            )
+            
+            breakdown = result['trace'].breakdown()
+            with st.expander(f"⏱️ Latency breakdown ({result['total_time'] * 1000:.0f} ms)"):
+                st.table([
+                    {"stage": stage, "ms": round(seconds * 1000, 1)}
+                    for stage, seconds in sorted(breakdown.items(), key=lambda item: -item[1])
+                ])
+                tokens = result['trace'].tokens
+                st.caption(f"Tokens: {tokens['prompt']} prompt / {tokens['completion']} completion")
+            
+            with st.sidebar.expander("📈 Stage latency (p50 / p95 ms)"):
+                st.table([
+                    {"stage": row["stage"], "p50": round(row["p50_ms"], 1), "p95": round(row["p95_ms"], 1), "n": row["count"]}
+                    for row in REGISTRY.stage_summary()
+                ])
+            
+            semantic_cache = st.session_state.rag_system.cache
+            if semantic_cache is not None:
+                stats = semantic_cache.stats()
+                st.sidebar.metric("Semantic cache hit rate", f"{stats['hit_rate']:.0%}")
+                st.sidebar.metric("Latency saved", f"{stats['latency_saved']:.1f}s")
 
     # Show history
     if st.session_state.history:
@@ -0,0 +1,69 @@
+"""
+Compare two benchmark result files
+
+    python -m benchmarks.compare results/bench-old.json results/bench-new.json
+
+Rows are matched by corpus size (and index type); every latency,
+duration and throughput metric is printed with its relative change.
+"""
+from typing import Dict, Iterator, List, Tuple
+import argparse
+import json
+
+# Lower is better for these suffixes; rates ("_per_sec") are higher-is-better
+_LOWER_IS_BETTER = ("_ms", "_seconds")
+
+
+def _flatten(row:Dict, prefix:str="")->Iterator[Tuple[str, float]]:
+    for key, value in row.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", float(value)
+
+
+def _row_key(section:str, row:Dict)->Tuple:
+    return (section, row.get("pages", row.get("chunks")), row.get("index_type"))
+
+
+def compare(old:Dict, new:Dict, threshold:float=0.10)->List[str]:
+    """Lines describing each metric's change; regressions beyond `threshold` are flagged"""
+    lines = []
+    old_rows = {_row_key(s, r): r for s, rows in old["results"].items() for r in rows}
+    for section, rows in new["results"].items():
+        for row in rows:
+            key = _row_key(section, row)
+            if key not in old_rows:
+                continue
+            before = dict(_flatten(old_rows[key]))
+            label = f"{section} size={key[1]}" + (f" {key[2]}" if key[2] else "")
+            for metric, value in _flatten(row):
+                if metric not in before or metric in ("pages", "chunks", "documents", "tool_calls"):
+                    continue
+                if not (metric.endswith(_LOWER_IS_BETTER) or metric.endswith("_per_sec")):
+                    continue
+                base = before[metric]
+                change = (value - base) / base if base else 0.0
+                worse = change > threshold if metric.endswith(_LOWER_IS_BETTER) else change < -threshold
+                flag = "  ⚠️ regression" if worse else ""
+                lines.append(f"{label:<28} {metric:<24} {base:12.3f} → {value:12.3f} ({change:+.1%}){flag}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change flagged as a regression")
+    args = parser.parse_args()
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{old['meta'].get('commit')} → {new['meta'].get('commit')}")
+    for line in compare(old, new, args.threshold):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+import hashlib
+import json
+import re
+import threading
+import time
+
+import numpy as np
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+_WORD = re.compile(r"\w+")
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic offline embeddings
+    ---
+
+    Feature-hashed bag of words (plus word bigrams), L2-normalised, so
+    texts sharing vocabulary are close; unlike random fake embeddings,
+    retrieval over them behaves like retrieval over a real model.
+    `latency` is paid per request; with `max_concurrent` only that many
+    requests are served at once, as under a provider's concurrency or
+    rate limits, and further requests queue.
+    """
+
+    def __init__(self, size:int=384, latency:float=0.0, max_concurrent:int=0):
+        self.size = size
+        self.latency = latency
+        self.calls = 0
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+
+    def _embed(self, text:str)->List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        words = _WORD.findall(text.lower())
+        for feature in words + [a + " " + b for a, b in zip(words, words[1:])]:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.size
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm > 0 else vector).tolist()
+
+    def embed_documents(self, texts:List[str])->List[List[float]]:
+        self.calls += 1
+        if self.latency:
+            if self._slots is not None:
+                with self._slots:
+                    time.sleep(self.latency)
+            else:
+                time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text:str)->List[float]:
+        return self.embed_documents([text])[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Offline chat model with a latency profile
+    ---
+
+    Waits `time_to_first_token`, then emits `answer_tokens` tokens at
+    `tokens_per_second`. Bound to tools (as in a ReAct agent), it first
+    makes `tool_calls` tool-call turns, cycling through the bound tools
+    with the user question as input, and then answers. With
+    `parallel_tool_calls` every turn calls all bound tools at once.
+    The prompt of every call is kept in `prompts` until `reset_stats`.
+    """
+    time_to_first_token:float = 0.2
+    tokens_per_second:float = 50.0
+    answer_tokens:int = 40
+    tool_calls:int = 1
+    parallel_tool_calls:bool = False
+
+    _lock:threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _calls:int = PrivateAttr(default=0)
+    _busy_seconds:float = PrivateAttr(default=0.0)
+    _prompts:List[str] = PrivateAttr(default_factory=list)
+
+    @property
+    def _llm_type(self)->str:
+        return "fake-chat"
+
+    @property
+    def calls(self)->int:
+        return self._calls
+
+    @property
+    def busy_seconds(self)->float:
+        """Total simulated model time across calls"""
+        return self._busy_seconds
+
+    @property
+    def prompts(self)->List[str]:
+        return list(self._prompts)
+
+    def reset_stats(self):
+        with self._lock:
+            self._calls = 0
+            self._busy_seconds = 0.0
+            self._prompts.clear()
+
+    def _prompt(self, messages:List[BaseMessage]):
+        with self._lock:
+            self._prompts.append("\n".join(str(message.content) for message in messages))
+
+    def _record(self, seconds:float):
+        with self._lock:
+            self._calls += 1
+            self._busy_seconds += seconds
+
+    def bind_tools(self, tools:Sequence[Any], **kwargs:Any):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    @staticmethod
+    def _question(messages:List[BaseMessage])->str:
+        for message in messages:
+            if isinstance(message, HumanMessage):
+                return str(message.content)
+        return str(messages[-1].content) if messages else ""
+
+    def _tool_call(self, messages:List[BaseMessage], tools:Optional[List[Dict]])->Optional[AIMessage]:
+        if not tools:
+            return None
+        made = sum(1 for message in messages if isinstance(message, AIMessage) and message.tool_calls)
+        if made >= self.tool_calls:
+            return None
+        functions = [t["function"] for t in tools] if self.parallel_tool_calls else [tools[made % len(tools)]["function"]]
+        calls = []
+        for i, function in enumerate(functions):
+            arg = next(iter(function.get("parameters", {}).get("properties", {})), "__arg1")
+            calls.append({"name": function["name"], "args": {arg: self._question(messages)}, "id": f"call_{made}_{i}"})
+        return AIMessage(content="", tool_calls=calls)
+
+    def _answer_tokens(self, messages:List[BaseMessage])->List[str]:
+        context = " ".join(str(m.content) for m in messages if isinstance(m, ToolMessage))
+        words = (_WORD.findall(context) or _WORD.findall(self._question(messages)) or ["ok"])
+        return [f" {words[i % len(words)]}" for i in range(self.answer_tokens)]
+
+    def _generate(
+        self,
+        messages:List[BaseMessage],
+        stop:Optional[List[str]]=None,
+        run_manager:Optional[CallbackManagerForLLMRun]=None,
+        tools:Optional[List[Dict]]=None,
+        **kwargs:Any,
+    )->ChatResult:
+        start = time.perf_counter()
+        self._prompt(messages)
+        time.sleep(self.time_to_first_token)
+        message = self._tool_call(messages, tools)
+        if message is None:
+            tokens = self._answer_tokens(messages)
+            time.sleep(len(tokens) / self.tokens_per_second)
+            message = AIMessage(content="".join(tokens).strip())
+        self._record(time.perf_counter() - start)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages:List[BaseMessage],
+        stop:Optional[List[str]]=None,
+        run_manager:Optional[CallbackManagerForLLMRun]=None,
+        tools:Optional[List[Dict]]=None,
+        **kwargs:Any,
+    )->Iterator[ChatGenerationChunk]:
+        start = time.perf_counter()
+        self._prompt(messages)
+        time.sleep(self.time_to_first_token)
+        message = self._tool_call(messages, tools)
+        if message is not None:
+            self._record(time.perf_counter() - start)
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+                for i, call in enumerate(message.tool_calls)
+            ]))
+            return
+        for token in self._answer_tokens(messages):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+            time.sleep(1 / self.tokens_per_second)
+        self._record(time.perf_counter() - start)
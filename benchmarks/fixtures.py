@@ -0,0 +1,383 @@
+from typing import Dict, List, Optional
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import base64
+import json
+import random
+import struct
+import threading
+import time
+
+_SERVICES = ["kafka", "postgres", "redis", "nginx", "spark", "airflow", "elasticsearch", "kubelet", "etcd", "vault"]
+_SYMPTOMS = [
+    "high p99 latency", "consumer lag", "OOMKilled restarts", "disk pressure", "connection resets",
+    "replication delay", "certificate expiry", "throttled CPU", "stuck leader election", "5xx spike",
+]
+_ERRORS = ["ORA-00942", "ECONNREFUSED", "HTTP 503", "SIGKILL", "ENOSPC", "TLS handshake timeout", "error 1205"]
+_METRICS = ["node_cpu_seconds_total", "kafka_consumergroup_lag", "pg_stat_replication_lag", "container_memory_rss"]
+_STEPS = [
+    "check the dashboard for", "restart the", "scale out the", "drain the node running", "roll back the last deploy of",
+    "inspect the logs of", "increase the memory limit of", "rotate the credentials of", "page the owner of",
+]
+
+
+def page_text(page:int, paragraphs:int=6)->Dict[str, str]:
+    """Deterministic runbook-style title and paragraphs for fixture page `page`"""
+    rng = random.Random(page)
+    service = _SERVICES[page % len(_SERVICES)]
+    symptom = rng.choice(_SYMPTOMS)
+    body = []
+    for _ in range(paragraphs):
+        sentences = [
+            f"When {service} on db-{rng.randint(1, 40):02d}.prod.internal shows {rng.choice(_SYMPTOMS)}, "
+            f"{rng.choice(_STEPS)} {service}.",
+            f"Alerts fire on {rng.choice(_METRICS)} and logs contain {rng.choice(_ERRORS)}.",
+            f"Escalate to the {rng.choice(_SERVICES)} on-call if the issue persists for {rng.randint(5, 60)} minutes.",
+        ]
+        rng.shuffle(sentences)
+        body.append(" ".join(sentences))
+    return {"title": f"Runbook {page}: {service} {symptom}", "body": "\n".join(f"<p>{p}</p>" for p in body)}
+
+
+def boilerplate_html(paragraphs:int)->str:
+    """Disclaimer/header paragraphs shared verbatim by every fixture page"""
+    rng = random.Random(-1)
+    return "\n".join(
+        f"<p>Notice {i}: this runbook is maintained by the {rng.choice(_SERVICES)} platform team. "
+        f"Before you {rng.choice(_STEPS)} any service, confirm the change window, open an incident ticket "
+        f"and record every command you run. Escalations follow the standard {rng.choice(_SERVICES)} on-call policy.</p>"
+        for i in range(paragraphs)
+    )
+
+
+def wiki_articles(count:int=50)->List[Dict[str, str]]:
+    """Small fixed encyclopedia served by the fake Wikipedia API"""
+    articles = []
+    for i in range(count):
+        service = _SERVICES[i % len(_SERVICES)]
+        articles.append({
+            "pageid": str(1000 + i),
+            "title": f"{service.capitalize()} ({i})",
+            "extract": (
+                f"{service.capitalize()} is a widely deployed piece of infrastructure software. "
+                f"Operators monitor it through metrics such as {_METRICS[i % len(_METRICS)]} "
+                f"and common failure modes include {_SYMPTOMS[i % len(_SYMPTOMS)]}."
+            ),
+        })
+    return articles
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server:"FixtureServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body:bytes, content_type:str, status:int=200, headers:Optional[Dict[str, str]]=None):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith("/pages/") and url.path.endswith(".html"):
+            try:
+                page = int(url.path[len("/pages/"):-len(".html")])
+            except ValueError:
+                return self._send(b"not found", "text/plain", 404)
+            revision = self.server.revisions.get(page, 0)
+            etag = f'"{page}.{revision}"'
+            self.server.page_requests += 1
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(b"", "text/html; charset=utf-8", 304, {"ETag": etag})
+            text = page_text(page)
+            body = text["body"] + "".join(
+                f"<p>Revision {r}: {page_text(page * 1000 + r, paragraphs=1)['body'][3:-4]}</p>" for r in range(1, revision + 1)
+            )
+            body = self.server.boilerplate + body + self.server.boilerplate
+            html = f"<html><head><title>{text['title']}</title></head><body><h1>{text['title']}</h1>{body}</body></html>"
+            return self._send(html.encode("utf-8"), "text/html; charset=utf-8", headers={"ETag": etag})
+        if url.path == "/w/api.php":
+            if self.server.wiki_latency:
+                time.sleep(self.server.wiki_latency)
+            params = {key: values[0] for key, values in parse_qs(url.query, keep_blank_values=True).items()}
+            return self._send(json.dumps(self.server.wiki(params)).encode("utf-8"), "application/json")
+        self._send(b"not found", "text/plain", 404)
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """
+    Local HTTP server standing in for the web
+    ---
+
+    Serves generated runbook pages at `/pages/<n>.html` (WebBaseLoader
+    targets) with ETags, answering `If-None-Match` with 304 until a page
+    is revised with `revise`, and a minimal MediaWiki `api.php` (search, page info and
+    extracts) at `/w/api.php` for the `wikipedia` package.
+
+    Args:
+        latency: Seconds added to every response
+        wiki_latency: Further seconds added to every `api.php` response
+        boilerplate: Shared paragraphs added at the top and bottom of every page
+    """
+    daemon_threads = True
+    request_queue_size = 128  # the default backlog of 5 drops connects from concurrent loaders, stalling them ~1s
+
+    def __init__(self, latency:float=0.0, wiki_latency:float=0.0, boilerplate:int=0):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.latency = latency
+        self.wiki_latency = wiki_latency
+        self.boilerplate = boilerplate_html(boilerplate) if boilerplate else ""
+        self.articles = wiki_articles()
+        self.revisions:Dict[int, int] = {}
+        self.page_requests = 0
+        self._thread:Optional[threading.Thread] = None
+
+    @property
+    def base_url(self)->str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def wiki_api_url(self)->str:
+        return f"{self.base_url}/w/api.php"
+
+    def page_urls(self, count:int)->List[str]:
+        return [f"{self.base_url}/pages/{i}.html" for i in range(count)]
+
+    def revise(self, pages:List[int]):
+        """Append a paragraph to each of `pages`, changing their ETag"""
+        for page in pages:
+            self.revisions[page] = self.revisions.get(page, 0) + 1
+
+    def wiki(self, params:Dict[str, str])->Dict:
+        """Answer the subset of the MediaWiki query API the `wikipedia` package uses"""
+        if params.get("list") == "search":
+            terms = set(params.get("srsearch", "").lower().split())
+            ranked = sorted(
+                self.articles,
+                key=lambda a: -len(terms & set((a["title"] + " " + a["extract"]).lower().split())),
+            )
+            limit = int(params.get("srlimit", 10))
+            return {"query": {"search": [{"title": a["title"]} for a in ranked[:limit]]}}
+
+        title = params.get("titles")
+        article = next((a for a in self.articles if a["title"] == title or a["pageid"] == params.get("pageids")), None)
+        if article is None:
+            return {"query": {"pages": {"-1": {"title": title, "missing": ""}}}}
+        page = {"pageid": int(article["pageid"]), "title": article["title"]}
+        if "info" in params.get("prop", ""):
+            page["fullurl"] = f"{self.base_url}/wiki/{article['pageid']}"
+        if "extracts" in params.get("prop", ""):
+            page["extract"] = article["extract"]
+        if "revisions" in params.get("prop", ""):
+            page["revisions"] = [{"revid": 1, "parentid": 0}]
+        return {"query": {"pages": {article["pageid"]: page}}}
+
+    def start(self)->"FixtureServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Limit:
+    """Provider-side token bucket: `limit` per minute, holding `burst_seconds` worth when idle"""
+
+    def __init__(self, limit:float, burst_seconds:float):
+        self.limit = limit
+        self.rate = limit / 60.0
+        self.capacity = max(1.0, limit * burst_seconds / 60.0)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now:float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reset(self)->float:
+        return (self.capacity - self.level) / self.rate
+
+
+class _OpenAIHandler(BaseHTTPRequestHandler):
+    server:"MockOpenAIServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status:int, payload:Dict, headers:Dict[str, str]):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, chunks:List[Dict], headers:Dict[str, str]):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        for chunk in [f"data: {json.dumps(c)}\n\n" for c in chunks] + ["data: [DONE]\n\n"]:
+            data = chunk.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        payload = json.loads(body or b"{}")
+        path = urlparse(self.path).path
+        if not path.endswith(("/chat/completions", "/embeddings")):
+            return self._send(404, {"error": {"message": "not found"}}, {})
+        if "input" in payload:
+            inputs = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+            tokens = sum(len(item) if isinstance(item, list) else max(1, len(str(item)) // 4) for item in inputs)
+        else:
+            tokens = len(json.dumps(payload.get("messages", []))) // 4 + int(payload.get("max_tokens") or payload.get("max_completion_tokens") or 0)
+        admitted, headers = self.server.admit(payload.get("model", ""), tokens)
+        if not admitted:
+            error = {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}
+            return self._send(429, {"error": error}, headers)
+        time.sleep(self.server.latency)
+        created = int(time.time())
+        if "input" in payload:
+            vectors = [[float((i + j) % 7) for j in range(self.server.dimension)] for i in range(len(inputs))]
+            data = [
+                {
+                    "object": "embedding",
+                    "index": i,
+                    "embedding": base64.b64encode(struct.pack(f"<{len(v)}f", *v)).decode("ascii")
+                    if payload.get("encoding_format") == "base64" else v,
+                }
+                for i, v in enumerate(vectors)
+            ]
+            usage = {"prompt_tokens": tokens, "total_tokens": tokens}
+            return self._send(200, {"object": "list", "data": data, "model": payload["model"], "usage": usage}, headers)
+        answer = "Restart the service and check the dashboard."
+        usage = {"prompt_tokens": tokens, "completion_tokens": 8, "total_tokens": tokens + 8}
+        if payload.get("stream"):
+            base = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created, "model": payload["model"]}
+            chunks = [
+                {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": word + " "}, "finish_reason": None}]}
+                for word in answer.split()
+            ]
+            chunks.append({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            chunks.append({**base, "choices": [], "usage": usage})
+            return self._stream(chunks, headers)
+        message = {"role": "assistant", "content": answer}
+        completion = {
+            "id": "chatcmpl-mock", "object": "chat.completion", "created": created, "model": payload["model"],
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}], "usage": usage,
+        }
+        return self._send(200, completion, headers)
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    """
+    Local OpenAI-compatible endpoint that enforces rate limits
+    ---
+
+    Serves `/v1/chat/completions` (plain and streamed) and `/v1/embeddings`
+    behind per-model requests-per-minute and tokens-per-minute buckets,
+    answering like the OpenAI API: `x-ratelimit-*` headers on every
+    response and 429 with `retry-after-ms` once a limit is exhausted.
+
+    Args:
+        requests_per_minute: Request limit of every model
+        tokens_per_minute: Token limit of every model
+        burst_seconds: Seconds of budget a bucket holds when idle
+        latency: Seconds each admitted request takes
+        dimension: Size of returned embeddings
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, requests_per_minute:float=600, tokens_per_minute:float=200_000, burst_seconds:float=1.0, latency:float=0.05, dimension:int=8):
+        super().__init__(("127.0.0.1", 0), _OpenAIHandler)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.burst_seconds = burst_seconds
+        self.latency = latency
+        self.dimension = dimension
+        self.limits:Dict[str, Dict[str, _Limit]] = {}
+        self.served = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._thread:Optional[threading.Thread] = None
+
+    @property
+    def base_url(self)->str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def admit(self, model:str, tokens:int):
+        """Take one request and `tokens` from `model`'s buckets; (admitted, rate-limit headers)"""
+        with self._lock:
+            limits = self.limits.setdefault(model, {
+                "requests": _Limit(self.requests_per_minute, self.burst_seconds),
+                "tokens": _Limit(self.tokens_per_minute, self.burst_seconds),
+            })
+            now = time.monotonic()
+            cost = {"requests": 1, "tokens": min(tokens, limits["tokens"].capacity)}
+            for limit in limits.values():
+                limit.refill(now)
+            short = {kind: cost[kind] - limit.level for kind, limit in limits.items() if limit.level < cost[kind]}
+            if not short:
+                for kind, limit in limits.items():
+                    limit.level -= cost[kind]
+                self.served += 1
+            else:
+                self.throttled += 1
+            headers = {}
+            for kind, limit in limits.items():
+                headers[f"x-ratelimit-limit-{kind}"] = str(int(limit.limit))
+                headers[f"x-ratelimit-remaining-{kind}"] = str(int(limit.level))
+                headers[f"x-ratelimit-reset-{kind}"] = f"{limit.reset():.3f}s"
+            if short:
+                wait = max(deficit / limits[kind].rate for kind, deficit in short.items())
+                headers["retry-after-ms"] = str(int(wait * 1000) + 1)
+            return not short, headers
+
+    def start(self)->"MockOpenAIServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+@contextmanager
+def local_wikipedia(api_url:str):
+    """Point the `wikipedia` package (and WikipediaAPIWrapper, which resets the language) at `api_url`"""
+    import wikipedia
+    import wikipedia.wikipedia as client
+
+    original_url, original_set_lang = client.API_URL, wikipedia.set_lang
+
+    def set_lang(prefix):
+        client.API_URL = api_url
+
+    client.API_URL = api_url
+    wikipedia.set_lang = set_lang
+    try:
+        yield
+    finally:
+        client.API_URL = original_url
+        wikipedia.set_lang = original_set_lang
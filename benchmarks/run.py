@@ -0,0 +1,589 @@
+"""
+Offline benchmark suite
+
+Runs ingest, index, graph and ReAct benchmarks against local stand-ins
+(fixture HTTP server, hashing embeddings, fake chat model) at several
+corpus sizes, and a rate-limit benchmark against a mock OpenAI endpoint,
+and writes the results to JSON:
+
+    python -m benchmarks.run --sizes 50,200,1000
+    python -m benchmarks.compare old.json new.json
+"""
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+from langchain_core.documents import Document
+
+from aiops_rag_databricksapp.ingest import DocumentProcessor
+from aiops_rag_databricksapp.store import VectorStore
+from aiops_rag_databricksapp.ann import ANNConfig
+from aiops_rag_databricksapp.context import ContextPacker
+from aiops_rag_databricksapp.rag_graph import RAGGraphBuilder
+from aiops_rag_databricksapp.rag_react_node import ReActRAGNodes
+from aiops_rag_databricksapp.rag_state import RAGState
+from aiops_rag_databricksapp.memory import ConversationMemory, conversation_blocks, render_turns
+from aiops_rag_databricksapp.tools import ToolPolicy
+from aiops_rag_databricksapp.batching import QueryDispatcher
+from aiops_rag_databricksapp.refresh import IncrementalRefresher
+from aiops_rag_databricksapp.dedup import NearDuplicateFilter
+from aiops_rag_databricksapp.scheduler import Priority, RequestScheduler, request_priority
+from aiops_rag_databricksapp.metrics import MetricsRegistry
+
+from benchmarks.fakes import FakeChatModel, HashingEmbeddings
+from benchmarks.fixtures import FixtureServer, MockOpenAIServer, local_wikipedia, page_text
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def latency_summary(samples:List[float])->Dict[str, float]:
+    """Mean, p50, p95, p99 and max of latency samples in milliseconds"""
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "mean_ms": 1000 * statistics.fmean(ordered),
+        "p50_ms": 1000 * pick(0.50),
+        "p95_ms": 1000 * pick(0.95),
+        "p99_ms": 1000 * pick(0.99),
+        "max_ms": 1000 * ordered[-1],
+    }
+
+
+def questions(count:int, corpus_pages:int)->List[str]:
+    """Questions drawn from fixture page titles so they have answers in the corpus"""
+    step = max(1, corpus_pages // count)
+    return [f"How do I handle {page_text(i * step)['title'].split(': ', 1)[1]}?" for i in range(count)]
+
+
+def bench_ingest(server:FixtureServer, pages:int, args)->Tuple[Dict, List[Document]]:
+    processor = DocumentProcessor(
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        data_dir=None,
+        max_workers=args.loader_workers,
+        per_host_limit=args.per_host_limit,
+        splitter_mode=args.splitter,
+    )
+    start = time.perf_counter()
+    documents = processor.load_documents(server.page_urls(pages))
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    chunks = processor.split_documents(documents)
+    split_seconds = time.perf_counter() - start
+    row = {
+        "pages": pages,
+        "documents": len(documents),
+        "chunks": len(chunks),
+        "load_seconds": load_seconds,
+        "split_seconds": split_seconds,
+        "pages_per_sec": pages / load_seconds if load_seconds else 0.0,
+        "chunks_per_sec": len(chunks) / split_seconds if split_seconds else 0.0,
+        "splitter": args.splitter,
+    }
+    for mode in ("recursive", "offset"):
+        # Same documents through each splitter, for a like-for-like split time
+        other = DocumentProcessor(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap, data_dir=None, splitter_mode=mode)
+        _ = other.splitter
+        start = time.perf_counter()
+        split = other.split_documents(documents)
+        row[f"split_{mode}_seconds"] = time.perf_counter() - start
+        row[f"split_{mode}_chunks"] = len(split)
+    if args.dedup_threshold:
+        dedup = NearDuplicateFilter(threshold=args.dedup_threshold)
+        start = time.perf_counter()
+        chunks = list(dedup.filter(chunks))
+        dedup_seconds = time.perf_counter() - start
+        row["dedup"] = {
+            "seconds": dedup_seconds,
+            "chunks_per_sec": dedup.stats.chunks / dedup_seconds if dedup_seconds else 0.0,
+            "exact": dedup.stats.exact,
+            "near": dedup.stats.near,
+            "embeddings_saved": dedup.stats.embeddings_saved,
+            "chars_saved": dedup.stats.chars_saved,
+        }
+    return row, chunks
+
+
+def build_store(chunks:List[Document], index_type:str, args)->VectorStore:
+    store = VectorStore(ann=ANNConfig(index_type=index_type, train_size=min(len(chunks), 50_000)))
+    store.embedding = HashingEmbeddings(size=args.dimension, latency=args.embed_latency, max_concurrent=args.embed_max_concurrent)
+    for i in range(0, len(chunks), args.embed_batch_size):
+        store.add_documents(chunks[i:i + args.embed_batch_size])
+    store.flush()
+    return store
+
+
+def bench_refresh(server:FixtureServer, pages:int, args)->Dict:
+    """Initial build, no-op refresh and refresh after revising a fraction of the pages, from a reloaded (memory-mapped) index"""
+    def store_at(index_dir:Path)->VectorStore:
+        store = VectorStore()
+        store.embedding = HashingEmbeddings(size=args.dimension, latency=args.embed_latency)
+        if store.index_exists(index_dir):
+            store.load_vectorstore(index_dir)
+        return store
+
+    def refresher(index_dir:Path)->IncrementalRefresher:
+        processor = DocumentProcessor(
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+            data_dir=None,
+            max_workers=args.loader_workers,
+            per_host_limit=args.per_host_limit,
+            splitter_mode=args.splitter,
+        )
+        return IncrementalRefresher(
+            processor=processor, store=store_at(index_dir), index_dir=index_dir, embed_batch_size=args.embed_batch_size
+        )
+
+    urls = server.page_urls(pages)
+    with tempfile.TemporaryDirectory() as tmp:
+        index_dir = Path(tmp) / "index"
+        initial = refresher(index_dir).run(urls)
+        requests_before = server.page_requests
+        noop = refresher(index_dir).run(urls)
+
+        changed = list(range(0, pages, max(1, round(1 / args.refresh_changed))))
+        server.revise(changed)
+        incremental_refresher = refresher(index_dir)
+        incremental = incremental_refresher.run(urls)
+        vectors = incremental_refresher.store.vectorstore.index.ntotal
+    return {
+        "pages": pages,
+        "chunks": vectors,
+        "initial_seconds": initial.seconds,
+        "noop_seconds": noop.seconds,
+        "noop_not_modified": noop.not_modified,
+        "changed_pages": len(changed),
+        "incremental_seconds": incremental.seconds,
+        "chunks_added": incremental.chunks_added,
+        "chunks_removed": incremental.chunks_removed,
+        "chunks_kept": incremental.chunks_kept,
+        "requests": server.page_requests - requests_before,
+    }
+
+
+def bench_index(chunks:List[Document], index_type:str, queries:List[str], args)->Tuple[Dict, VectorStore]:
+    start = time.perf_counter()
+    store = build_store(chunks, index_type, args)
+    build_seconds = time.perf_counter() - start
+
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        store.retrieve(query, k=args.k)
+        samples.append(time.perf_counter() - start)
+    return {
+        "chunks": len(chunks),
+        "index_type": index_type,
+        "build_seconds": build_seconds,
+        "chunks_per_sec": len(chunks) / build_seconds if build_seconds else 0.0,
+        "query": latency_summary(samples),
+    }, store
+
+
+def bench_concurrency(store:VectorStore, queries:List[str], args)->Dict:
+    """Retrieval throughput and tail latency under concurrent callers, with and without query micro-batching"""
+    def drive()->Dict:
+        def timed(query:str)->float:
+            start = time.perf_counter()
+            store.retrieve(query, k=args.k)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            samples = list(pool.map(timed, queries * args.concurrency))
+        wall = time.perf_counter() - start
+        return {"queries_per_sec": len(samples) / wall, "latency": latency_summary(samples)}
+
+    row = {"chunks": len(store.vectorstore.index_to_docstore_id), "concurrency": args.concurrency}
+    previous = store.dispatcher
+    try:
+        store.dispatcher = None
+        row["unbatched"] = drive()
+        store.dispatcher = QueryDispatcher(
+            store,
+            max_batch_size=args.query_batch_size,
+            max_wait_ms=args.query_batch_wait_ms,
+            max_in_flight=args.query_batch_in_flight,
+        )
+        row["batched"] = drive()
+        row["batched"]["mean_batch_size"] = store.dispatcher.stats()["mean_batch_size"]
+    finally:
+        store.dispatcher = previous
+    return row
+
+
+def bench_graph(store:VectorStore, queries:List[str], args)->Dict:
+    llm = FakeChatModel(
+        time_to_first_token=args.llm_ttft,
+        tokens_per_second=args.llm_tokens_per_sec,
+        answer_tokens=args.answer_tokens,
+    )
+    builder = RAGGraphBuilder(
+        retriever=store.get_retriever(),
+        llm=llm,
+        packer=ContextPacker(model="gpt-4o-mini"),
+    )
+    start = time.perf_counter()
+    builder.build()
+    compile_seconds = time.perf_counter() - start
+
+    totals, overheads = [], []
+    for query in queries:
+        llm.reset_stats()
+        start = time.perf_counter()
+        builder.run(query)
+        total = time.perf_counter() - start
+        totals.append(total)
+        overheads.append(total - llm.busy_seconds)
+    return {
+        "chunks": len(store.vectorstore.index_to_docstore_id),
+        "compile_seconds": compile_seconds,
+        "run": latency_summary(totals),
+        "overhead": latency_summary(overheads),
+    }
+
+
+def bench_react(store:VectorStore, server:FixtureServer, queries:List[str], args)->Dict:
+    llm = FakeChatModel(
+        time_to_first_token=args.llm_ttft,
+        tokens_per_second=args.llm_tokens_per_sec,
+        answer_tokens=args.answer_tokens,
+        tool_calls=args.react_tool_calls,
+        parallel_tool_calls=args.parallel_tool_calls,
+    )
+    nodes = ReActRAGNodes(
+        retriever=store.get_retriever(),
+        llm=llm,
+        tool_policies={"wikipedia": ToolPolicy(timeout=args.tool_timeout)},
+    )
+    totals, overheads, calls = [], [], []
+    with local_wikipedia(server.wiki_api_url):
+        for query in queries:
+            llm.reset_stats()
+            start = time.perf_counter()
+            nodes.generate_answer(RAGState(question=query))
+            total = time.perf_counter() - start
+            totals.append(total)
+            overheads.append(total - llm.busy_seconds)
+            calls.append(llm.calls)
+    return {
+        "chunks": len(store.vectorstore.index_to_docstore_id),
+        "tool_calls": args.react_tool_calls,
+        "llm_calls_per_question": statistics.fmean(calls),
+        "run": latency_summary(totals),
+        "tools_and_overhead": latency_summary(overheads),
+        "tools": nodes.tool_stats(),
+    }
+
+
+def conversation(topics:List[str], turns:int)->List[str]:
+    """Chat script cycling through topics: question, same-topic rephrase, follow-up leaning on the history"""
+    script = []
+    for i in range(turns):
+        topic = topics[(i // 3) % len(topics)]
+        subject = topic.removeprefix("How do I handle ").rstrip("?")
+        script.append([topic, f"What is the first step to handle {subject}?", "What else should I check for that?"][i % 3])
+    return script
+
+
+def bench_chat(store:VectorStore, topics:List[str], args)->Dict:
+    """Multi-turn conversations through the chat graph: answer prompt size per turn, chunk reuse and memory LLM calls"""
+    llm = FakeChatModel(
+        time_to_first_token=args.llm_ttft,
+        tokens_per_second=args.llm_tokens_per_sec,
+        answer_tokens=args.answer_tokens,
+    )
+    memory = ConversationMemory(
+        llm=llm,
+        summary_token_budget=args.memory_summary_tokens,
+        history_token_budget=args.memory_history_tokens,
+    )
+    builder = RAGGraphBuilder(
+        retriever=store.get_retriever(),
+        llm=llm,
+        packer=ContextPacker(model="gpt-4o-mini"),
+        memory=memory,
+    )
+    builder.build()
+
+    script = conversation(topics, args.chat_turns)
+    totals, bounded, unbounded = [], [], []
+    reused = condensed = summarized = 0
+    for c in range(args.chat_conversations):
+        thread_id = f"bench-{c}"
+        summary, recent, history = "", [], []
+        for question in script:
+            llm.reset_stats()
+            start = time.perf_counter()
+            result = builder.run(question, thread_id=thread_id)
+            totals.append(time.perf_counter() - start)
+            prompts = llm.prompts
+            answer_prompt = next(p for p in prompts if p.lstrip().startswith("Answer the question"))
+            tokens = memory.count_tokens(answer_prompt)
+            bounded.append(tokens)
+            # Same prompt with every earlier turn kept verbatim instead of the summary and recent turns
+            unbounded.append(
+                tokens - memory.count_tokens("".join(conversation_blocks(summary, recent)))
+                + (memory.count_tokens(render_turns(history)) if history else 0)
+            )
+            reused += bool(result["reused"])
+            condensed += sum(p.startswith("Rewrite the follow-up") for p in prompts)
+            summarized += sum(p.startswith("Update the running summary") for p in prompts)
+            summary, recent = result["summary"], list(result["turns"])
+            history.append((question, result["answer"]))
+    asked = len(totals)
+    tail = max(1, args.chat_turns // 4)
+    last = [tokens for i, tokens in enumerate(bounded) if i % args.chat_turns >= args.chat_turns - tail]
+    last_unbounded = [tokens for i, tokens in enumerate(unbounded) if i % args.chat_turns >= args.chat_turns - tail]
+    return {
+        "chunks": len(store.vectorstore.index_to_docstore_id),
+        "conversations": args.chat_conversations,
+        "turns": args.chat_turns,
+        "run": latency_summary(totals),
+        "prompt_tokens_max": max(bounded, default=0),
+        "prompt_tokens_last_turns": statistics.mean(last) if last else 0.0,
+        "unbounded_prompt_tokens_last_turns": statistics.mean(last_unbounded) if last_unbounded else 0.0,
+        "reuse_rate": reused / asked if asked else 0.0,
+        "condense_calls": condensed,
+        "summary_calls": summarized,
+    }
+
+
+def bench_ratelimit(args)->Dict:
+    """Interactive questions arriving during a background burst, against a rate-limited mock endpoint, with and without the scheduler"""
+    from langchain_openai import ChatOpenAI
+
+    def scenario(scheduled:bool)->Dict:
+        server = MockOpenAIServer(
+            requests_per_minute=args.rl_rpm, tokens_per_minute=args.rl_tpm, burst_seconds=1.0, latency=args.rl_latency
+        ).start()
+        scheduler = RequestScheduler(
+            name="bench",
+            requests_per_minute=args.rl_rpm,
+            tokens_per_minute=args.rl_tpm,
+            burst_seconds=1.0,
+            interactive_max_wait=args.rl_max_wait,
+            completion_tokens=64,
+            registry=MetricsRegistry(),
+        ) if scheduled else None
+        llm = ChatOpenAI(
+            model="gpt-4o-mini", api_key="offline-benchmark", base_url=server.base_url,
+            **(scheduler.client_kwargs() if scheduled else {}),
+        )
+
+        def call(priority:Priority)->Optional[float]:
+            start = time.perf_counter()
+            try:
+                with request_priority(priority):
+                    llm.invoke("Summarize the runbook for kafka consumer lag")
+            except Exception:
+                return None
+            return time.perf_counter() - start
+
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=8) as background_pool:
+                background = [background_pool.submit(call, Priority.BACKGROUND) for _ in range(args.rl_background)]
+                time.sleep(0.2)
+                with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                    interactive = list(pool.map(call, [Priority.INTERACTIVE] * (args.concurrency * args.rl_requests)))
+                background = [future.result() for future in background]
+            wall = time.perf_counter() - start
+        finally:
+            server.stop()
+        served = [seconds for seconds in interactive if seconds is not None]
+        row = {
+            "wall_seconds": wall,
+            "provider_429s": server.throttled,
+            "interactive_failed": len(interactive) - len(served),
+            "background_failed": sum(seconds is None for seconds in background),
+            "interactive": latency_summary(served) if served else {},
+        }
+        if scheduler is not None:
+            stats = scheduler.stats()
+            row.update(rejected=stats["rejected"], retries=stats["retries"])
+        return row
+
+    return {
+        "rpm": args.rl_rpm,
+        "interactive_requests": args.concurrency * args.rl_requests,
+        "background_requests": args.rl_background,
+        "unscheduled": scenario(False),
+        "scheduled": scenario(True),
+    }
+
+
+def git_commit()->Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv:Optional[List[str]]=None):
+    parser = argparse.ArgumentParser(description="Offline RAG benchmarks")
+    parser.add_argument("--sizes", default="50,200,1000", help="Comma-separated corpus sizes in pages")
+    parser.add_argument("--index-types", default="flat,hnsw", help="Comma-separated ANN index types")
+    parser.add_argument("--queries", type=int, default=50, help="Queries per retrieval benchmark")
+    parser.add_argument("--graph-queries", type=int, default=10, help="Questions per graph/ReAct benchmark")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--splitter", default="offset", choices=["offset", "recursive"], help="Text splitter used by the ingest pipeline")
+    parser.add_argument("--loader-workers", type=int, default=8)
+    parser.add_argument("--per-host-limit", type=int, default=8)
+    parser.add_argument("--web-latency", type=float, default=0.0, help="Seconds added to every fixture response")
+    parser.add_argument("--boilerplate", type=int, default=0, help="Shared paragraphs added to the top and bottom of every fixture page")
+    parser.add_argument("--dedup-threshold", type=float, default=0.9, help="Near-duplicate threshold of the ingest dedup stage; 0 disables it")
+    parser.add_argument("--wiki-latency", type=float, default=0.0, help="Further seconds added to fake Wikipedia responses")
+    parser.add_argument("--tool-timeout", type=float, default=10.0, help="Deadline of the wikipedia tool in seconds")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Seconds per embedding call")
+    parser.add_argument("--embed-max-concurrent", type=int, default=0, help="Embedding requests served at once (provider limit); 0 for no limit")
+    parser.add_argument("--embed-batch-size", type=int, default=256)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--refresh-changed", type=float, default=0.05, help="Fraction of pages revised before the incremental refresh")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent callers in the concurrency benchmark")
+    parser.add_argument("--query-batch-size", type=int, default=16)
+    parser.add_argument("--query-batch-wait-ms", type=float, default=5.0)
+    parser.add_argument("--query-batch-in-flight", type=int, default=4, help="Query batches embedded and searched at once")
+    parser.add_argument("--rl-rpm", type=float, default=1200, help="Requests per minute of the mock rate-limited endpoint")
+    parser.add_argument("--rl-tpm", type=float, default=1_000_000, help="Tokens per minute of the mock rate-limited endpoint")
+    parser.add_argument("--rl-latency", type=float, default=0.05, help="Seconds per mock endpoint request")
+    parser.add_argument("--rl-background", type=int, default=80, help="Background requests in flight when interactive ones arrive")
+    parser.add_argument("--rl-requests", type=int, default=2, help="Interactive requests per concurrent caller")
+    parser.add_argument("--rl-max-wait", type=float, default=5.0, help="Maximum queueing seconds of an interactive request")
+    parser.add_argument("--llm-ttft", type=float, default=0.05, help="Fake model time to first token")
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--answer-tokens", type=int, default=20)
+    parser.add_argument("--react-tool-calls", type=int, default=2)
+    parser.add_argument("--parallel-tool-calls", action="store_true", help="Call every tool in each agent turn")
+    parser.add_argument("--chat-conversations", type=int, default=2, help="Conversations in the chat benchmark")
+    parser.add_argument("--chat-turns", type=int, default=24, help="Turns per conversation in the chat benchmark")
+    parser.add_argument("--memory-summary-tokens", type=int, default=300)
+    parser.add_argument("--memory-history-tokens", type=int, default=800)
+    parser.add_argument("--skip", default="", help="Comma-separated benchmarks to skip: ingest,refresh,index,concurrency,graph,react,chat,ratelimit")
+    parser.add_argument("--out", type=Path, default=None, help="Output JSON path")
+    return parser.parse_args(argv)
+
+
+def main(argv:Optional[List[str]]=None)->Path:
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    index_types = [name for name in args.index_types.split(",") if name]
+    skip = set(args.skip.split(","))
+    results:Dict[str, List[Dict]] = {"ingest": [], "refresh": [], "index": [], "concurrency": [], "graph": [], "react": [], "chat": [], "ratelimit": []}
+
+    server = FixtureServer(latency=args.web_latency, wiki_latency=args.wiki_latency, boilerplate=args.boilerplate).start()
+    try:
+        for pages in sizes:
+            print(f"▶ corpus of {pages} pages")
+            ingest, chunks = bench_ingest(server, pages, args)
+            if "ingest" not in skip:
+                results["ingest"].append(ingest)
+                print(f"   ingest: {ingest['pages_per_sec']:.1f} pages/s, {ingest['chunks']} chunks")
+                print(
+                    f"   split: recursive {ingest['split_recursive_seconds'] * 1000:.1f} ms, "
+                    f"offset {ingest['split_offset_seconds'] * 1000:.1f} ms"
+                )
+                if "dedup" in ingest:
+                    print(
+                        f"   dedup: {ingest['dedup']['embeddings_saved']} duplicates "
+                        f"({ingest['dedup']['exact']} exact), {ingest['dedup']['chunks_per_sec']:.0f} chunks/s"
+                    )
+
+            if "refresh" not in skip:
+                row = bench_refresh(server, pages, args)
+                results["refresh"].append(row)
+                print(
+                    f"   refresh: initial {row['initial_seconds']:.2f}s, no-op {row['noop_seconds']:.2f}s, "
+                    f"{row['changed_pages']} pages changed {row['incremental_seconds']:.2f}s "
+                    f"(+{row['chunks_added']} / -{row['chunks_removed']} chunks, {row['chunks_kept']} kept)"
+                )
+
+            queries = questions(args.queries, pages)
+            store = None
+            for index_type in index_types:
+                row, built = bench_index(chunks, index_type, queries, args)
+                store = store or built
+                if "index" not in skip:
+                    results["index"].append(row)
+                    print(f"   index {index_type}: build {row['build_seconds']:.2f}s, query p50 {row['query']['p50_ms']:.2f}ms")
+
+            if "concurrency" not in skip:
+                row = bench_concurrency(store, queries, args)
+                results["concurrency"].append(row)
+                print(
+                    f"   concurrency x{row['concurrency']}: {row['unbatched']['queries_per_sec']:.0f} → "
+                    f"{row['batched']['queries_per_sec']:.0f} q/s, p99 {row['unbatched']['latency']['p99_ms']:.1f} → "
+                    f"{row['batched']['latency']['p99_ms']:.1f}ms (mean batch {row['batched']['mean_batch_size']:.1f})"
+                )
+
+            graph_queries = questions(args.graph_queries, pages)
+            if "graph" not in skip:
+                row = bench_graph(store, graph_queries, args)
+                results["graph"].append(row)
+                print(f"   graph: run p50 {row['run']['p50_ms']:.1f}ms, overhead p50 {row['overhead']['p50_ms']:.1f}ms")
+            if "react" not in skip:
+                row = bench_react(store, server, graph_queries, args)
+                results["react"].append(row)
+                print(f"   react: run p50 {row['run']['p50_ms']:.1f}ms, tools+overhead p50 {row['tools_and_overhead']['p50_ms']:.1f}ms")
+            if "chat" not in skip:
+                row = bench_chat(store, graph_queries, args)
+                results["chat"].append(row)
+                print(
+                    f"   chat: {row['turns']} turns, answer prompt {row['prompt_tokens_last_turns']:.0f} tokens on the last turns "
+                    f"(max {row['prompt_tokens_max']}, {row['unbounded_prompt_tokens_last_turns']:.0f} with full history), "
+                    f"reuse {row['reuse_rate']:.0%}, {row['condense_calls']} condense / {row['summary_calls']} summary calls, "
+                    f"run p50 {row['run']['p50_ms']:.1f}ms"
+                )
+    finally:
+        server.stop()
+
+    if "ratelimit" not in skip:
+        row = bench_ratelimit(args)
+        results["ratelimit"].append(row)
+        for mode in ("unscheduled", "scheduled"):
+            print(
+                f"▶ rate limit {mode}: {row[mode]['provider_429s']} provider 429s, "
+                f"{row[mode]['interactive_failed']} / {row['interactive_requests']} interactive and "
+                f"{row[mode]['background_failed']} / {row['background_requests']} background requests failed, "
+                f"interactive p95 {row[mode]['interactive'].get('p95_ms', 0.0):.0f}ms"
+            )
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {key: str(value) for key, value in vars(args).items()},
+        },
+        "results": results,
+    }
+    out = args.out or RESULTS_DIR / f"bench-{commit or 'local'}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"📊 Results written to {out}")
+    return out
+
+
+if __name__ == "__main__":
+    main()
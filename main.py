@@ -1,18 +1,35 @@
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional
 from pathlib import Path
+import time
+import uuid
+
+_import_start = time.perf_counter()
 
 from aiops_rag_databricksapp.config import AIConfigSettings, AIConfig
 settings = AIConfig()
 settings.activate_LLM_environment
 
 from aiops_rag_databricksapp.store import VectorStore
+from aiops_rag_databricksapp.sharding import ShardedVectorStore
+from aiops_rag_databricksapp.ann import ANNConfig, format_report
 from aiops_rag_databricksapp.ingest import DocumentProcessor
+from aiops_rag_databricksapp.pipeline import IngestPipeline
+from aiops_rag_databricksapp.dedup import NearDuplicateFilter
+from aiops_rag_databricksapp.refresh import IncrementalRefresher, RefreshReport
 from aiops_rag_databricksapp.rag_graph import RAGGraphBuilder
+from aiops_rag_databricksapp.semantic_cache import SemanticCache
+from aiops_rag_databricksapp.context import ContextPacker
 from aiops_rag_databricksapp.rag_node import RAGNodes
 from aiops_rag_databricksapp.rag_react_node import ReActRAGNodes
+from aiops_rag_databricksapp.router import QueryRouter
+from aiops_rag_databricksapp.memory import ConversationMemory, SessionCheckpointer
+from aiops_rag_databricksapp.tools import ToolPolicy
+from aiops_rag_databricksapp.scheduler import RequestScheduler
+from aiops_rag_databricksapp.lifecycle import StartupProfile, import_runtime
+from aiops_rag_databricksapp.metrics import REGISTRY, configure_trace_log, serve_metrics
 
-from langchain_openai import ChatOpenAI
+_import_seconds = time.perf_counter() - _import_start
 
 @dataclass
 class AgenticRAG:
@@ -24,51 +41,281 @@ class AgenticRAG:
 
         self.urls = self.urls or self.config.settings.default_urls
         self.llm_model:str = self.config.llm_model
-        self.llm:ChatOpenAI = ChatOpenAI(model=self.llm_model)
+        # Shared admission control for each model's provider rate limits
+        self.llm_scheduler = RequestScheduler(
+            name="llm",
+            requests_per_minute=self.config.settings.llm_requests_per_minute,
+            tokens_per_minute=self.config.settings.llm_tokens_per_minute,
+            burst_seconds=self.config.settings.rate_limit_burst_seconds,
+            background_reserve=self.config.settings.rate_limit_background_reserve,
+            max_queue=self.config.settings.rate_limit_max_queue,
+            interactive_max_wait=self.config.settings.rate_limit_max_wait,
+            max_retries=self.config.settings.rate_limit_max_retries,
+        ) if self.config.settings.rate_limit_enabled else None
+        self.embedding_scheduler = RequestScheduler(
+            name="embedding",
+            requests_per_minute=self.config.settings.embedding_requests_per_minute,
+            tokens_per_minute=self.config.settings.embedding_tokens_per_minute,
+            burst_seconds=self.config.settings.rate_limit_burst_seconds,
+            background_reserve=self.config.settings.rate_limit_background_reserve,
+            max_queue=self.config.settings.rate_limit_max_queue,
+            interactive_max_wait=self.config.settings.rate_limit_max_wait,
+            max_retries=self.config.settings.rate_limit_max_retries,
+        ) if self.config.settings.rate_limit_enabled else None
+        from langchain_openai import ChatOpenAI
+        self.llm:ChatOpenAI = ChatOpenAI(
+            model=self.llm_model,
+            stream_usage=True,
+            **(self.llm_scheduler.client_kwargs() if self.llm_scheduler else {}),
+        )
+        self.graph_builder:Optional[RAGGraphBuilder] = None
         self.doc_processor = DocumentProcessor(
             chunk_size=self.config.settings.chunk_size,
-            chunk_overlap=self.config.settings.chunk_overlap
+            chunk_overlap=self.config.settings.chunk_overlap,
+            data_dir=self.config.settings.data_dir or None,
+            max_workers=self.config.settings.loader_max_workers,
+            per_host_limit=self.config.settings.loader_per_host_limit,
+            url_timeout=self.config.settings.url_timeout,
+            url_retries=self.config.settings.url_retries,
+            pdf_workers=self.config.settings.pdf_workers,
+            splitter_mode=self.config.settings.text_splitter,
+            length_unit=self.config.settings.chunk_length_unit,
+            tokenizer_model=self.config.settings.llm_model,
+        )
+        self.vector_store = VectorStore(
+            embedding_model=self.config.settings.embedding_model,
+            embedding_cache_path=self.config.settings.embedding_cache_path or None,
+            embedding_cache_max_mb=self.config.settings.embedding_cache_max_mb,
+            embedding_cache_dtype=self.config.settings.embedding_cache_dtype,
+            retrieval_mode=self.config.settings.retrieval_mode,
+            retrieval_k=self.config.settings.retrieval_k,
+            retrieval_fetch_k=self.config.settings.retrieval_fetch_k,
+            retrieval_mmr_lambda=self.config.settings.retrieval_mmr_lambda,
+            retrieval_source_cap=self.config.settings.retrieval_source_cap,
+            retrieval_score_threshold=self.config.settings.retrieval_score_threshold,
+            query_batch_size=self.config.settings.query_batch_size,
+            query_batch_wait_ms=self.config.settings.query_batch_wait_ms,
+            query_batch_in_flight=self.config.settings.query_batch_in_flight,
+            scheduler=self.embedding_scheduler,
+            ann=ANNConfig(
+                index_type=self.config.settings.index_type,
+                storage=self.config.settings.index_storage,
+                nlist=self.config.settings.ivf_nlist,
+                nprobe=self.config.settings.ivf_nprobe,
+                pq_m=self.config.settings.pq_m,
+                pq_bits=self.config.settings.pq_bits,
+                hnsw_m=self.config.settings.hnsw_m,
+                ef_construction=self.config.settings.hnsw_ef_construction,
+                ef_search=self.config.settings.hnsw_ef_search,
+                train_size=self.config.settings.index_train_size,
+            ),
         )
-        self.vector_store = VectorStore()
+        if self.config.settings.sharding_enabled:
+            self.vector_store = ShardedVectorStore(
+                template=self.vector_store, max_workers=self.config.settings.shard_workers
+            )
+        self.semantic_cache = SemanticCache(
+            embeddings=self.vector_store.embedding,
+            threshold=self.config.settings.semantic_cache_threshold,
+            ttl_seconds=self.config.settings.semantic_cache_ttl_seconds,
+            max_entries=self.config.settings.semantic_cache_max_entries,
+        ) if self.config.settings.semantic_cache_enabled else None
+        if self.semantic_cache is not None:
+            REGISTRY.register_collector("semantic_cache", self.semantic_cache.stats)
+        REGISTRY.register_collector("embedding_cache", self.vector_store.embedding_cache_stats)
+        if getattr(self.vector_store, "dispatcher", None) is not None:
+            REGISTRY.register_collector("query_batching", self.vector_store.dispatcher.stats)
+        for scheduler in (self.llm_scheduler, self.embedding_scheduler):
+            if scheduler is not None:
+                REGISTRY.register_collector(f"{scheduler.name}_scheduler", scheduler.stats)
+        if self.config.settings.metrics_port:
+            serve_metrics(self.config.settings.metrics_port)
+        if self.config.settings.trace_log_path:
+            configure_trace_log(self.config.settings.trace_log_path)
     
-    def initialise_vectorestore(self):
-        """Setup vector store with processed documents"""
+    def initialise_vectorestore(self, rebuild:bool=False):
+        """Load the persisted vector store, or build and persist it"""
+        index_dir = Path(self.config.settings.index_dir)
+        if not rebuild and self.vector_store.index_exists(index_dir):
+            print(f"📦 Loading vector store from {index_dir}...")
+            manifest = self.vector_store.load_vectorstore(index_dir)
+            print(
+                f"🔍 Vector store loaded ({manifest['num_vectors']} chunks, "
+                f"{manifest.get('index_factory', 'Flat')} index, corpus {manifest['corpus_version']})"
+            )
+            if self.semantic_cache is not None:
+                self.semantic_cache.set_corpus_version(manifest['corpus_version'])
+            return
         print(f"📄 Processing {len(self.urls)} URLs...")
-        documents = self.doc_processor.process_urls(self.urls)
-        print(f"📊 Created {len(documents)} document chunks")
-        print("🔍 Creating vector store...")
-        self.vector_store.create_vectorstore(documents)
-        print("🔍 Vector store initialised...")
+        pipeline = IngestPipeline(
+            processor=self.doc_processor,
+            store=self.vector_store,
+            embed_batch_size=self.config.settings.embed_batch_size,
+            queue_size=self.config.settings.ingest_queue_size,
+            dedup=NearDuplicateFilter(
+                threshold=self.config.settings.dedup_threshold,
+                num_perm=self.config.settings.dedup_num_perm,
+            ) if self.config.settings.dedup_enabled else None,
+            on_progress=lambda stats: print(
+                f"   ⏳ {stats.documents} docs → {stats.chunks} chunks indexed ({stats.chunks_per_sec:.1f} chunks/s)"
+            ),
+        )
+        stats = pipeline.run(self.urls)
+        for timing in self.doc_processor.last_timings:
+            print(f"   ⏱️ {timing.source}: {timing.documents} docs in {timing.seconds:.2f}s ({timing.attempts} attempt(s))")
+        print(f"📊 Indexed {stats.chunks} document chunks in {stats.seconds:.1f}s")
+        if stats.duplicates:
+            print(f"🧹 Collapsed {stats.duplicates} near-duplicate chunks ({stats.duplicates} embeddings, {stats.duplicate_chars:,} chars saved)")
+        manifest = self.vector_store.save_vectorstore(
+            index_dir, corpus_version=self.config.settings.corpus_version or None
+        )
+        print(f"🔍 Vector store initialised and saved to {index_dir} (corpus {manifest['corpus_version']})")
+        if self.semantic_cache is not None:
+            self.semantic_cache.set_corpus_version(manifest['corpus_version'])
         
     
-    def build_agentic_rag_graph(self, question:str):
+    def refresh(self)->RefreshReport:
+        """Incrementally refresh the live index from its sources, dropping answers cached against the old corpus"""
+        def invalidate(report:RefreshReport):
+            if self.semantic_cache is not None:
+                self.semantic_cache.set_corpus_version(report.corpus_version)
+            if self.graph_builder is not None and self.graph_builder.agent is not None:
+                self.graph_builder.agent.executor.clear_cache()
+
+        report = IncrementalRefresher(
+            processor=self.doc_processor,
+            store=self.vector_store,
+            index_dir=self.config.settings.index_dir,
+            embed_batch_size=self.config.settings.embed_batch_size,
+            corpus_version=self.config.settings.corpus_version or None,
+            on_change=invalidate,
+            dedup=NearDuplicateFilter(
+                threshold=self.config.settings.dedup_threshold,
+                num_perm=self.config.settings.dedup_num_perm,
+            ) if self.config.settings.dedup_enabled else None,
+        ).run(self.urls)
+        print(
+            f"🔄 Refreshed {report.sources} sources in {report.seconds:.1f}s: "
+            f"{len(report.changed)} changed, {len(report.removed)} removed, {len(report.failed)} failed | "
+            f"+{report.chunks_added} / -{report.chunks_removed} chunks (corpus {report.corpus_version})"
+        )
+        return report
+    
+    def ann_report(self, k:int=10):
+        """Print recall@k and latency of the configured index type against exact search"""
+        print(f"📐 ANN recall@{k} vs exact search over {self.vector_store.manifest['num_vectors']} vectors:")
+        print(format_report(self.vector_store.ann_report(k=k)) + "\n")
+    
+    def build_agentic_rag_graph(self)->RAGGraphBuilder:
+        """Build and compile the graph once; later calls reuse it"""
+        if self.graph_builder is not None:
+            return self.graph_builder
+        settings = self.config.settings
+        router = QueryRouter(
+            min_top_score=settings.route_min_top_score,
+            confident_score=settings.route_confident_score,
+            min_term_overlap=settings.route_min_term_overlap,
+        ) if settings.routing_enabled else None
+        agent = ReActRAGNodes(
+            retriever=self.vector_store.get_retriever(),
+            llm=self.llm,
+            tool_policies={name: ToolPolicy(timeout=settings.tool_timeout_seconds) for name in ("retriever", "wikipedia")},
+            max_steps=settings.agent_max_steps,
+            time_budget=settings.agent_time_budget,
+        ) if router is not None else None
+        memory = ConversationMemory(
+            llm=self.llm,
+            model=settings.llm_model,
+            summary_token_budget=settings.memory_summary_token_budget,
+            history_token_budget=settings.memory_history_token_budget,
+            reuse_overlap=settings.memory_reuse_overlap,
+        ) if settings.memory_enabled else None
         self.graph_builder=RAGGraphBuilder(
             retriever=self.vector_store.get_retriever(),
-            llm=self.llm
+            llm=self.llm,
+            cache=self.semantic_cache,
+            packer=ContextPacker(
+                model=settings.llm_model,
+                token_budget=settings.context_token_budget,
+                duplicate_threshold=settings.context_duplicate_threshold,
+            ),
+            router=router,
+            agent=agent,
+            memory=memory,
+            checkpointer=SessionCheckpointer(max_sessions=settings.memory_max_sessions) if memory is not None else None,
         )
         self.graph_builder.build()
         print("✅ System initialized successfully!\n")
-        return self.graph_builder.run(question=question)
+        return self.graph_builder
     
-    def ask(self, question:str)->str:
+    def warm_up(self):
+        """Compile the graph and warm the embeddings client and index before the first question"""
+        self.build_agentic_rag_graph().warm_up()
+    
+    def start(self, profile:StartupProfile, rebuild:bool=False)->StartupProfile:
+        """
+        Run the start-up lifecycle, timing each phase
+        
+        Args:
+            profile: Profile the phases are recorded into
+            rebuild: Rebuild the index instead of loading it
+            
+        Returns:
+            The profile with index_load, graph_compile and warm_up recorded
+        """
+        with profile.phase("index_load"):
+            self.initialise_vectorestore(rebuild=rebuild)
+        with profile.phase("graph_compile"):
+            self.build_agentic_rag_graph()
+        with profile.phase("warm_up"):
+            self.warm_up()
+        return profile
+    
+    def ask(self, question:str, thread_id:Optional[str]=None)->str:
         """
-        Ask a question to the RAG system
+        Ask a question to the RAG system, printing the answer as it streams
         
         Args:
             question: User question
+            thread_id: Conversation the question follows up on; None asks it on its own
             
         Returns:
             Generated answer
         """
         print(f"❓ Question: {question}\n")
         print("🤔 Processing...")
-        result = self.build_agentic_rag_graph(question=question)
-        answer = result['answer']
-        print(f"✅ Answer: {answer}\n")
+        graph_builder = self.build_agentic_rag_graph()
+        answer = ""
+        streaming = False
+        for event in graph_builder.stream(question, thread_id=thread_id):
+            if event["type"] == "sources":
+                print(f"📄 Retrieved {len(event['retrieved_docs'])} source documents")
+            elif event["type"] == "route":
+                print(f"🧭 Route: {event['route']} ({event['reason']})")
+            elif event["type"] == "token":
+                if not streaming:
+                    print("✅ Answer: ", end="", flush=True)
+                    streaming = True
+                print(event["content"], end="", flush=True)
+            elif event["type"] == "done":
+                answer = event["answer"]
+                if event["query"] and event["query"] != question:
+                    print(f"\n\n🔎 Searched for: {event['query']}", end="")
+                print(f"\n\n⏱️ First token: {event['time_to_first_token']:.2f}s | Total: {event['total_time']:.2f}s")
+                breakdown = event["trace"].breakdown()
+                print("   " + " | ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in breakdown.items()))
+                if self.semantic_cache is not None:
+                    stats = self.semantic_cache.stats()
+                    print(
+                        f"⚡ Semantic cache: {'hit' if event['cached'] else 'miss'} | "
+                        f"hit rate {stats['hit_rate']:.0%} | saved {stats['latency_saved']:.1f}s\n"
+                    )
         return answer   
     
     def agentic_chat(self):
-        print("💬 Agentic Chat Mode - Type 'quit' to exit\n")
+        print("💬 Agentic Chat Mode - Type 'quit' to exit, ':refresh' to refresh the index, ':new' to start a new conversation\n")
+        graph_builder = self.build_agentic_rag_graph()
+        thread_id = uuid.uuid4().hex if graph_builder.memory is not None else None
         
         while True:
             question = input("Enter your question: ").strip()
@@ -77,8 +324,19 @@ class AgenticRAG:
                 print("👋 Goodbye!")
                 break
             
+            if question == ":refresh":
+                self.refresh()
+                continue
+            
+            if question == ":new":
+                if thread_id is not None:
+                    graph_builder.forget(thread_id)
+                    thread_id = uuid.uuid4().hex
+                print("🧹 Started a new conversation\n")
+                continue
+            
             if question:
-                self.ask(question)
+                self.ask(question, thread_id=thread_id)
                 print("-" * 80 + "\n")
     
 def main():
@@ -92,8 +350,15 @@ def main():
             urls = [line.strip() for line in f if line.strip()]
     
     # Initialize RAG system
-    rag = AgenticRAG(urls=urls)
-    rag.initialise_vectorestore()
+    profile = StartupProfile()
+    profile.record("import", _import_seconds)
+    with profile.phase("import"):
+        import_runtime()
+    with profile.phase("config"):
+        rag = AgenticRAG(urls=urls)
+    rag.start(profile)
+    print("🚀 Startup breakdown:")
+    print(profile.report() + "\n")
     
     # Example questions
     example_questions = [
@@ -0,0 +1,238 @@
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+import math
+import time
+
+import numpy as np
+
+from dataclasses import dataclass, replace
+
+if TYPE_CHECKING:
+    import faiss
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+VECTOR_STORAGE = ("float32", "float16", "sq8")
+# Training points per IVF centroid / PQ code faiss asks for
+_POINTS_PER_CENTROID = 39
+
+_STORAGE_CODES = {"float32": "Flat", "float16": "SQfp16", "sq8": "SQ8"}
+
+
+@dataclass
+class ANNConfig:
+    """
+    FAISS index type and search parameters
+    ---
+
+    `flat` is exact search; `ivf_flat` and `ivf_pq` partition the vectors
+    into `nlist` inverted lists of which `nprobe` are scanned per query
+    (`ivf_pq` additionally compresses vectors to `pq_m` codes of
+    `pq_bits` bits); `hnsw` is a graph index whose query-time breadth is
+    `ef_search`. `storage` keeps flat/IVF-Flat/HNSW vectors as float32,
+    float16 or 8-bit scalar-quantized codes.
+
+    Args:
+        index_type: One of "flat", "ivf_flat", "ivf_pq", "hnsw"
+        storage: One of "float32", "float16", "sq8" (ignored by ivf_pq)
+        nlist: Number of IVF lists; capped by the training sample size
+        nprobe: IVF lists scanned per query
+        pq_m: PQ sub-quantizers; must divide the embedding dimension
+        pq_bits: Bits per PQ code
+        hnsw_m: HNSW neighbours per node
+        ef_construction: HNSW build-time breadth
+        ef_search: HNSW query-time breadth
+        train_size: Vectors buffered to train the index before it accepts additions
+    """
+    index_type:str = "flat"
+    storage:str = "float32"
+    nlist:int = 1024
+    nprobe:int = 16
+    pq_m:int = 16
+    pq_bits:int = 8
+    hnsw_m:int = 32
+    ef_construction:int = 40
+    ef_search:int = 64
+    train_size:int = 50_000
+
+    def __post_init__(self):
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{self.index_type}'; expected one of {INDEX_TYPES}.")
+        if self.storage not in VECTOR_STORAGE:
+            raise ValueError(f"Unknown vector storage '{self.storage}'; expected one of {VECTOR_STORAGE}.")
+
+    @property
+    def requires_training(self)->bool:
+        """Whether the index must be trained on a sample before vectors are added"""
+        return self.index_type in ("ivf_flat", "ivf_pq") or self.storage == "sq8"
+
+    def factory_string(self, dimension:int, n_train:int=0)->str:
+        """
+        `faiss.index_factory` description of the index
+
+        Args:
+            dimension: Embedding dimension
+            n_train: Size of the training sample, used to cap nlist and pq_bits
+        """
+        storage = _STORAGE_CODES[self.storage]
+        if self.index_type == "flat":
+            return storage
+        if self.index_type == "hnsw":
+            return f"HNSW{self.hnsw_m},{storage}"
+
+        nlist = self.nlist
+        if n_train:
+            nlist = max(1, min(nlist, n_train // _POINTS_PER_CENTROID))
+        if self.index_type == "ivf_flat":
+            return f"IVF{nlist},{storage}"
+
+        if dimension % self.pq_m:
+            raise ValueError(f"pq_m={self.pq_m} does not divide the embedding dimension {dimension}.")
+        bits = self.pq_bits
+        if n_train:
+            bits = max(1, min(bits, int(math.log2(max(2, n_train // _POINTS_PER_CENTROID)))))
+        return f"IVF{nlist},PQ{self.pq_m}x{bits}"
+
+    def build(self, dimension:int, sample:Optional[np.ndarray]=None)->"faiss.Index":
+        """
+        Create an empty index, trained on `sample` if the type needs it
+
+        Args:
+            dimension: Embedding dimension
+            sample: Training vectors, required when `requires_training`
+        """
+        import faiss
+
+        n_train = 0 if sample is None else len(sample)
+        index = faiss.index_factory(dimension, self.factory_string(dimension, n_train))
+        if self.index_type == "hnsw":
+            index.hnsw.efConstruction = self.ef_construction
+        if not index.is_trained:
+            if sample is None or len(sample) == 0:
+                raise ValueError(f"Index type '{self.index_type}' with '{self.storage}' storage needs a training sample.")
+            index.train(np.ascontiguousarray(sample, dtype=np.float32))
+        enable_reconstruct(index)
+        self.apply_search_params(index)
+        return index
+
+    def apply_search_params(self, index:"faiss.Index"):
+        """Set the query-time knobs (nprobe / efSearch) on a built or loaded index"""
+        import faiss
+
+        params = faiss.ParameterSpace()
+        if self.index_type in ("ivf_flat", "ivf_pq"):
+            params.set_index_parameter(index, "nprobe", self.nprobe)
+        elif self.index_type == "hnsw":
+            params.set_index_parameter(index, "efSearch", self.ef_search)
+
+
+def enable_reconstruct(index:"faiss.Index"):
+    """Keep an id -> list map on IVF indexes so stored vectors can be reconstructed for re-ranking"""
+    import faiss
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+
+
+def index_bytes(index:"faiss.Index")->int:
+    """Serialized size of an index, a proxy for its memory footprint"""
+    import faiss
+
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def recall_report(
+    vectors:np.ndarray,
+    configs:Sequence[ANNConfig],
+    k:int=10,
+    n_queries:int=200,
+    seed:int=0,
+)->List[Dict]:
+    """
+    Measure recall@k and query latency of index configurations against exact search
+
+    A random sample of `vectors` is held out as queries; every
+    configuration is built on the rest and compared with a flat
+    float32 index over the same vectors.
+
+    Args:
+        vectors: Corpus embeddings
+        configs: Index configurations to compare
+        k: Neighbours per query
+        n_queries: Held-out query vectors
+        seed: Sampling seed
+
+    Returns:
+        One row per configuration with index, recall, latency, build time and size
+    """
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(vectors))
+    n_queries = min(n_queries, max(1, len(vectors) // 10))
+    queries, base = vectors[order[:n_queries]], vectors[order[n_queries:]]
+    k = min(k, len(base))
+
+    exact = faiss.IndexFlatL2(base.shape[1])
+    exact.add(base)
+    _, truth = exact.search(queries, k)
+
+    rows:List[Dict] = []
+    for config in configs:
+        start = time.perf_counter()
+        sample = None
+        if config.requires_training:
+            sample = base[rng.permutation(len(base))[:config.train_size]]
+        index = config.build(base.shape[1], sample)
+        index.add(base)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, found = index.search(queries, k)
+        search_seconds = time.perf_counter() - start
+
+        hits = sum(len(set(found[i]) & set(truth[i])) for i in range(len(queries)))
+        rows.append({
+            "index": index_description(config, base.shape[1], 0 if sample is None else len(sample)),
+            "recall": hits / (len(queries) * k),
+            "latency_ms": 1000 * search_seconds / len(queries),
+            "build_seconds": build_seconds,
+            "bytes": index_bytes(index),
+        })
+    return rows
+
+
+def index_description(config:ANNConfig, dimension:int, n_train:int=0)->str:
+    """Factory string plus the query-time knob, e.g. "IVF64,Flat nprobe=8\""""
+    description = config.factory_string(dimension, n_train)
+    if config.index_type in ("ivf_flat", "ivf_pq"):
+        description += f" nprobe={config.nprobe}"
+    elif config.index_type == "hnsw":
+        description += f" efSearch={config.ef_search}"
+    return description
+
+
+def default_sweep(config:ANNConfig)->List[ANNConfig]:
+    """Exact baseline plus `config` at a range of nprobe / efSearch settings"""
+    sweep = [ANNConfig()]
+    if config.index_type in ("ivf_flat", "ivf_pq"):
+        sweep += [replace(config, nprobe=n) for n in (1, 4, 16, 64) if n <= config.nlist]
+    elif config.index_type == "hnsw":
+        sweep += [replace(config, ef_search=ef) for ef in (16, 64, 256)]
+    elif config.storage != "float32":
+        sweep.append(config)
+    return sweep
+
+
+def format_report(rows:List[Dict])->str:
+    """Fixed-width table of `recall_report` rows"""
+    lines = [f"   {'index':<32} {'recall':>7} {'ms/query':>9} {'build s':>8} {'MB':>8}"]
+    for row in rows:
+        lines.append(
+            f"   {row['index']:<32} {row['recall']:7.3f} {row['latency_ms']:9.3f} "
+            f"{row['build_seconds']:8.2f} {row['bytes'] / 1e6:8.1f}"
+        )
+    return "\n".join(lines)
+
+if __name__=="__main__":
+    __all__=["ANNConfig","enable_reconstruct","recall_report","default_sweep","format_report","index_bytes","index_description"]
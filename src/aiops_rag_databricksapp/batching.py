@@ -0,0 +1,216 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import Context, copy_context
+import threading
+import time
+
+import numpy as np
+
+from aiops_rag_databricksapp.metrics import REGISTRY, MetricsRegistry, RequestTrace, current_trace, span
+
+from dataclasses import dataclass, field
+
+
+@dataclass
+class _Request:
+    query:str
+    fetch_k:int
+    vector:Optional[np.ndarray]
+    vectorstore:Any
+    future:Future = field(default_factory=Future)
+    arrived:float = field(default_factory=time.perf_counter)
+    # The caller's context (request priority, request trace), captured on the caller's thread
+    context:Context = field(default_factory=copy_context)
+    trace:Optional[RequestTrace] = field(default_factory=current_trace)
+
+
+class QueryDispatcher:
+    """
+    Micro-batches concurrent queries against one `VectorStore`
+    ---
+
+    Callers from any thread (e.g. concurrent Streamlit sessions sharing
+    one graph) enqueue their query; dispatcher threads gather the queue
+    into batches, embed a batch's queries in one embeddings request, run
+    one FAISS search over the whole query matrix and hand every caller
+    its own query vector and candidate positions.
+
+    Up to `max_in_flight` batches are served at once: while one batch
+    waits on its embeddings request the next one is already gathered
+    and sent, so throughput keeps rising with load instead of being
+    capped at one batch per embedding round trip.
+
+    A batch runs in the context of its first caller, so its embeddings
+    request goes out with that caller's `request_priority`. The batch's
+    `batch_embed` and `batch_search` spans are added to the request
+    trace of every caller in it.
+
+    A batch is dispatched once it has `max_batch_size` queries or its
+    first query has waited `max_wait_ms`, which bounds the added latency.
+    While queries arrive further apart than the window (light load) a
+    batch is dispatched at once, so a lone user never waits; batches
+    still grow by themselves while the previous ones are being served.
+
+    Args:
+        store: Vector store whose embeddings client and index are used
+        max_batch_size: Maximum queries per batch
+        max_wait_ms: Longest a query waits for others to join its batch
+        max_in_flight: Batches embedded and searched concurrently
+        registry: Metrics registry for batch statistics
+    """
+
+    def __init__(
+        self,
+        store:Any,
+        max_batch_size:int=16,
+        max_wait_ms:float=5.0,
+        max_in_flight:int=4,
+        registry:MetricsRegistry=REGISTRY,
+    ):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}")
+        if max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be at least 1, got {max_in_flight}")
+        self.store = store
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_in_flight = max_in_flight
+        self.registry = registry
+        self._queue:"deque[_Request]" = deque()
+        self._cond = threading.Condition()
+        self._workers:List[threading.Thread] = []
+        self._idle = 0
+        self._last_arrival = 0.0
+        self._interval = float("inf")
+        self.batches = 0
+        self.queries = 0
+        self.max_seen = 0
+
+    def _ensure_worker(self):
+        """Start another dispatcher thread when none is idle, up to `max_in_flight`; called with the lock held"""
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+        if self._idle == 0 and len(self._workers) < self.max_in_flight:
+            worker = threading.Thread(target=self._run, name=f"query-dispatcher-{len(self._workers)}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def search(
+        self,
+        query:str,
+        fetch_k:int,
+        query_vector:Optional[np.ndarray]=None,
+        vectorstore:Any=None,
+    )->Tuple[np.ndarray, np.ndarray]:
+        """
+        Embed `query` (unless `query_vector` is given) and search the index, batched with concurrent callers
+
+        Args:
+            vectorstore: FAISS store to search, e.g. one pinned with `VectorStore.snapshot`; defaults to the live one
+
+        Returns:
+            The query vector and the positions of its `fetch_k` nearest vectors (-1 padded)
+        """
+        vectorstore = vectorstore or self.store.vectorstore
+        if vectorstore is None:
+            raise ValueError("Vector store not initialized. Call create_vectorstore first.")
+        request = _Request(query=query, fetch_k=fetch_k, vector=query_vector, vectorstore=vectorstore)
+        with self._cond:
+            now = request.arrived
+            if self._last_arrival:
+                # Smoothed inter-arrival time, the load signal for whether waiting pays off
+                gap = now - self._last_arrival
+                self._interval = gap if self._interval == float("inf") else 0.8 * self._interval + 0.2 * gap
+            self._last_arrival = now
+            self._queue.append(request)
+            self._ensure_worker()
+            self._cond.notify()
+        with span("batched_search"):
+            return request.future.result()
+
+    def _collect(self)->List[_Request]:
+        with self._cond:
+            self._idle += 1
+            try:
+                while True:
+                    while not self._queue:
+                        self._cond.wait()
+                    if self._interval <= self.max_wait:
+                        deadline = self._queue[0].arrived + self.max_wait
+                        while 0 < len(self._queue) < self.max_batch_size:
+                            remaining = deadline - time.perf_counter()
+                            if remaining <= 0:
+                                break
+                            self._cond.wait(remaining)
+                    # Another dispatcher thread may have taken the queue while this one waited
+                    if self._queue:
+                        count = min(len(self._queue), self.max_batch_size)
+                        return [self._queue.popleft() for _ in range(count)]
+            finally:
+                self._idle -= 1
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = batch[0].context.run(self._execute, batch)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
+
+    @staticmethod
+    @contextmanager
+    def _span(name:str, requests:List[_Request], **attributes:Any)->Iterator[None]:
+        """`span` over the active trace, also added to the traces of the batch's other callers"""
+        active = current_trace()
+        start = time.perf_counter()
+        with span(name, **attributes):
+            yield
+        seconds = time.perf_counter() - start
+        traces = {id(request.trace): request.trace for request in requests if request.trace is not None and request.trace is not active}
+        for trace in traces.values():
+            trace.add_span(name, start, seconds, **attributes)
+
+    def _execute(self, batch:List[_Request])->List[Tuple[np.ndarray, np.ndarray]]:
+        to_embed = [i for i, request in enumerate(batch) if request.vector is None]
+        vectors:List[Optional[np.ndarray]] = [request.vector for request in batch]
+        if to_embed:
+            with self._span("batch_embed", batch, batch=len(to_embed)):
+                embedded = self.store.embedding.embed_documents([batch[i].query for i in to_embed])
+            for i, vector in zip(to_embed, embedded):
+                vectors[i] = np.asarray(vector, dtype=np.float32)
+        matrix = np.vstack(vectors).astype(np.float32, copy=False)
+        fetch_k = max(request.fetch_k for request in batch)
+        # Queries pinned to a store replaced meanwhile are searched on their own store
+        stores:Dict[int, List[int]] = {}
+        for i, request in enumerate(batch):
+            stores.setdefault(id(request.vectorstore), []).append(i)
+        found = np.empty((len(batch), fetch_k), dtype=np.int64)
+        with self._span("batch_search", batch, batch=len(batch)):
+            for rows in stores.values():
+                _, found[rows] = batch[rows[0]].vectorstore.index.search(matrix[rows], fetch_k)
+
+        with self._cond:
+            self.batches += 1
+            self.queries += len(batch)
+            self.max_seen = max(self.max_seen, len(batch))
+        self.registry.inc("rag_query_batches_total")
+        self.registry.inc("rag_query_batched_total", len(batch))
+        return [(matrix[i], found[i, :request.fetch_k]) for i, request in enumerate(batch)]
+
+    def stats(self)->Dict[str, float]:
+        """Batches dispatched, queries served and batch sizes"""
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch_size": self.queries / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_seen,
+        }
+
+
+if __name__=="__main__":
+    __all__=["QueryDispatcher"]
@@ -0,0 +1,81 @@
+from typing import Any, Dict, List, Optional, Protocol, Sequence, runtime_checkable
+from collections import OrderedDict
+import threading
+
+from langchain_core.documents import Document
+
+from aiops_rag_databricksapp.store import content_hash
+
+
+@runtime_checkable
+class ChunkStore(Protocol):
+    """Anything that resolves chunk ids to the stored chunks; `VectorStore` is one"""
+
+    def get_chunks(self, ids:Sequence[str])->List[Optional[Document]]:
+        ...
+
+
+class InMemoryChunkStore:
+    """
+    Bounded id to chunk map for retrievers that are not backed by a `VectorStore`
+    ---
+
+    Retrieved documents are registered under their `id` (or a hash of
+    their text) and evicted least recently used beyond `max_entries`.
+
+    Args:
+        max_entries: Maximum number of chunks kept
+    """
+
+    def __init__(self, max_entries:int=10_000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._docs:"OrderedDict[str, Document]" = OrderedDict()
+
+    def put(self, docs:Sequence[Document])->List[str]:
+        """Register documents, returning their chunk ids"""
+        ids = []
+        with self._lock:
+            for doc in docs:
+                doc_id = doc.id or content_hash(doc.page_content)
+                self._docs[doc_id] = doc
+                self._docs.move_to_end(doc_id)
+                ids.append(doc_id)
+            while len(self._docs) > self.max_entries:
+                self._docs.popitem(last=False)
+        return ids
+
+    def get_chunks(self, ids:Sequence[str])->List[Optional[Document]]:
+        with self._lock:
+            return [self._docs.get(doc_id) for doc_id in ids]
+
+
+def chunk_store_for(retriever:Any)->ChunkStore:
+    """The `VectorStore` behind `retriever`, or a private in-memory chunk store"""
+    store = getattr(retriever, "store", None)
+    return store if isinstance(store, ChunkStore) else InMemoryChunkStore()
+
+
+def chunk_refs(docs:Sequence[Document], chunks:ChunkStore)->Dict[str, List]:
+    """
+    State update referencing retrieved documents by id
+
+    Args:
+        docs: Retrieved documents, best first
+        chunks: Store the ids resolve against
+
+    Returns:
+        `chunk_ids` and `scores` for a `RAGState` update
+    """
+    if isinstance(chunks, InMemoryChunkStore):
+        ids = chunks.put(docs)
+    else:
+        ids = [doc.id for doc in docs]
+    return {
+        "chunk_ids": ids,
+        "scores": [float(doc.metadata.get("score", 0.0)) for doc in docs],
+    }
+
+
+if __name__=="__main__":
+    __all__=["ChunkStore","InMemoryChunkStore","chunk_store_for","chunk_refs"]
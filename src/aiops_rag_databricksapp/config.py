@@ -1,7 +1,8 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field, BaseModel
-from typing import List
+from typing import List, Optional
 from dataclasses import dataclass
+from functools import lru_cache
 import os
 
 class AIConfigSettings(BaseSettings):
@@ -11,14 +12,92 @@ class AIConfigSettings(BaseSettings):
     llm_model:str = "gpt-5-nano-2025-08-07"
     chunk_size:int = 500
     chunk_overlap:int = 50
+    text_splitter:str = "offset"
+    chunk_length_unit:str = "chars"
+    data_dir:str = "data"
+    loader_max_workers:int = 8
+    loader_per_host_limit:int = 2
+    url_timeout:float = 20.0
+    url_retries:int = 2
+    pdf_workers:int = 0
+    embed_batch_size:int = 256
+    ingest_queue_size:int = 4
+    dedup_enabled:bool = True
+    dedup_threshold:float = 0.9
+    dedup_num_perm:int = 128
+    embedding_model:str = "text-embedding-ada-002"
+    index_dir:str = "artifacts/faiss_index"
+    corpus_version:str = ""
+    embedding_cache_path:str = "artifacts/embedding_cache.sqlite"
+    embedding_cache_max_mb:int = 512
+    embedding_cache_dtype:str = "float32"
+    retrieval_mode:str = "hybrid"
+    retrieval_k:int = 4
+    retrieval_fetch_k:int = 20
+    retrieval_mmr_lambda:float = 0.7
+    retrieval_source_cap:int = 0
+    retrieval_score_threshold:Optional[float] = None
+    index_type:str = "flat"
+    index_storage:str = "float32"
+    index_train_size:int = 50_000
+    ivf_nlist:int = 1024
+    ivf_nprobe:int = 16
+    pq_m:int = 16
+    pq_bits:int = 8
+    hnsw_m:int = 32
+    hnsw_ef_construction:int = 40
+    hnsw_ef_search:int = 64
+    query_batch_size:int = 16
+    query_batch_wait_ms:float = 5.0
+    query_batch_in_flight:int = 4
+    sharding_enabled:bool = False
+    shard_workers:int = 4
+    semantic_cache_enabled:bool = True
+    semantic_cache_threshold:float = 0.95
+    semantic_cache_ttl_seconds:float = 3600.0
+    semantic_cache_max_entries:int = 1000
+    context_token_budget:int = 3000
+    context_duplicate_threshold:float = 0.9
+    routing_enabled:bool = True
+    route_min_top_score:float = 0.78
+    route_confident_score:float = 0.85
+    route_min_term_overlap:float = 0.5
+    agent_max_steps:int = 6
+    agent_time_budget:float = 30.0
+    tool_timeout_seconds:float = 10.0
+    rate_limit_enabled:bool = True
+    llm_requests_per_minute:float = 500
+    llm_tokens_per_minute:float = 200_000
+    embedding_requests_per_minute:float = 3000
+    embedding_tokens_per_minute:float = 1_000_000
+    rate_limit_burst_seconds:float = 10.0
+    rate_limit_background_reserve:float = 0.2
+    rate_limit_max_queue:int = 256
+    rate_limit_max_wait:float = 10.0
+    rate_limit_max_retries:int = 4
+    memory_enabled:bool = True
+    memory_summary_token_budget:int = 300
+    memory_history_token_budget:int = 800
+    memory_reuse_overlap:float = 0.6
+    memory_max_sessions:int = 1000
+    metrics_port:int = 0
+    trace_log_path:str = ""
     default_urls:List[str]=[
         "https://lilianweng.github.io/posts/2023-06-23-agent/",
         "https://lilianweng.github.io/posts/2024-04-12-diffusion-video/"
     ]
 
+@lru_cache(maxsize=1)
+def get_settings()->AIConfigSettings:
+    """Load the settings once per process, on first use"""
+    return AIConfigSettings()
+
 @dataclass
 class AIConfig:
-    settings = AIConfigSettings()
+    @property
+    def settings(self)->AIConfigSettings:
+        return get_settings()
+
     @property
     def activate_LLM_environment(self):
         """Initialize the LLM Model"""
@@ -29,6 +108,6 @@ class AIConfig:
         return self.settings.llm_model
         
 if __name__=="__main__":
-    __all__=["AIConfigSettings","AIConfig"]
+    __all__=["AIConfigSettings","AIConfig","get_settings"]
         
         
\ No newline at end of file
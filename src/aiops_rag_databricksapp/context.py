@@ -0,0 +1,181 @@
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import re
+
+from langchain_core.documents import Document
+
+from dataclasses import dataclass
+
+_WORD = re.compile(r"\w+")
+# Longest suffix/prefix overlap searched for chunks without offsets
+_MAX_TEXT_OVERLAP = 400
+# Smallest remainder worth filling with a truncated passage
+_MIN_PARTIAL_TOKENS = 64
+
+
+def token_counter(model:str)->Tuple[Callable[[str], int], Callable[[str, int], str]]:
+    """Token count and truncate functions for `model`, approximated if tiktoken is unavailable"""
+    try:
+        import tiktoken
+
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+        return (
+            lambda text: len(encoding.encode(text, disallowed_special=())),
+            lambda text, n: encoding.decode(encoding.encode(text, disallowed_special=())[:n]),
+        )
+    except Exception:
+        return (lambda text: (len(text) + 3) // 4, lambda text, n: text[:n * 4])
+
+
+@dataclass
+class ContextPacker:
+    """
+    Token-budgeted context packing
+    ---
+
+    Retrieved chunks are packed into the prompt context in three steps:
+    overlapping or adjacent chunks of the same source are merged back
+    into one passage, near-duplicate passages are dropped, and passages
+    are added in relevance order until `token_budget` is reached.
+
+    Args:
+        model: Model whose tokenizer is used to count tokens
+        token_budget: Maximum context tokens
+        duplicate_threshold: Word-shingle Jaccard similarity at which a passage is a near-duplicate
+    """
+    model:str
+    token_budget:int = 3000
+    duplicate_threshold:float = 0.9
+
+    def __post_init__(self):
+        self.count_tokens, self._truncate = token_counter(self.model)
+
+    @staticmethod
+    def _source_key(doc:Document)->Tuple:
+        return (doc.metadata.get("source"), doc.metadata.get("page"))
+
+    @staticmethod
+    def _has_offset(doc:Document)->bool:
+        start = doc.metadata.get("start_index")
+        return start is not None and start >= 0
+
+    @staticmethod
+    def _text_overlap(left:str, right:str)->int:
+        """Length of the longest suffix of `left` that is a prefix of `right`"""
+        for size in range(min(len(left), len(right), _MAX_TEXT_OVERLAP), 0, -1):
+            if left.endswith(right[:size]):
+                return size
+        return 0
+
+    def _merge(self, docs:List[Document])->List[Document]:
+        """Merge overlapping/adjacent chunks of a source, keeping each passage at its best rank"""
+        groups:Dict[Tuple, List[Tuple[int, Document]]] = {}
+        for rank, doc in enumerate(docs):
+            groups.setdefault(self._source_key(doc), []).append((rank, doc))
+
+        passages:List[Tuple[int, Document]] = []
+        for members in groups.values():
+            with_offsets = [m for m in members if self._has_offset(m[1])]
+            passages.extend(m for m in members if not self._has_offset(m[1]))
+            with_offsets.sort(key=lambda m: m[1].metadata["start_index"])
+
+            current:Optional[Tuple[int, int, int, str, dict]] = None
+            for rank, doc in with_offsets:
+                start = doc.metadata["start_index"]
+                end = start + len(doc.page_content)
+                if current is not None and start <= current[2]:
+                    best, cur_start, cur_end, text, metadata = current
+                    if end > cur_end:
+                        text = text + doc.page_content[cur_end - start:]
+                    current = (min(best, rank), cur_start, max(cur_end, end), text, metadata)
+                    continue
+                if current is not None:
+                    passages.append(self._passage(current))
+                current = (rank, start, end, doc.page_content, dict(doc.metadata))
+            if current is not None:
+                passages.append(self._passage(current))
+
+        passages.sort(key=lambda p: p[0])
+        return self._merge_text_overlaps(passages)
+
+    @staticmethod
+    def _passage(current:Tuple[int, int, int, str, dict])->Tuple[int, Document]:
+        rank, start, end, text, metadata = current
+        metadata.update(start_index=start, end_index=end)
+        return rank, Document(page_content=text, metadata=metadata)
+
+    def _merge_text_overlaps(self, passages:List[Tuple[int, Document]])->List[Document]:
+        """Join passages of a source whose text overlaps, for chunks that carry no offsets"""
+        merged:List[Document] = []
+        for _, doc in passages:
+            for i, kept in enumerate(merged):
+                if self._source_key(kept) != self._source_key(doc):
+                    continue
+                if doc.page_content in kept.page_content:
+                    break
+                overlap = self._text_overlap(kept.page_content, doc.page_content)
+                if overlap:
+                    merged[i] = Document(page_content=kept.page_content + doc.page_content[overlap:], metadata=kept.metadata)
+                    break
+                overlap = self._text_overlap(doc.page_content, kept.page_content)
+                if overlap:
+                    merged[i] = Document(page_content=doc.page_content + kept.page_content[overlap:], metadata=kept.metadata)
+                    break
+            else:
+                merged.append(doc)
+        return merged
+
+    @staticmethod
+    def _shingles(text:str, size:int=5)->Set[Tuple[str, ...]]:
+        words = _WORD.findall(text.lower())
+        if len(words) <= size:
+            return {tuple(words)}
+        return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+    def _drop_near_duplicates(self, docs:List[Document])->List[Document]:
+        kept:List[Document] = []
+        kept_shingles:List[Set[Tuple[str, ...]]] = []
+        for doc in docs:
+            shingles = self._shingles(doc.page_content)
+            duplicate = False
+            for other in kept_shingles:
+                union = len(shingles | other)
+                if union and len(shingles & other) / union >= self.duplicate_threshold:
+                    duplicate = True
+                    break
+            if not duplicate:
+                kept.append(doc)
+                kept_shingles.append(shingles)
+        return kept
+
+    def pack(self, docs:List[Document])->List[Document]:
+        """
+        Pack retrieved chunks into a token budget
+
+        Args:
+            docs: Retrieved chunks, most relevant first
+
+        Returns:
+            Passages to place in the prompt, most relevant first
+        """
+        packed:List[Document] = []
+        remaining = self.token_budget
+        for doc in self._drop_near_duplicates(self._merge(docs)):
+            tokens = self.count_tokens(doc.page_content)
+            if tokens <= remaining:
+                packed.append(doc)
+                remaining -= tokens
+            elif remaining >= _MIN_PARTIAL_TOKENS:
+                packed.append(Document(
+                    page_content=self._truncate(doc.page_content, remaining),
+                    metadata=doc.metadata,
+                ))
+                remaining = 0
+            if remaining <= 0:
+                break
+        return packed
+
+if __name__=="__main__":
+    __all__=["ContextPacker","token_counter"]
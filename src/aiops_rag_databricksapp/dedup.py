@@ -0,0 +1,214 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from collections import defaultdict
+import re
+import uuid
+import zlib
+
+import numpy as np
+
+from langchain_core.documents import Document
+
+from aiops_rag_databricksapp.store import content_hash
+
+from dataclasses import dataclass
+
+_WORD = re.compile(r"\w+")
+# Mersenne prime 2^31 - 1; keeps a * hash + b inside uint64 for 32-bit hashes
+_PRIME = np.uint64((1 << 31) - 1)
+
+
+def lsh_bands(num_perm:int, threshold:float)->Tuple[int, int]:
+    """
+    Bands and rows per band for LSH over `num_perm` MinHash values
+
+    Picks the banding whose candidate threshold `(1/b)^(1/r)` is highest
+    while still below `threshold`, so true near-duplicates become
+    candidates with high probability and the signature check does the rest.
+    """
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    below = [(b, r) for b, r in options if (1 / b) ** (1 / r) <= threshold]
+    if not below:
+        return options[-1]
+    return max(below, key=lambda option: (1 / option[0]) ** (1 / option[1]))
+
+
+@dataclass
+class DedupStats:
+    """Counters of one deduplication pass"""
+    chunks:int = 0
+    exact:int = 0
+    near:int = 0
+    chars_saved:int = 0
+
+    @property
+    def duplicates(self)->int:
+        return self.exact + self.near
+
+    @property
+    def embeddings_saved(self)->int:
+        """Embedding inputs (and index entries) not created for duplicates"""
+        return self.duplicates
+
+
+@dataclass
+class NearDuplicateFilter:
+    """
+    Collapse near-duplicate chunks before they are embedded
+    ---
+
+    Each chunk's word shingles are reduced to a MinHash signature and
+    banded into an LSH index. A chunk whose estimated Jaccard similarity
+    to an already kept chunk reaches `threshold` is dropped, and its
+    source is recorded on the kept chunk. Identical texts are caught by
+    content hash before any hashing work.
+
+    Kept chunks are given docstore ids up front, so `apply` can write
+    the merged `metadata["sources"]` onto chunks that were already
+    embedded and indexed by the time their duplicates arrived.
+
+    Args:
+        threshold: Estimated word-shingle Jaccard similarity at which a chunk is a duplicate
+        num_perm: MinHash permutations per signature
+        shingle_size: Words per shingle
+        seed: Seed of the permutation parameters
+    """
+    threshold:float = 0.9
+    num_perm:int = 128
+    shingle_size:int = 5
+    seed:int = 1
+
+    def __post_init__(self):
+        if not 0 < self.threshold <= 1:
+            raise ValueError(f"threshold must be in (0, 1], got {self.threshold}")
+        rng = np.random.default_rng(self.seed)
+        self._a = rng.integers(1, int(_PRIME), size=self.num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), size=self.num_perm, dtype=np.uint64)
+        self.bands, self.rows = lsh_bands(self.num_perm, self.threshold)
+        self.reset()
+
+    def reset(self):
+        """Forget kept chunks and counters"""
+        self._buckets:List[Dict[bytes, List[int]]] = [defaultdict(list) for _ in range(self.bands)]
+        self._signatures:List[np.ndarray] = []
+        # (docstore id, source) of each kept chunk by position; the chunks themselves are not retained
+        self._kept:List[Tuple[str, Optional[str]]] = []
+        self._exact:Dict[str, int] = {}
+        self.merged:Dict[str, List[str]] = {}
+        # Docstore id of each dropped chunk that had one -> id of the kept chunk it was collapsed into
+        self.duplicate_of:Dict[str, str] = {}
+        self.stats = DedupStats()
+
+    def signature(self, text:str)->Optional[np.ndarray]:
+        """MinHash signature of the text's word shingles; None for text without words"""
+        words = _WORD.findall(text.lower())
+        if not words:
+            return None
+        size = min(self.shingle_size, len(words))
+        hashes = np.fromiter(
+            (zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)),
+            dtype=np.uint64,
+        )
+        return ((np.outer(hashes, self._a) + self._b) % _PRIME).min(axis=0).astype(np.uint32)
+
+    def _bands(self, signature:np.ndarray)->Iterator[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def _match(self, signature:np.ndarray)->Optional[int]:
+        candidates = {i for band, key in self._bands(signature) for i in self._buckets[band].get(key, ())}
+        best, best_score = None, self.threshold
+        for i in candidates:
+            score = float(np.mean(self._signatures[i] == signature))
+            if score >= best_score:
+                best, best_score = i, score
+        return best
+
+    def _merge(self, kept:Tuple[str, Optional[str]], duplicate:Document):
+        kept_id, kept_source = kept
+        source = duplicate.metadata.get("source")
+        sources = self.merged.setdefault(kept_id, [])
+        if source is not None and source != kept_source and source not in sources:
+            sources.append(source)
+        if duplicate.id:
+            self.duplicate_of[duplicate.id] = kept_id
+        self.stats.chars_saved += len(duplicate.page_content)
+
+    def _keep(self, doc_id:str, source:Optional[str], digest:str, signature:Optional[np.ndarray]):
+        position = len(self._kept)
+        self._kept.append((doc_id, source))
+        self._exact.setdefault(digest, position)
+        if signature is None:
+            signature = np.zeros(self.num_perm, dtype=np.uint32)
+        else:
+            for band, key in self._bands(signature):
+                self._buckets[band][key].append(position)
+        self._signatures.append(signature)
+
+    def add_indexed(self, chunks:Iterable[Tuple[str, Document]]):
+        """
+        Register chunks that are already indexed, so later chunks are checked against them
+
+        Indexed chunks are neither modified nor counted in `stats`.
+
+        Args:
+            chunks: (docstore id, chunk) pairs, as `VectorStore.iter_chunks` yields them
+        """
+        for doc_id, chunk in chunks:
+            self._keep(doc_id, chunk.metadata.get("source"), content_hash(chunk.page_content), self.signature(chunk.page_content))
+
+    def filter(self, chunks:Iterable[Document])->Iterator[Document]:
+        """
+        Yield the chunks that are not near-duplicates of an earlier chunk
+
+        Args:
+            chunks: Chunks to deduplicate, consumed lazily
+
+        Yields:
+            Kept chunks, each with a docstore id set
+        """
+        for chunk in chunks:
+            self.stats.chunks += 1
+            digest = content_hash(chunk.page_content)
+            if digest in self._exact:
+                self.stats.exact += 1
+                self._merge(self._kept[self._exact[digest]], chunk)
+                continue
+            signature = self.signature(chunk.page_content)
+            if signature is not None:
+                match = self._match(signature)
+                if match is not None:
+                    self.stats.near += 1
+                    self._merge(self._kept[match], chunk)
+                    continue
+            chunk.id = chunk.id or str(uuid.uuid4())
+            self._keep(chunk.id, chunk.metadata.get("source"), digest, signature)
+            yield chunk
+
+    def apply(self, store)->int:
+        """
+        Record the sources of collapsed duplicates on the stored chunks
+
+        Sets `metadata["sources"]` (the chunk's own source first) on every
+        kept chunk that absorbed duplicates from other sources. Sources
+        recorded on the chunk by an earlier pass are kept.
+
+        Args:
+            store: `VectorStore` or `ShardedVectorStore` the kept chunks were added to
+
+        Returns:
+            Number of stored chunks updated
+        """
+        ids = [doc_id for doc_id, sources in self.merged.items() if sources]
+        updated = 0
+        for doc_id, doc in zip(ids, store.get_chunks(ids)):
+            if doc is None:
+                continue
+            own = doc.metadata.get("source")
+            sources = list(doc.metadata.get("sources") or ([own] if own is not None else []))
+            doc.metadata["sources"] = sources + [source for source in self.merged[doc_id] if source not in sources]
+            updated += 1
+        return updated
+
+
+if __name__=="__main__":
+    __all__=["NearDuplicateFilter","DedupStats","lsh_bands"]
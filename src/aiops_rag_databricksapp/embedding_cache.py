@@ -0,0 +1,193 @@
+from typing import Dict, List, Optional, Sequence, Union
+from pathlib import Path
+import hashlib
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from langchain_core.embeddings import Embeddings
+
+from dataclasses import dataclass
+
+# SQLite caps the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+
+@dataclass
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed embedding cache in front of an embeddings client
+    ---
+
+    Vectors are stored in SQLite keyed by (model, sha256(text)) as packed
+    float32 or float16 blobs. When the cache grows past `max_bytes` the
+    least recently used entries are evicted.
+
+    Args:
+        underlying: Embeddings client used on cache misses
+        model: Embedding model name, part of the cache key
+        path: SQLite database file
+        max_bytes: Size cap for stored vectors
+        dtype: Storage precision, "float32" or "float16"
+    """
+    underlying:Embeddings
+    model:str
+    path:Union[str, Path]
+    max_bytes:int = 512 * 1024 * 1024
+    dtype:str = "float32"
+
+    def __post_init__(self):
+        if self.dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported cache dtype: {self.dtype}. Use float32 or float16.")
+        self._np_dtype = np.dtype(self.dtype)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " dtype TEXT NOT NULL,"
+            " vec BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, hash)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)")
+        self._conn.commit()
+        self._bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings"
+        ).fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.embedding_calls = 0
+        self.evictions = 0
+
+    @staticmethod
+    def text_hash(text:str)->str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, hashes:Sequence[str])->Dict[str, List[float]]:
+        found:Dict[str, List[float]] = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(hashes), _LOOKUP_BATCH):
+                batch = list(hashes[i:i + _LOOKUP_BATCH])
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT hash, dtype, vec FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [self.model, *batch],
+                ).fetchall()
+                for h, dtype, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=dtype).astype(np.float32).tolist()
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                    [(now, self.model, h) for h in found],
+                )
+                self._conn.commit()
+        return found
+
+    def _store(self, items:Dict[str, List[float]]):
+        now = time.time()
+        rows = [
+            (self.model, h, self.dtype, np.asarray(vec, dtype=self._np_dtype).tobytes(), now)
+            for h, vec in items.items()
+        ]
+        with self._lock:
+            # Rows stored concurrently by another miss of the same text are replaced, not added
+            replaced = 0
+            hashes = [r[1] for r in rows]
+            for i in range(0, len(hashes), _LOOKUP_BATCH):
+                batch = hashes[i:i + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                replaced += self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [self.model, *batch],
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, dtype, vec, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._bytes += sum(len(r[3]) for r in rows) - replaced
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is at 90% of its cap"""
+        target = int(self.max_bytes * 0.9)
+        while self._bytes > target:
+            rows = self._conn.execute(
+                "SELECT model, hash, LENGTH(vec) FROM embeddings ORDER BY last_used LIMIT ?",
+                (_LOOKUP_BATCH,),
+            ).fetchall()
+            if not rows:
+                self._bytes = 0
+                break
+            for model, h, size in rows:
+                if self._bytes <= target:
+                    break
+                self._conn.execute("DELETE FROM embeddings WHERE model = ? AND hash = ?", (model, h))
+                self._bytes -= size
+                self.evictions += 1
+
+    def _embed(self, texts:List[str], as_query:bool)->List[List[float]]:
+        hashes = [self.text_hash(t) for t in texts]
+        found = self._lookup(list(dict.fromkeys(hashes)))
+
+        missing:Dict[str, str] = {}
+        for h, t in zip(hashes, texts):
+            if h not in found and h not in missing:
+                missing[h] = t
+        missed = sum(1 for h in hashes if h in missing)
+        with self._lock:
+            self.hits += len(texts) - missed
+            self.misses += missed
+            if missing:
+                self.embedding_calls += 1
+
+        if missing:
+            if as_query and len(missing) == 1:
+                vectors = [self.underlying.embed_query(next(iter(missing.values())))]
+            else:
+                vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self._store(fresh)
+            found.update(fresh)
+
+        return [found[h] for h in hashes]
+
+    def embed_documents(self, texts:List[str])->List[List[float]]:
+        """Embed documents, calling the underlying client only for unseen texts"""
+        return self._embed(list(texts), as_query=False)
+
+    def embed_query(self, text:str)->List[float]:
+        """Embed a query through the cache"""
+        return self._embed([text], as_query=True)[0]
+
+    def stats(self)->Dict[str, Union[int, float]]:
+        """Hit/miss counters and cache size"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            hits, misses = self.hits, self.misses
+            total = hits + misses
+            return {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / total if total else 0.0,
+                "embedding_calls": self.embedding_calls,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": self._bytes,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+if __name__=="__main__":
+    __all__=["CachedEmbeddings"]
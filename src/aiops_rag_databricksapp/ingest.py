@@ -1,15 +1,44 @@
-from typing import List, Union
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
 
-from langchain_community.document_loaders.web_base import WebBaseLoader
-from langchain_community.document_loaders.pdf import PyPDFLoader, PyPDFDirectoryLoader
-from langchain_community.document_loaders.text import TextLoader
-
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain.schema import Document
+from langchain_core.documents import Document
 
 from dataclasses import dataclass
 
+logger = logging.getLogger(__name__)
+
+def _parse_pdf_file(file_path:str)->Tuple[str, List[Document], Optional[str]]:
+    """
+    Parse one PDF into per-page documents
+
+    Runs inside pool workers, so failures are returned rather than raised
+    and one malformed file cannot abort the batch.
+    """
+    from langchain_community.document_loaders.pdf import PyPDFLoader
+
+    try:
+        docs = PyPDFLoader(file_path).load()
+        for doc in docs:
+            doc.metadata["source"] = file_path
+        return file_path, docs, None
+    except Exception as e:
+        return file_path, [], f"{type(e).__name__}: {e}"
+
+@dataclass
+class SourceTiming:
+    """Wall-clock timing of loading a single source"""
+    source:str
+    seconds:float
+    documents:int
+    attempts:int = 1
+
 @dataclass
 class DocumentProcessor:
     """
@@ -19,63 +48,365 @@ class DocumentProcessor:
     Args:
         chunk_size: Size of text chunks
         chunk_overlap: Overlap between chunks
+        data_dir: Local PDF directory loaded once alongside the given sources
+        max_workers: Number of sources loaded concurrently
+        per_host_limit: Maximum concurrent requests to a single host
+        url_timeout: Connect/read timeout in seconds for each URL request
+        url_retries: Retries for timed out, refused or 5xx/429 URL requests
+        pdf_workers: Processes used to parse PDFs of a directory; 0 parses in-process
+        splitter_mode: "offset" splits by offsets into the original text; "recursive" uses `RecursiveCharacterTextSplitter`
+        length_unit: Unit of chunk_size/chunk_overlap, "chars" or "tokens" (offset splitter only)
+        tokenizer_model: Model whose tokenizer sizes chunks when length_unit is "tokens"
     """
     chunk_size:int
     chunk_overlap:int
+    data_dir:Optional[str] = "data"
+    max_workers:int = 8
+    per_host_limit:int = 2
+    url_timeout:float = 20.0
+    url_retries:int = 2
+    pdf_workers:int = 0
+    splitter_mode:str = "offset"
+    length_unit:str = "chars"
+    tokenizer_model:str = "gpt-4o-mini"
     
     def __post_init__(self):
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap
-        )
+        if self.splitter_mode not in ("offset", "recursive"):
+            raise ValueError(f"Unknown splitter_mode '{self.splitter_mode}'; use 'offset' or 'recursive'")
+        if self.length_unit != "chars" and self.splitter_mode != "offset":
+            raise ValueError("Token-based chunk sizing requires splitter_mode='offset'")
+        self._splitter = None
+        self.last_timings:List[SourceTiming] = []
+        self.pdf_errors:Dict[str, str] = {}
+        self._host_limits:Dict[str, threading.BoundedSemaphore] = {}
+        self._host_limits_lock = threading.Lock()
+    
+    @property
+    def splitter(self):
+        """Text splitter, constructed on first use"""
+        if self._splitter is None and self.splitter_mode == "offset":
+            from aiops_rag_databricksapp.splitter import OffsetTextSplitter
+
+            self._splitter = OffsetTextSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                length_unit=self.length_unit,
+                model=self.tokenizer_model,
+            )
+        elif self._splitter is None:
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+            self._splitter = RecursiveCharacterTextSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                add_start_index=True
+            )
+        return self._splitter
+    
+    def _host_limit(self, url:str)->threading.BoundedSemaphore:
+        host = urlparse(url).netloc
+        with self._host_limits_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_limits[host]
+    
+    @staticmethod
+    def _is_retryable(error:Exception)->bool:
+        import requests
+
+        if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+            return True
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response.status_code == 429 or error.response.status_code >= 500
+        return False
     
     def load_from_url(self, url:str)->List[Document]:
         """Load document(s) from a URL"""
-        loader = WebBaseLoader(url)
+        from langchain_community.document_loaders.web_base import WebBaseLoader
+
+        loader = WebBaseLoader(
+            url,
+            requests_kwargs={"timeout": self.url_timeout},
+            raise_for_status=True,
+            show_progress=False,
+        )
         return loader.load()
 
+    def iter_pdf_dir(self, directory: Union[str, Path]) -> Iterator[Document]:
+        """
+        Stream page documents from all PDFs inside a directory
+
+        With `pdf_workers` > 0 files are parsed in a process pool; pages
+        are still yielded file by file in sorted path order. Files that
+        fail to parse are skipped and recorded in `pdf_errors`.
+        """
+        files = self.pdf_files(directory)
+        if self.pdf_workers > 0 and len(files) > 1:
+            pool = ProcessPoolExecutor(
+                max_workers=min(self.pdf_workers, len(files)),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            results = pool.map(_parse_pdf_file, files, chunksize=max(1, len(files) // (self.pdf_workers * 4)))
+        else:
+            pool = None
+            results = map(_parse_pdf_file, files)
+        try:
+            for file_path, docs, error in results:
+                if error is not None:
+                    logger.warning("Skipping unreadable PDF %s: %s", file_path, error)
+                    self.pdf_errors[file_path] = error
+                    continue
+                yield from docs
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
     def load_from_pdf_dir(self, directory: Union[str, Path]) -> List[Document]:
         """Load documents from all PDFs inside a directory"""
-        loader = PyPDFDirectoryLoader(str(directory))
-        return loader.load()
+        return list(self.iter_pdf_dir(directory))
 
     def load_from_txt(self, file_path: Union[str, Path]) -> List[Document]:
         """Load document(s) from a TXT file"""
+        from langchain_community.document_loaders.text import TextLoader
+
         loader = TextLoader(str(file_path), encoding="utf-8")
         return loader.load()
 
     def load_from_pdf(self, file_path: Union[str, Path]) -> List[Document]:
         """Load document(s) from a PDF file"""
-        loader = PyPDFDirectoryLoader(str("data"))
-        return loader.load()
+        file_path, docs, error = _parse_pdf_file(str(file_path))
+        if error is not None:
+            logger.warning("Skipping unreadable PDF %s: %s", file_path, error)
+            self.pdf_errors[file_path] = error
+        return docs
+    
+    def _loader_for(self, src:str)->Callable[[str], List[Document]]:
+        """Pick the loader for a source, failing before any work starts"""
+        if src.startswith("http://") or src.startswith("https://"):
+            return self.load_from_url
+        path = Path(src)
+        if path.is_dir():  # PDF directory
+            return self.load_from_pdf_dir
+        if path.suffix.lower() == ".txt":
+            return self.load_from_txt
+        if path.suffix.lower() == ".pdf":
+            return self.load_from_pdf
+        raise ValueError(
+            f"Unsupported source type: {src}. "
+            "Use URL, .txt file, .pdf file or PDF directory."
+        )
+    
+    def _with_retries(self, src:str, call:Callable[[str], Any])->Tuple[Any, int]:
+        """Run `call(src)`, under the host limit and retrying transient failures with backoff for URLs"""
+        is_url = src.startswith("http://") or src.startswith("https://")
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                if is_url:
+                    with self._host_limit(src):
+                        return call(src), attempt
+                return call(src), attempt
+            except Exception as e:
+                if not is_url or attempt > self.url_retries or not self._is_retryable(e):
+                    raise
+                time.sleep(min(2 ** (attempt - 1), 8))
+
+    def _load_source(self, src:str, loader:Callable[[str], List[Document]])->tuple:
+        """Load one source, retrying transient URL failures with backoff"""
+        start = time.perf_counter()
+        docs, attempt = self._with_retries(src, loader)
+        return docs, SourceTiming(
+            source=src,
+            seconds=time.perf_counter() - start,
+            documents=len(docs),
+            attempts=attempt,
+        )
+    
+    def load_url_if_modified(self, url:str, validators:Dict[str, Any])->Tuple[Optional[List[Document]], Dict[str, Any]]:
+        """
+        Conditionally fetch a URL
+
+        The stored `ETag` / `Last-Modified` are sent as `If-None-Match` /
+        `If-Modified-Since`, so an unchanged page costs a 304 and no
+        download or parsing. Changed pages are parsed like `load_from_url`.
+
+        Returns:
+            The page documents (None if unchanged) and the validators to store
+        """
+        import requests
+        from bs4 import BeautifulSoup
+        from langchain_community.document_loaders.web_base import _build_metadata
+
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        response = requests.get(url, headers=headers, timeout=self.url_timeout)
+        if response.status_code == 304:
+            return None, validators
+        response.raise_for_status()
+        response.encoding = response.apparent_encoding
+        soup = BeautifulSoup(response.text, "html.parser")
+        fresh = {
+            key: value
+            for key, value in (("etag", response.headers.get("ETag")), ("last_modified", response.headers.get("Last-Modified")))
+            if value
+        }
+        return [Document(page_content=soup.get_text(), metadata=_build_metadata(soup, url))], fresh
+
+    def load_file_if_modified(self, path:str, validators:Dict[str, Any])->Tuple[Optional[List[Document]], Dict[str, Any]]:
+        """
+        Load a TXT or PDF file unless its size and modification time match `validators`
+
+        Returns:
+            The file's documents (None if unchanged) and the validators to store
+        """
+        stat = Path(path).stat()
+        fresh = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        if all(validators.get(key) == value for key, value in fresh.items()):
+            return None, fresh
+        return self._loader_for(path)(path), fresh
+
+    def load_if_modified(self, src:str, validators:Optional[Dict[str, Any]]=None)->Tuple[Optional[List[Document]], Dict[str, Any], SourceTiming]:
+        """
+        Load a URL or file only if it changed since `validators` were recorded
+
+        URLs are fetched with conditional requests under the same host
+        limit and retries as `load_documents`; files are compared by size
+        and modification time.
+
+        Args:
+            src: URL, TXT file or PDF file
+            validators: Validators returned by the previous call; None loads unconditionally
+
+        Returns:
+            The documents (None if unchanged), the new validators and the load timing
+        """
+        validators = validators or {}
+        is_url = src.startswith("http://") or src.startswith("https://")
+        load = self.load_url_if_modified if is_url else self.load_file_if_modified
+        start = time.perf_counter()
+        (docs, fresh), attempt = self._with_retries(src, lambda source: load(source, validators))
+        return docs, fresh, SourceTiming(
+            source=src,
+            seconds=time.perf_counter() - start,
+            documents=len(docs or []),
+            attempts=attempt,
+        )
+
+    def pdf_files(self, directory:Union[str, Path])->List[str]:
+        """PDF files of a directory, in the order `iter_pdf_dir` reads them"""
+        return sorted(str(f) for f in Path(directory).glob("[!.]*.pdf") if f.is_file())
+
+    def unique_sources(self, sources:List[str])->List[str]:
+        """
+        Deduplicate sources and append the local data directory
+
+        Local paths are compared after resolving, so `data` and `./data`
+        are loaded once.
+        """
+        candidates = list(sources or [])
+        if self.data_dir and Path(self.data_dir).is_dir():
+            candidates.append(self.data_dir)
+        seen = set()
+        unique:List[str] = []
+        for src in candidates:
+            is_url = src.startswith("http://") or src.startswith("https://")
+            key = src if is_url else str(Path(src).resolve())
+            if key not in seen:
+                seen.add(key)
+                unique.append(src)
+        return unique
     
     def load_documents(self, sources:List[str])->List[Document]:
         """
-        Load documents from URLs, PDF directories, or TXT files
+        Load documents from URLs, PDF directories, PDF files or TXT files
+
+        Sources are loaded concurrently; each distinct source is loaded
+        once and results keep the order of `sources`. Per-source timings
+        are kept in `last_timings`.
 
         Args:
-            sources: List of URLs, PDF folder paths, or TXT file paths
+            sources: List of URLs, PDF folder paths, PDF files or TXT file paths
 
         Returns:
             List of loaded documents
         """
+        unique = self.unique_sources(sources)
+        loaders = [(src, self._loader_for(src)) for src in unique]
+        
         docs: List[Document] = []
-        for src in sources:
-            if src.startswith("http://") or src.startswith("https://"):
-                docs.extend(self.load_from_url(src))
-           
-            path = Path("data")
-            if path.is_dir():  # PDF directory
-                docs.extend(self.load_from_pdf_dir(path))
-            elif path.suffix.lower() == ".txt":
-                docs.extend(self.load_from_txt(path))
-            else:
-                raise ValueError(
-                    f"Unsupported source type: {src}. "
-                    "Use URL, .txt file, or PDF directory."
-                )
+        self.last_timings = []
+        if not loaders:
+            return docs
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(loaders)))) as pool:
+            futures = [pool.submit(self._load_source, src, loader) for src, loader in loaders]
+            for future in futures:
+                src_docs, timing = future.result()
+                docs.extend(src_docs)
+                self.last_timings.append(timing)
         return docs
     
+    def iter_documents(self, sources:List[str])->Iterator[Document]:
+        """
+        Stream documents from sources as their loads complete
+
+        At most `max_workers` URL/file loads are in flight at a time, and
+        PDF directories are streamed page by page while those run, so no
+        more than a window of sources is held in memory. Per-source
+        timings are kept in `last_timings`.
+
+        Args:
+            sources: List of URLs, PDF folder paths, PDF files or TXT file paths
+
+        Yields:
+            Loaded documents
+        """
+        loaders = [(src, self._loader_for(src)) for src in self.unique_sources(sources)]
+        directories = [src for src, loader in loaders if loader == self.load_from_pdf_dir]
+        remaining = iter([(src, loader) for src, loader in loaders if loader != self.load_from_pdf_dir])
+        self.last_timings = []
+        
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as pool:
+            pending = {
+                pool.submit(self._load_source, src, loader)
+                for src, loader in itertools.islice(remaining, self.max_workers)
+            }
+            for directory in directories:
+                start = time.perf_counter()
+                count = 0
+                for doc in self.iter_pdf_dir(directory):
+                    count += 1
+                    yield doc
+                self.last_timings.append(SourceTiming(
+                    source=directory,
+                    seconds=time.perf_counter() - start,
+                    documents=count,
+                ))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    docs, timing = future.result()
+                    self.last_timings.append(timing)
+                    yield from docs
+                for src, loader in itertools.islice(remaining, len(done)):
+                    pending.add(pool.submit(self._load_source, src, loader))
+    
+    def iter_chunks(self, documents:Iterable[Document])->Iterator[Document]:
+        """
+        Split a stream of documents into a stream of chunks
+        
+        Args:
+            documents: Documents to split, consumed lazily
+            
+        Yields:
+            Document chunks
+        """
+        for doc in documents:
+            yield from self.splitter.split_documents([doc])
+    
     def split_documents(self, documents: List[Document]) -> List[Document]:
         """
         Split documents into chunks
@@ -102,4 +433,4 @@ class DocumentProcessor:
         return self.split_documents(docs)
     
 if __name__=="__main__":
-    __all__=["DocumentProcessor"]
\ No newline at end of file
+    __all__=["DocumentProcessor","SourceTiming"]
\ No newline at end of file
@@ -0,0 +1,227 @@
+from typing import Dict, Iterable, List, Tuple, Union
+from pathlib import Path
+import math
+import re
+import threading
+
+import numpy as np
+
+from dataclasses import dataclass
+
+# Keeps error codes, hostnames, metric names and paths together (e.g.
+# "ORA-00942", "db-01.prod.internal", "node_cpu_seconds_total")
+_TOKEN = re.compile(r"[a-z0-9](?:[a-z0-9_.:/\-]*[a-z0-9])?")
+_PART = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text:str)->List[str]:
+    """Lower-cased terms; compound tokens are also indexed by their parts"""
+    terms:List[str] = []
+    for token in _TOKEN.findall(text.lower()):
+        terms.append(token)
+        parts = _PART.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+@dataclass
+class BM25Index:
+    """
+    Compact in-process BM25 inverted index
+    ---
+
+    Documents are added incrementally; each `add` folds their postings
+    into flat numpy arrays (CSR layout: per-term offsets into
+    doc/term-frequency arrays), so scoring a query is a few vectorised
+    array operations per query term.
+
+    `add`, `remove` and `save` hold a lock and replace the arrays instead
+    of editing them, so `search` only reads: it runs concurrently with
+    them on the arrays as they were when it started.
+
+    Removed documents are masked out of results at once and dropped from
+    the arrays once they make up `compact_ratio` of the index, and on
+    every `save`, so replacing documents does not grow the index.
+
+    Args:
+        k1: Term-frequency saturation
+        b: Document-length normalisation
+        compact_ratio: Share of removed documents at which they are dropped from the arrays
+    """
+    k1:float = 1.5
+    b:float = 0.75
+    compact_ratio:float = 0.2
+
+    def __post_init__(self):
+        self.vocab:Dict[str, int] = {}
+        self.ids:List[str] = []
+        self._pending:List[Dict[int, int]] = []
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._postings = np.zeros(0, dtype=np.int32)
+        self._tfs = np.zeros(0, dtype=np.float32)
+        self._doc_len = np.zeros(0, dtype=np.float32)
+        self._deleted = np.zeros(0, dtype=bool)
+        self._lock = threading.Lock()
+
+    def __len__(self)->int:
+        return len(self.ids)
+
+    def add(self, ids:Iterable[str], texts:Iterable[str]):
+        """
+        Index documents
+
+        Args:
+            ids: Docstore ids of the documents
+            texts: Document texts
+        """
+        with self._lock:
+            for doc_id, text in zip(ids, texts):
+                counts:Dict[int, int] = {}
+                for term in tokenize(text):
+                    term_id = self.vocab.setdefault(term, len(self.vocab))
+                    counts[term_id] = counts.get(term_id, 0) + 1
+                self.ids.append(doc_id)
+                self._pending.append(counts)
+            self._compact()
+
+    def _compact(self):
+        """Fold pending documents into the CSR arrays; called with the lock held"""
+        if not self._pending:
+            return
+        n_old = len(self._doc_len)
+        n_terms = len(self.vocab)
+
+        old_counts = np.diff(self._offsets)
+        old_counts = np.concatenate([old_counts, np.zeros(n_terms - len(old_counts), dtype=np.int64)])
+        new_terms = np.fromiter(
+            (term_id for counts in self._pending for term_id in counts), dtype=np.int64
+        )
+        new_docs = np.fromiter(
+            (n_old + i for i, counts in enumerate(self._pending) for _ in counts), dtype=np.int32
+        )
+        new_tfs = np.fromiter(
+            (tf for counts in self._pending for tf in counts.values()), dtype=np.float32
+        )
+
+        # Stable merge of old postings (grouped by term) with the new ones
+        old_terms = np.repeat(np.arange(len(old_counts), dtype=np.int64), old_counts)
+        terms = np.concatenate([old_terms, new_terms])
+        order = np.argsort(terms, kind="stable")
+        self._postings = np.concatenate([self._postings, new_docs])[order]
+        self._tfs = np.concatenate([self._tfs, new_tfs])[order]
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=n_terms))])
+
+        new_len = np.array([sum(counts.values()) for counts in self._pending], dtype=np.float32)
+        self._doc_len = np.concatenate([self._doc_len, new_len])
+        self._deleted = np.concatenate([self._deleted, np.zeros(len(self._pending), dtype=bool)])
+        self._pending = []
+
+    def _drop_deleted(self):
+        """Rebuild the arrays without removed documents and terms left without postings; called with the lock held"""
+        if not self._deleted.any():
+            return
+        keep = ~self._deleted
+        n_terms = len(self._offsets) - 1
+        terms = np.repeat(np.arange(n_terms, dtype=np.int64), np.diff(self._offsets))
+        live = keep[self._postings]
+        renumber = np.cumsum(keep, dtype=np.int64) - 1
+        counts = np.bincount(terms[live], minlength=n_terms)
+        used = counts > 0
+        term_ids = np.cumsum(used, dtype=np.int64) - 1
+        postings = renumber[self._postings[live]].astype(np.int32)
+        tfs = self._tfs[live]
+
+        self.vocab = {term: int(term_ids[i]) for term, i in self.vocab.items() if used[i]}
+        self.ids = [doc_id for doc_id, kept in zip(self.ids, keep) if kept]
+        self._offsets = np.concatenate([[0], np.cumsum(counts[used])]).astype(np.int64)
+        self._postings, self._tfs = postings, tfs
+        self._doc_len = self._doc_len[keep]
+        self._deleted = np.zeros(len(self.ids), dtype=bool)
+
+    def remove(self, ids:Iterable[str]):
+        """Exclude documents from results, dropping them from the arrays once enough have been removed"""
+        with self._lock:
+            positions = {doc_id: pos for pos, doc_id in enumerate(self.ids)}
+            deleted = self._deleted.copy()
+            for doc_id in ids:
+                if doc_id in positions:
+                    deleted[positions[doc_id]] = True
+            self._deleted = deleted
+            if deleted.any() and deleted.mean() >= self.compact_ratio:
+                self._drop_deleted()
+
+    def search(self, query:str, k:int=10)->List[Tuple[str, float]]:
+        """
+        Rank documents against a query
+
+        Args:
+            query: Search query
+            k: Number of results
+
+        Returns:
+            (docstore id, BM25 score) pairs, best first
+        """
+        with self._lock:
+            ids, vocab, offsets, postings = self.ids, self.vocab, self._offsets, self._postings
+            all_tfs, doc_len, deleted = self._tfs, self._doc_len, self._deleted
+        n_docs = int((~deleted).sum())
+        if n_docs == 0:
+            return []
+        avg_len = float(doc_len[~deleted].mean()) or 1.0
+        scores = np.zeros(len(doc_len), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = vocab.get(term)
+            # Terms first seen by a later `add` have no postings in these arrays
+            if term_id is None or term_id >= len(offsets) - 1:
+                continue
+            start, end = offsets[term_id], offsets[term_id + 1]
+            docs = postings[start:end]
+            live = ~deleted[docs]
+            docs, tfs = docs[live], all_tfs[start:end][live]
+            if len(docs) == 0:
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * doc_len[docs] / avg_len)
+            np.add.at(scores, docs, idf * tfs * (self.k1 + 1) / (tfs + norm))
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(ids[i], float(scores[i])) for i in candidates]
+
+    def save(self, path:Union[str, Path]):
+        """Write the index to a single .npz file"""
+        with self._lock:
+            self._drop_deleted()
+            terms = sorted(self.vocab, key=self.vocab.get)
+            np.savez(
+                path,
+                params=np.array([self.k1, self.b], dtype=np.float64),
+                terms=np.array(terms, dtype=str),
+                ids=np.array(self.ids, dtype=str),
+                offsets=self._offsets,
+                postings=self._postings,
+                tfs=self._tfs,
+                doc_len=self._doc_len,
+                deleted=self._deleted,
+            )
+
+    @classmethod
+    def load(cls, path:Union[str, Path])->"BM25Index":
+        """Read an index written by `save`"""
+        with np.load(path, allow_pickle=False) as data:
+            k1, b = data["params"].tolist()
+            index = cls(k1=k1, b=b)
+            index.vocab = {term: i for i, term in enumerate(data["terms"].tolist())}
+            index.ids = data["ids"].tolist()
+            index._offsets = data["offsets"]
+            index._postings = data["postings"]
+            index._tfs = data["tfs"]
+            index._doc_len = data["doc_len"]
+            index._deleted = data["deleted"]
+        return index
+
+if __name__=="__main__":
+    __all__=["BM25Index","tokenize"]
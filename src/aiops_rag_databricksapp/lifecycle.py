@@ -0,0 +1,55 @@
+from typing import Dict, Iterator
+from contextlib import contextmanager
+import time
+
+from dataclasses import dataclass, field
+
+
+@dataclass
+class StartupProfile:
+    """
+    Wall-clock breakdown of application start-up
+    ---
+
+    Phases are recorded in the order they run, e.g. import, config,
+    index_load, graph_compile and warm_up.
+    """
+    phases:Dict[str, float] = field(default_factory=dict)
+
+    @contextmanager
+    def phase(self, name:str)->Iterator[None]:
+        """Time the enclosed block as phase `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name:str, seconds:float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @property
+    def total(self)->float:
+        return sum(self.phases.values())
+
+    def report(self)->str:
+        """Human-readable breakdown, one phase per line"""
+        lines = [f"   {name:<14} {seconds:7.3f}s" for name, seconds in self.phases.items()]
+        lines.append(f"   {'total':<14} {self.total:7.3f}s")
+        return "\n".join(lines)
+
+
+def import_runtime():
+    """
+    Import the heavy LangChain/OpenAI/FAISS/LangGraph modules
+
+    The package imports these lazily; calling this during start-up moves
+    their cost into a measurable phase instead of the first request.
+    """
+    import faiss  # noqa: F401
+    import langchain_openai  # noqa: F401
+    import langchain_community.vectorstores.faiss  # noqa: F401
+    import langgraph.graph  # noqa: F401
+
+if __name__=="__main__":
+    __all__=["StartupProfile","import_runtime"]
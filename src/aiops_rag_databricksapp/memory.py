@@ -0,0 +1,232 @@
+from typing import TYPE_CHECKING, Any, Dict, List, Sequence, Set, Tuple
+from collections import OrderedDict
+import logging
+import threading
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.memory import InMemorySaver
+
+from aiops_rag_databricksapp.context import token_counter
+from aiops_rag_databricksapp.lexical import tokenize
+from aiops_rag_databricksapp.metrics import span, with_llm_metrics
+from aiops_rag_databricksapp.rag_state import RAGState
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+Turn = Tuple[str, str]
+
+# Words that point back at earlier turns ("restart it", "what about the other one")
+_REFERRING = frozenset(
+    "it its this that these those they them their there he she him her above previous same former latter "
+    "also else other another one ones more again instead then".split()
+)
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is me my of on or should the to "
+    "was what when where which who why will with you your about".split()
+) | _REFERRING
+
+CONDENSE_PROMPT = """Rewrite the follow-up question as a standalone search query for the runbook index.
+Keep every service, error and metric name it refers to. Return only the query.
+
+{conversation}Follow-up question: {question}
+Standalone query:"""
+
+SUMMARY_PROMPT = """Update the running summary of a conversation about operational runbooks with the new turns.
+Keep services, errors, decisions and open questions; drop pleasantries. At most {words} words.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}
+
+Updated summary:"""
+
+
+def render_turns(turns:Sequence[Turn])->str:
+    return "".join(f"User: {question}\nAssistant: {answer}\n" for question, answer in turns)
+
+
+def conversation_blocks(summary:str, turns:Sequence[Turn])->Tuple[str, str]:
+    """Prompt blocks for the running summary and the recent turns; empty when there are none"""
+    return (
+        f"Conversation summary:\n{summary}\n\n" if summary else "",
+        f"Recent conversation:\n{render_turns(turns)}\n" if turns else "",
+    )
+
+
+@dataclass
+class ConversationMemory:
+    """
+    Bounded multi-turn memory for the chat graph
+    ---
+
+    Runs as two graph nodes around the RAG nodes, on state checkpointed
+    per conversation thread:
+
+    - `condense` (first) rewrites a follow-up into a standalone retrieval
+      query, calling the LLM only for questions that look like follow-ups,
+      and marks the previous turn's chunks for reuse when the new query
+      stays on the same topic, which skips retrieval.
+    - `remember` (last) appends the turn to the verbatim history. Once
+      the history exceeds `history_token_budget`, its oldest turns are
+      folded into a running summary capped at `summary_token_budget`,
+      down to half the budget. The summary therefore changes every few
+      turns rather than every turn, which keeps the prompt prefix stable.
+
+    The prompt carries at most the summary, the history and the packed
+    context, so its size stays bounded however long the conversation runs.
+    Memory LLM calls are counted in the request trace but kept out of the
+    graph's token stream, so they are not taken for answer tokens.
+
+    Args:
+        llm: Chat model used to condense follow-ups and update the summary
+        model: Model whose tokenizer counts memory tokens
+        summary_token_budget: Maximum tokens of the running summary
+        history_token_budget: Maximum tokens of verbatim recent turns
+        reuse_overlap: Fraction of the query's terms shared with the previous query at which its chunks are reused
+        min_standalone_terms: Content terms from which a question without referring words counts as standalone
+    """
+    llm:"ChatOpenAI"
+    model:str = "gpt-4o-mini"
+    summary_token_budget:int = 300
+    history_token_budget:int = 800
+    reuse_overlap:float = 0.6
+    min_standalone_terms:int = 3
+
+    def __post_init__(self):
+        self.count_tokens, self._truncate = token_counter(self.model)
+
+    @staticmethod
+    def _terms(text:str)->Set[str]:
+        return {term for term in tokenize(text) if term not in _STOPWORDS and len(term) > 1}
+
+    def is_follow_up(self, question:str)->bool:
+        """Whether `question` likely depends on earlier turns"""
+        words = set(tokenize(question))
+        return bool(words & _REFERRING) or len(self._terms(question)) < self.min_standalone_terms
+
+    def topic_overlap(self, query:str, previous:str)->float:
+        """Fraction of the content terms of `query` that `previous` shares"""
+        terms = self._terms(query)
+        if not terms:
+            return 1.0
+        return len(terms & self._terms(previous)) / len(terms)
+
+    def _complete(self, prompt:str)->str:
+        return str(self.llm.invoke(prompt, config=with_llm_metrics()).content).strip()
+
+    def condense(self, state:RAGState)->Dict[str, Any]:
+        """Memory node: standalone retrieval query for this turn, and whether the last turn's chunks still apply"""
+        if not (state.turns or state.summary):
+            return {"query": state.question, "reused": False}
+        query = state.question
+        if self.is_follow_up(state.question):
+            summary, recent = conversation_blocks(state.summary, state.turns)
+            with span("condense"):
+                query = self._complete(CONDENSE_PROMPT.format(conversation=summary + recent, question=state.question))
+            query = query or state.question
+        reused = bool(state.chunk_ids) and bool(state.query) and self.topic_overlap(query, state.query) >= self.reuse_overlap
+        update:Dict[str, Any] = {"query": query, "reused": reused}
+        if reused:
+            # Re-emitted so streaming callers see the sources of this turn
+            update.update(chunk_ids=state.chunk_ids, scores=state.scores)
+        return update
+
+    def _tokens(self, turns:Sequence[Turn])->int:
+        return self.count_tokens(render_turns(turns)) if turns else 0
+
+    def _fallback_summary(self, summary:str, turns:Sequence[Turn])->str:
+        """Extractive summary: the questions asked, oldest dropped first"""
+        lines = ([summary] if summary else []) + [f"User asked: {question}" for question, _ in turns]
+        while len(lines) > 1 and self.count_tokens("\n".join(lines)) > self.summary_token_budget:
+            lines.pop(0)
+        return self._truncate("\n".join(lines), self.summary_token_budget)
+
+    def summarize(self, summary:str, turns:Sequence[Turn])->str:
+        """Running summary with `turns` folded in, within `summary_token_budget`"""
+        prompt = SUMMARY_PROMPT.format(
+            words=max(1, self.summary_token_budget * 3 // 4), summary=summary or "(none)", turns=render_turns(turns)
+        )
+        try:
+            with span("summarize"):
+                updated = self._complete(prompt)
+        except Exception as e:
+            logger.warning("Conversation summary update failed (%s); keeping an extractive summary", e)
+            return self._fallback_summary(summary, turns)
+        if self.count_tokens(updated) > self.summary_token_budget:
+            updated = self._truncate(updated, self.summary_token_budget)
+        return updated
+
+    def remember(self, state:RAGState)->Dict[str, Any]:
+        """Memory node: record the turn, folding the oldest turns into the summary once over budget"""
+        turns:List[Turn] = [*state.turns, (state.question, state.answer)]
+        summary = state.summary
+        if self._tokens(turns) > self.history_token_budget:
+            keep = len(turns)
+            while keep > 0 and self._tokens(turns[len(turns) - keep:]) > self.history_token_budget // 2:
+                keep -= 1
+            summary = self.summarize(summary, turns[:len(turns) - keep])
+            turns = turns[len(turns) - keep:]
+        return {"turns": turns, "summary": summary}
+
+
+class SessionCheckpointer(InMemorySaver):
+    """
+    In-memory checkpointer holding only the latest state of recent conversations
+    ---
+
+    Each saved checkpoint replaces the thread's earlier checkpoints, so a
+    conversation costs one bounded state however many turns it has, and
+    beyond `max_sessions` threads the least recently used one is dropped.
+
+    Args:
+        max_sessions: Conversation threads kept
+    """
+
+    def __init__(self, max_sessions:int=1000):
+        super().__init__()
+        self.max_sessions = max_sessions
+        self._sessions:"OrderedDict[str, None]" = OrderedDict()
+        self._blob_keys:Dict[Tuple[str, str], Set[tuple]] = {}
+        self._lock = threading.Lock()
+
+    def put(self, config:RunnableConfig, checkpoint, metadata, new_versions)->RunnableConfig:
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            checkpoints = self.storage[thread_id][checkpoint_ns]
+            for checkpoint_id in [cid for cid in checkpoints if cid != checkpoint["id"]]:
+                del checkpoints[checkpoint_id]
+                self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            keys = self._blob_keys.setdefault((thread_id, checkpoint_ns), set())
+            keys.update((thread_id, checkpoint_ns, channel, version) for channel, version in new_versions.items())
+            live = {(thread_id, checkpoint_ns, *item) for item in checkpoint["channel_versions"].items()}
+            for key in keys - live:
+                self.blobs.pop(key, None)
+            keys &= live
+            self._sessions[thread_id] = None
+            self._sessions.move_to_end(thread_id)
+            evicted = []
+            while len(self._sessions) > self.max_sessions:
+                evicted.append(self._sessions.popitem(last=False)[0])
+        for old in evicted:
+            self.delete_thread(old)
+        return saved
+
+    def delete_thread(self, thread_id:str)->None:
+        with self._lock:
+            self._sessions.pop(thread_id, None)
+            for key in [key for key in self._blob_keys if key[0] == thread_id]:
+                del self._blob_keys[key]
+        super().delete_thread(thread_id)
+
+
+if __name__=="__main__":
+    __all__=["ConversationMemory","SessionCheckpointer","conversation_blocks"]
@@ -0,0 +1,459 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from uuid import UUID, uuid4
+import inspect
+import json
+import logging
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import RunnableConfig
+
+from dataclasses import dataclass, field
+
+# Histogram bucket upper bounds in seconds
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Key under which the request trace travels in RunnableConfig["configurable"]
+TRACE_KEY = "request_trace"
+
+trace_logger = logging.getLogger("aiops_rag_databricksapp.trace")
+
+
+@dataclass
+class Histogram:
+    """Cumulative-bucket histogram plus a window of recent samples for quantiles"""
+    counts:List[int] = field(default_factory=lambda: [0] * len(_BUCKETS))
+    total:float = 0.0
+    count:int = 0
+    recent:deque = field(default_factory=lambda: deque(maxlen=1024))
+
+    def observe(self, value:float):
+        for i, bound in enumerate(_BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+        self.recent.append(value)
+
+    def quantile(self, q:float)->float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class MetricsRegistry:
+    """
+    Process-wide latency histograms, counters and gauges
+    ---
+
+    Exposed in the Prometheus text format by `to_prometheus`. Gauges
+    come from collectors, callables returning a dict of numbers that are
+    read at export time (e.g. cache statistics).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms:Dict[Tuple[str, Tuple], Histogram] = {}
+        self._counters:Dict[Tuple[str, Tuple], float] = {}
+        self._collectors:Dict[str, Callable[[], Optional[Dict[str, float]]]] = {}
+
+    @staticmethod
+    def _key(name:str, labels:Dict[str, str])->Tuple[str, Tuple]:
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name:str, value:float, **labels:str):
+        with self._lock:
+            self._histograms.setdefault(self._key(name, labels), Histogram()).observe(value)
+
+    def inc(self, name:str, value:float=1.0, **labels:str):
+        with self._lock:
+            key = self._key(name, labels)
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def register_collector(self, name:str, collect:Callable[[], Optional[Dict[str, float]]]):
+        """Export the numeric values `collect()` returns as gauges `rag_<name>_<key>`"""
+        with self._lock:
+            self._collectors[name] = collect
+
+    def record_request(self, trace:"RequestTrace"):
+        """Fold a finished request into the request-level metrics"""
+        cached = str(trace.cache_hit).lower()
+        self.observe("rag_request_seconds", trace.total or 0.0, cached=cached)
+        self.inc("rag_requests_total", cached=cached)
+        if trace.ttft is not None:
+            self.observe("rag_time_to_first_token_seconds", trace.ttft, cached=cached)
+        self.inc("rag_retrieved_docs_total", trace.retrieved_docs)
+        if trace.route is not None:
+            self.observe("rag_route_seconds", trace.total or 0.0, route=trace.route)
+            self.inc("rag_route_total", route=trace.route, reason=trace.route_reason)
+        for kind, count in trace.tokens.items():
+            self.inc("rag_llm_tokens_total", count, kind=kind)
+
+    def stage_summary(self)->List[Dict[str, Any]]:
+        """Count, mean, p50 and p95 in milliseconds of every recorded stage"""
+        with self._lock:
+            rows = [
+                {
+                    "stage": dict(labels)["stage"],
+                    "count": hist.count,
+                    "mean_ms": 1000 * hist.total / hist.count if hist.count else 0.0,
+                    "p50_ms": 1000 * hist.quantile(0.5),
+                    "p95_ms": 1000 * hist.quantile(0.95),
+                }
+                for (name, labels), hist in self._histograms.items()
+                if name == "rag_stage_seconds"
+            ]
+        return sorted(rows, key=lambda row: row["stage"])
+
+    @staticmethod
+    def _labels(labels:Tuple, extra:Optional[Dict[str, str]]=None)->str:
+        items = list(labels) + list((extra or {}).items())
+        if not items:
+            return ""
+        return "{" + ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in items) + "}"
+
+    def to_prometheus(self)->str:
+        """All metrics in the Prometheus text exposition format"""
+        lines:List[str] = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            collectors = list(self._collectors.items())
+
+        declared = set()
+        for (name, labels), hist in histograms:
+            if name not in declared:
+                lines.append(f"# TYPE {name} histogram")
+                declared.add(name)
+            for bound, count in zip(_BUCKETS, hist.counts):
+                lines.append(f"{name}_bucket{self._labels(labels, {'le': str(bound)})} {count}")
+            lines.append(f"{name}_bucket{self._labels(labels, {'le': '+Inf'})} {hist.count}")
+            lines.append(f"{name}_sum{self._labels(labels)} {hist.total}")
+            lines.append(f"{name}_count{self._labels(labels)} {hist.count}")
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for collector, collect in collectors:
+            for key, value in (collect() or {}).items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE rag_{collector}_{key} gauge")
+                    lines.append(f"rag_{collector}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+REGISTRY = MetricsRegistry()
+
+
+@dataclass
+class Span:
+    """One timed stage of a request, with its start relative to the request start"""
+    name:str
+    start:float
+    seconds:float
+    attributes:Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class RequestTrace:
+    """
+    Spans, token counts and outcome of one question
+    ---
+
+    Spans are appended from whichever thread runs the stage, so all
+    mutation goes through a lock.
+    """
+    question:str
+    request_id:str = field(default_factory=lambda: uuid4().hex[:12])
+    spans:List[Span] = field(default_factory=list)
+    tokens:Dict[str, int] = field(default_factory=lambda: {"prompt": 0, "completion": 0})
+    cache_hit:bool = False
+    retrieved_docs:int = 0
+    ttft:Optional[float] = None
+    total:Optional[float] = None
+    route:Optional[str] = None
+    route_reason:str = ""
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self.started_at = time.time()
+
+    def elapsed(self)->float:
+        return time.perf_counter() - self._start
+
+    def add_span(self, name:str, start:float, seconds:float, **attributes:Any):
+        """Record a stage that started at perf_counter time `start`"""
+        with self._lock:
+            self.spans.append(Span(name, start - self._start, seconds, attributes))
+
+    def add_tokens(self, prompt:int=0, completion:int=0):
+        with self._lock:
+            self.tokens["prompt"] += prompt
+            self.tokens["completion"] += completion
+
+    def mark_first_token(self):
+        with self._lock:
+            if self.ttft is None:
+                self.ttft = self.elapsed()
+
+    def breakdown(self)->Dict[str, float]:
+        """Seconds per stage name, summed over repeated stages"""
+        totals:Dict[str, float] = {}
+        with self._lock:
+            for item in self.spans:
+                totals[item.name] = totals.get(item.name, 0.0) + item.seconds
+        return totals
+
+    def to_dict(self)->Dict[str, Any]:
+        with self._lock:
+            spans = [
+                {"name": s.name, "start_ms": 1000 * s.start, "ms": 1000 * s.seconds, **s.attributes}
+                for s in self.spans
+            ]
+        return {
+            "request_id": self.request_id,
+            "started_at": self.started_at,
+            "question": self.question,
+            "total_ms": 1000 * (self.total or 0.0),
+            "ttft_ms": None if self.ttft is None else 1000 * self.ttft,
+            "cache_hit": self.cache_hit,
+            "retrieved_docs": self.retrieved_docs,
+            "route": self.route,
+            "route_reason": self.route_reason,
+            "tokens": dict(self.tokens),
+            "spans": spans,
+        }
+
+
+_current:ContextVar[Optional[RequestTrace]] = ContextVar("aiops_rag_request_trace", default=None)
+
+
+def current_trace()->Optional[RequestTrace]:
+    return _current.get()
+
+
+@contextmanager
+def active_trace(trace:Optional[RequestTrace])->Iterator[Optional[RequestTrace]]:
+    """Make `trace` the target of `span` calls in the enclosed block"""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name:str, registry:MetricsRegistry=REGISTRY, **attributes:Any)->Iterator[None]:
+    """
+    Time the enclosed block as stage `name`
+
+    Always observed in the stage histogram; also added to the active
+    request trace, if there is one.
+    """
+    trace = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe("rag_stage_seconds", seconds, stage=name)
+        if trace is not None:
+            trace.add_span(name, start, seconds, **attributes)
+
+
+def finish_trace(trace:RequestTrace, registry:MetricsRegistry=REGISTRY):
+    """Close a request: record its totals and write it to the trace log; later calls are no-ops"""
+    if trace.total is not None:
+        return
+    trace.total = trace.elapsed()
+    registry.record_request(trace)
+    if trace_logger.isEnabledFor(logging.INFO):
+        trace_logger.info(json.dumps(trace.to_dict(), default=str))
+
+
+def trace_config(trace:RequestTrace, config:Optional[RunnableConfig]=None)->RunnableConfig:
+    """Run config carrying `trace` to instrumented nodes and LLM calls"""
+    config = dict(config or {})
+    config["configurable"] = {**config.get("configurable", {}), TRACE_KEY: trace}
+    config["callbacks"] = list(config.get("callbacks") or []) + [LLMMetricsHandler(trace)]
+    return config
+
+
+def with_llm_metrics(config:Optional[RunnableConfig]=None)->RunnableConfig:
+    """`config` with an LLM metrics handler attached, bound to the active trace, unless it has one"""
+    config = dict(config or {})
+    callbacks = config.get("callbacks")
+    if isinstance(callbacks, list) and any(isinstance(cb, LLMMetricsHandler) for cb in callbacks):
+        return config
+    if callbacks is not None and not isinstance(callbacks, list):
+        # A callback manager from a parent run already carries the parent's handlers
+        return config
+    config["callbacks"] = list(callbacks or []) + [LLMMetricsHandler(_current.get())]
+    return config
+
+
+def _trace_from(config:Optional[RunnableConfig])->Optional[RequestTrace]:
+    return ((config or {}).get("configurable") or {}).get(TRACE_KEY) or _current.get()
+
+
+def instrument_node(name:str, func:Callable)->Callable:
+    """
+    Wrap a graph node so it runs as span `node:<name>` of the request trace
+
+    The trace is taken from the run config and made active for the
+    node, so stages timed inside it (embedding, search, prompt
+    building) land in the same trace.
+    """
+    takes_config = "config" in inspect.signature(func).parameters
+
+    if inspect.iscoroutinefunction(func):
+        async def node(state, config:RunnableConfig):
+            with active_trace(_trace_from(config)), span(f"node:{name}"):
+                return await (func(state, config=config) if takes_config else func(state))
+    else:
+        def node(state, config:RunnableConfig):
+            with active_trace(_trace_from(config)), span(f"node:{name}"):
+                return func(state, config=config) if takes_config else func(state)
+    node.__name__ = getattr(func, "__name__", name)
+    return node
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """
+    Callback handler timing LLM calls and tools
+    ---
+
+    Records `llm_first_token` (time to first streamed token) and `llm`
+    (full call) spans, prompt/completion token counts (from the usage
+    metadata, or counted streamed tokens when the provider reports
+    none) and `tool:<name>` spans.
+    """
+    run_inline = True
+
+    def __init__(self, trace:Optional[RequestTrace]=None, registry:MetricsRegistry=REGISTRY):
+        self.trace = trace
+        self.registry = registry
+        self._starts:Dict[UUID, float] = {}
+        self._first_token:Dict[UUID, bool] = {}
+        self._streamed:Dict[UUID, int] = {}
+        self._tools:Dict[UUID, Tuple[str, float]] = {}
+
+    def _record(self, name:str, start:float, **attributes:Any):
+        seconds = time.perf_counter() - start
+        self.registry.observe("rag_stage_seconds", seconds, stage=name)
+        if self.trace is not None:
+            self.trace.add_span(name, start, seconds, **attributes)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id:UUID, **kwargs:Any):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id:UUID, **kwargs:Any):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_new_token(self, token:str, *, run_id:UUID, **kwargs:Any):
+        self._streamed[run_id] = self._streamed.get(run_id, 0) + 1
+        if not self._first_token.get(run_id) and run_id in self._starts and token:
+            self._first_token[run_id] = True
+            self._record("llm_first_token", self._starts[run_id])
+            if self.trace is not None:
+                self.trace.mark_first_token()
+
+    @staticmethod
+    def _usage(response)->Tuple[int, int]:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            return usage.get("prompt_tokens", 0) or 0, usage.get("completion_tokens", 0) or 0
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if metadata:
+                    return metadata.get("input_tokens", 0), metadata.get("output_tokens", 0)
+        return 0, 0
+
+    def on_llm_end(self, response, *, run_id:UUID, **kwargs:Any):
+        start = self._starts.pop(run_id, None)
+        streamed = self._streamed.pop(run_id, 0)
+        self._first_token.pop(run_id, None)
+        prompt, completion = self._usage(response)
+        completion = completion or streamed
+        self.registry.inc("rag_llm_calls_total")
+        if self.trace is not None:
+            self.trace.add_tokens(prompt=prompt, completion=completion)
+        else:
+            self.registry.inc("rag_llm_tokens_total", prompt, kind="prompt")
+            self.registry.inc("rag_llm_tokens_total", completion, kind="completion")
+        if start is not None:
+            self._record("llm", start, prompt_tokens=prompt, completion_tokens=completion)
+
+    def on_llm_error(self, error:BaseException, *, run_id:UUID, **kwargs:Any):
+        self._starts.pop(run_id, None)
+        self._streamed.pop(run_id, None)
+        self._first_token.pop(run_id, None)
+        self.registry.inc("rag_llm_errors_total")
+
+    def on_tool_start(self, serialized, input_str, *, run_id:UUID, **kwargs:Any):
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        self._tools[run_id] = (name, time.perf_counter())
+
+    def on_tool_end(self, output, *, run_id:UUID, **kwargs:Any):
+        name, start = self._tools.pop(run_id, ("tool", None))
+        if start is not None:
+            self._record(f"tool:{name}", start)
+
+    def on_tool_error(self, error:BaseException, *, run_id:UUID, **kwargs:Any):
+        name, start = self._tools.pop(run_id, ("tool", None))
+        if start is not None:
+            self._record(f"tool:{name}", start, error=type(error).__name__)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry:MetricsRegistry = REGISTRY
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.to_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_metrics(port:int, registry:MetricsRegistry=REGISTRY, host:str="0.0.0.0")->ThreadingHTTPServer:
+    """Serve `/metrics` for Prometheus scraping from a daemon thread"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+def configure_trace_log(path:str):
+    """Append one JSON trace per request to `path`"""
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_logger.addHandler(handler)
+    trace_logger.setLevel(logging.INFO)
+    trace_logger.propagate = False
+
+if __name__=="__main__":
+    __all__=["REGISTRY","MetricsRegistry","RequestTrace","Span","span","active_trace","current_trace",
+             "finish_trace","trace_config","with_llm_metrics","instrument_node","LLMMetricsHandler",
+             "serve_metrics","configure_trace_log"]
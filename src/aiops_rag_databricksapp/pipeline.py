@@ -0,0 +1,163 @@
+from typing import Callable, Iterable, Iterator, List, Optional
+import itertools
+import queue
+import threading
+import time
+
+from langchain_core.documents import Document
+
+from aiops_rag_databricksapp.ingest import DocumentProcessor
+from aiops_rag_databricksapp.store import VectorStore
+from aiops_rag_databricksapp.dedup import NearDuplicateFilter
+from aiops_rag_databricksapp.scheduler import Priority, request_priority
+
+from dataclasses import dataclass, field
+
+_DONE = object()
+
+
+@dataclass
+class IngestStats:
+    """Running counters of a streaming ingest"""
+    documents:int = 0
+    chunks:int = 0
+    batches:int = 0
+    duplicates:int = 0
+    duplicate_chars:int = 0
+    started:float = field(default_factory=time.perf_counter)
+    finished:Optional[float] = None
+
+    @property
+    def seconds(self)->float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def chunks_per_sec(self)->float:
+        return self.chunks / self.seconds if self.seconds > 0 else 0.0
+
+
+@dataclass
+class IngestPipeline:
+    """
+    Streaming load → split → embed → index pipeline
+    ---
+
+    A background thread loads and splits sources into fixed-size chunk
+    batches and hands them over a bounded queue; the calling thread embeds
+    each batch and adds it to the index. Memory held by the pipeline is
+    bounded by `queue_size` batches regardless of corpus size, and the
+    index grows batch by batch.
+
+    With `dedup`, near-duplicate chunks are collapsed between splitting
+    and batching, so they are never embedded; the kept chunk lists the
+    sources of the duplicates it absorbed.
+
+    Args:
+        processor: Document loader and splitter
+        store: Vector store the batches are added to
+        embed_batch_size: Chunks per embedding request
+        queue_size: Batches buffered between splitting and embedding
+        progress_interval: Seconds between progress callbacks
+        on_progress: Called with the running stats every `progress_interval`
+        dedup: Near-duplicate filter applied to the chunk stream; None keeps every chunk
+    """
+    processor:DocumentProcessor
+    store:VectorStore
+    embed_batch_size:int = 256
+    queue_size:int = 4
+    progress_interval:float = 5.0
+    on_progress:Optional[Callable[[IngestStats], None]] = None
+    dedup:Optional[NearDuplicateFilter] = None
+
+    def _batches(self, chunks:Iterable[Document])->Iterator[List[Document]]:
+        chunks = iter(chunks)
+        while True:
+            batch = list(itertools.islice(chunks, self.embed_batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def _produce(self, sources:List[str], batches:queue.Queue, stats:IngestStats, stop:threading.Event):
+        """Load and split sources into the queue; runs on the producer thread"""
+        def counted(documents:Iterable[Document])->Iterator[Document]:
+            for doc in documents:
+                stats.documents += 1
+                yield doc
+        try:
+            documents = counted(self.processor.iter_documents(sources))
+            chunks = self.processor.iter_chunks(documents)
+            if self.dedup is not None:
+                chunks = self.dedup.filter(chunks)
+            for batch in self._batches(chunks):
+                while not stop.is_set():
+                    try:
+                        batches.put(batch, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            batches.put(_DONE)
+        except BaseException as e:
+            batches.put(e)
+
+    def run(self, sources:List[str])->IngestStats:
+        """
+        Ingest sources into the vector store
+
+        Args:
+            sources: List of URLs, PDF folder paths, PDF files or TXT file paths
+
+        Returns:
+            Final ingest statistics
+        """
+        stats = IngestStats()
+        if self.dedup is not None:
+            self.dedup.reset()
+        batches:queue.Queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._produce, args=(sources, batches, stats, stop), daemon=True
+        )
+        producer.start()
+
+        last_report = time.perf_counter()
+        try:
+            while True:
+                item = batches.get()
+                if item is _DONE:
+                    # Index types that train on a sample may still hold buffered batches
+                    with request_priority(Priority.BACKGROUND):
+                        self.store.flush()
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                # Ingest embedding requests yield to interactive queries under a shared rate limit
+                with request_priority(Priority.BACKGROUND):
+                    self.store.add_documents(item)
+                stats.chunks += len(item)
+                stats.batches += 1
+                if self.on_progress and time.perf_counter() - last_report >= self.progress_interval:
+                    last_report = time.perf_counter()
+                    self.on_progress(stats)
+        finally:
+            stop.set()
+            while producer.is_alive():
+                # Unblock a producer waiting on a full queue
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    pass
+                producer.join(timeout=0.1)
+
+        if self.dedup is not None:
+            self.dedup.apply(self.store)
+            stats.duplicates = self.dedup.stats.duplicates
+            stats.duplicate_chars = self.dedup.stats.chars_saved
+        stats.finished = time.perf_counter()
+        if self.on_progress:
+            self.on_progress(stats)
+        return stats
+
+if __name__=="__main__":
+    __all__=["IngestPipeline","IngestStats"]
@@ -1,64 +1,589 @@
-from langgraph.graph import StateGraph, END
-from langgraph.graph.state import CompiledStateGraph
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+import time
+
+import numpy as np
+
 from aiops_rag_databricksapp.rag_state import RAGState
-from aiops_rag_databricksapp.rag_react_node import ReActRAGNodes
-from aiops_rag_databricksapp.rag_node import RAGNodes
+from aiops_rag_databricksapp.rag_react_node import AgentBudgetExceeded, ReActRAGNodes
+from aiops_rag_databricksapp.rag_node import QUERY_VECTOR_KEY, RAGNodes
+from aiops_rag_databricksapp.embedding_cache import CachedEmbeddings
+from aiops_rag_databricksapp.semantic_cache import CacheEntry, SemanticCache
+from aiops_rag_databricksapp.context import ContextPacker
+from aiops_rag_databricksapp.memory import ConversationMemory, SessionCheckpointer
+from aiops_rag_databricksapp.metrics import (
+    RequestTrace, active_trace, current_trace, finish_trace, instrument_node, span, trace_config
+)
+from aiops_rag_databricksapp.router import (
+    AGENT_ROUTE, FALLBACK_ROUTE, RAG_ROUTE, QueryRouter, log_decision, log_outcome, router_logger
+)
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessageChunk
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 
-from langchain.schema.vectorstore import VectorStoreRetriever
-from langchain_openai import ChatOpenAI
+if TYPE_CHECKING:
+    from langgraph.checkpoint.base import BaseCheckpointSaver
+    from langgraph.graph.state import CompiledStateGraph
+    from langchain_core.vectorstores import VectorStoreRetriever
+    from langchain_openai import ChatOpenAI
 
 
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 @dataclass
 class RAGGraphBuilder:
-    """Builds and manages the LangGraph workflow"""
-    retriever: VectorStoreRetriever
-    llm: ChatOpenAI
-    
+    """
+    Builds and manages the LangGraph workflow
+    ---
+
+    Args:
+        retriever: Retriever used by the retriever node
+        llm: Chat model used by the responder node
+        max_concurrency: Maximum questions in flight in `run_batch`/`arun_batch`
+        cache: Semantic answer cache consulted by `run`, `arun`, `run_batch`, `arun_batch` and `stream`
+        packer: Token-budgeted context packer used by the responder
+        search_kwargs: Retriever options passed on every retrieval, e.g. k or lambda_mult
+        router: Routes each question to classic RAG or the ReAct agent; None always uses classic RAG
+        agent: ReAct nodes for escalated questions; created from the retriever and llm if None
+        memory: Conversation memory for questions asked with a `thread_id`; None answers every question on its own
+        checkpointer: Where conversation threads are kept; a `SessionCheckpointer` if None
+    """
+    retriever: "VectorStoreRetriever"
+    llm: "ChatOpenAI"
+    max_concurrency: int = 8
+    cache: Optional[SemanticCache] = None
+    packer: Optional[ContextPacker] = None
+    search_kwargs: Dict[str, Any] = field(default_factory=dict)
+    router: Optional[QueryRouter] = None
+    agent: Optional[ReActRAGNodes] = None
+    memory: Optional[ConversationMemory] = None
+    checkpointer: Optional["BaseCheckpointSaver"] = None
+
     def __post_init__(self):
-        self.nodes:RAGNodes = RAGNodes(retriever=self.retriever,llm=self.llm)
-        self.graph:CompiledStateGraph=None
-    
-    def build(self)->CompiledStateGraph:
+        self.nodes:RAGNodes = RAGNodes(
+            retriever=self.retriever,llm=self.llm,packer=self.packer,search_kwargs=self.search_kwargs
+        )
+        if self.router is not None and self.agent is None:
+            self.agent = ReActRAGNodes(
+                retriever=self.retriever,llm=self.llm,search_kwargs=self.search_kwargs,chunks=self.nodes.chunks
+            )
+        if self.memory is not None and self.checkpointer is None:
+            self.checkpointer = SessionCheckpointer()
+        self.graph:Optional["CompiledStateGraph"]=None
+        self.chat_graph:Optional["CompiledStateGraph"]=None
+
+    def build(self)->"CompiledStateGraph":
         """
         Build the RAG workflow graph
-        
+
+        retriever → responder; with a router, retriever → router, which
+        sends confident questions to the responder and escalates the rest
+        to the ReAct agent.
+
+        With memory, a chat graph is compiled alongside it for questions
+        asked in a conversation thread: memory → retriever → … →
+        remember, with the state checkpointed per thread. The memory node
+        condenses the question into a standalone query and skips the
+        retriever when the previous turn's chunks still apply.
+
         Returns:
             Compiled graph instance
         """
-        
-        builder = StateGraph(RAGState)
-        
-        builder.add_node("retriever", self.nodes.retrieve_docs)
-        builder.add_node("responder", self.nodes.generate_answer)
-        
-        builder.set_entry_point("retriever")
-        
-        builder.add_edge("retriever","responder")
-        builder.add_edge("responder",END)
-        
-        self.graph = builder.compile()
+        self.graph = self._compile(chat=False)
+        if self.memory is not None:
+            self.chat_graph = self._compile(chat=True)
         return self.graph
-    
-    def run(self, question:str)->dict:
+
+    def _compile(self, chat:bool)->"CompiledStateGraph":
+        from langgraph.graph import StateGraph, END
+
+        builder = StateGraph(RAGState)
+        end = "remember" if chat else END
+
+        builder.add_node("retriever", RunnableLambda(
+            instrument_node("retriever", self.nodes.retrieve_docs),
+            afunc=instrument_node("retriever", self.nodes.aretrieve_docs),
+            name="retriever",
+        ))
+        builder.add_node("responder", RunnableLambda(
+            instrument_node("responder", self.nodes.generate_answer),
+            afunc=instrument_node("responder", self.nodes.agenerate_answer),
+            name="responder",
+        ))
+
+        if chat:
+            builder.add_node("memory", RunnableLambda(instrument_node("memory", self.memory.condense), name="memory"))
+            builder.add_node("remember", RunnableLambda(instrument_node("remember", self.memory.remember), name="remember"))
+            answer = "router" if self.router is not None else "responder"
+            builder.set_entry_point("memory")
+            builder.add_conditional_edges(
+                "memory", lambda state: answer if state.reused else "retriever", {answer: answer, "retriever": "retriever"}
+            )
+            builder.add_edge("remember",END)
+        else:
+            builder.set_entry_point("retriever")
+
+        if self.router is not None:
+            builder.add_node("router", RunnableLambda(instrument_node("router", self._route), name="router"))
+            builder.add_node("agent", RunnableLambda(
+                instrument_node("agent", self._agent_answer),
+                afunc=instrument_node("agent", self._aagent_answer),
+                name="agent",
+            ))
+            builder.add_edge("retriever","router")
+            builder.add_conditional_edges(
+                "router", lambda state: state.route, {RAG_ROUTE: "responder", AGENT_ROUTE: "agent"}
+            )
+            builder.add_edge("agent",end)
+        else:
+            builder.add_edge("retriever","responder")
+        builder.add_edge("responder",end)
+
+        return builder.compile(checkpointer=self.checkpointer if chat else None)
+
+    def _route(self, state:RAGState)->Dict[str, Any]:
+        """Router node: decide between classic RAG and the agent from the retrieval results"""
+        decision = self.router.decide(state.query or state.question, state.scores, state.documents(self.nodes.chunks))
+        trace = current_trace()
+        if trace is not None:
+            trace.route, trace.route_reason = decision.route, decision.reason
+        log_decision(decision, request_id=trace.request_id if trace else None, question=state.question)
+        return {"route": decision.route}
+
+    def _fallback(self, error:AgentBudgetExceeded):
+        trace = current_trace()
+        if trace is not None:
+            trace.route = FALLBACK_ROUTE
+        router_logger.warning("%s; answering with classic RAG", error)
+
+    def _agent_answer(self, state:RAGState, config:Optional[RunnableConfig]=None)->Dict[str, Any]:
+        """Agent node: ReAct answer, or classic RAG once the agent's budget runs out"""
+        try:
+            return self.agent.generate_answer(state, config=config)
+        except AgentBudgetExceeded as e:
+            self._fallback(e)
+            return {**self.nodes.generate_answer(state, config=config), "route": FALLBACK_ROUTE}
+
+    async def _aagent_answer(self, state:RAGState, config:Optional[RunnableConfig]=None)->Dict[str, Any]:
+        """Async variant of `_agent_answer`"""
+        try:
+            return await self.agent.agenerate_answer(state, config=config)
+        except AgentBudgetExceeded as e:
+            self._fallback(e)
+            return {**await self.nodes.agenerate_answer(state, config=config), "route": FALLBACK_ROUTE}
+
+    @staticmethod
+    def _finish(trace:RequestTrace):
+        """Close the request trace and log the latency of its route"""
+        if trace.total is not None:
+            return
+        finish_trace(trace)
+        if trace.route is not None:
+            log_outcome(trace.route, trace.route_reason, trace.total, trace.ttft, request_id=trace.request_id)
+
+    def warm_up(self):
+        """
+        Compile the graph and run one retrieval ahead of the first question
+
+        The retrieval opens the embeddings client's connection pool and
+        faults the index pages in, so the first user question does not pay
+        for either.
+        """
+        if self.graph is None:
+            self.build()
+        self.retriever.invoke("warm up")
+
+    def _query_embeddings(self)->Optional[Embeddings]:
+        """
+        Embeddings client of the retriever's store, for embedding a batch of questions at once
+
+        A caching client is bypassed, so one-off question vectors are not
+        written to the persistent embedding cache. None when the retriever
+        has no store and so cannot take precomputed query vectors.
+        """
+        embeddings = getattr(getattr(self.retriever, "store", None), "embedding", None)
+        return embeddings.underlying if isinstance(embeddings, CachedEmbeddings) else embeddings
+
+    def documents(self, chunk_ids:List[str])->List[Document]:
+        """Resolve chunk ids from a result or event to the stored chunks"""
+        return [doc for doc in self.nodes.chunks.get_chunks(chunk_ids) if doc is not None]
+
+    def _with_documents(self, result:dict)->dict:
+        """Final state plus its chunks resolved, for callers outside the graph"""
+        return {**result, "retrieved_docs": self.documents(result.get("chunk_ids", []))}
+
+    @staticmethod
+    def _cached_result(question:str, entry:CacheEntry)->dict:
+        return {
+            "question": question,
+            "chunk_ids": entry.chunk_ids,
+            "scores": entry.scores,
+            "answer": entry.answer,
+            "cached": True,
+        }
+
+    def _cache_result(self, result:dict, latency:float, trace:Optional[RequestTrace]=None):
+        if self.cache is not None and result.get("answer"):
+            with active_trace(trace), span("cache_store"):
+                self.cache.store(
+                    result["question"], result["answer"], result.get("chunk_ids", []), result.get("scores", []), latency
+                )
+
+    def _cache_lookup(self, question:str, trace:RequestTrace, vector:Optional[np.ndarray]=None)->Optional[CacheEntry]:
+        if self.cache is None:
+            return None
+        with active_trace(trace), span("cache_lookup"):
+            entry = self.cache.lookup(question, vector=vector)
+        if entry is not None:
+            trace.cache_hit = True
+            trace.retrieved_docs = len(entry.chunk_ids)
+        return entry
+
+    def _batch_config(self, max_concurrency:Optional[int])->RunnableConfig:
+        return {"max_concurrency": max_concurrency or self.max_concurrency}
+
+    @staticmethod
+    def _thread_config(thread_id:str)->RunnableConfig:
+        return {"configurable": {"thread_id": thread_id}}
+
+    def _session(self, question:str, thread_id:Optional[str], trace:RequestTrace)->Tuple[Any, Any, RunnableConfig, Dict[str, Any], bool]:
+        """
+        Graph, input, config and run options for a question, and whether it stands on its own
+
+        A question asked in a thread runs on the chat graph from the
+        thread's checkpointed state; only the first question of a thread
+        stands on its own, so only it may be answered from or stored in
+        the semantic cache.
+        """
+        if self.graph is None:
+            self.build()
+        if thread_id is None:
+            return self.graph, RAGState(question=question), trace_config(trace), {}, True
+        if self.chat_graph is None:
+            raise ValueError("thread_id needs conversation memory; build the graph with a ConversationMemory")
+        config = trace_config(trace, self._thread_config(thread_id))
+        values = self.chat_graph.get_state(self._thread_config(thread_id)).values
+        standalone = not (values.get("turns") or values.get("summary"))
+        # Only the state at the end of a turn is checkpointed
+        return self.chat_graph, {"question": question}, config, {"durability": "exit"}, standalone
+
+    def _remember_cached(self, thread_id:Optional[str], question:str, entry:CacheEntry):
+        """Record a cached answer as the first turn of its thread"""
+        if thread_id is None:
+            return
+        self.chat_graph.update_state(self._thread_config(thread_id), {
+            "question": question,
+            "query": question,
+            "chunk_ids": entry.chunk_ids,
+            "scores": entry.scores,
+            "answer": entry.answer,
+            "turns": [(question, entry.answer)],
+        }, as_node="remember")
+
+    def forget(self, thread_id:str):
+        """Drop a conversation thread and its memory"""
+        if self.checkpointer is not None:
+            self.checkpointer.delete_thread(thread_id)
+
+    def run(self, question:str, thread_id:Optional[str]=None)->dict:
         """
         Run the RAG workflow
-        
+
         Args:
             question: User question
-            
+            thread_id: Conversation the question belongs to; None answers it on its own
+
         Returns:
-            Final state with answer
+            Final state with answer, plus `retrieved_docs` resolved from its chunk ids
+        """
+        trace = RequestTrace(question)
+        try:
+            graph, graph_input, config, options, standalone = self._session(question, thread_id, trace)
+            entry = self._cache_lookup(question, trace) if standalone else None
+            if entry is not None:
+                self._remember_cached(thread_id, question, entry)
+                return self._with_documents(self._cached_result(question, entry))
+
+            start = time.perf_counter()
+            result = graph.invoke(graph_input, config=config, **options)
+            trace.retrieved_docs = len(result.get("chunk_ids", []))
+            if standalone:
+                self._cache_result(result, time.perf_counter() - start, trace)
+            return self._with_documents(result)
+        finally:
+            self._finish(trace)
+
+    @staticmethod
+    def _record_batch_embedding(traces:List[RequestTrace], start:float):
+        """Add the shared question embedding request to every question's trace"""
+        seconds = time.perf_counter() - start
+        for trace in traces:
+            trace.add_span("embed_queries", start, seconds, batch=len(traces))
+
+    def _batch_lookup(self, questions:List[str], vectors:List[Optional[np.ndarray]], traces:List[RequestTrace])->List[Optional[dict]]:
+        """Cached results of a batch's questions, None for the questions to answer"""
+        results:List[Optional[dict]] = []
+        for question, vector, trace in zip(questions, vectors, traces):
+            entry = self._cache_lookup(question, trace, vector)
+            results.append(None if entry is None else self._with_documents(self._cached_result(question, entry)))
+        return results
+
+    def _batch_configs(self, misses:List[int], vectors:List[Optional[np.ndarray]], traces:List[RequestTrace], max_concurrency:Optional[int])->List[RunnableConfig]:
+        """Per-question run configs carrying the question's trace and embedding"""
+        return [
+            trace_config(traces[i], {**self._batch_config(max_concurrency), "configurable": {QUERY_VECTOR_KEY: vectors[i]}})
+            for i in misses
+        ]
+
+    def _batch_answered(self, results:List[Optional[dict]], misses:List[int], answered:List[dict], traces:List[RequestTrace], latency:float):
+        """Fill in the answered questions of a batch and cache their answers"""
+        for i, result in zip(misses, answered):
+            traces[i].retrieved_docs = len(result.get("chunk_ids", []))
+            self._cache_result(result, latency, traces[i])
+            results[i] = self._with_documents(result)
+
+    def run_batch(self, questions:List[str], max_concurrency:Optional[int]=None)->List[dict]:
         """
+        Run the RAG workflow for many questions concurrently
+
+        The questions are embedded in a single request to the store's
+        embeddings client, and each vector is used both for the semantic
+        cache lookup and for the question's retrieval. Cached questions
+        are answered from the cache; each question gets its own request
+        trace, like a question asked through `run`.
+
+        Args:
+            questions: User questions
+            max_concurrency: Override for `max_concurrency`
+
+        Returns:
+            Final states with `retrieved_docs`, in the order of `questions`
+        """
+        if self.graph is None:
+            self.build()
+        traces = [RequestTrace(question) for question in questions]
+        try:
+            vectors:List[Optional[np.ndarray]] = [None] * len(questions)
+            embeddings = self._query_embeddings()
+            if embeddings is not None and questions:
+                start = time.perf_counter()
+                vectors = [np.asarray(vector, dtype=np.float32) for vector in embeddings.embed_documents(list(questions))]
+                self._record_batch_embedding(traces, start)
+
+            results = self._batch_lookup(questions, vectors, traces)
+            misses = [i for i, result in enumerate(results) if result is None]
+            if misses:
+                start = time.perf_counter()
+                answered = self.graph.batch(
+                    [RAGState(question=questions[i]) for i in misses],
+                    config=self._batch_configs(misses, vectors, traces, max_concurrency),
+                )
+                self._batch_answered(results, misses, answered, traces, time.perf_counter() - start)
+            return results
+        finally:
+            for trace in traces:
+                self._finish(trace)
+
+    async def arun(self, question:str, thread_id:Optional[str]=None)->dict:
+        """Async variant of `run`"""
+        trace = RequestTrace(question)
+        try:
+            graph, graph_input, config, options, standalone = self._session(question, thread_id, trace)
+            entry = self._cache_lookup(question, trace) if standalone else None
+            if entry is not None:
+                self._remember_cached(thread_id, question, entry)
+                return self._with_documents(self._cached_result(question, entry))
+
+            start = time.perf_counter()
+            result = await graph.ainvoke(graph_input, config=config, **options)
+            trace.retrieved_docs = len(result.get("chunk_ids", []))
+            if standalone:
+                self._cache_result(result, time.perf_counter() - start, trace)
+            return self._with_documents(result)
+        finally:
+            self._finish(trace)
+
+    async def arun_batch(self, questions:List[str], max_concurrency:Optional[int]=None)->List[dict]:
+        """Async variant of `run_batch`"""
         if self.graph is None:
             self.build()
-            
-        initial_state = RAGState(question=question)
-        return self.graph.invoke(initial_state)
-    
+        traces = [RequestTrace(question) for question in questions]
+        try:
+            vectors:List[Optional[np.ndarray]] = [None] * len(questions)
+            embeddings = self._query_embeddings()
+            if embeddings is not None and questions:
+                start = time.perf_counter()
+                vectors = [np.asarray(vector, dtype=np.float32) for vector in await embeddings.aembed_documents(list(questions))]
+                self._record_batch_embedding(traces, start)
+
+            results = self._batch_lookup(questions, vectors, traces)
+            misses = [i for i, result in enumerate(results) if result is None]
+            if misses:
+                start = time.perf_counter()
+                answered = await self.graph.abatch(
+                    [RAGState(question=questions[i]) for i in misses],
+                    config=self._batch_configs(misses, vectors, traces, max_concurrency),
+                )
+                self._batch_answered(results, misses, answered, traces, time.perf_counter() - start)
+            return results
+        finally:
+            for trace in traces:
+                self._finish(trace)
+
+    def _stream_event(self, namespace:tuple, mode:str, chunk, timing:dict)->Optional[dict]:
+        """
+        Translate one LangGraph stream item into a stream event
+
+        Model output of the answering nodes becomes `token` events as it
+        streams. The ReAct agent's turns are not streamed: a turn is only
+        known to be the answer once it ends without tool calls, and the
+        agent may still run out of budget and hand over to classic RAG.
+        Its answer is emitted whole once the agent node has finished,
+        while a classic RAG fallback streams like the responder, so the
+        streamed text always equals the final answer. Only top-level
+        updates change the state.
+        """
+        if mode == "messages":
+            message, metadata = chunk
+            if namespace or metadata.get("langgraph_node") not in ("responder", "agent") or not message.content:
+                return None
+            if not isinstance(message, AIMessageChunk):
+                return None
+            return self._token_event(message.content, timing)
+        if namespace:
+            return None
+        for node, update in chunk.items():
+            update = dict(update)
+            timing["state"].update(update)
+            if node == "retriever" or (node == "memory" and update.get("reused")):
+                return self._sources_event(update["chunk_ids"], update["scores"])
+            if node == "router":
+                return {"type": "route", "route": update["route"], "reason": timing["trace"].route_reason}
+            if node == "agent" and update.get("route") != FALLBACK_ROUTE and update.get("answer"):
+                return self._token_event(update["answer"], timing)
+        return None
+
+    @staticmethod
+    def _token_event(content:str, timing:dict)->dict:
+        if timing["ttft"] is None:
+            timing["ttft"] = time.perf_counter() - timing["start"]
+        return {"type": "token", "content": content}
+
+    def _sources_event(self, chunk_ids:List[str], scores:List[float])->dict:
+        return {
+            "type": "sources",
+            "chunk_ids": chunk_ids,
+            "scores": scores,
+            "retrieved_docs": self.documents(chunk_ids),
+        }
+
+    def _done_event(self, timing:dict, cached:bool=False)->dict:
+        total = time.perf_counter() - timing["start"]
+        trace:RequestTrace = timing["trace"]
+        chunk_ids = timing["state"].get("chunk_ids", [])
+        trace.retrieved_docs = len(chunk_ids)
+        if cached:
+            trace.mark_first_token()
+        self._finish(trace)
+        return {
+            "type": "done",
+            "answer": timing["state"].get("answer", ""),
+            "chunk_ids": chunk_ids,
+            "scores": timing["state"].get("scores", []),
+            "retrieved_docs": self.documents(chunk_ids),
+            "time_to_first_token": timing["ttft"] if timing["ttft"] is not None else total,
+            "total_time": total,
+            "cached": cached,
+            "route": timing["state"].get("route", ""),
+            "query": timing["state"].get("query", ""),
+            "trace": trace,
+        }
+
+    def _cached_events(self, question:str, entry:CacheEntry, timing:dict)->Iterator[dict]:
+        """Replay a cached answer as stream events"""
+        timing["state"] = self._cached_result(question, entry)
+        yield self._sources_event(entry.chunk_ids, entry.scores)
+        timing["ttft"] = time.perf_counter() - timing["start"]
+        yield {"type": "token", "content": entry.answer}
+        yield self._done_event(timing, cached=True)
+
+    def stream(self, question:str, thread_id:Optional[str]=None)->Iterator[dict]:
+        """
+        Run the RAG workflow, streaming sources and answer tokens
+
+        Yields events in order: one `sources` event with the retrieved
+        chunk ids, scores and documents, a `route` event when a router is
+        configured, `token` events as the LLM emits answer tokens, then a
+        `done` event with the final answer and the time-to-first-token and
+        total time in seconds, and the request's `RequestTrace` with its
+        per-stage latency breakdown. In a thread, the `sources` event of a
+        follow-up on the same topic carries the previous turn's chunks.
+
+        Args:
+            question: User question
+            thread_id: Conversation the question belongs to; None answers it on its own
+
+        Yields:
+            Event dicts keyed by `type`
+        """
+        trace = RequestTrace(question)
+        timing = {"start": time.perf_counter(), "ttft": None, "state": {"question": question}, "trace": trace}
+        try:
+            graph, graph_input, config, options, standalone = self._session(question, thread_id, trace)
+            entry = self._cache_lookup(question, trace) if standalone else None
+            if entry is not None:
+                self._remember_cached(thread_id, question, entry)
+                yield from self._cached_events(question, entry, timing)
+                return
+
+            for namespace, mode, chunk in graph.stream(
+                graph_input,
+                stream_mode=["updates", "messages"],
+                config=config,
+                subgraphs=True,
+                **options,
+            ):
+                event = self._stream_event(namespace, mode, chunk, timing)
+                if event is not None:
+                    yield event
+            if standalone:
+                self._cache_result(timing["state"], time.perf_counter() - timing["start"], trace)
+            yield self._done_event(timing)
+        finally:
+            self._finish(trace)
+
+    async def astream(self, question:str, thread_id:Optional[str]=None)->AsyncIterator[dict]:
+        """Async variant of `stream`"""
+        trace = RequestTrace(question)
+        timing = {"start": time.perf_counter(), "ttft": None, "state": {"question": question}, "trace": trace}
+        try:
+            graph, graph_input, config, options, standalone = self._session(question, thread_id, trace)
+            entry = self._cache_lookup(question, trace) if standalone else None
+            if entry is not None:
+                self._remember_cached(thread_id, question, entry)
+                for event in self._cached_events(question, entry, timing):
+                    yield event
+                return
+
+            async for namespace, mode, chunk in graph.astream(
+                graph_input,
+                stream_mode=["updates", "messages"],
+                config=config,
+                subgraphs=True,
+                **options,
+            ):
+                event = self._stream_event(namespace, mode, chunk, timing)
+                if event is not None:
+                    yield event
+            if standalone:
+                self._cache_result(timing["state"], time.perf_counter() - timing["start"], trace)
+            yield self._done_event(timing)
+        finally:
+            self._finish(trace)
+
 if __name__=="__main__":
     __all__=["RAGGraphBuilder"]
-        
-        
\ No newline at end of file
+
+
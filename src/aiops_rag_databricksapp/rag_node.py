@@ -1,46 +1,95 @@
 from aiops_rag_databricksapp.rag_state import RAGState
+from aiops_rag_databricksapp.context import ContextPacker
+from aiops_rag_databricksapp.chunks import ChunkStore, chunk_refs, chunk_store_for
+from aiops_rag_databricksapp.metrics import span
+from aiops_rag_databricksapp.memory import conversation_blocks
 
-from langchain.schema.vectorstore import VectorStoreRetriever
-from langchain_openai import ChatOpenAI
+from typing import TYPE_CHECKING, Any, Dict, Optional
 
+from langchain_core.runnables import RunnableConfig
 
-from dataclasses import dataclass
+if TYPE_CHECKING:
+    from langchain_core.vectorstores import VectorStoreRetriever
+    from langchain_openai import ChatOpenAI
+
+
+from dataclasses import dataclass, field
+
+# Run config key of a question's precomputed embedding, set by `RAGGraphBuilder.run_batch`
+QUERY_VECTOR_KEY = "query_vector"
 
 @dataclass
 class RAGNodes:
-    """Contains node functions for RAG workflow"""
-    retriever:VectorStoreRetriever
-    llm:ChatOpenAI
+    """
+    Contains node functions for RAG workflow
+    ---
+
+    Args:
+        retriever: Retriever for the question
+        llm: Chat model generating the answer
+        packer: Packs retrieved chunks into a token budget; None uses every chunk as is
+        search_kwargs: Per-call retriever options, e.g. k, fetch_k, lambda_mult, score_threshold
+        chunks: Store retrieved chunk ids resolve against; defaults to the retriever's `VectorStore`
+    """
+    retriever:"VectorStoreRetriever"
+    llm:"ChatOpenAI"
+    packer:Optional[ContextPacker] = None
+    search_kwargs:Dict[str, Any] = field(default_factory=dict)
+    chunks:Optional[ChunkStore] = None
     
-    def retrieve_docs(self, state:RAGState) -> RAGState:
+    def __post_init__(self):
+        if self.chunks is None:
+            self.chunks = chunk_store_for(self.retriever)
+    
+    def _search_kwargs(self, state:RAGState, config:Optional[RunnableConfig])->Dict[str, Any]:
+        """Retriever options, plus the question's embedding when the run config carries one"""
+        vector = ((config or {}).get("configurable") or {}).get(QUERY_VECTOR_KEY)
+        if vector is None or state.query:
+            return self.search_kwargs
+        return {**self.search_kwargs, "query_vector": vector}
+
+    def retrieve_docs(self, state:RAGState, config:Optional[RunnableConfig]=None) -> Dict[str, Any]:
         """
         Retrieve relevant documents node
         
         Args:
             state: Current RAG state
+            config: Run config; a `query_vector` in its configurable is used instead of embedding the question
             
         Returns:
-            Updated RAG state with retrieved documents
+            State update with the retrieved chunk ids and scores
         """
-        docs = self.retriever.invoke(state.question)
-        return RAGState(
-            question=state.question,
-            retrieved_docs=docs
-        )
+        docs = self.retriever.invoke(state.query or state.question, **self._search_kwargs(state, config))
+        return chunk_refs(docs, self.chunks)
+    
+    async def aretrieve_docs(self, state:RAGState, config:Optional[RunnableConfig]=None) -> Dict[str, Any]:
+        """Async variant of `retrieve_docs`"""
+        docs = await self.retriever.ainvoke(state.query or state.question, **self._search_kwargs(state, config))
+        return chunk_refs(docs, self.chunks)
     
-    def generate_answer(self,state:RAGState)->RAGState:
+    def build_prompt(self, state:RAGState)->str:
         """
-        Generate answer from retrieved documents node
-        
-        Args:
-            state: Current RAG state with retrieved documents
-            
-        Returns:
-            Updated RAG state with generated answer
+        Build the answer prompt from the question and retrieved documents
+
+        In a chat thread the conversation summary and recent turns come
+        right after the instructions and before the context: they only
+        grow between turns, so consecutive prompts of a conversation share
+        their longest possible prefix for the provider's prompt cache.
         """
-        context = "\n\n".join([doc.page_content for doc in state.retrieved_docs])
-        
-        prompt = f"""
+        docs = state.documents(self.chunks)
+        if self.packer is not None:
+            docs = self.packer.pack(docs)
+        context = "\n\n".join([doc.page_content for doc in docs])
+
+        if state.summary or state.turns:
+            summary, recent = conversation_blocks(state.summary, state.turns)
+            return (
+                "Answer the question only based on the context. "
+                "Use the conversation only to understand what the question refers to.\n\n"
+                f"{summary}{recent}Context:\n{context}\n\nQuestion: {state.question}\n"
+            )
+
+        return f"""
                 Answer the question only based on the context.
 
                 Context:
@@ -48,14 +97,31 @@ class RAGNodes:
 
                 Question: {state.question}
         """
+    
+    def generate_answer(self,state:RAGState,config:Optional[RunnableConfig]=None)->Dict[str, Any]:
+        """
+        Generate answer from retrieved documents node
         
-        response = self.llm.invoke(input=prompt)
+        Args:
+            state: Current RAG state with retrieved documents
+            config: Run config, forwarded so graph streaming sees LLM tokens
+            
+        Returns:
+            State update with the generated answer
+        """
+        with span("build_prompt"):
+            prompt = self.build_prompt(state)
+        response = self.llm.invoke(input=prompt, config=config)
+        
+        return {"answer": response.content}
+    
+    async def agenerate_answer(self,state:RAGState,config:Optional[RunnableConfig]=None)->Dict[str, Any]:
+        """Async variant of `generate_answer`"""
+        with span("build_prompt"):
+            prompt = self.build_prompt(state)
+        response = await self.llm.ainvoke(input=prompt, config=config)
         
-        return RAGState(
-            question=state.question,
-            retrieved_docs=state.retrieved_docs,
-            answer=response.content
-        )
+        return {"answer": response.content}
 
 if __name__=="__main__":
     __all__=["RAGNodes"]
\ No newline at end of file
@@ -1,42 +1,76 @@
-from typing import List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+import time
 from aiops_rag_databricksapp.rag_state import RAGState
+from aiops_rag_databricksapp.chunks import ChunkStore, chunk_refs, chunk_store_for
 
 from langchain_core.documents import Document
 from langchain_core.tools import Tool
-from langchain_core.messages import HumanMessage
-from langchain.agents import create_react_agent
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import Runnable, RunnableConfig
 
-from langchain_community.utilities import WikipediaAPIWrapper
-from langchain_community.tools.wikipedia.tool import WikipediaQueryRun
+from aiops_rag_databricksapp.metrics import span, with_llm_metrics
+from aiops_rag_databricksapp.tools import ToolExecutor, ToolPolicy, set_wikipedia_timeout
 
-from langchain.schema.vectorstore import VectorStoreRetriever
-from langchain.schema.runnable import Runnable
-from langchain_openai import OpenAI
+if TYPE_CHECKING:
+    from langchain_core.vectorstores import VectorStoreRetriever
+    from langchain_openai import ChatOpenAI
+
+from dataclasses import dataclass, field
+
+
+class AgentBudgetExceeded(Exception):
+    """The ReAct agent ran out of steps or time before producing an answer"""
 
-from dataclasses import dataclass
 
 @dataclass
 class ReActRAGNodes:
-    """Contains node functions for RAG workflow"""
-    retriever: VectorStoreRetriever
-    llm: OpenAI
+    """
+    Contains node functions for RAG workflow
+    ---
+
+    Args:
+        retriever: Retriever behind the `retriever` tool and node
+        llm: Chat model driving the ReAct agent
+        search_kwargs: Per-call retriever options
+        chunks: Store retrieved chunk ids resolve against; defaults to the retriever's `VectorStore`
+        executor: Tool execution layer (result cache, deadlines, concurrency); created if None
+        tool_policies: Per-tool deadline and cache policy by tool name
+        max_steps: Agent turns (LLM call plus its tool calls) allowed per answer
+        time_budget: Seconds an answer may take, checked between agent steps; None for no limit
+    """
+    retriever: "VectorStoreRetriever"
+    llm: "ChatOpenAI"
+    search_kwargs: Dict[str, Any] = field(default_factory=dict)
+    chunks: Optional[ChunkStore] = None
+    executor: Optional[ToolExecutor] = None
+    tool_policies: Dict[str, ToolPolicy] = field(default_factory=dict)
+    max_steps: int = 6
+    time_budget: Optional[float] = 30.0
     
     def __post_init__(self):
         self.__agent:Runnable = None
+        if self.chunks is None:
+            self.chunks = chunk_store_for(self.retriever)
+        if self.executor is None:
+            self.executor = ToolExecutor()
 
-    def retrieve_docs(self, state:RAGState)->RAGState:
+    def retrieve_docs(self, state:RAGState)->Dict[str, Any]:
         """Classic retriever node"""
-        docs = self.retriever.invoke(state.question)
-        return RAGState(
-            question=state.question,
-            retrieved_docs=docs
-        )
+        with span("node:react_retriever"):
+            docs = self.retriever.invoke(state.query or state.question, **self.search_kwargs)
+        return chunk_refs(docs, self.chunks)
+    
+    async def aretrieve_docs(self, state:RAGState)->Dict[str, Any]:
+        """Async variant of `retrieve_docs`"""
+        with span("node:react_retriever"):
+            docs = await self.retriever.ainvoke(state.query or state.question, **self.search_kwargs)
+        return chunk_refs(docs, self.chunks)
     
     def __build_tools(self)->List[Tool]:
-        """Build retriever + wikipedia tools"""
+        """Build retriever + wikipedia tools, run through the tool executor"""
         
         def retriever_tool_fn(query:str)->str:
-            docs:List[Document] = self.retriever.invoke(query)
+            docs:List[Document] = self.retriever.invoke(query, **self.search_kwargs)
             if not docs:
                 return "No documents found."
             
@@ -47,49 +81,120 @@ class ReActRAGNodes:
                 merged.append(f"[{i}] {title}\n{d.page_content}")
             return "\n\n".join(merged)
 
-        retriever_tool = Tool(
+        retriever_tool = self.executor.tool(
             name="retriever",
             description="Fetch passages from indexed corpus.",
             func=retriever_tool_fn,
+            policy=self.tool_policies.get("retriever"),
         )
+        from langchain_community.utilities import WikipediaAPIWrapper
+        from langchain_community.tools.wikipedia.tool import WikipediaQueryRun
+
+        # Each HTTP request of a Wikipedia call is bounded, so a hung backend frees its tool thread
+        set_wikipedia_timeout((self.tool_policies.get("wikipedia") or self.executor.default_policy).timeout)
         wiki = WikipediaQueryRun(
             api_wrapper=WikipediaAPIWrapper(top_k_results=3, lang="en")
         )
-        wikipedia_tool = Tool(
+        wikipedia_tool = self.executor.tool(
             name="wikipedia",
             description="Search Wikipedia for general knowledge.",
             func=wiki.run,
+            policy=self.tool_policies.get("wikipedia"),
         )
         return [retriever_tool, wikipedia_tool]
 
+    def tool_stats(self)->Dict[str, Dict[str, float]]:
+        """Per-tool latency and result cache statistics"""
+        return self.executor.stats()
+
     def __build_agent(self):
         """ReAct agent with tools"""
-        tools = self._build_tools()
+        from langgraph.prebuilt import create_react_agent
+
+        tools = self.__build_tools()
         system_prompt = (
             "You are a helpful RAG agent. "
             "Prefer 'retriever' for user-provided docs; use 'wikipedia' for general knowledge. "
             "Return only the final useful answer."
         )
-        self.__agent = create_react_agent(self.llm, tools=tools,prompt=system_prompt)
+        self.__agent = create_react_agent(self.llm, tools=tools,prompt=system_prompt,checkpointer=False)
+
+    @staticmethod
+    def __final_answer(result:dict)->Optional[str]:
+        messages = result.get("messages",[])
+        if messages:
+            return getattr(messages[-1], "content", None)
+        return None
+
+    @staticmethod
+    def __answered(result:dict)->bool:
+        messages = result.get("messages",[])
+        return bool(messages) and isinstance(messages[-1], AIMessage) and not messages[-1].tool_calls
 
-    def generate_answer(self, state:RAGState)->RAGState:
+    def __agent_config(self, config:Optional[RunnableConfig])->RunnableConfig:
+        config = with_llm_metrics(config)
+        # Each agent step is two graph steps: the LLM call and the tool calls it requested
+        config["recursion_limit"] = 2 * self.max_steps + 1
+        return config
+
+    def __check_time(self, result:dict, deadline:Optional[float]):
+        if deadline is not None and time.monotonic() > deadline and not self.__answered(result):
+            raise AgentBudgetExceeded(f"ReAct agent exceeded its time budget of {self.time_budget}s")
+
+    def generate_answer(self, state:RAGState, config:Optional[RunnableConfig]=None)->Dict[str, Any]:
         """
         Generate answer using ReAct agent with retriever + wikipedia.
+
+        LLM calls and tool calls of the agent loop are timed through a
+        metrics callback handler added to `config`. The loop is stopped
+        after `max_steps` steps or once `time_budget` has passed.
+
+        Raises:
+            AgentBudgetExceeded: The budget ran out before a final answer
         """
+        from langgraph.errors import GraphRecursionError
+
         if self.__agent is None:
             self.__build_agent()
         
-        result = self.__agent.invoke({"messages":[HumanMessage(content=state.question)]})
-        messages = result.get("messages",[])
-        if messages:
-            answer_msg = messages[-1]
-            answer = getattr(answer_msg, "content", None)
+        deadline = time.monotonic() + self.time_budget if self.time_budget else None
+        result:dict = {}
+        with span("node:react_agent"):
+            try:
+                for result in self.__agent.stream(
+                    {"messages":[HumanMessage(content=state.query or state.question)]},
+                    config=self.__agent_config(config),
+                    stream_mode="values",
+                ):
+                    self.__check_time(result, deadline)
+            except GraphRecursionError as e:
+                raise AgentBudgetExceeded(f"ReAct agent exceeded its budget of {self.max_steps} steps") from e
+        answer = self.__final_answer(result)
         
-        return RAGState(
-            question=state.question,
-            retrieved_docs=state.retrieved_docs,
-            answer=answer or "Could not generate answer."
-        )
+        return {"answer": answer or "Could not generate answer."}
+
+    async def agenerate_answer(self, state:RAGState, config:Optional[RunnableConfig]=None)->Dict[str, Any]:
+        """Async variant of `generate_answer`"""
+        from langgraph.errors import GraphRecursionError
+
+        if self.__agent is None:
+            self.__build_agent()
+        
+        deadline = time.monotonic() + self.time_budget if self.time_budget else None
+        result:dict = {}
+        with span("node:react_agent"):
+            try:
+                async for result in self.__agent.astream(
+                    {"messages":[HumanMessage(content=state.query or state.question)]},
+                    config=self.__agent_config(config),
+                    stream_mode="values",
+                ):
+                    self.__check_time(result, deadline)
+            except GraphRecursionError as e:
+                raise AgentBudgetExceeded(f"ReAct agent exceeded its budget of {self.max_steps} steps") from e
+        answer = self.__final_answer(result)
+        
+        return {"answer": answer or "Could not generate answer."}
 
 if __name__=="__main__":
-    __all__=["ReActRAGNodes"]
\ No newline at end of file
+    __all__=["ReActRAGNodes","AgentBudgetExceeded"]
\ No newline at end of file
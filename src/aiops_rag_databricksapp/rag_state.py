@@ -1,14 +1,41 @@
-from typing import List
+from typing import TYPE_CHECKING, List, Tuple
 from pydantic import BaseModel
-from langchain.schema import Document
+from langchain_core.documents import Document
+
+if TYPE_CHECKING:
+    from aiops_rag_databricksapp.chunks import ChunkStore
 
 class RAGState(BaseModel):
-    """State object for RAG workflow"""
-    
+    """
+    State object for RAG workflow
+    ---
+
+    Retrieved chunks are carried by id with their retrieval scores, best
+    first; their text is resolved from the shared chunk store only where
+    it is needed (prompt building, sources shown to the user), so the
+    state stays a few hundred bytes whatever k and the chunk size are.
+    `route` records whether the answer came from classic RAG or the agent.
+
+    In a chat thread, `query` is the question rewritten as a standalone
+    retrieval query, `summary` and `turns` are the conversation memory
+    (running summary and recent (question, answer) turns) and `reused`
+    marks a turn answered from the previous turn's chunks.
+    """
+
     question:str
-    retrieved_docs:List[Document] = []
+    chunk_ids:List[str] = []
+    scores:List[float] = []
     answer:str=""
-    
-    
+    route:str=""
+    query:str=""
+    summary:str=""
+    turns:List[Tuple[str, str]] = []
+    reused:bool=False
+
+    def documents(self, chunks:"ChunkStore")->List[Document]:
+        """Retrieved chunks resolved from `chunks`; ids no longer stored are skipped"""
+        return [doc for doc in chunks.get_chunks(self.chunk_ids) if doc is not None]
+
+
 if __name__=="__main__":
-    __all__=["RAGState"]
\ No newline at end of file
+    __all__=["RAGState"]
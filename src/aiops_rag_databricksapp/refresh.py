@@ -0,0 +1,446 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict, deque
+from pathlib import Path
+import argparse
+import json
+import logging
+import os
+import time
+import uuid
+
+from langchain_core.documents import Document
+
+from aiops_rag_databricksapp.ingest import DocumentProcessor
+from aiops_rag_databricksapp.dedup import NearDuplicateFilter
+from aiops_rag_databricksapp.store import content_hash
+from aiops_rag_databricksapp.metrics import REGISTRY
+from aiops_rag_databricksapp.scheduler import Priority, RequestScheduler, request_priority
+
+from dataclasses import asdict, dataclass, field
+
+logger = logging.getLogger(__name__)
+
+REFRESH_STATE_FILE = "sources.json"
+REFRESH_FORMAT_VERSION = 1
+
+
+@dataclass
+class SourceState:
+    """
+    What the last refresh recorded for one source
+    ---
+
+    Args:
+        validators: ETag/Last-Modified of a URL, or size/mtime of a file
+        content_hash: Digest of the source's loaded text
+        chunks: (content hash, docstore id) of every chunk of the source, in order
+    """
+    validators:Dict[str, Any] = field(default_factory=dict)
+    content_hash:str = ""
+    chunks:List[Tuple[str, str]] = field(default_factory=list)
+
+
+@dataclass
+class RefreshReport:
+    """Outcome of one incremental refresh"""
+    sources:int = 0
+    not_modified:int = 0
+    unchanged:int = 0
+    changed:List[str] = field(default_factory=list)
+    removed:List[str] = field(default_factory=list)
+    failed:Dict[str, str] = field(default_factory=dict)
+    chunks_added:int = 0
+    chunks_removed:int = 0
+    chunks_kept:int = 0
+    duplicates:int = 0
+    seconds:float = 0.0
+    corpus_version:Optional[str] = None
+
+    @property
+    def corpus_changed(self)->bool:
+        return bool(self.chunks_added or self.chunks_removed)
+
+
+def _source_hash(documents:List[Document])->str:
+    return content_hash("\x1e".join(doc.page_content for doc in documents))
+
+
+@dataclass
+class IncrementalRefresher:
+    """
+    Keep a persisted index current at the cost of what changed
+    ---
+
+    Every source is re-checked with a conditional request (URLs) or
+    its size and modification time (files). Only sources that come back
+    modified, with different text, are re-split; their chunks are diffed
+    by content hash against the chunks indexed for them last time, so
+    only new chunks are embedded and added, and chunks that disappeared
+    are deleted from the live store in place. Sources no longer listed
+    lose their chunks. Failed sources keep what they had.
+
+    Per-source validators and chunk hashes are kept in `sources.json`
+    inside the index directory. Without it (an index built by a full
+    ingest) the chunk lists are recovered from the stored chunks and
+    every source is fetched once unconditionally; unchanged chunks are
+    still not re-embedded.
+
+    With `dedup`, new chunks go through the same near-duplicate filter
+    as an ingest, seeded with the chunks that stay in the index, so a
+    chunk that repeats indexed text is recorded against the chunk it
+    repeats instead of being embedded again.
+
+    Args:
+        processor: Loads and splits sources
+        store: `VectorStore` or `ShardedVectorStore`, loaded from `index_dir` if it exists
+        index_dir: Directory the index and the refresh state are persisted to
+        embed_batch_size: Chunks embedded per request
+        corpus_version: Explicit corpus version written on save; defaults to a digest of the chunk hashes
+        on_change: Called with the report after a refresh changed the corpus, e.g. to drop caches
+        dedup: Near-duplicate filter applied to new chunks; None to embed every new chunk
+    """
+    processor:DocumentProcessor
+    store:Any
+    index_dir:Union[str, Path]
+    embed_batch_size:int = 256
+    corpus_version:Optional[str] = None
+    on_change:Optional[Callable[[RefreshReport], None]] = None
+    dedup:Optional[NearDuplicateFilter] = None
+
+    @property
+    def state_path(self)->Path:
+        return Path(self.index_dir) / REFRESH_STATE_FILE
+
+    def sources(self, sources:List[str])->List[str]:
+        """Deduplicated sources with PDF directories expanded into their files, as chunks record them"""
+        expanded:List[str] = []
+        for src in self.processor.unique_sources(sources):
+            is_url = src.startswith("http://") or src.startswith("https://")
+            if not is_url and Path(src).is_dir():
+                expanded.extend(self.processor.pdf_files(src))
+            else:
+                expanded.append(src)
+        return expanded
+
+    def load_state(self)->Dict[str, SourceState]:
+        """
+        Per-source state of the last refresh
+
+        Falls back to grouping the stored chunks by source when no state
+        was saved or it belongs to a different build of the index.
+        """
+        manifest = self.store.manifest or {}
+        if self.state_path.is_file():
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("format_version") == REFRESH_FORMAT_VERSION and saved.get("corpus_hash") == manifest.get("corpus_hash"):
+                return {
+                    src: SourceState(
+                        validators=entry["validators"],
+                        content_hash=entry["content_hash"],
+                        chunks=[tuple(chunk) for chunk in entry["chunks"]],
+                    )
+                    for src, entry in saved["sources"].items()
+                }
+            logger.info("Refresh state at %s does not match the index; rebuilding it from the stored chunks", self.state_path)
+        state:Dict[str, SourceState] = defaultdict(SourceState)
+        for doc_id, doc in self.store.iter_chunks():
+            digest = content_hash(doc.page_content)
+            # A chunk that absorbed duplicates at ingest belongs to all of their sources
+            for source in doc.metadata.get("sources") or [doc.metadata.get("source", "")]:
+                state[source].chunks.append((digest, doc_id))
+        return dict(state)
+
+    def save_state(self, state:Dict[str, SourceState]):
+        """Write the refresh state next to the index it describes"""
+        path = self.state_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "format_version": REFRESH_FORMAT_VERSION,
+                "corpus_hash": (self.store.manifest or {}).get("corpus_hash"),
+                "sources": {src: asdict(entry) for src, entry in state.items()},
+            }, f)
+        os.replace(tmp, path)
+
+    def _fetch(self, sources:List[str], state:Dict[str, SourceState], report:RefreshReport)->Dict[str, Tuple[Optional[List[Document]], Dict[str, Any]]]:
+        """Conditionally load every source concurrently; failures are recorded in `report`"""
+        def fetch(src:str):
+            known = state.get(src)
+            return self.processor.load_if_modified(src, known.validators if known else None)
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.processor.max_workers, len(sources)))) as pool:
+            futures = {src: pool.submit(fetch, src) for src in sources}
+            for src, future in futures.items():
+                try:
+                    docs, validators, _ = future.result()
+                except Exception as e:
+                    logger.warning("Refresh of %s failed, keeping its indexed chunks: %s", src, e)
+                    report.failed[src] = f"{type(e).__name__}: {e}"
+                    continue
+                results[src] = (docs, validators)
+        return results
+
+    def _diff(self, chunks:List[Document], previous:List[Tuple[str, str]])->Tuple[List[Tuple[str, Optional[str]]], List[Document], List[str]]:
+        """
+        Match a source's new chunks to its indexed ones by content hash
+
+        Returns:
+            (hash, id or None) per new chunk in order, the chunks to embed and the ids to delete
+        """
+        indexed:Dict[str, deque] = defaultdict(deque)
+        for digest, doc_id in previous:
+            indexed[digest].append(doc_id)
+        matched:List[Tuple[str, Optional[str]]] = []
+        to_add:List[Document] = []
+        for chunk in chunks:
+            digest = content_hash(chunk.page_content)
+            if indexed[digest]:
+                matched.append((digest, indexed[digest].popleft()))
+            else:
+                matched.append((digest, None))
+                to_add.append(chunk)
+        to_delete = [doc_id for ids in indexed.values() for doc_id in ids]
+        return matched, to_add, to_delete
+
+    def run(self, sources:List[str])->RefreshReport:
+        """
+        Refresh the index from `sources` and persist it
+
+        Args:
+            sources: URLs, TXT/PDF files or PDF directories, as for `DocumentProcessor`
+
+        Returns:
+            What was fetched, embedded and removed
+        """
+        start = time.perf_counter()
+        report = RefreshReport()
+        state = self.load_state()
+        sources = self.sources(sources)
+        report.sources = len(sources)
+        fetched = self._fetch(sources, state, report)
+
+        new_state = {src: entry for src, entry in state.items() if src in report.failed}
+        pending:List[Tuple[str, List[Tuple[str, Optional[str]]]]] = []
+        to_add:List[Document] = []
+        to_delete:List[str] = []
+        for src in sources:
+            if src not in fetched:
+                continue
+            docs, validators = fetched[src]
+            known = state.get(src, SourceState())
+            if docs is None:
+                report.not_modified += 1
+                new_state[src] = SourceState(validators=validators, content_hash=known.content_hash, chunks=known.chunks)
+                continue
+            digest = _source_hash(docs)
+            if digest == known.content_hash:
+                report.unchanged += 1
+                new_state[src] = SourceState(validators=validators, content_hash=digest, chunks=known.chunks)
+                continue
+            chunks = self.processor.split_documents(docs)
+            matched, added, deleted = self._diff(chunks, known.chunks)
+            kept = [(doc_id, chunk) for (_, doc_id), chunk in zip(matched, chunks) if doc_id is not None]
+            for stored, (_, chunk) in zip(self.store.get_chunks([doc_id for doc_id, _ in kept]), kept):
+                # Offsets may have moved; the sources of collapsed duplicates stay. A chunk
+                # another source owns and this one repeats keeps the owner's metadata
+                if stored is not None and stored.metadata.get("source") == chunk.metadata.get("source"):
+                    stored.metadata = {**stored.metadata, **chunk.metadata}
+            if not added and not deleted:
+                report.unchanged += 1
+            else:
+                report.changed.append(src)
+            report.chunks_kept += len(matched) - len(added)
+            to_add.extend(added)
+            to_delete.extend(deleted)
+            pending.append((src, matched))
+            new_state[src] = SourceState(validators=validators, content_hash=digest)
+        for src, entry in state.items():
+            if src not in new_state and src not in fetched:
+                report.removed.append(src)
+                to_delete.extend(doc_id for _, doc_id in entry.chunks)
+
+        unique = to_add
+        if self.dedup is not None and to_add:
+            unique = self._deduplicate(to_add, to_delete, new_state, pending)
+            report.duplicates = len(to_add) - len(unique)
+
+        # Add before deleting so a changed source is never missing from live results
+        new_ids:List[str] = []
+        with request_priority(Priority.BACKGROUND):
+            for i in range(0, len(unique), self.embed_batch_size):
+                new_ids.extend(self.store.add_documents(unique[i:i + self.embed_batch_size]))
+            self.store.flush()
+        if self.dedup is not None and to_add:
+            self.dedup.apply(self.store)
+            assigned = iter([self.dedup.duplicate_of.get(chunk.id, chunk.id) for chunk in to_add])
+        else:
+            assigned = iter(new_ids)
+        for src, matched in pending:
+            new_state[src].chunks = [(digest, doc_id or next(assigned)) for digest, doc_id in matched]
+        report.chunks_added = len(new_ids)
+        # Chunks shared between sources stay while any source still has them
+        referenced = {doc_id for entry in new_state.values() for _, doc_id in entry.chunks}
+        to_delete = [doc_id for doc_id in set(to_delete) if doc_id not in referenced]
+        report.chunks_removed = self.store.delete_documents(to_delete) if to_delete else 0
+
+        if report.corpus_changed or self.store.manifest is None:
+            manifest = self._save()
+            report.corpus_version = manifest["corpus_version"]
+        else:
+            report.corpus_version = self.store.manifest["corpus_version"]
+        self.save_state(new_state)
+
+        report.seconds = time.perf_counter() - start
+        REGISTRY.inc("rag_refresh_chunks_total", report.chunks_added, change="added")
+        REGISTRY.inc("rag_refresh_chunks_total", report.chunks_removed, change="removed")
+        REGISTRY.observe("rag_refresh_seconds", report.seconds)
+        if report.corpus_changed and self.on_change is not None:
+            self.on_change(report)
+        return report
+
+    def _deduplicate(self, to_add:List[Document], to_delete:List[str], new_state:Dict[str, SourceState], pending:List[Tuple[str, List[Tuple[str, Optional[str]]]]])->List[Document]:
+        """
+        Drop new chunks that near-duplicate each other or a chunk staying in the index
+
+        Every new chunk is given its docstore id first, so the id of the
+        kept chunk a dropped one was collapsed into is found in
+        `dedup.duplicate_of`.
+
+        Returns:
+            The chunks to embed
+        """
+        staying = {doc_id for entry in new_state.values() for _, doc_id in entry.chunks}
+        staying.update(doc_id for _, matched in pending for _, doc_id in matched if doc_id is not None)
+        leaving = set(to_delete) - staying
+        self.dedup.reset()
+        self.dedup.add_indexed((doc_id, doc) for doc_id, doc in self.store.iter_chunks() if doc_id not in leaving)
+        for chunk in to_add:
+            chunk.id = chunk.id or str(uuid.uuid4())
+        return list(self.dedup.filter(to_add))
+
+    def _save(self)->Dict:
+        """Persist the store; a sharded store only rewrites the shards that changed"""
+        changed = getattr(self.store, "changed", None)
+        if changed is not None and self.store.index_exists(self.index_dir):
+            manifest = self.store.manifest
+            for name in sorted(changed):
+                manifest = self.store.save_shard(self.index_dir, name, corpus_version=self.corpus_version)
+            return manifest
+        return self.store.save_vectorstore(self.index_dir, corpus_version=self.corpus_version)
+
+
+def read_sources(urls_file:Union[str, Path], default:Iterable[str])->List[str]:
+    """Sources listed one per line in `urls_file`, or `default` if it does not exist"""
+    path = Path(urls_file)
+    if path.is_file():
+        with open(path, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    return list(default)
+
+
+def refresh_index(index_dir:Optional[Union[str, Path]]=None, urls_file:Union[str, Path]="data/urls.txt")->RefreshReport:
+    """
+    Incrementally refresh the configured index from its sources
+
+    Args:
+        index_dir: Index directory; defaults to the configured index_dir
+        urls_file: Sources, one per line; defaults to the configured default_urls if it does not exist
+
+    Returns:
+        What was fetched, embedded and removed
+    """
+    from aiops_rag_databricksapp.config import AIConfig
+    from aiops_rag_databricksapp.store import VectorStore
+    from aiops_rag_databricksapp.sharding import ShardedVectorStore
+    from aiops_rag_databricksapp.ann import ANNConfig
+
+    config = AIConfig()
+    config.activate_LLM_environment
+    settings = config.settings
+    index_dir = Path(index_dir or settings.index_dir)
+
+    store = VectorStore(
+        embedding_model=settings.embedding_model,
+        embedding_cache_path=settings.embedding_cache_path or None,
+        embedding_cache_max_mb=settings.embedding_cache_max_mb,
+        embedding_cache_dtype=settings.embedding_cache_dtype,
+        retrieval_mode=settings.retrieval_mode,
+        scheduler=RequestScheduler(
+            name="embedding",
+            requests_per_minute=settings.embedding_requests_per_minute,
+            tokens_per_minute=settings.embedding_tokens_per_minute,
+            burst_seconds=settings.rate_limit_burst_seconds,
+            background_reserve=settings.rate_limit_background_reserve,
+            max_queue=settings.rate_limit_max_queue,
+            interactive_max_wait=settings.rate_limit_max_wait,
+            max_retries=settings.rate_limit_max_retries,
+        ) if settings.rate_limit_enabled else None,
+        ann=ANNConfig(
+            index_type=settings.index_type,
+            storage=settings.index_storage,
+            nlist=settings.ivf_nlist,
+            nprobe=settings.ivf_nprobe,
+            pq_m=settings.pq_m,
+            pq_bits=settings.pq_bits,
+            hnsw_m=settings.hnsw_m,
+            ef_construction=settings.hnsw_ef_construction,
+            ef_search=settings.hnsw_ef_search,
+            train_size=settings.index_train_size,
+        ),
+    )
+    if settings.sharding_enabled:
+        store = ShardedVectorStore(template=store, max_workers=settings.shard_workers)
+    if store.index_exists(index_dir):
+        store.load_vectorstore(index_dir, mmap=False)
+
+    refresher = IncrementalRefresher(
+        processor=DocumentProcessor(
+            chunk_size=settings.chunk_size,
+            chunk_overlap=settings.chunk_overlap,
+            data_dir=settings.data_dir or None,
+            max_workers=settings.loader_max_workers,
+            per_host_limit=settings.loader_per_host_limit,
+            url_timeout=settings.url_timeout,
+            url_retries=settings.url_retries,
+            splitter_mode=settings.text_splitter,
+            length_unit=settings.chunk_length_unit,
+            tokenizer_model=settings.llm_model,
+        ),
+        store=store,
+        index_dir=index_dir,
+        embed_batch_size=settings.embed_batch_size,
+        corpus_version=settings.corpus_version or None,
+        dedup=NearDuplicateFilter(
+            threshold=settings.dedup_threshold,
+            num_perm=settings.dedup_num_perm,
+        ) if settings.dedup_enabled else None,
+    )
+    return refresher.run(read_sources(urls_file, settings.default_urls))
+
+
+def main(argv:Optional[List[str]]=None)->int:
+    """Entry point of the scheduled refresh job; exits with 1 when a source could not be fetched"""
+    parser = argparse.ArgumentParser(description="Incrementally refresh the persisted index from its sources")
+    parser.add_argument("--index-dir", default=None, help="Index directory; defaults to the configured index_dir")
+    parser.add_argument("--urls-file", default="data/urls.txt", help="Sources, one per line; defaults to the configured default_urls")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    report = refresh_index(args.index_dir, args.urls_file)
+    print(
+        f"🔄 Refreshed {report.sources} sources in {report.seconds:.1f}s: {report.not_modified} not modified, "
+        f"{report.unchanged} unchanged, {len(report.changed)} changed, {len(report.removed)} removed, "
+        f"{len(report.failed)} failed | +{report.chunks_added} / -{report.chunks_removed} chunks "
+        f"({report.chunks_kept} kept, {report.duplicates} duplicates), corpus {report.corpus_version}"
+    )
+    for src, error in report.failed.items():
+        print(f"❌ {src}: {error}")
+    return 1 if report.failed else 0
+
+
+if __name__=="__main__":
+    raise SystemExit(main())
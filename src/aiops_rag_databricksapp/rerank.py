@@ -0,0 +1,69 @@
+from typing import Hashable, List, Optional, Sequence
+
+import numpy as np
+
+
+def normalize_rows(vectors:np.ndarray)->np.ndarray:
+    """Scale rows to unit length, leaving zero rows as they are"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def mmr_select(
+    relevance:np.ndarray,
+    vectors:np.ndarray,
+    k:int,
+    lambda_mult:float=0.5,
+    groups:Optional[Sequence[Hashable]]=None,
+    per_group_cap:int=0,
+)->List[int]:
+    """
+    Greedy maximal marginal relevance selection
+
+    Each step picks the candidate maximising
+    `lambda_mult * relevance - (1 - lambda_mult) * max similarity to the picks so far`.
+    Pairwise similarities are computed once as a matrix product and the
+    running maximum is updated with one vector operation per pick.
+
+    Args:
+        relevance: Relevance of each candidate to the query, higher is better
+        vectors: Unit-length candidate vectors, one row per candidate
+        k: Number of candidates to select
+        lambda_mult: 1 ranks by relevance only, 0 by diversity only
+        groups: Group of each candidate (e.g. its source)
+        per_group_cap: Maximum picks per group; 0 disables the cap
+
+    Returns:
+        Indices of the selected candidates in pick order
+    """
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+    relevance = np.asarray(relevance, dtype=np.float32)
+    similarity = vectors @ vectors.T
+    max_similarity = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+
+    group_ids = None
+    if groups is not None and per_group_cap > 0:
+        _, group_ids = np.unique(np.array([str(g) for g in groups]), return_inverse=True)
+        group_counts = np.zeros(group_ids.max() + 1, dtype=np.int64)
+
+    selected:List[int] = []
+    while len(selected) < k and available.any():
+        redundancy = np.where(np.isfinite(max_similarity), max_similarity, 0.0)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[:, best], out=max_similarity)
+        if group_ids is not None:
+            group_counts[group_ids[best]] += 1
+            if group_counts[group_ids[best]] >= per_group_cap:
+                available[group_ids == group_ids[best]] = False
+    return selected
+
+if __name__=="__main__":
+    __all__=["mmr_select","normalize_rows"]
@@ -0,0 +1,179 @@
+from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+import numpy as np
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import run_in_executor
+
+from aiops_rag_databricksapp.rerank import mmr_select, normalize_rows
+from aiops_rag_databricksapp.metrics import span
+
+# Shared by all retrievers; dense and lexical search of one query run side by side
+_SEARCH_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieval")
+
+
+def reciprocal_rank_fusion(rankings:List[List[str]], k:int=60)->List[Tuple[str, float]]:
+    """
+    Fuse ranked id lists with reciprocal rank fusion
+
+    Args:
+        rankings: Ranked lists of ids, best first
+        k: RRF damping constant
+
+    Returns:
+        (id, fused score) pairs, best first
+    """
+    scores:Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class StoreRetriever(BaseRetriever):
+    """
+    Over-fetching retriever with MMR re-ranking over a `VectorStore`
+    ---
+
+    Fetches `fetch_k` dense candidates (fused with `fetch_k` BM25
+    candidates by reciprocal rank fusion when `hybrid`), reconstructs
+    their vectors from the FAISS index and selects `k` of them with
+    maximal marginal relevance, at most `per_source_cap` per source.
+    Dense-only candidates below `score_threshold` cosine similarity are
+    dropped, so weak queries return fewer chunks; BM25 matches are kept.
+
+    k, fetch_k, lambda_mult, score_threshold and per_source_cap can be
+    overridden per call, e.g. `retriever.invoke(query, k=2)`, and an
+    already computed `query_vector` can be passed to skip embedding the
+    query. When the store has a query dispatcher, embedding and dense
+    search are micro-batched with concurrent callers. Each document
+    carries its cosine similarity in `metadata["score"]`.
+    """
+    store:Any
+    k:int = 4
+    fetch_k:int = 20
+    hybrid:bool = True
+    rrf_k:int = 60
+    lambda_mult:float = 0.7
+    per_source_cap:int = 0
+    score_threshold:Optional[float] = None
+
+    @property
+    def vectorstore(self):
+        """Underlying FAISS store, for callers that reach for its embeddings"""
+        return self.store.vectorstore
+
+    def _lexical(self, query:str, fetch_k:int)->List[str]:
+        if self.store.lexical is None:
+            return []
+        with span("lexical_search"):
+            return [doc_id for doc_id, _ in self.store.lexical.search(query, k=fetch_k)]
+
+    def _get_relevant_documents(
+        self,
+        query:str,
+        *,
+        run_manager:CallbackManagerForRetrieverRun,
+        k:Optional[int]=None,
+        fetch_k:Optional[int]=None,
+        lambda_mult:Optional[float]=None,
+        score_threshold:Optional[float]=None,
+        per_source_cap:Optional[int]=None,
+        query_vector:Optional[np.ndarray]=None,
+    )->List[Document]:
+        k = k or self.k
+        fetch_k = max(fetch_k or self.fetch_k, k)
+        lambda_mult = self.lambda_mult if lambda_mult is None else lambda_mult
+        score_threshold = self.score_threshold if score_threshold is None else score_threshold
+        per_source_cap = self.per_source_cap if per_source_cap is None else per_source_cap
+
+        lexical = _SEARCH_POOL.submit(copy_context().run, self._lexical, query, fetch_k) if self.hybrid else None
+        # One store for the whole query, so a concurrent delete cannot shift positions between search and re-ranking
+        with self.store.snapshot() as (vectorstore, positions):
+            dispatcher = getattr(self.store, "dispatcher", None)
+            if dispatcher is not None:
+                query_vector, found = dispatcher.search(query, fetch_k, query_vector, vectorstore=vectorstore)
+            else:
+                if query_vector is None:
+                    with span("embed_query"):
+                        query_vector = np.asarray(self.store.embedding.embed_query(query), dtype=np.float32)
+                with span("dense_search"):
+                    _, found = vectorstore.index.search(query_vector[None, :], fetch_k)
+                found = found[0]
+            dense = [vectorstore.index_to_docstore_id[int(pos)] for pos in found if pos >= 0]
+            lexical_ids = lexical.result() if lexical is not None else []
+
+            with span("rerank"):
+                return self._rerank(
+                    vectorstore, positions, query_vector, dense, lexical_ids, k, lambda_mult, score_threshold, per_source_cap
+                )
+
+    async def _aget_relevant_documents(
+        self, query:str, *, run_manager:AsyncCallbackManagerForRetrieverRun, **kwargs:Any
+    )->List[Document]:
+        """Run the search in an executor, passing per-call options on (the base class drops them)"""
+        return await run_in_executor(None, self._get_relevant_documents, query, run_manager=run_manager.get_sync(), **kwargs)
+
+    def _rerank(
+        self,
+        vectorstore:Any,
+        positions:Dict[str, int],
+        query_vector:np.ndarray,
+        dense:List[str],
+        lexical_ids:List[str],
+        k:int,
+        lambda_mult:float,
+        score_threshold:Optional[float],
+        per_source_cap:int,
+    )->List[Document]:
+        """Fuse the candidate lists and select `k` documents with MMR, reading only the pinned `vectorstore`"""
+        # The lexical index is updated separately and may briefly name chunks the pinned store does not hold
+        lexical_ids = [doc_id for doc_id in lexical_ids if doc_id in positions]
+        fused = reciprocal_rank_fusion([dense, lexical_ids], k=self.rrf_k)
+        if not fused:
+            return []
+        ids = [doc_id for doc_id, _ in fused]
+        vectors = normalize_rows(vectorstore.index.reconstruct_batch(
+            np.array([positions[doc_id] for doc_id in ids], dtype=np.int64)
+        ))
+        cosine = vectors @ normalize_rows(query_vector)
+
+        keep = np.ones(len(ids), dtype=bool)
+        if score_threshold is not None:
+            lexical_set = set(lexical_ids)
+            keep = (cosine >= score_threshold) | np.array([doc_id in lexical_set for doc_id in ids])
+        candidates = np.flatnonzero(keep)
+        if self.hybrid:
+            fused_scores = np.array([score for _, score in fused], dtype=np.float32)
+            relevance = fused_scores / fused_scores.max()
+        else:
+            relevance = cosine
+
+        docs = [vectorstore.docstore.search(ids[i]) for i in candidates]
+        sources = [doc.metadata.get("source") if isinstance(doc, Document) else None for doc in docs]
+        picks = mmr_select(
+            relevance[candidates],
+            vectors[candidates],
+            k=k,
+            lambda_mult=lambda_mult,
+            groups=sources,
+            per_group_cap=per_source_cap,
+        )
+
+        results:List[Document] = []
+        for pick in picks:
+            doc, i = docs[pick], candidates[pick]
+            if isinstance(doc, Document):
+                results.append(Document(
+                    id=ids[i],
+                    page_content=doc.page_content,
+                    metadata={**doc.metadata, "score": float(cosine[i])},
+                ))
+        return results
+
+if __name__=="__main__":
+    __all__=["StoreRetriever","reciprocal_rank_fusion"]
@@ -0,0 +1,145 @@
+from typing import Any, List, Optional, Sequence
+import json
+import logging
+import re
+
+from langchain_core.documents import Document
+
+from aiops_rag_databricksapp.lexical import tokenize
+
+from dataclasses import asdict, dataclass
+
+RAG_ROUTE = "rag"
+AGENT_ROUTE = "agent"
+# Escalated, but the agent ran out of budget and classic RAG answered
+FALLBACK_ROUTE = "agent_fallback"
+
+router_logger = logging.getLogger("aiops_rag_databricksapp.router")
+
+# Cues of questions about the world rather than the indexed runbooks
+_OPEN_DOMAIN = re.compile(
+    r"\b(who (is|was|were|invented|founded)|when (did|was|were)|where (is|was)|capital of|population of|"
+    r"born|president|history of|wikipedia|latest|news|today|this (week|year)|current(ly)?|in (19|20)\d\d)\b",
+    re.IGNORECASE,
+)
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or should the this to "
+    "was what when where which who why will with you your".split()
+)
+
+
+@dataclass
+class RouteDecision:
+    """Chosen path for one question and the signals behind it"""
+    route:str
+    reasons:List[str]
+    top_score:float
+    mean_score:float
+    term_overlap:float
+    open_domain:bool
+
+    @property
+    def reason(self)->str:
+        return ",".join(self.reasons) or "confident"
+
+
+@dataclass
+class QueryRouter:
+    """
+    Heuristic router between classic RAG and the ReAct agent
+    ---
+
+    A question stays on the single-call RAG path when the local corpus
+    answers it confidently: the best retrieved chunk reaches
+    `min_top_score` cosine similarity and the retrieved chunks contain
+    at least `min_term_overlap` of the question's content terms. It is
+    escalated to the agent when retrieval is weak, or when it looks
+    open-domain (who/when/latest/... cues) and the best chunk is below
+    `confident_score`.
+
+    Every decision is logged as JSON to the `aiops_rag_databricksapp.router`
+    logger; together with the per-route latency metrics this is what the
+    thresholds are tuned from.
+
+    Args:
+        min_top_score: Minimum cosine similarity of the best chunk
+        confident_score: Best-chunk similarity that overrides open-domain cues
+        min_term_overlap: Minimum fraction of question terms found in the chunks
+    """
+    min_top_score:float = 0.78
+    confident_score:float = 0.85
+    min_term_overlap:float = 0.5
+
+    @staticmethod
+    def _terms(text:str)->List[str]:
+        return [term for term in tokenize(text) if term not in _STOPWORDS and len(term) > 1]
+
+    def term_overlap(self, question:str, docs:Sequence[Document])->float:
+        """Fraction of the question's content terms that occur in `docs`"""
+        terms = set(self._terms(question))
+        if not terms:
+            return 1.0
+        found = set()
+        for doc in docs:
+            found.update(terms.intersection(tokenize(doc.page_content)))
+        return len(found) / len(terms)
+
+    def decide(self, question:str, scores:Sequence[float], docs:Sequence[Document])->RouteDecision:
+        """
+        Route a question given its retrieval results
+
+        Args:
+            question: User question
+            scores: Cosine similarity of each retrieved chunk, best first
+            docs: Retrieved chunks
+
+        Returns:
+            The decision, with the signals it was based on
+        """
+        top = max(scores, default=0.0)
+        mean = sum(scores) / len(scores) if scores else 0.0
+        overlap = self.term_overlap(question, docs)
+        open_domain = bool(_OPEN_DOMAIN.search(question))
+
+        reasons = []
+        if not docs:
+            reasons.append("no_results")
+        elif top < self.min_top_score:
+            reasons.append("low_score")
+        if docs and overlap < self.min_term_overlap:
+            reasons.append("low_overlap")
+        if open_domain and top < self.confident_score:
+            reasons.append("open_domain")
+        return RouteDecision(
+            route=AGENT_ROUTE if reasons else RAG_ROUTE,
+            reasons=reasons,
+            top_score=top,
+            mean_score=mean,
+            term_overlap=overlap,
+            open_domain=open_domain,
+        )
+
+
+def log_decision(decision:RouteDecision, **fields:Any):
+    """Write a routing decision to the router log"""
+    if router_logger.isEnabledFor(logging.INFO):
+        router_logger.info(json.dumps(
+            {"event": "decision", **asdict(decision), "reason": decision.reason, **fields}, default=str
+        ))
+
+
+def log_outcome(route:str, reason:str, total:float, ttft:Optional[float], **fields:Any):
+    """Write the latency of a routed request to the router log, to be joined with its decision"""
+    if router_logger.isEnabledFor(logging.INFO):
+        router_logger.info(json.dumps({
+            "event": "outcome",
+            "route": route,
+            "reason": reason,
+            "total_ms": 1000 * total,
+            "ttft_ms": None if ttft is None else 1000 * ttft,
+            **fields,
+        }, default=str))
+
+
+if __name__=="__main__":
+    __all__=["QueryRouter","RouteDecision","RAG_ROUTE","AGENT_ROUTE","FALLBACK_ROUTE","log_decision","log_outcome"]
@@ -0,0 +1,484 @@
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+import asyncio
+import heapq
+import itertools
+import json
+import random
+import re
+import threading
+import time
+
+import httpx
+
+from aiops_rag_databricksapp.metrics import REGISTRY, MetricsRegistry
+
+from dataclasses import dataclass, field
+
+# Statuses retried by the scheduler; the OpenAI SDK retries the same set
+_RETRYABLE = frozenset({408, 409, 429, 500, 502, 503, 504})
+# Requests that got no response (refused or dropped connections, timeouts); the OpenAI SDK retries these too
+_RETRYABLE_ERRORS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+# "6m0s", "1.5s", "20ms" as used by x-ratelimit-reset-* headers
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+class Priority(IntEnum):
+    """Scheduling class of a request; lower values are admitted first"""
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class AdmissionRejected(Exception):
+    """A request was refused because the queue is full or it could not be admitted before its deadline"""
+
+
+_scope:ContextVar[Tuple[Priority, Optional[float]]] = ContextVar(
+    "aiops_rag_request_priority", default=(Priority.INTERACTIVE, None)
+)
+
+
+@contextmanager
+def request_priority(priority:Priority, max_wait:Optional[float]=None)->Iterator[None]:
+    """
+    Schedule the LLM and embedding requests of the enclosed block at `priority`
+
+    Args:
+        priority: Scheduling class of the requests
+        max_wait: Seconds a request may queue before it is rejected; None uses the scheduler's default for `priority`
+    """
+    token = _scope.set((priority, max_wait))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def parse_duration(value:str)->Optional[float]:
+    """Seconds of a `x-ratelimit-reset-*` duration such as "6m0s" or "20ms"; None if unparsable"""
+    parts = _DURATION.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(amount) * _UNITS[unit] for amount, unit in parts)
+
+
+def retry_after(headers:Mapping[str, str])->Optional[float]:
+    """
+    Seconds until a rate-limited request may be retried, from response headers
+
+    Prefers `retry-after-ms`, then `retry-after` (seconds or HTTP date),
+    then the reset time of whichever `x-ratelimit-*` limit is exhausted.
+    """
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000.0
+        except ValueError:
+            pass
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(headers["retry-after"]).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    resets = []
+    for kind in ("requests", "tokens"):
+        reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}", ""))
+        if reset is not None and headers.get(f"x-ratelimit-remaining-{kind}") in (None, "0"):
+            resets.append(reset)
+    return max(resets) if resets else None
+
+
+def estimate_tokens(body:bytes, completion_tokens:int=1024)->int:
+    """
+    Tokens an OpenAI request will count against the tokens-per-minute limit
+
+    Embedding inputs are counted as given (token ids) or at about four
+    characters per token; chat requests add their `max_completion_tokens`
+    (or `max_tokens`, else `completion_tokens`) to the prompt estimate.
+    """
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return 0
+    if not isinstance(payload, dict):
+        return 0
+    if "input" in payload:
+        inputs = payload["input"]
+        inputs = inputs if isinstance(inputs, list) and inputs and not isinstance(inputs[0], int) else [inputs]
+        return sum(len(item) if isinstance(item, list) else (len(str(item)) + 3) // 4 for item in inputs)
+    prompt = (len(json.dumps(payload.get("messages", []), ensure_ascii=False)) + 3) // 4
+    completion = payload.get("max_completion_tokens") or payload.get("max_tokens") or completion_tokens
+    return prompt + int(completion)
+
+
+@dataclass
+class TokenBucket:
+    """Budget refilled continuously at `rate` units per second up to `capacity`"""
+    rate:float
+    capacity:float
+
+    def __post_init__(self):
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now:float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, amount:float, floor:float=0.0)->float:
+        """Seconds until `amount` can be taken while leaving `floor` in the bucket"""
+        deficit = amount + floor - self.level
+        return max(0.0, deficit / self.rate) if deficit > 0 else 0.0
+
+
+@dataclass
+class SchedulerStats:
+    """Counters of one scheduler"""
+    admitted:int = 0
+    rejected:int = 0
+    rate_limited:int = 0
+    retries:int = 0
+    waited:float = 0.0
+
+
+@dataclass
+class RequestScheduler:
+    """
+    Admission control for the requests of one rate-limited model
+    ---
+
+    Requests are admitted against two token buckets, requests per minute
+    and tokens per minute, each holding at most `burst_seconds` worth of
+    budget. Waiting requests are admitted in priority order (interactive
+    before background, FIFO within a class), and background requests
+    leave `background_reserve` of each bucket for interactive ones.
+
+    A request that cannot be admitted within its maximum wait, or that
+    arrives to a full queue, is rejected at once instead of queueing
+    until it times out. Provider responses feed back into the buckets:
+    `x-ratelimit-remaining-*` headers correct the local budget, and a 429
+    pauses the whole scheduler until the `retry-after` /
+    `x-ratelimit-reset-*` time, plus jitter so waiting clients do not
+    retry in lockstep.
+
+    `client_kwargs` returns the `http_client` / `http_async_client` (and
+    `max_retries=0`, as retries happen here) to pass to `ChatOpenAI` or
+    `OpenAIEmbeddings`, so every request of that client goes through
+    the scheduler.
+
+    Args:
+        name: Label of the scheduler's metrics
+        requests_per_minute: Request limit; 0 disables it
+        tokens_per_minute: Token limit; 0 disables it
+        burst_seconds: Seconds of budget a bucket holds when idle
+        background_reserve: Fraction of each bucket background requests may not use
+        max_queue: Waiting requests beyond which new ones are rejected
+        interactive_max_wait: Default maximum queueing seconds of interactive requests; None waits indefinitely
+        background_max_wait: Default maximum queueing seconds of background requests; None waits indefinitely
+        max_retries: Retries of a rate-limited, failed (408/409/5xx) or unanswered (connect error, timeout) request
+        backoff_base: First retry delay when the response has no rate-limit headers
+        backoff_max: Cap of the exponential retry delay
+        jitter: Random fraction added to every retry delay
+        completion_tokens: Completion tokens assumed for chat requests without a max_tokens
+        registry: Metrics registry for admission statistics
+    """
+    name:str = "llm"
+    requests_per_minute:float = 500
+    tokens_per_minute:float = 200_000
+    burst_seconds:float = 10.0
+    background_reserve:float = 0.2
+    max_queue:int = 256
+    interactive_max_wait:Optional[float] = 10.0
+    background_max_wait:Optional[float] = None
+    max_retries:int = 4
+    backoff_base:float = 0.5
+    backoff_max:float = 30.0
+    jitter:float = 0.5
+    completion_tokens:int = 1024
+    registry:MetricsRegistry = field(default=REGISTRY, repr=False)
+
+    def __post_init__(self):
+        if self.requests_per_minute < 0 or self.tokens_per_minute < 0:
+            raise ValueError("Rate limits must be non-negative")
+        if not 0 <= self.background_reserve < 1:
+            raise ValueError(f"background_reserve must be in [0, 1), got {self.background_reserve}")
+        self._buckets:Dict[str, TokenBucket] = {
+            kind: TokenBucket(rate=limit / 60.0, capacity=max(1.0, limit * self.burst_seconds / 60.0))
+            for kind, limit in (("requests", self.requests_per_minute), ("tokens", self.tokens_per_minute))
+            if limit > 0
+        }
+        self._cond = threading.Condition()
+        self._queue:List[Tuple[int, int, float]] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self.counters = SchedulerStats()
+
+    def _max_wait(self, priority:Priority, max_wait:Optional[float])->Optional[float]:
+        if max_wait is not None:
+            return max_wait
+        return self.interactive_max_wait if priority == Priority.INTERACTIVE else self.background_max_wait
+
+    def _cost(self, tokens:float)->Dict[str, float]:
+        cost = {"requests": 1.0, "tokens": float(tokens)}
+        # A request larger than the bucket could never be admitted
+        return {kind: min(cost[kind], bucket.capacity) for kind, bucket in self._buckets.items()}
+
+    def _delay(self, priority:int, cost:Dict[str, float], now:float)->float:
+        """Seconds until the head request can be admitted"""
+        reserve = self.background_reserve if priority != Priority.INTERACTIVE else 0.0
+        delay = max(0.0, self._paused_until - now)
+        for kind, bucket in self._buckets.items():
+            bucket.refill(now)
+            # The reserve never exceeds what is left of a full bucket after the request itself
+            delay = max(delay, bucket.wait(cost[kind], min(reserve * bucket.capacity, bucket.capacity - cost[kind])))
+        return delay
+
+    def _estimate(self, ticket:Tuple[int, int, float], now:float)->float:
+        """Seconds until `ticket` is admitted if everything ahead of it goes first"""
+        ahead = [other for other in self._queue if other <= ticket]
+        estimate = max(0.0, self._paused_until - now)
+        for kind, bucket in self._buckets.items():
+            bucket.refill(now)
+            need = sum(self._cost(other[2])[kind] for other in ahead) - bucket.level
+            estimate = max(estimate, need / bucket.rate if need > 0 else 0.0)
+        return estimate
+
+    def _reject(self, priority:Priority, reason:str):
+        self.counters.rejected += 1
+        self.registry.inc("rag_scheduler_requests_total", scheduler=self.name, priority=priority.name.lower(), outcome="rejected")
+        raise AdmissionRejected(f"{self.name} scheduler rejected {priority.name.lower()} request: {reason}")
+
+    def acquire(self, tokens:float=0, priority:Optional[Priority]=None, max_wait:Optional[float]=None)->float:
+        """
+        Wait until a request may be sent and take its budget
+
+        Args:
+            tokens: Estimated tokens of the request
+            priority: Scheduling class; defaults to the enclosing `request_priority`, else interactive
+            max_wait: Maximum queueing seconds; defaults to the scope's, else the scheduler's for `priority`
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            AdmissionRejected: If the queue is full or the request cannot be admitted within `max_wait`
+        """
+        scope_priority, scope_wait = _scope.get()
+        priority = Priority(scope_priority if priority is None else priority)
+        max_wait = self._max_wait(priority, max_wait if max_wait is not None else scope_wait)
+        start = time.monotonic()
+        deadline = start + max_wait if max_wait is not None else None
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self._reject(priority, f"{len(self._queue)} requests already waiting")
+            ticket = (int(priority), next(self._seq), float(tokens))
+            heapq.heappush(self._queue, ticket)
+            # A new head (e.g. an interactive request overtaking background ones) must be looked at now
+            self._cond.notify_all()
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._queue[0] is ticket:
+                        delay = self._delay(priority, self._cost(tokens), now)
+                        if delay <= 0:
+                            heapq.heappop(self._queue)
+                            for kind, amount in self._cost(tokens).items():
+                                self._buckets[kind].level -= amount
+                            self._cond.notify_all()
+                            break
+                    else:
+                        delay = None
+                    if deadline is not None:
+                        if now + self._estimate(ticket, now) > deadline:
+                            self._reject(priority, f"not admissible within {max_wait:g}s")
+                        delay = deadline - now if delay is None else min(delay, deadline - now)
+                    self._cond.wait(delay)
+            except BaseException:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self._cond.notify_all()
+                raise
+            waited = time.monotonic() - start
+            self.counters.admitted += 1
+            self.counters.waited += waited
+        labels = {"scheduler": self.name, "priority": priority.name.lower()}
+        self.registry.inc("rag_scheduler_requests_total", outcome="admitted", **labels)
+        self.registry.observe("rag_scheduler_wait_seconds", waited, **labels)
+        return waited
+
+    def observe(self, status:int, headers:Mapping[str, str], attempt:int=0)->Optional[float]:
+        """
+        Fold a provider response into the budget
+
+        Args:
+            status: HTTP status of the response
+            headers: Response headers
+            attempt: Retries already made for this request
+
+        Returns:
+            Seconds to wait before retrying the request, or None if it should not be retried
+        """
+        now = time.monotonic()
+        with self._cond:
+            for kind, bucket in self._buckets.items():
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if remaining is None:
+                    continue
+                try:
+                    remaining = min(bucket.capacity, float(remaining))
+                except ValueError:
+                    continue
+                bucket.refill(now)
+                # Request counts are exact locally, so the provider's may only lower them; token
+                # counts are estimates, so the provider's count replaces them in both directions
+                bucket.level = min(bucket.level, remaining) if kind == "requests" else remaining
+            if status not in _RETRYABLE:
+                return None
+            self.registry.inc("rag_scheduler_responses_total", scheduler=self.name, status=str(status))
+            hinted = retry_after(headers) if status == 429 else None
+            delay = hinted if hinted is not None else min(self.backoff_max, self.backoff_base * 2 ** attempt)
+            delay *= 1 + random.uniform(0, self.jitter)
+            if status == 429:
+                self.counters.rate_limited += 1
+                # Hold every request of this scheduler, not just the one that hit the limit
+                self._paused_until = max(self._paused_until, now + delay)
+                self._cond.notify_all()
+            if attempt >= self.max_retries:
+                return None
+            self.counters.retries += 1
+        return delay
+
+    def failed(self, error:Exception, attempt:int=0)->Optional[float]:
+        """
+        Backoff for a request that got no response, e.g. a connect error or timeout
+
+        Unlike a 429 this does not pause the scheduler: only the failed
+        request waits before it is sent again.
+
+        Args:
+            error: Transport error the request failed with
+            attempt: Retries already made for this request
+
+        Returns:
+            Seconds to wait before retrying the request, or None if it should not be retried
+        """
+        self.registry.inc("rag_scheduler_errors_total", scheduler=self.name, error=type(error).__name__)
+        if attempt >= self.max_retries:
+            return None
+        with self._cond:
+            self.counters.retries += 1
+        return min(self.backoff_max, self.backoff_base * 2 ** attempt) * (1 + random.uniform(0, self.jitter))
+
+    def rejection(self, request:httpx.Request, error:AdmissionRejected)->httpx.Response:
+        """Local 429 answering a rejected request, so clients handle it like a provider rate limit"""
+        body = {"error": {"message": str(error), "type": "admission_rejected", "code": "admission_rejected"}}
+        return httpx.Response(429, json=body, headers={"x-scheduler-rejected": self.name}, request=request)
+
+    def client_kwargs(self)->Dict[str, Any]:
+        """`max_retries`, `http_client` and `http_async_client` routing an OpenAI client through this scheduler"""
+        import openai
+
+        return {
+            "max_retries": 0,
+            "http_client": openai.DefaultHttpxClient(transport=ScheduledTransport(self)),
+            "http_async_client": openai.DefaultAsyncHttpxClient(transport=AsyncScheduledTransport(self)),
+        }
+
+    def stats(self)->Dict[str, float]:
+        with self._cond:
+            now = time.monotonic()
+            for bucket in self._buckets.values():
+                bucket.refill(now)
+            return {
+                "queued": len(self._queue),
+                "admitted": self.counters.admitted,
+                "rejected": self.counters.rejected,
+                "rate_limited": self.counters.rate_limited,
+                "retries": self.counters.retries,
+                "mean_wait_seconds": self.counters.waited / self.counters.admitted if self.counters.admitted else 0.0,
+                "paused_seconds": max(0.0, self._paused_until - now),
+                **{f"{kind}_available": bucket.level for kind, bucket in self._buckets.items()},
+            }
+
+
+class ScheduledTransport(httpx.BaseTransport):
+    """
+    httpx transport that admits, retries and rate-limits every request through a `RequestScheduler`
+
+    Retryable statuses and requests that got no response (connect
+    errors, timeouts) are re-admitted and sent again after the
+    scheduler's jittered backoff, up to its `max_retries`.
+    """
+
+    def __init__(self, scheduler:RequestScheduler, transport:Optional[httpx.BaseTransport]=None):
+        self.scheduler = scheduler
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request:httpx.Request)->httpx.Response:
+        tokens = estimate_tokens(request.read(), self.scheduler.completion_tokens)
+        attempt = 0
+        while True:
+            try:
+                self.scheduler.acquire(tokens)
+            except AdmissionRejected as e:
+                return self.scheduler.rejection(request, e)
+            try:
+                response = self.transport.handle_request(request)
+            except _RETRYABLE_ERRORS as e:
+                delay = self.scheduler.failed(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                delay = self.scheduler.observe(response.status_code, response.headers, attempt)
+                if delay is None:
+                    return response
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncScheduledTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of `ScheduledTransport`; admission waits run on a worker thread"""
+
+    def __init__(self, scheduler:RequestScheduler, transport:Optional[httpx.AsyncBaseTransport]=None):
+        self.scheduler = scheduler
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request:httpx.Request)->httpx.Response:
+        tokens = estimate_tokens(await request.aread(), self.scheduler.completion_tokens)
+        attempt = 0
+        while True:
+            try:
+                await asyncio.to_thread(self.scheduler.acquire, tokens)
+            except AdmissionRejected as e:
+                return self.scheduler.rejection(request, e)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except _RETRYABLE_ERRORS as e:
+                delay = self.scheduler.failed(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                delay = self.scheduler.observe(response.status_code, response.headers, attempt)
+                if delay is None:
+                    return response
+                await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+if __name__=="__main__":
+    __all__=["RequestScheduler","Priority","AdmissionRejected","request_priority","ScheduledTransport","AsyncScheduledTransport","TokenBucket","estimate_tokens","retry_after"]
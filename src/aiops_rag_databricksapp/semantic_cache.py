@@ -0,0 +1,190 @@
+from typing import Dict, List, Optional, Union
+from collections import OrderedDict
+import itertools
+import threading
+import time
+
+import numpy as np
+
+from langchain_core.embeddings import Embeddings
+
+from dataclasses import dataclass
+
+# Question vectors of recent misses kept for `store`, so answering a miss embeds the question once
+_PENDING_VECTORS = 256
+
+@dataclass
+class CacheEntry:
+    """A cached answer and the ids and scores of the chunks it was generated from"""
+    question:str
+    answer:str
+    chunk_ids:List[str]
+    scores:List[float]
+    corpus_version:str
+    created:float
+    latency:float
+
+
+@dataclass
+class SemanticCache:
+    """
+    Semantic answer cache keyed by question embedding
+    ---
+
+    A lookup embeds the question and returns the stored answer of the
+    most similar past question if its cosine similarity reaches
+    `threshold`. Entries expire after `ttl_seconds`, the least recently
+    used entry is evicted beyond `max_entries`, and all entries are
+    dropped when the corpus version changes. The vector of a missed
+    question is kept until its answer is stored, so `store` does not
+    embed the question a second time.
+
+    Args:
+        embeddings: Embeddings client for questions
+        threshold: Minimum cosine similarity for a hit
+        ttl_seconds: Entry lifetime
+        max_entries: Maximum number of cached answers
+        corpus_version: Version of the index answers were generated from
+    """
+    embeddings:Embeddings
+    threshold:float = 0.95
+    ttl_seconds:float = 3600.0
+    max_entries:int = 1000
+    corpus_version:str = ""
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+        self._entries:"OrderedDict[int, CacheEntry]" = OrderedDict()
+        self._vectors:Dict[int, np.ndarray] = {}
+        self._ids = itertools.count()
+        self._matrix:Optional[np.ndarray] = None
+        self._matrix_keys:List[int] = []
+        self._pending:"OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+        self.latency_saved = 0.0
+
+    def _embed(self, question:str, vector:Optional[np.ndarray]=None)->np.ndarray:
+        if vector is None:
+            vector = self.embeddings.embed_query(question)
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _drop(self, key:int):
+        self._entries.pop(key, None)
+        self._vectors.pop(key, None)
+        self._matrix = None
+
+    def _search_matrix(self):
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries.keys())
+            self._matrix = (
+                np.vstack([self._vectors[k] for k in self._matrix_keys])
+                if self._matrix_keys else None
+            )
+        return self._matrix, self._matrix_keys
+
+    def set_corpus_version(self, corpus_version:str):
+        """Switch to a new corpus version, invalidating every entry"""
+        with self._lock:
+            if corpus_version != self.corpus_version:
+                self.corpus_version = corpus_version
+                self._clear()
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._pending.clear()
+        self._entries.clear()
+        self._vectors.clear()
+        self._matrix = None
+
+    def lookup(self, question:str, vector:Optional[np.ndarray]=None)->Optional[CacheEntry]:
+        """
+        Find a cached answer for a semantically equivalent question
+
+        Args:
+            question: User question
+            vector: The question's embedding from `embeddings`, if already computed
+
+        Returns:
+            The matching entry, or None on a miss
+        """
+        start = time.perf_counter()
+        vector = self._embed(question, vector)
+        with self._lock:
+            self.lookups += 1
+            matrix, keys = self._search_matrix()
+            if matrix is None:
+                self._remember_miss(question, vector)
+                return None
+            similarities = matrix @ vector
+            now = time.time()
+            for pos in np.argsort(-similarities):
+                if similarities[pos] < self.threshold:
+                    break
+                entry = self._entries[keys[pos]]
+                if now - entry.created > self.ttl_seconds or entry.corpus_version != self.corpus_version:
+                    self._drop(keys[pos])
+                    continue
+                self._entries.move_to_end(keys[pos])
+                self.hits += 1
+                self.latency_saved += max(0.0, entry.latency - (time.perf_counter() - start))
+                return entry
+            self._remember_miss(question, vector)
+        return None
+
+    def _remember_miss(self, question:str, vector:np.ndarray):
+        self._pending[question] = vector
+        self._pending.move_to_end(question)
+        while len(self._pending) > _PENDING_VECTORS:
+            self._pending.popitem(last=False)
+
+    def store(self, question:str, answer:str, chunk_ids:List[str], scores:List[float], latency:float):
+        """
+        Cache an answer
+
+        Args:
+            question: User question
+            answer: Generated answer
+            chunk_ids: Ids of the chunks the answer was generated from
+            scores: Retrieval scores of those chunks
+            latency: Seconds it took to produce the answer
+        """
+        with self._lock:
+            vector = self._pending.pop(question, None)
+        if vector is None:
+            vector = self._embed(question)
+        with self._lock:
+            key = next(self._ids)
+            self._entries[key] = CacheEntry(
+                question=question,
+                answer=answer,
+                chunk_ids=list(chunk_ids),
+                scores=list(scores),
+                corpus_version=self.corpus_version,
+                created=time.time(),
+                latency=latency,
+            )
+            self._vectors[key] = vector
+            self._matrix = None
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def stats(self)->Dict[str, Union[int, float]]:
+        """Hit rate and latency saved"""
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "latency_saved": self.latency_saved,
+                "entries": len(self._entries),
+            }
+
+if __name__=="__main__":
+    __all__=["SemanticCache","CacheEntry"]
@@ -0,0 +1,404 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlparse
+import dataclasses
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import run_in_executor
+
+from aiops_rag_databricksapp.store import VectorStore, content_hash
+from aiops_rag_databricksapp.metrics import span
+
+from dataclasses import dataclass, field
+
+SHARDS_DIR = "shards"
+SHARDS_MANIFEST_FILE = "shards.json"
+SHARDS_FORMAT_VERSION = 1
+
+
+def default_shard_key(doc:Document)->str:
+    """
+    Shard of a chunk: `metadata["shard"]` if set, else the host of a URL
+    source or the parent directory of a file source
+    """
+    if doc.metadata.get("shard"):
+        return str(doc.metadata["shard"])
+    source = str(doc.metadata.get("source") or "")
+    if source.startswith(("http://", "https://")):
+        return urlparse(source).netloc or "web"
+    return Path(source).parent.name or "local"
+
+
+def _shard_dir_name(name:str)->str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name) or "_"
+
+
+@dataclass
+class ShardedVectorStore:
+    """
+    Vector store split into independent per-corpus shards
+    ---
+
+    Every shard is a `VectorStore` configured like `template` (sharing
+    its embeddings client) holding the chunks of one corpus or source
+    group, as chosen by `shard_key`. Shards are built, saved, loaded and
+    rebuilt independently and in parallel; a query fans out to all (or a
+    filtered subset of) shards concurrently and the per-shard results are
+    merged by cosine score.
+
+    On disk, each shard is a `save_vectorstore` directory under
+    `shards/<name>` next to a `shards.json` manifest listing the shards
+    and their corpus versions.
+
+    Args:
+        template: Configuration of every shard
+        shard_key: Maps a chunk to its shard name
+        max_workers: Shards built, loaded or searched at the same time
+    """
+    template:VectorStore = field(default_factory=VectorStore)
+    shard_key:Callable[[Document], str] = default_shard_key
+    max_workers:int = 4
+    retriever = None
+    manifest = None
+
+    def __post_init__(self):
+        self.shards:Dict[str, VectorStore] = {}
+        self.changed:Set[str] = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="shard")
+
+    @property
+    def embedding(self)->Embeddings:
+        return self.template.embedding
+
+    @embedding.setter
+    def embedding(self, embedding:Embeddings):
+        self.template.embedding = embedding
+        for shard in self.shards.values():
+            shard.embedding = embedding
+
+    def embedding_cache_stats(self)->Optional[Dict]:
+        return self.template.embedding_cache_stats()
+
+    def _new_shard(self)->VectorStore:
+        shard = dataclasses.replace(self.template)
+        shard.embedding = self.template.embedding
+        return shard
+
+    def _shard(self, name:str)->VectorStore:
+        with self._lock:
+            if name not in self.shards:
+                self.shards[name] = self._new_shard()
+            return self.shards[name]
+
+    def _map(self, func:Callable[[str], Any], names:Iterable[str])->Dict[str, Any]:
+        """Run `func(name)` for every shard name on the pool"""
+        futures = {name: self._pool.submit(copy_context().run, func, name) for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
+    def _ensure_retriever(self):
+        if self.retriever is None:
+            self.retriever = ShardedRetriever(
+                store=self,
+                k=self.template.retrieval_k,
+                max_workers=self.max_workers,
+            )
+
+    def create_vectorstore(self, documents:List[Document]):
+        """Build every shard from scratch, in parallel"""
+        self.shards = {}
+        self.changed = set()
+        self.manifest = None
+        self.add_documents(documents)
+        self.flush()
+
+    def add_documents(self, documents:List[Document])->List[str]:
+        """
+        Route a batch of documents to their shards and add them
+
+        Shards receiving documents embed and index them in parallel.
+
+        Returns:
+            Docstore ids, in the order of `documents`
+        """
+        groups:Dict[str, List[int]] = {}
+        for i, doc in enumerate(documents):
+            groups.setdefault(self.shard_key(doc), []).append(i)
+        added = self._map(lambda name: self._shard(name).add_documents([documents[i] for i in groups[name]]), groups)
+        ids:List[Optional[str]] = [None] * len(documents)
+        for name, positions in groups.items():
+            for i, doc_id in zip(positions, added[name]):
+                ids[i] = doc_id
+        self.changed.update(groups)
+        self.manifest = None
+        self._ensure_retriever()
+        return ids
+
+    def delete_documents(self, ids:Iterable[str])->int:
+        """
+        Remove chunks from the shards holding them, in place and in parallel
+
+        Returns:
+            Number of chunks removed
+        """
+        ids = set(ids)
+        owners:Dict[str, List[str]] = {}
+        for name, shard in list(self.shards.items()):
+            if shard.vectorstore is None:
+                continue
+            positions = shard.docstore_positions()
+            owned = [doc_id for doc_id in ids if doc_id in positions]
+            if owned:
+                owners[name] = owned
+        removed = self._map(lambda name: self.shards[name].delete_documents(owners[name]), owners)
+        self.changed.update(owners)
+        self.manifest = None
+        return sum(removed.values())
+
+    def iter_chunks(self)->Iterator[Tuple[str, Document]]:
+        """Stored chunks with their docstore ids, shard by shard"""
+        for _, shard in sorted(self.shards.items()):
+            yield from shard.iter_chunks()
+
+    def flush(self):
+        """Flush every shard's buffered batches"""
+        self._map(lambda name: self.shards[name].flush(), list(self.shards))
+
+    def build_shard(self, name:str, documents:List[Document])->VectorStore:
+        """
+        Rebuild one shard from `documents` and swap it in
+
+        Queries keep using the old shard until the new one is complete.
+        """
+        shard = self._new_shard()
+        shard.create_vectorstore(documents)
+        with self._lock:
+            self.shards[name] = shard
+        self.changed.add(name)
+        self.manifest = None
+        self._ensure_retriever()
+        return shard
+
+    def drop_shard(self, name:str):
+        with self._lock:
+            self.shards.pop(name, None)
+        self.manifest = None
+
+    @staticmethod
+    def index_exists(path:Union[str, Path])->bool:
+        """Whether a persisted sharded index exists at `path`"""
+        return (Path(path) / SHARDS_MANIFEST_FILE).is_file()
+
+    def _write_manifest(self, path:Path, corpus_version:Optional[str])->Dict:
+        shard_manifests = {name: shard.manifest for name, shard in self.shards.items() if shard.manifest}
+        corpus_hash = content_hash("\n".join(
+            f"{name}:{shard_manifests[name]['corpus_hash']}" for name in sorted(shard_manifests)
+        ))
+        manifest = {
+            "format_version": SHARDS_FORMAT_VERSION,
+            "embedding_model": self.template.embedding_model,
+            "corpus_version": corpus_version or corpus_hash[:16],
+            "corpus_hash": corpus_hash,
+            "index_type": self.template.ann.index_type,
+            "index_factory": ", ".join(sorted({m.get("index_factory", "") for m in shard_manifests.values()})),
+            "num_vectors": sum(m["num_vectors"] for m in shard_manifests.values()),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "shards": {
+                name: {
+                    "dir": f"{SHARDS_DIR}/{_shard_dir_name(name)}",
+                    "corpus_version": m["corpus_version"],
+                    "num_vectors": m["num_vectors"],
+                }
+                for name, m in sorted(shard_manifests.items())
+            },
+        }
+        tmp = path / (SHARDS_MANIFEST_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, path / SHARDS_MANIFEST_FILE)
+        self.manifest = manifest
+        return manifest
+
+    def save_vectorstore(self, path:Union[str, Path], corpus_version:Optional[str]=None)->Dict:
+        """
+        Persist every shard, in parallel, and the shard manifest
+
+        Args:
+            path: Target directory
+            corpus_version: Explicit corpus version; defaults to a digest of the shard hashes
+
+        Returns:
+            The written shard manifest
+        """
+        if not self.shards:
+            raise ValueError("Vector store not initialized. Call create_vectorstore first.")
+        path = Path(path)
+        (path / SHARDS_DIR).mkdir(parents=True, exist_ok=True)
+        self._map(lambda name: self.shards[name].save_vectorstore(path / SHARDS_DIR / _shard_dir_name(name)), list(self.shards))
+        self.changed.clear()
+        return self._write_manifest(path, corpus_version)
+
+    def save_shard(self, path:Union[str, Path], name:str, corpus_version:Optional[str]=None)->Dict:
+        """Persist one shard and update the shard manifest, leaving the other shards untouched"""
+        path = Path(path)
+        (path / SHARDS_DIR).mkdir(parents=True, exist_ok=True)
+        self.shards[name].save_vectorstore(path / SHARDS_DIR / _shard_dir_name(name))
+        self.changed.discard(name)
+        return self._write_manifest(path, corpus_version)
+
+    def load_vectorstore(self, path:Union[str, Path], mmap:bool=True, shards:Optional[List[str]]=None)->Dict:
+        """
+        Load persisted shards, in parallel
+
+        Args:
+            path: Directory written by `save_vectorstore`
+            mmap: Memory-map the shard indexes
+            shards: Names of the shards to load; None loads all. A store loaded
+                with a subset only lists that subset when saved again.
+
+        Returns:
+            The shard manifest
+
+        Raises:
+            ValueError: If the format, embedding model or index type does not match, or a shard is unknown
+        """
+        path = Path(path)
+        with open(path / SHARDS_MANIFEST_FILE, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != SHARDS_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported shard format {manifest.get('format_version')} at {path}; "
+                f"expected {SHARDS_FORMAT_VERSION}. Rebuild the index."
+            )
+        names = list(manifest["shards"]) if shards is None else shards
+        unknown = [name for name in names if name not in manifest["shards"]]
+        if unknown:
+            raise ValueError(f"Unknown shards {unknown} at {path}; available: {sorted(manifest['shards'])}")
+
+        def load(name:str)->VectorStore:
+            shard = self._new_shard()
+            shard.load_vectorstore(path / manifest["shards"][name]["dir"], mmap=mmap)
+            return shard
+
+        loaded = self._map(load, names)
+        with self._lock:
+            self.shards = loaded
+        self.changed.clear()
+        self.manifest = manifest
+        self._ensure_retriever()
+        return manifest
+
+    def get_chunks(self, ids:List[str])->List[Optional[Document]]:
+        """Stored chunks by docstore id, looked up across shards"""
+        found:List[Optional[Document]] = [None] * len(ids)
+        for shard in list(self.shards.values()):
+            missing = [i for i, doc in enumerate(found) if doc is None]
+            if not missing:
+                break
+            for i, doc in zip(missing, shard.get_chunks([ids[i] for i in missing])):
+                found[i] = doc
+        return found
+
+    def ann_report(self, k:int=10, n_queries:int=200)->List[Dict]:
+        """`VectorStore.ann_report` of every shard, index names prefixed with the shard"""
+        rows = []
+        for name, shard in sorted(self.shards.items()):
+            if shard.vectorstore is None or shard.vectorstore.index.ntotal < 2:
+                continue  # nothing to hold out queries from
+            for row in shard.ann_report(k=k, n_queries=n_queries):
+                rows.append({**row, "shard": name, "index": f"{name}/{row['index']}"})
+        return rows
+
+    def get_retriever(self):
+        """
+        Get the fan-out retriever over all shards
+
+        Returns:
+            Retriever instance
+        """
+        if self.retriever is None:
+            raise ValueError("Vector store not initialized. Call create_vectorstore first.")
+        return self.retriever
+
+    def retrieve(self, query:str, k:int=4, **search_kwargs)->List[Document]:
+        """Retrieve relevant documents across shards; `shards=[...]` restricts the search"""
+        return self.get_retriever().invoke(query, k=k, **search_kwargs)
+
+
+class ShardedRetriever(BaseRetriever):
+    """
+    Fan-out retriever over the shards of a `ShardedVectorStore`
+    ---
+
+    Embeds the query once (unless a `query_vector` is passed), runs every
+    shard's retriever concurrently and merges the results by cosine score
+    (`metadata["score"]`), each tagged with its shard in
+    `metadata["shard"]`. `shards=[...]` restricts a call to the named shards; other options (k, fetch_k, lambda_mult,
+    ...) are passed on to the shard retrievers.
+    """
+    store:Any
+    k:int = 4
+    max_workers:int = 4
+
+    @property
+    def vectorstore(self):
+        """FAISS store of the first shard, for callers that reach for its embeddings"""
+        shards = list(self.store.shards.values())
+        return shards[0].vectorstore if shards else None
+
+    def _get_relevant_documents(
+        self,
+        query:str,
+        *,
+        run_manager:CallbackManagerForRetrieverRun,
+        k:Optional[int]=None,
+        shards:Optional[List[str]]=None,
+        query_vector:Optional[np.ndarray]=None,
+        **search_kwargs:Any,
+    )->List[Document]:
+        k = k or self.k
+        targets = {
+            name: shard for name, shard in list(self.store.shards.items())
+            if shard.retriever is not None and (shards is None or name in shards)
+        }
+        if not targets:
+            return []
+        if query_vector is None:
+            with span("embed_query"):
+                query_vector = np.asarray(self.store.embedding.embed_query(query), dtype=np.float32)
+
+        def search(name:str)->List[Document]:
+            with span("shard_search", shard=name):
+                return targets[name].retriever.invoke(
+                    query, k=k, query_vector=query_vector, config={"callbacks": run_manager.get_child()}, **search_kwargs
+                )
+
+        results = self.store._map(search, targets)
+        merged = [
+            Document(id=doc.id, page_content=doc.page_content, metadata={**doc.metadata, "shard": name})
+            for name, docs in results.items() for doc in docs
+        ]
+        merged.sort(key=lambda doc: doc.metadata.get("score", 0.0), reverse=True)
+        return merged[:k]
+
+    async def _aget_relevant_documents(
+        self, query:str, *, run_manager:AsyncCallbackManagerForRetrieverRun, **kwargs:Any
+    )->List[Document]:
+        """Run the search in an executor, passing per-call options on (the base class drops them)"""
+        return await run_in_executor(None, self._get_relevant_documents, query, run_manager=run_manager.get_sync(), **kwargs)
+
+
+if __name__=="__main__":
+    __all__=["ShardedVectorStore","ShardedRetriever","default_shard_key"]
@@ -0,0 +1,175 @@
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+from bisect import bisect_left
+import re
+
+from langchain_core.documents import Document
+
+from dataclasses import dataclass, field
+
+Span = Tuple[int, int]
+
+_WHITESPACE = frozenset(" \t\n\r\x0b\x0c")
+
+
+def _token_starts(model:str)->Optional[Callable[[str], List[int]]]:
+    """Character offset of every token of a text for `model`, or None if tiktoken is unavailable"""
+    try:
+        import tiktoken
+
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+        return lambda text: encoding.decode_with_offsets(encoding.encode(text, disallowed_special=()))[1]
+    except Exception:
+        return None
+
+
+@dataclass
+class OffsetTextSplitter:
+    """
+    Recursive text splitter that works on offsets into the original text
+    ---
+
+    Follows the `RecursiveCharacterTextSplitter` algorithm (separators
+    tried in order, separators kept at the start of the following piece,
+    pieces merged up to `chunk_size` with up to `chunk_overlap` carried
+    over, whitespace stripped), but every piece is a (start, end) span of
+    the source text located by a separator scan, and lengths are span widths.
+    No intermediate strings are built; a chunk's text is one slice of the
+    original, taken only when a `Document` is materialized.
+
+    With `length_unit="tokens"`, sizes count tokens of `model`: the text
+    is tokenized once and a span's length is the number of tokens that
+    start inside it (about four characters per token without tiktoken).
+
+    Chunks carry `start_index` and `end_index` in their metadata, so the
+    exact span of a source can be shown without storing extra text.
+
+    Args:
+        chunk_size: Maximum chunk length
+        chunk_overlap: Maximum length carried over between consecutive chunks
+        length_unit: "chars" or "tokens"
+        model: Tokenizer model for "tokens" sizing
+        separators: Separators tried in order; "" splits between characters
+    """
+    chunk_size:int
+    chunk_overlap:int
+    length_unit:str = "chars"
+    model:str = "gpt-4o-mini"
+    separators:Sequence[str] = field(default_factory=lambda: ["\n\n", "\n", " ", ""])
+
+    def __post_init__(self):
+        if self.chunk_overlap > self.chunk_size:
+            raise ValueError(f"chunk_overlap ({self.chunk_overlap}) is larger than chunk_size ({self.chunk_size})")
+        if self.length_unit not in ("chars", "tokens"):
+            raise ValueError(f"Unknown length_unit '{self.length_unit}'; use 'chars' or 'tokens'")
+        self._token_starts = _token_starts(self.model) if self.length_unit == "tokens" else None
+        self._patterns = {separator: re.compile(re.escape(separator)) for separator in self.separators if separator}
+
+    def _length_function(self, text:str)->Optional[Callable[[int, int], int]]:
+        """Length of a span of `text`; None for plain character counts"""
+        if self.length_unit == "chars":
+            return None
+        if self._token_starts is None:
+            return lambda start, end: (end - start + 3) // 4
+        starts = self._token_starts(text)
+        return lambda start, end: bisect_left(starts, end) - bisect_left(starts, start)
+
+    def _pieces(self, text:str, start:int, end:int, separator:str)->List[Span]:
+        """Spans between occurrences of `separator`, each occurrence kept at the start of the next span"""
+        if not separator:
+            return [(i, i + 1) for i in range(start, end)]
+        bounds = [start, *(match.start() for match in self._patterns[separator].finditer(text, start, end)), end]
+        return [(piece_start, piece_end) for piece_start, piece_end in zip(bounds, bounds[1:]) if piece_end > piece_start]
+
+    @staticmethod
+    def _strip(text:str, start:int, end:int)->Span:
+        while start < end and text[start] in _WHITESPACE:
+            start += 1
+        while end > start and text[end - 1] in _WHITESPACE:
+            end -= 1
+        return start, end
+
+    def _merge(self, text:str, pieces:List[Span], lengths:List[int], spans:List[Span]):
+        """Merge contiguous pieces into chunk spans with overlap"""
+        first = 0
+        total = 0
+        for i, piece_length in enumerate(lengths):
+            if i > first and total + piece_length > self.chunk_size:
+                start, end = self._strip(text, pieces[first][0], pieces[i - 1][1])
+                if end > start:
+                    spans.append((start, end))
+                while total > self.chunk_overlap or (total + piece_length > self.chunk_size and total > 0):
+                    total -= lengths[first]
+                    first += 1
+            total += piece_length
+        if first < len(pieces):
+            start, end = self._strip(text, pieces[first][0], pieces[-1][1])
+            if end > start:
+                spans.append((start, end))
+
+    def _split(self, text:str, start:int, end:int, separators:Sequence[str], length:Optional[Callable[[int, int], int]], spans:List[Span]):
+        separator, remaining = separators[-1], []
+        for i, candidate in enumerate(separators):
+            if candidate == "":
+                separator = candidate
+                break
+            if text.find(candidate, start, end) != -1:
+                separator, remaining = candidate, separators[i + 1:]
+                break
+        pieces = self._pieces(text, start, end, separator)
+        if length is None:
+            lengths = [piece_end - piece_start for piece_start, piece_end in pieces]
+        else:
+            lengths = [length(piece_start, piece_end) for piece_start, piece_end in pieces]
+        good = 0
+        for i, piece_length in enumerate(lengths):
+            if piece_length < self.chunk_size:
+                continue
+            if i > good:
+                self._merge(text, pieces[good:i], lengths[good:i], spans)
+            if remaining:
+                self._split(text, pieces[i][0], pieces[i][1], remaining, length, spans)
+            else:
+                spans.append(pieces[i])
+            good = i + 1
+        if good < len(pieces):
+            self._merge(text, pieces[good:], lengths[good:], spans)
+
+    def split_spans(self, text:str)->List[Span]:
+        """
+        Chunk spans of `text`
+
+        Returns:
+            (start, end) character offsets of each chunk, in order
+        """
+        spans:List[Span] = []
+        if text:
+            self._split(text, 0, len(text), list(self.separators), self._length_function(text), spans)
+        return spans
+
+    def iter_spans(self, documents:Iterable[Document])->Iterator[Tuple[Document, int, int]]:
+        """(source document, start, end) of every chunk, without materializing chunk text"""
+        for doc in documents:
+            for start, end in self.split_spans(doc.page_content):
+                yield doc, start, end
+
+    def split_text(self, text:str)->List[str]:
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def split_documents(self, documents:Iterable[Document])->List[Document]:
+        """
+        Split documents into chunk documents
+
+        Each chunk's text is a single slice of its source and its metadata
+        is the source's plus `start_index` / `end_index`.
+        """
+        return [
+            Document(page_content=doc.page_content[start:end], metadata={**doc.metadata, "start_index": start, "end_index": end})
+            for doc, start, end in self.iter_spans(documents)
+        ]
+
+
+if __name__=="__main__":
+    __all__=["OffsetTextSplitter"]
@@ -1,32 +1,608 @@
-from typing import Dict, List
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import datetime, timezone
+import hashlib
+import json
+import shutil
+import threading
+import uuid
 
-from langchain_community.vectorstores.faiss import FAISS
-from langchain_openai import OpenAIEmbeddings
-from langchain.schema import Document
+import numpy as np
 
-from dataclasses import dataclass
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from aiops_rag_databricksapp.embedding_cache import CachedEmbeddings
+from aiops_rag_databricksapp.lexical import BM25Index
+from aiops_rag_databricksapp.ann import ANNConfig, default_sweep, enable_reconstruct, recall_report
+from aiops_rag_databricksapp.metrics import span
+from aiops_rag_databricksapp.batching import QueryDispatcher
+
+from dataclasses import dataclass, field
+
+if TYPE_CHECKING:
+    from aiops_rag_databricksapp.scheduler import RequestScheduler
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.jsonl"
+MANIFEST_FILE = "manifest.json"
+LEXICAL_FILE = "lexical.npz"
+FORMAT_VERSION = 1
+
+
+def content_hash(text:str)->str:
+    """SHA-256 hex digest of a chunk's text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 
 @dataclass
 class VectorStore:
-    embedding = OpenAIEmbeddings()
+    """
+    FAISS vector store with a persistent on-disk format
+    ---
+
+    A persisted index is a directory holding the raw FAISS index
+    (`index.faiss`), the chunk texts and metadata (`docstore.jsonl`),
+    the BM25 inverted index (`lexical.npz`) and a `manifest.json` with
+    the embedding model, corpus version and per-chunk content hashes.
+
+    In "hybrid" retrieval mode the retriever fuses dense FAISS and BM25
+    results; "dense" uses FAISS alone.
+
+    The FAISS index type is chosen by `ann`. Index types that need
+    training buffer added batches until `ann.train_size` vectors are
+    available (or `flush` is called), train on them and then add them.
+
+    Args:
+        embedding_model: OpenAI embedding model used for documents and queries
+        embedding_cache_path: SQLite file for the embedding cache; None disables it
+        embedding_cache_max_mb: Size cap of the embedding cache
+        embedding_cache_dtype: Storage precision of cached vectors
+        retrieval_mode: "hybrid" (BM25 + dense) or "dense"
+        retrieval_k: Number of documents a retriever returns
+        retrieval_fetch_k: Candidates fetched from each index before re-ranking
+        retrieval_mmr_lambda: MMR trade-off; 1 ranks by relevance only, lower values favour diversity
+        retrieval_source_cap: Maximum chunks per source in one result; 0 disables the cap
+        retrieval_score_threshold: Minimum cosine similarity of dense-only hits; None disables it
+        ann: FAISS index type and search parameters
+        query_batch_size: Concurrent queries embedded and searched together; 0 disables micro-batching
+        query_batch_wait_ms: Longest a query waits for others to join its batch
+        query_batch_in_flight: Query batches embedded and searched at once
+        scheduler: Rate-limit scheduler every embeddings request goes through; None sends them directly
+    """
+    embedding_model:str = "text-embedding-ada-002"
+    embedding_cache_path:Optional[str] = None
+    embedding_cache_max_mb:int = 512
+    embedding_cache_dtype:str = "float32"
+    retrieval_mode:str = "hybrid"
+    retrieval_k:int = 4
+    retrieval_fetch_k:int = 20
+    retrieval_mmr_lambda:float = 0.7
+    retrieval_source_cap:int = 0
+    retrieval_score_threshold:Optional[float] = None
+    ann:ANNConfig = field(default_factory=ANNConfig)
+    query_batch_size:int = 0
+    query_batch_wait_ms:float = 5.0
+    query_batch_in_flight:int = 4
+    scheduler:Optional["RequestScheduler"] = None
     vectorstore = None
     retriever = None
+    manifest = None
+    lexical:Optional[BM25Index] = None
+
+    def __post_init__(self):
+        self._embedding:Optional[Embeddings] = None
+        self._pending:List[Tuple[List[str], List[str], List[List[float]], List[dict]]] = []
+        self._index_factory:Optional[str] = None
+        self._positions:Optional[Tuple[Any, int, Dict[str, int]]] = None
+        self._mapped = False
+        self._lock = threading.Lock()
+        # id() of each FAISS store pinned by a query -> number of such queries
+        self._readers:Dict[int, int] = {}
+        # Replaced stores still pinned, with the chunk ids to drop from the shared docstore once they are not
+        self._retired:List[Tuple[Any, List[str]]] = []
+        self.dispatcher:Optional[QueryDispatcher] = (
+            QueryDispatcher(
+                self,
+                max_batch_size=self.query_batch_size,
+                max_wait_ms=self.query_batch_wait_ms,
+                max_in_flight=self.query_batch_in_flight,
+            )
+            if self.query_batch_size > 0 else None
+        )
+
+    @property
+    def embedding(self)->Embeddings:
+        """Embeddings client, constructed on first use"""
+        if self._embedding is None:
+            from langchain_openai import OpenAIEmbeddings
+
+            embedding = OpenAIEmbeddings(
+                model=self.embedding_model, **(self.scheduler.client_kwargs() if self.scheduler else {})
+            )
+            if self.embedding_cache_path:
+                embedding = CachedEmbeddings(
+                    underlying=embedding,
+                    model=self.embedding_model,
+                    path=self.embedding_cache_path,
+                    max_bytes=self.embedding_cache_max_mb * 1024 * 1024,
+                    dtype=self.embedding_cache_dtype,
+                )
+            self._embedding = embedding
+        return self._embedding
+
+    @embedding.setter
+    def embedding(self, embedding:Embeddings):
+        self._embedding = embedding
+
+    def embedding_cache_stats(self)->Optional[Dict]:
+        """Hit/miss counters of the embedding cache, if enabled"""
+        if isinstance(self._embedding, CachedEmbeddings):
+            return self._embedding.stats()
+        return None
 
     def create_vectorstore(self, documents:List[Document]):
         """
         Create vector store from documents
-        
+
         Args:
             documents: List of documents to embed
         """
-        self.vectorstore = FAISS.from_documents(documents=documents, embedding=self.embedding)
-        self.retriever = self.vectorstore.as_retriever()
-        
+        self.vectorstore = None
+        self.retriever = None
+        self.lexical = None
+        self._pending = []
+        self._mapped = False
+        self.add_documents(documents)
+        self.flush()
+
+    def add_documents(self, documents:List[Document])->List[str]:
+        """
+        Embed a batch of documents and add it to the index
+
+        Creates the vector store on the first batch, so an index can be
+        built incrementally from a stream of batches. For index types
+        that need training, batches are buffered until enough vectors
+        for the training sample have arrived.
+
+        Args:
+            documents: Batch of documents to embed and add; a document's `id` is kept as its docstore id
+
+        Returns:
+            Docstore ids of the added documents
+        """
+        texts = [doc.page_content for doc in documents]
+        with span("embed_documents", batch=len(texts)):
+            vectors = self.embedding.embed_documents(texts)
+        metadatas = [doc.metadata for doc in documents]
+        ids = [doc.id or str(uuid.uuid4()) for doc in documents]
+        self._pending.append((ids, texts, vectors, metadatas))
+        self.manifest = None
+        buffered = sum(len(batch[0]) for batch in self._pending)
+        if self.vectorstore is None and self.ann.requires_training and buffered < self.ann.train_size:
+            return ids
+        self.flush()
+        return ids
+
+    def flush(self):
+        """
+        Add buffered batches, building (and training) the index first if needed
+
+        Like `delete_documents`, additions never touch an index a query
+        has pinned (see `snapshot`): the index and its id map are then
+        copied, extended and swapped in, and pinned queries finish on the
+        old ones. Otherwise the index is extended in place.
+        """
+        if not self._pending:
+            return
+        from langchain_community.vectorstores.faiss import FAISS
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+
+        with self._lock:
+            batches, self._pending = self._pending, []
+            if not batches:
+                return
+            ids = [doc_id for batch in batches for doc_id in batch[0]]
+            texts = [text for batch in batches for text in batch[1]]
+            vectors = [vector for batch in batches for vector in batch[2]]
+            metadatas = [metadata for batch in batches for metadata in batch[3]]
+
+            if self.vectorstore is None:
+                matrix = np.asarray(vectors, dtype=np.float32)
+                sample = None
+                if self.ann.requires_training:
+                    sample = matrix[np.random.default_rng(0).permutation(len(matrix))[:self.ann.train_size]]
+                n_train = 0 if sample is None else len(sample)
+                self._index_factory = self.ann.factory_string(matrix.shape[1], n_train)
+                self.vectorstore = FAISS(
+                    embedding_function=self.embedding,
+                    index=self.ann.build(matrix.shape[1], sample),
+                    docstore=InMemoryDocstore(),
+                    index_to_docstore_id={},
+                )
+                self.lexical = BM25Index()
+                self.retriever = self._build_retriever()
+            elif self._mapped or id(self.vectorstore) in self._readers:
+                old = self.vectorstore
+                self.vectorstore = FAISS(
+                    embedding_function=old.embedding_function,
+                    index=self._index_copy(),
+                    docstore=old.docstore,
+                    index_to_docstore_id=dict(old.index_to_docstore_id),
+                )
+                self._mapped = False
+            self.vectorstore.add_embeddings(
+                text_embeddings=list(zip(texts, vectors)),
+                metadatas=metadatas,
+                ids=ids,
+            )
+            self._positions = None
+        if self.lexical is not None:
+            self.lexical.add(ids, texts)
+
+    def _index_copy(self)->"faiss.Index":
+        """Heap copy of the FAISS index; a memory-mapped index is read-only and is copied through serialization"""
+        import faiss
+
+        if self._mapped:
+            index = faiss.deserialize_index(faiss.serialize_index(self.vectorstore.index))
+        else:
+            index = faiss.clone_index(self.vectorstore.index)
+        enable_reconstruct(index)
+        self.ann.apply_search_params(index)
+        return index
+
+    @staticmethod
+    def _remove_positions(index:"faiss.Index", removed:np.ndarray)->"faiss.Index":
+        """
+        Remove the vectors at `removed` (sorted) positions, keeping positions contiguous
+
+        Flat and IVF indexes drop the vectors in place. IVF ids are shifted
+        down afterwards, so position i is again the i-th surviving vector as
+        the id map expects. HNSW graphs do not support removal: the index
+        is rebuilt from the surviving vectors, which costs as much as
+        adding them all again (a full graph construction).
+        """
+        import faiss
+
+        ivf = faiss.try_extract_index_ivf(index)
+        if isinstance(faiss.downcast_index(index), faiss.IndexFlatCodes):
+            index.remove_ids(removed)
+        elif ivf is not None:
+            ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+            index.remove_ids(removed)
+            for list_no in range(ivf.nlist):
+                size = ivf.invlists.list_size(list_no)
+                if size:
+                    ids = faiss.rev_swig_ptr(ivf.invlists.get_ids(list_no), size)
+                    ids -= np.searchsorted(removed, ids)
+            ivf.set_direct_map_type(faiss.DirectMap.Array)
+        else:
+            keep = np.setdiff1d(np.arange(index.ntotal), removed)
+            vectors = index.reconstruct_n(0, index.ntotal)[keep]
+            index.reset()
+            index.add(vectors)
+        return index
+
+    def delete_documents(self, ids:Iterable[str])->int:
+        """
+        Remove chunks from the live store in place
+
+        Nothing is re-embedded. Flat and IVF indexes drop the vectors
+        directly; HNSW indexes are rebuilt from the surviving vectors (see
+        `_remove_positions`). When no query has the store pinned (see
+        `snapshot`) and the index is in memory, it is edited in place.
+        Otherwise an edited copy is swapped in together with its id map,
+        so pinned queries finish on the old index, and the removed chunks
+        stay in the docstore until the last of them is done.
+
+        Args:
+            ids: Docstore ids to remove; ids not in the store are ignored
+
+        Returns:
+            Number of chunks removed
+        """
+        self.flush()
+        if self.vectorstore is None:
+            raise ValueError("Vector store not initialized. Call create_vectorstore first.")
+        from langchain_community.vectorstores.faiss import FAISS
+
+        with self._lock:
+            old = self.vectorstore
+            positions = self.docstore_positions(old)
+            removed = sorted({positions[doc_id] for doc_id in ids if doc_id in positions})
+            if not removed:
+                return 0
+            removed_ids = [old.index_to_docstore_id[pos] for pos in removed]
+            dropped = set(removed)
+            survivors = dict(enumerate(
+                doc_id for pos, doc_id in sorted(old.index_to_docstore_id.items()) if pos not in dropped
+            ))
+            removed_positions = np.asarray(removed, dtype=np.int64)
+            if not self._mapped and id(old) not in self._readers:
+                self._remove_positions(old.index, removed_positions)
+                old.index_to_docstore_id.clear()
+                old.index_to_docstore_id.update(survivors)
+                old.docstore.delete(removed_ids)
+            else:
+                self.vectorstore = FAISS(
+                    embedding_function=old.embedding_function,
+                    index=self._remove_positions(self._index_copy(), removed_positions),
+                    docstore=old.docstore,
+                    index_to_docstore_id=survivors,
+                )
+                self._retired.append((old, removed_ids))
+            self._mapped = False
+            self._positions = None
+        if self.lexical is not None:
+            self.lexical.remove(removed_ids)
+        self.manifest = None
+        return len(removed)
+
+    @staticmethod
+    def index_exists(path:Union[str, Path])->bool:
+        """Whether a persisted index exists at `path`"""
+        return (Path(path) / MANIFEST_FILE).is_file()
+
+    def save_vectorstore(self, path:Union[str, Path], corpus_version:Optional[str]=None)->Dict:
+        """
+        Persist the vector store to a directory
+
+        The directory is written next to the target and swapped in once
+        complete, so readers never observe a half-written index.
+
+        Args:
+            path: Target directory
+            corpus_version: Explicit corpus version; defaults to a digest of the chunk hashes
+
+        Returns:
+            The written manifest
+        """
+        self.flush()
+        if self.vectorstore is None:
+            raise ValueError("Vector store not initialized. Call create_vectorstore first.")
+        import faiss
+
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        if tmp_path.exists():
+            shutil.rmtree(tmp_path)
+        tmp_path.mkdir(parents=True)
+
+        index_to_id = self.vectorstore.index_to_docstore_id
+        hashes:List[str] = []
+        with open(tmp_path / DOCSTORE_FILE, "w", encoding="utf-8") as f:
+            for i in range(len(index_to_id)):
+                doc_id = index_to_id[i]
+                doc:Document = self.vectorstore.docstore.search(doc_id)
+                hashes.append(content_hash(doc.page_content))
+                f.write(json.dumps({
+                    "id": doc_id,
+                    "page_content": doc.page_content,
+                    "metadata": doc.metadata,
+                }, ensure_ascii=False) + "\n")
+
+        faiss.write_index(self.vectorstore.index, str(tmp_path / INDEX_FILE))
+        if self.lexical is not None:
+            self.lexical.save(tmp_path / LEXICAL_FILE)
+
+        corpus_hash = content_hash("\n".join(sorted(hashes)))
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "embedding_model": self.embedding_model,
+            "corpus_version": corpus_version or corpus_hash[:16],
+            "corpus_hash": corpus_hash,
+            "dimension": self.vectorstore.index.d,
+            "index_type": self.ann.index_type,
+            "index_factory": self._index_factory or self.ann.factory_string(self.vectorstore.index.d),
+            "num_vectors": self.vectorstore.index.ntotal,
+            "lexical_index": self.lexical is not None,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "content_hashes": hashes,
+        }
+        with open(tmp_path / MANIFEST_FILE, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        if path.exists():
+            shutil.rmtree(path)
+        tmp_path.rename(path)
+        self.manifest = manifest
+        return manifest
+
+    def load_vectorstore(self, path:Union[str, Path], mmap:bool=True)->Dict:
+        """
+        Load a persisted vector store
+
+        With `mmap` the vectors are memory-mapped read-only, so start-up
+        does not copy them onto the heap and processes on the same node
+        share one copy through the page cache.
+
+        Args:
+            path: Directory written by `save_vectorstore`
+            mmap: Memory-map the index instead of reading it into memory
+
+        Returns:
+            The loaded manifest
+
+        Raises:
+            ValueError: If the index was built with a different embedding model or index type
+        """
+        import faiss
+        from langchain_community.vectorstores.faiss import FAISS
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+
+        path = Path(path)
+        with open(path / MANIFEST_FILE, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported index format {manifest.get('format_version')} at {path}; "
+                f"expected {FORMAT_VERSION}. Rebuild the index."
+            )
+        if manifest["embedding_model"] != self.embedding_model:
+            raise ValueError(
+                f"Index at {path} was built with embedding model "
+                f"'{manifest['embedding_model']}' but '{self.embedding_model}' is configured. "
+                "Rebuild the index or change the configured embedding model."
+            )
+        if manifest.get("index_type", "flat") != self.ann.index_type:
+            raise ValueError(
+                f"Index at {path} is a '{manifest.get('index_type', 'flat')}' index but "
+                f"'{self.ann.index_type}' is configured. Rebuild the index or change the configured index type."
+            )
+
+        flags = 0
+        if mmap:
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        index = faiss.read_index(str(path / INDEX_FILE), flags)
+        enable_reconstruct(index)
+        self.ann.apply_search_params(index)
+        self._index_factory = manifest.get("index_factory")
+
+        docs:Dict[str, Document] = {}
+        index_to_id:Dict[int, str] = {}
+        with open(path / DOCSTORE_FILE, "r", encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                record = json.loads(line)
+                docs[record["id"]] = Document(
+                    id=record["id"],
+                    page_content=record["page_content"],
+                    metadata=record["metadata"],
+                )
+                index_to_id[i] = record["id"]
+
+        if index.ntotal != len(index_to_id) or index.ntotal != manifest["num_vectors"]:
+            raise ValueError(
+                f"Index at {path} is inconsistent: {index.ntotal} vectors, "
+                f"{len(index_to_id)} documents, manifest says {manifest['num_vectors']}."
+            )
+
+        self.vectorstore = FAISS(
+            embedding_function=self.embedding,
+            index=index,
+            docstore=InMemoryDocstore(docs),
+            index_to_docstore_id=index_to_id,
+        )
+        self.lexical = BM25Index.load(path / LEXICAL_FILE) if (path / LEXICAL_FILE).is_file() else None
+        self._positions = None
+        self._mapped = mmap
+        self.retriever = self._build_retriever()
+        self.manifest = manifest
+        return manifest
+
+    def _build_retriever(self):
+        """Over-fetching, MMR re-ranking retriever; BM25 fusion in hybrid mode"""
+        from aiops_rag_databricksapp.retrieval import StoreRetriever
+
+        return StoreRetriever(
+            store=self,
+            k=self.retrieval_k,
+            fetch_k=self.retrieval_fetch_k,
+            hybrid=self.retrieval_mode == "hybrid",
+            lambda_mult=self.retrieval_mmr_lambda,
+            per_source_cap=self.retrieval_source_cap,
+            score_threshold=self.retrieval_score_threshold,
+        )
+
+    def docstore_positions(self, vectorstore:Any=None)->Dict[str, int]:
+        """Map of docstore id to position in the FAISS index of `vectorstore`, by default the live one"""
+        vectorstore = vectorstore or self.vectorstore
+        id_map = vectorstore.index_to_docstore_id
+        cached = self._positions
+        if cached is None or cached[0] is not vectorstore or cached[1] != len(id_map):
+            cached = (vectorstore, len(id_map), {doc_id: pos for pos, doc_id in list(id_map.items())})
+            self._positions = cached
+        return cached[2]
+
+    @contextmanager
+    def snapshot(self)->Iterator[Tuple[Any, Dict[str, int]]]:
+        """
+        Pin the live FAISS store and its id -> position map for one query
+
+        Everything a query reads (index, id map, positions, docstore) comes
+        from the pinned store, so a concurrent `delete_documents` cannot
+        shift positions under it.
+        """
+        with self._lock:
+            vectorstore = self.vectorstore
+            if vectorstore is None:
+                raise ValueError("Vector store not initialized. Call create_vectorstore first.")
+            self._readers[id(vectorstore)] = self._readers.get(id(vectorstore), 0) + 1
+            positions = self.docstore_positions(vectorstore)
+        try:
+            yield vectorstore, positions
+        finally:
+            with self._lock:
+                self._readers[id(vectorstore)] -= 1
+                if not self._readers[id(vectorstore)]:
+                    del self._readers[id(vectorstore)]
+                    self._release_retired()
+
+    def _release_retired(self):
+        """Drop the chunks removed from replaced stores no query still pins; called with the lock held"""
+        live = self.docstore_positions() if self.vectorstore is not None else {}
+        pinned = []
+        for old, removed_ids in self._retired:
+            if id(old) in self._readers:
+                pinned.append((old, removed_ids))
+                continue
+            # An id added back since its removal belongs to the live store again
+            stale = [doc_id for doc_id in removed_ids if doc_id not in live]
+            if stale:
+                old.docstore.delete(stale)
+        self._retired = pinned
+
+    def iter_chunks(self)->Iterator[Tuple[str, Document]]:
+        """Stored chunks with their docstore ids, in index order"""
+        if self.vectorstore is None:
+            return
+        docstore = self.vectorstore.docstore
+        for _, doc_id in sorted(self.vectorstore.index_to_docstore_id.items()):
+            yield doc_id, docstore.search(doc_id)
+
+    def get_chunks(self, ids:List[str])->List[Optional[Document]]:
+        """
+        Stored chunks by docstore id, without copying
+
+        Args:
+            ids: Docstore ids
+
+        Returns:
+            The chunks, None for ids not in the store
+        """
+        if self.vectorstore is None:
+            return [None] * len(ids)
+        docstore = self.vectorstore.docstore
+        found = [docstore.search(doc_id) for doc_id in ids]
+        return [doc if isinstance(doc, Document) else None for doc in found]
+
+    def ann_report(self, configs:Optional[List[ANNConfig]]=None, k:int=10, n_queries:int=200)->List[Dict]:
+        """
+        Recall@k and latency of index configurations against exact search
+
+        Runs over the vectors of this store (approximate for PQ/SQ8
+        indexes, which do not keep the original vectors).
+
+        Args:
+            configs: Configurations to compare; defaults to an nprobe/efSearch sweep of `ann`
+            k: Neighbours per query
+            n_queries: Corpus vectors held out as queries
+
+        Returns:
+            Rows as produced by `ann.recall_report`
+        """
+        if self.vectorstore is None:
+            raise ValueError("Vector store not initialized. Call create_vectorstore first.")
+        index = self.vectorstore.index
+        vectors = index.reconstruct_n(0, index.ntotal)
+        return recall_report(vectors, configs or default_sweep(self.ann), k=k, n_queries=n_queries)
+
     def get_retriever(self):
         """
         Get the retriever instance
-        
+
         Returns:
             Retriever instance
         """
@@ -34,17 +610,18 @@ class VectorStore:
             raise ValueError("Vector store not initialized. Call create_vectorstore first.")
         return self.retriever
 
-    def retrieve(self, query: str, k: int = 4) -> List[Document]:
+    def retrieve(self, query: str, k: int = 4, **search_kwargs) -> List[Document]:
         """
         Retrieve relevant documents for a query
-        
+
         Args:
             query: Search query
             k: Number of documents to retrieve
-            
+            search_kwargs: Per-call fetch_k, lambda_mult, score_threshold or per_source_cap
+
         Returns:
             List of relevant documents
         """
         if self.retriever is None:
             raise ValueError("Vector store not initialized. Call create_vectorstore first.")
-        return self.retriever.invoke(query)
\ No newline at end of file
+        return self.retriever.invoke(query, k=k, **search_kwargs)
@@ -0,0 +1,304 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextvars import copy_context
+import asyncio
+import threading
+import time
+
+from langchain_core.tools import Tool
+
+from aiops_rag_databricksapp.metrics import REGISTRY, MetricsRegistry
+
+from dataclasses import dataclass, field
+
+
+@dataclass
+class ToolPolicy:
+    """
+    Deadline, concurrency and result caching of one tool
+    ---
+
+    Args:
+        timeout: Seconds a caller waits for a result before getting `fallback`
+        ttl_seconds: Lifetime of a cached result; 0 disables caching
+        max_entries: Cached results kept, least recently used evicted first
+        max_concurrency: Calls of the tool running at once; further calls get `fallback` right away
+        fallback: Observation returned to the agent when the deadline passes or the tool is saturated
+    """
+    timeout:float = 10.0
+    ttl_seconds:float = 600.0
+    max_entries:int = 256
+    max_concurrency:int = 4
+    fallback:str = "The {name} tool did not answer in time. Continue with the information you already have."
+
+
+@dataclass
+class ToolStats:
+    """Call counts and recent latencies of one tool"""
+    calls:int = 0
+    hits:int = 0
+    timeouts:int = 0
+    rejected:int = 0
+    errors:int = 0
+    latencies:deque = field(default_factory=lambda: deque(maxlen=1024))
+
+    def summary(self)->Dict[str, float]:
+        ordered = sorted(self.latencies)
+        pick = lambda q: 1000 * ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+        return {
+            "calls": self.calls,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.calls if self.calls else 0.0,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "p50_ms": pick(0.50),
+            "p95_ms": pick(0.95),
+        }
+
+
+class _ResultCache:
+    """LRU map of normalised query to (expiry, result)"""
+
+    def __init__(self, policy:ToolPolicy):
+        self.policy = policy
+        self._items:"OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def get(self, key:str)->Optional[str]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return item[1]
+
+    def put(self, key:str, value:str):
+        if self.policy.ttl_seconds <= 0:
+            return
+        self._items[key] = (time.monotonic() + self.policy.ttl_seconds, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.policy.max_entries:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+
+@dataclass
+class ToolExecutor:
+    """
+    Execution layer for agent tools
+    ---
+
+    Each tool runs on its own thread pool of `max_concurrency` threads,
+    behind a per-tool result cache. Identical queries in flight at the
+    same time share one call, and a caller waits at most the tool's
+    `timeout` before receiving the fallback observation; a call that
+    finishes after its deadline still fills the cache for the next ask.
+    A call that would exceed the tool's `max_concurrency` gets the
+    fallback at once instead of queueing behind calls that may hang, so
+    a stuck backend holds at most its own tool's threads and never
+    delays the other tools. Independent tool calls of one agent turn
+    therefore run concurrently (LangGraph's tool node dispatches them in
+    parallel) and a slow tool cannot stall the answer.
+
+    Latencies and outcomes (hit, miss, timeout, rejected, error) are
+    exported to the metrics registry as `rag_tool_seconds` and
+    `rag_tool_calls_total`.
+
+    Args:
+        default_policy: Policy of tools registered without one
+        registry: Metrics registry the tool metrics are recorded in
+    """
+    default_policy:ToolPolicy = field(default_factory=ToolPolicy)
+    registry:MetricsRegistry = REGISTRY
+
+    def __post_init__(self):
+        # Re-entrant: a future that is already done runs its settle callback in the submitting thread
+        self._lock = threading.RLock()
+        self._funcs:Dict[str, Callable[[str], Any]] = {}
+        self._policies:Dict[str, ToolPolicy] = {}
+        self._caches:Dict[str, _ResultCache] = {}
+        self._stats:Dict[str, ToolStats] = {}
+        self._pools:Dict[str, ThreadPoolExecutor] = {}
+        self._running:Dict[str, int] = {}
+        self._inflight:Dict[Tuple[str, str], Future] = {}
+
+    def register(self, name:str, func:Callable[[str], Any], policy:Optional[ToolPolicy]=None):
+        """Register `func` under `name`; re-registering replaces it and clears its cache"""
+        policy = policy or self.default_policy
+        with self._lock:
+            previous = self._pools.get(name)
+            if previous is not None:
+                previous.shutdown(wait=False)
+            self._funcs[name] = func
+            self._policies[name] = policy
+            self._caches[name] = _ResultCache(policy)
+            self._pools[name] = ThreadPoolExecutor(max_workers=policy.max_concurrency, thread_name_prefix=f"tool-{name}")
+            self._running.setdefault(name, 0)
+            self._stats.setdefault(name, ToolStats())
+
+    def tool(self, name:str, description:str, func:Callable[[str], Any], policy:Optional[ToolPolicy]=None)->Tool:
+        """
+        Register `func` and wrap it as a LangChain tool
+
+        Args:
+            name: Tool name shown to the agent
+            description: Tool description shown to the agent
+            func: Function of the query string
+            policy: Deadline and caching policy; defaults to `default_policy`
+
+        Returns:
+            Tool whose sync and async entry points go through this executor
+        """
+        self.register(name, func, policy)
+
+        async def coroutine(query:str)->str:
+            return await self.arun(name, query)
+
+        return Tool(name=name, description=description, func=lambda query: self.run(name, query), coroutine=coroutine)
+
+    @staticmethod
+    def _cache_key(query:str)->str:
+        return " ".join(str(query).lower().split())
+
+    def _record(self, name:str, outcome:str, seconds:float):
+        with self._lock:
+            stats = self._stats[name]
+            stats.calls += 1
+            stats.hits += outcome == "hit"
+            stats.timeouts += outcome == "timeout"
+            stats.rejected += outcome == "rejected"
+            stats.errors += outcome == "error"
+            stats.latencies.append(seconds)
+        self.registry.observe("rag_tool_seconds", seconds, tool=name)
+        self.registry.inc("rag_tool_calls_total", tool=name, outcome=outcome)
+
+    def _settle(self, name:str, key:str, future:Future):
+        with self._lock:
+            self._inflight.pop((name, key), None)
+            self._running[name] -= 1
+            if not future.cancelled() and future.exception() is None:
+                self._caches[name].put(key, str(future.result()))
+
+    def _submit(self, name:str, query:str)->Tuple[Optional[str], Optional[Future]]:
+        """Cached result, or the (possibly shared) future computing it; neither when the tool is saturated"""
+        key = self._cache_key(query)
+        with self._lock:
+            if name not in self._funcs:
+                raise KeyError(f"Unknown tool: {name}")
+            cached = self._caches[name].get(key)
+            if cached is not None:
+                return cached, None
+            future = self._inflight.get((name, key))
+            if future is None:
+                if self._running[name] >= self._policies[name].max_concurrency:
+                    return None, None
+                self._running[name] += 1
+                future = self._pools[name].submit(copy_context().run, self._funcs[name], query)
+                self._inflight[(name, key)] = future
+                future.add_done_callback(lambda done: self._settle(name, key, done))
+        return None, future
+
+    def _fallback(self, name:str)->str:
+        return self._policies[name].fallback.format(name=name)
+
+    def run(self, name:str, query:str)->str:
+        """
+        Run tool `name` on `query` within its deadline
+
+        Returns:
+            The tool result, a cached result, or the fallback observation
+            (deadline passed or tool saturated)
+        """
+        start = time.perf_counter()
+        cached, future = self._submit(name, query)
+        if cached is not None:
+            self._record(name, "hit", time.perf_counter() - start)
+            return cached
+        if future is None:
+            self._record(name, "rejected", time.perf_counter() - start)
+            return self._fallback(name)
+        try:
+            result = str(future.result(timeout=self._policies[name].timeout))
+        except FutureTimeout:
+            self._record(name, "timeout", time.perf_counter() - start)
+            return self._fallback(name)
+        except Exception as e:
+            self._record(name, "error", time.perf_counter() - start)
+            return f"The {name} tool failed: {e}"
+        self._record(name, "miss", time.perf_counter() - start)
+        return result
+
+    async def arun(self, name:str, query:str)->str:
+        """Async variant of `run`; the event loop is never blocked by the tool"""
+        start = time.perf_counter()
+        cached, future = self._submit(name, query)
+        if cached is not None:
+            self._record(name, "hit", time.perf_counter() - start)
+            return cached
+        if future is None:
+            self._record(name, "rejected", time.perf_counter() - start)
+            return self._fallback(name)
+        try:
+            result = str(await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)), timeout=self._policies[name].timeout
+            ))
+        except asyncio.TimeoutError:
+            self._record(name, "timeout", time.perf_counter() - start)
+            return self._fallback(name)
+        except Exception as e:
+            self._record(name, "error", time.perf_counter() - start)
+            return f"The {name} tool failed: {e}"
+        self._record(name, "miss", time.perf_counter() - start)
+        return result
+
+    def stats(self)->Dict[str, Dict[str, float]]:
+        """Per-tool calls, cache hit rate, timeouts, rejections, errors and p50/p95 latency"""
+        with self._lock:
+            return {name: stats.summary() for name, stats in self._stats.items()}
+
+    def clear_cache(self):
+        """Drop every cached tool result, e.g. after the index changed"""
+        with self._lock:
+            for cache in self._caches.values():
+                cache.clear()
+
+
+class _TimeoutRequests:
+    """`requests` module stand-in whose `get` applies a default timeout"""
+
+    def __init__(self, requests_module, timeout:float):
+        self._requests = requests_module
+        self.timeout = timeout
+
+    def get(self, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self._requests.get(*args, **kwargs)
+
+    def __getattr__(self, name:str):
+        return getattr(self._requests, name)
+
+
+def set_wikipedia_timeout(seconds:float):
+    """
+    Give the `wikipedia` package's HTTP requests a timeout
+
+    The package calls `requests.get` without one, so a hung backend would
+    hold a tool thread forever; with the timeout the call fails and its
+    thread is freed.
+    """
+    import wikipedia.wikipedia as client
+
+    current = client.requests
+    if isinstance(current, _TimeoutRequests):
+        current.timeout = seconds
+    else:
+        client.requests = _TimeoutRequests(current, seconds)
+
+
+if __name__=="__main__":
+    __all__=["ToolExecutor","ToolPolicy","ToolStats","set_wikipedia_timeout"]
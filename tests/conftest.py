@@ -0,0 +1,11 @@
+import pytest
+
+from benchmarks.fixtures import FixtureServer
+
+
+@pytest.fixture
+def fixture_server():
+    """Local stand-in for web pages and the Wikipedia API"""
+    server = FixtureServer().start()
+    yield server
+    server.stop()
@@ -0,0 +1,111 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import faiss
+import numpy as np
+import pytest
+
+from aiops_rag_databricksapp import scheduler
+from aiops_rag_databricksapp.batching import QueryDispatcher
+from aiops_rag_databricksapp.metrics import MetricsRegistry, RequestTrace, active_trace
+from aiops_rag_databricksapp.scheduler import Priority, request_priority
+
+from benchmarks.fakes import HashingEmbeddings
+
+
+def make_store(latency:float=0.0, max_concurrent:int=0):
+    embedding = HashingEmbeddings(size=64, latency=latency, max_concurrent=max_concurrent)
+    index = faiss.IndexFlatIP(64)
+    texts = [f"runbook {i} disk pressure on node {i}" for i in range(32)]
+    index.add(np.asarray(HashingEmbeddings(size=64).embed_documents(texts), dtype=np.float32))
+    return SimpleNamespace(embedding=embedding, vectorstore=SimpleNamespace(index=index))
+
+
+def search_concurrently(dispatcher:QueryDispatcher, count:int):
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def call(i):
+        barrier.wait()
+        results[i] = dispatcher.search(f"disk pressure on node {i}", fetch_k=3)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def test_each_caller_gets_its_own_vector_and_positions():
+    store = make_store()
+    dispatcher = QueryDispatcher(store, max_batch_size=8, registry=MetricsRegistry())
+
+    results, _ = search_concurrently(dispatcher, 8)
+    for i, (vector, positions) in enumerate(results):
+        expected = np.asarray(store.embedding.embed_query(f"disk pressure on node {i}"), dtype=np.float32)
+        np.testing.assert_allclose(vector, expected)
+        assert positions.shape == (3,)
+        assert positions[0] == i
+    assert dispatcher.stats()["queries"] == 8
+
+
+def test_several_batches_are_embedded_at_once():
+    store = make_store(latency=0.1)
+    dispatcher = QueryDispatcher(store, max_batch_size=1, max_wait_ms=0, max_in_flight=4, registry=MetricsRegistry())
+
+    _, elapsed = search_concurrently(dispatcher, 4)
+    # One batch at a time would take four embedding round trips
+    assert elapsed < 0.3
+    assert dispatcher.stats()["batches"] == 4
+
+
+def test_embedding_errors_reach_every_caller_of_the_batch():
+    store = make_store()
+    store.embedding.embed_documents = lambda texts: (_ for _ in ()).throw(RuntimeError("provider down"))
+    dispatcher = QueryDispatcher(store, registry=MetricsRegistry())
+
+    with pytest.raises(RuntimeError, match="provider down"):
+        dispatcher.search("disk pressure", fetch_k=3)
+    # The dispatcher keeps serving after a failed batch
+    store.embedding = HashingEmbeddings(size=64)
+    _, positions = dispatcher.search("disk pressure on node 2", fetch_k=3)
+    assert positions[0] == 2
+
+
+def test_invalid_limits_are_rejected():
+    with pytest.raises(ValueError):
+        QueryDispatcher(make_store(), max_in_flight=0)
+
+
+def test_batches_run_in_their_callers_context():
+    store = make_store()
+    embed_documents = store.embedding.embed_documents
+    priorities = []
+
+    def embed(texts):
+        # The scheduler of the embeddings client reads the priority from the running context
+        priorities.append(scheduler._scope.get()[0])
+        return embed_documents(texts)
+
+    store.embedding.embed_documents = embed
+    dispatcher = QueryDispatcher(store, max_batch_size=4, max_wait_ms=50, max_in_flight=1, registry=MetricsRegistry())
+    traces = [RequestTrace(f"disk pressure on node {i}") for i in range(4)]
+    barrier = threading.Barrier(4)
+
+    def call(i):
+        with request_priority(Priority.BACKGROUND), active_trace(traces[i]):
+            barrier.wait()
+            dispatcher.search(traces[i].question, fetch_k=3)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert priorities and set(priorities) == {Priority.BACKGROUND}
+    for trace in traces:
+        names = [span.name for span in trace.spans]
+        assert "batch_embed" in names and "batch_search" in names
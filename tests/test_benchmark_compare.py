@@ -0,0 +1,21 @@
+from benchmarks.compare import compare
+
+
+def report(**graph):
+    return {"meta": {}, "results": {"graph": [{"chunks": 100, **graph}]}}
+
+
+def test_flags_latency_regressions_beyond_threshold():
+    lines = compare(report(run={"p50_ms": 100.0}), report(run={"p50_ms": 130.0}), threshold=0.1)
+    assert len(lines) == 1
+    assert "run.p50_ms" in lines[0] and "regression" in lines[0]
+
+
+def test_higher_throughput_is_not_a_regression():
+    lines = compare(report(queries_per_sec=100.0), report(queries_per_sec=150.0))
+    assert len(lines) == 1 and "regression" not in lines[0]
+
+
+def test_rows_are_matched_by_corpus_size():
+    old = {"meta": {}, "results": {"graph": [{"chunks": 50, "compile_seconds": 1.0}]}}
+    assert compare(old, report(compile_seconds=2.0)) == []
@@ -0,0 +1,98 @@
+from typing import List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from aiops_rag_databricksapp.chunks import InMemoryChunkStore, chunk_refs, chunk_store_for
+from aiops_rag_databricksapp.rag_graph import RAGGraphBuilder
+from aiops_rag_databricksapp.rag_node import RAGNodes
+from aiops_rag_databricksapp.rag_state import RAGState
+from aiops_rag_databricksapp.semantic_cache import SemanticCache
+from aiops_rag_databricksapp.store import VectorStore
+
+from benchmarks.fakes import FakeChatModel, HashingEmbeddings
+
+QUESTION = "how do I restart kafka broker 3"
+
+
+class ListRetriever(BaseRetriever):
+    """Retriever over a fixed list, returning documents without ids, as most LangChain retrievers may"""
+    texts:List[str]
+
+    def _get_relevant_documents(self, query:str, *, run_manager:CallbackManagerForRetrieverRun)->List[Document]:
+        words = set(query.split())
+        return [Document(page_content=text, metadata={"score": 0.5}) for text in self.texts if words & set(text.split())]
+
+
+def make_store()->VectorStore:
+    store = VectorStore()
+    store.embedding = HashingEmbeddings(size=64)
+    store.create_vectorstore([
+        Document(page_content=f"kafka broker {i} restart procedure " * 20, metadata={"source": f"runbook-{i}"}) for i in range(10)
+    ])
+    return store
+
+
+def llm()->FakeChatModel:
+    return FakeChatModel(time_to_first_token=0, tokens_per_second=1e6, answer_tokens=8)
+
+
+def test_state_carries_ids_and_scores_that_resolve_from_the_store():
+    store = make_store()
+    nodes = RAGNodes(retriever=store.get_retriever(), llm=llm())
+    assert nodes.chunks is store
+
+    update = nodes.retrieve_docs(RAGState(question=QUESTION))
+    state = RAGState(question=QUESTION, **update)
+    docs = state.documents(store)
+    assert [doc.id for doc in docs] == state.chunk_ids
+    assert len(state.scores) == len(state.chunk_ids) and all(0 < score <= 1 for score in state.scores)
+    # The state holds references, not chunk text
+    serialized = state.model_dump_json()
+    assert "restart procedure" not in serialized
+    assert len(serialized) < sum(len(doc.page_content) for doc in docs)
+    assert all(doc.page_content in nodes.build_prompt(state) for doc in docs)
+
+
+def test_chunks_deleted_from_the_store_are_skipped():
+    store = make_store()
+    nodes = RAGNodes(retriever=store.get_retriever(), llm=llm())
+    state = RAGState(question=QUESTION, **nodes.retrieve_docs(RAGState(question=QUESTION)))
+
+    store.delete_documents(state.chunk_ids[:1])
+    assert [doc.id for doc in state.documents(store)] == state.chunk_ids[1:]
+
+
+def test_retrievers_without_a_store_register_their_documents_in_memory():
+    retriever = ListRetriever(texts=["restart kafka broker", "rotate postgres logs", "restart redis"])
+    chunks = chunk_store_for(retriever)
+    assert isinstance(chunks, InMemoryChunkStore)
+
+    nodes = RAGNodes(retriever=retriever, llm=llm(), chunks=chunks)
+    state = RAGState(question="restart", **nodes.retrieve_docs(RAGState(question="restart")))
+    assert len(state.chunk_ids) == 2 and state.scores == [0.5, 0.5]
+    assert [doc.page_content for doc in state.documents(chunks)] == ["restart kafka broker", "restart redis"]
+    # Ids are content hashes, so the same text always gets the same id
+    assert chunk_refs([Document(page_content="restart redis")], chunks)["chunk_ids"] == state.chunk_ids[1:]
+
+
+def test_in_memory_chunk_store_evicts_least_recently_used():
+    chunks = InMemoryChunkStore(max_entries=2)
+    ids = chunks.put([Document(id=name, page_content=name) for name in ("a", "b")])
+    chunks.put([Document(id="a", page_content="a"), Document(id="c", page_content="c")])
+    assert [doc is not None for doc in chunks.get_chunks(ids + ["c"])] == [True, False, True]
+
+
+def test_graph_and_cache_results_resolve_chunks_from_ids():
+    store = make_store()
+    graph = RAGGraphBuilder(retriever=store.get_retriever(), llm=llm(), cache=SemanticCache(embeddings=store.embedding))
+
+    result = graph.run(QUESTION)
+    assert result["chunk_ids"] and [doc.id for doc in result["retrieved_docs"]] == result["chunk_ids"]
+    assert graph.cache.lookup(QUESTION).chunk_ids == result["chunk_ids"]
+
+    store.delete_documents(result["chunk_ids"][:1])
+    cached = graph.run(QUESTION)
+    assert cached["cached"] and cached["chunk_ids"] == result["chunk_ids"]
+    assert [doc.id for doc in cached["retrieved_docs"]] == result["chunk_ids"][1:]
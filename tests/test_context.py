@@ -0,0 +1,62 @@
+from langchain_core.documents import Document
+
+from aiops_rag_databricksapp.context import ContextPacker
+
+TEXT = (
+    "Check the broker logs for disk pressure before restarting. Drain the partition leaders to other brokers. "
+    "Restart the broker and wait until it rejoins the ISR. Confirm consumer lag recovers within ten minutes. "
+    "Escalate to the platform team if under-replicated partitions remain after the restart."
+)
+
+
+def chunk(start:int, end:int, source:str="kafka.md", offsets:bool=True)->Document:
+    metadata = {"source": source}
+    if offsets:
+        metadata["start_index"] = start
+    return Document(page_content=TEXT[start:end], metadata=metadata)
+
+
+def test_overlapping_and_adjacent_chunks_are_merged_back():
+    packer = ContextPacker(model="gpt-4o-mini")
+    packed = packer.pack([chunk(100, 200), chunk(0, 120), chunk(200, 260), chunk(0, 80, source="redis.md")])
+
+    assert [doc.metadata["source"] for doc in packed] == ["kafka.md", "redis.md"]
+    assert packed[0].page_content == TEXT[0:260]
+    assert (packed[0].metadata["start_index"], packed[0].metadata["end_index"]) == (0, 260)
+
+
+def test_chunks_without_offsets_are_merged_by_their_text():
+    packer = ContextPacker(model="gpt-4o-mini")
+    packed = packer.pack([chunk(90, 200, offsets=False), chunk(0, 120, offsets=False), chunk(20, 60, offsets=False)])
+    assert [doc.page_content for doc in packed] == [TEXT[0:200]]
+
+
+def test_near_duplicate_passages_are_dropped():
+    packer = ContextPacker(model="gpt-4o-mini", duplicate_threshold=0.8)
+    copy = Document(page_content=TEXT[:-1] + "!", metadata={"source": "mirror.md"})
+    packed = packer.pack([chunk(0, len(TEXT)), copy, chunk(0, 80, source="redis.md")])
+    assert [doc.metadata["source"] for doc in packed] == ["kafka.md", "redis.md"]
+
+
+def test_passages_are_packed_in_rank_order_within_the_budget():
+    packer = ContextPacker(model="gpt-4o-mini")
+    docs = [
+        Document(page_content=" ".join(f"check {service} node {i}." for i in range(20)), metadata={"source": f"{service}.md"})
+        for service in ("kafka", "redis", "spark")
+    ]
+    packer.token_budget = packer.count_tokens(docs[0].page_content) + 70
+    packed = packer.pack(docs)
+
+    assert sum(packer.count_tokens(doc.page_content) for doc in packed) <= packer.token_budget
+    assert packed[0].page_content == docs[0].page_content
+    # The remainder is filled with the start of the next passage
+    assert len(packed) == 2 and docs[1].page_content.startswith(packed[1].page_content)
+
+
+def test_a_remainder_too_small_for_a_passage_is_left_empty():
+    packer = ContextPacker(model="gpt-4o-mini")
+    first = packer.count_tokens(TEXT)
+    packer.token_budget = first + 10
+    other = Document(page_content=" ".join(f"check redis node {i}." for i in range(20)), metadata={"source": "redis.md"})
+    packed = packer.pack([chunk(0, len(TEXT)), other])
+    assert [doc.page_content for doc in packed] == [TEXT]
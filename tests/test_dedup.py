@@ -0,0 +1,21 @@
+from langchain_core.documents import Document
+
+from aiops_rag_databricksapp.dedup import NearDuplicateFilter
+
+TEXT = "restart the kafka broker after the disk usage alert clears and check the consumer lag on every partition"
+
+
+def test_duplicates_are_dropped_and_their_sources_recorded():
+    dedup = NearDuplicateFilter(threshold=0.8)
+    chunks = [
+        Document(page_content=TEXT, metadata={"source": "a.md"}),
+        Document(page_content=TEXT, metadata={"source": "b.md"}),
+        Document(page_content=TEXT + " again", metadata={"source": "c.md"}),
+        Document(page_content="rotate the postgres credentials stored in the vault", metadata={"source": "a.md"}),
+    ]
+
+    kept = list(dedup.filter(chunks))
+    assert [doc.metadata["source"] for doc in kept] == ["a.md", "a.md"]
+    assert all(doc.id for doc in kept)
+    assert dedup.merged[kept[0].id] == ["b.md", "c.md"]
+    assert (dedup.stats.exact, dedup.stats.near) == (1, 1)
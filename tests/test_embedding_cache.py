@@ -0,0 +1,76 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from aiops_rag_databricksapp import embedding_cache
+from aiops_rag_databricksapp.embedding_cache import CachedEmbeddings
+
+from benchmarks.fakes import HashingEmbeddings
+
+DIM = 64
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    """Strictly increasing timestamps, so recency never ties"""
+    ticks = itertools.count(1_000_000)
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: float(next(ticks)))
+
+
+def make_cache(path, **kwargs)->CachedEmbeddings:
+    return CachedEmbeddings(underlying=HashingEmbeddings(size=DIM), model="hashing", path=path, **kwargs)
+
+
+def texts(start:int, count:int):
+    return [f"restart worker {i} after the disk alert" for i in range(start, start + count)]
+
+
+def test_only_unseen_texts_reach_the_underlying_client(tmp_path):
+    cache = make_cache(tmp_path / "cache.sqlite")
+    first = cache.embed_documents(texts(0, 4))
+    again = cache.embed_documents(texts(2, 4))
+
+    np.testing.assert_allclose(again[:2], first[2:], atol=1e-6)
+    assert cache.underlying.calls == 2
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 6, 6)
+    assert cache.embed_query(texts(0, 1)[0]) == pytest.approx(first[0], abs=1e-6)
+    assert cache.underlying.calls == 2
+
+
+@pytest.mark.parametrize("dtype, width", [("float32", 4), ("float16", 2)])
+def test_stored_bytes_are_accounted_per_vector(tmp_path, dtype, width):
+    path = tmp_path / "cache.sqlite"
+    cache = make_cache(path, dtype=dtype)
+    cache.embed_documents(texts(0, 5))
+    assert cache.stats()["bytes"] == 5 * DIM * width
+
+    # Storing a text again replaces its row instead of counting it twice
+    cache._store({CachedEmbeddings.text_hash(texts(0, 1)[0]): [0.0] * DIM})
+    assert cache.stats()["bytes"] == 5 * DIM * width
+    cache.close()
+    assert make_cache(path, dtype=dtype).stats()["bytes"] == 5 * DIM * width
+
+
+def test_least_recently_used_vectors_are_evicted(tmp_path):
+    cache = make_cache(tmp_path / "cache.sqlite", max_bytes=10 * DIM * 4)
+    cache.embed_documents(texts(0, 10))
+    cache.embed_documents(texts(0, 2))  # used again, so they outlive texts 2..9
+    cache.embed_documents(texts(10, 1))
+
+    stats = cache.stats()
+    assert stats["bytes"] <= int(cache.max_bytes * 0.9)
+    assert stats["evictions"] == 10 + 1 - stats["entries"]
+    calls = cache.underlying.calls
+    cache.embed_documents(texts(0, 2) + texts(10, 1))
+    assert cache.underlying.calls == calls
+    # Texts 2..9 were stored together, so which of them went first is arbitrary
+    misses = cache.stats()["misses"]
+    cache.embed_documents(texts(2, 8))
+    assert cache.stats()["misses"] - misses == stats["evictions"]
+
+
+def test_unsupported_dtype_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="float32 or float16"):
+        make_cache(tmp_path / "cache.sqlite", dtype="int8")
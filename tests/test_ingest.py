@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+from aiops_rag_databricksapp.ingest import DocumentProcessor
+
+from benchmarks.fixtures import FixtureServer
+
+
+@pytest.fixture
+def slow_server():
+    """Fixture pages that each take 0.2s to serve"""
+    server = FixtureServer(latency=0.2).start()
+    yield server
+    server.stop()
+
+
+def make_pdf(text:str)->bytes:
+    """Minimal one-page PDF showing `text`"""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+@pytest.fixture
+def pdf_dir(tmp_path):
+    """Three readable runbook PDFs and one that is not a PDF at all"""
+    directory = tmp_path / "pdfs"
+    directory.mkdir()
+    for i in range(3):
+        (directory / f"runbook-{i}.pdf").write_bytes(make_pdf(f"restart kafka broker {i}"))
+    (directory / "runbook-1b.pdf").write_bytes(b"<html>not a pdf</html>")
+    return directory
+
+
+def processor(**kwargs)->DocumentProcessor:
+    options = dict(chunk_size=300, chunk_overlap=30, data_dir=None, max_workers=8, per_host_limit=8)
+    options.update(kwargs)
+    return DocumentProcessor(**options)
+
+
+def test_sources_are_loaded_once_concurrently_and_in_order(slow_server, tmp_path, monkeypatch):
+    notes = tmp_path / "notes.txt"
+    notes.write_text("drain the node before rebooting it", encoding="utf-8")
+    urls = slow_server.page_urls(4)
+    loader = processor()
+    load_from_url = loader.load_from_url
+
+    def reversed_latency(url):
+        # Later sources finish first
+        time.sleep(0.1 * (len(urls) - urls.index(url)))
+        return load_from_url(url)
+
+    monkeypatch.setattr(loader, "load_from_url", reversed_latency)
+    sources = [urls[0], str(notes), urls[1], urls[0], str(tmp_path / "." / "notes.txt"), urls[2], urls[3]]
+    start = time.perf_counter()
+    docs = loader.load_documents(sources)
+    elapsed = time.perf_counter() - start
+
+    expected = [urls[0], str(notes), urls[1], urls[2], urls[3]]
+    assert [doc.metadata["source"] for doc in docs] == expected
+    assert [timing.source for timing in loader.last_timings] == expected
+    assert slow_server.page_requests == 4
+    # One at a time would take 4 * 0.2s of serving plus 1.0s of added latency
+    assert elapsed < 1.0
+
+
+def test_requests_to_one_host_are_limited(slow_server):
+    loader = processor(per_host_limit=2)
+    start = time.perf_counter()
+    loader.load_documents(slow_server.page_urls(4))
+    assert time.perf_counter() - start >= 0.4
+
+
+def test_unsupported_sources_fail_before_anything_is_loaded(slow_server):
+    loader = processor()
+    with pytest.raises(ValueError, match="Unsupported source type"):
+        loader.load_documents(slow_server.page_urls(2) + ["runbook.docx"])
+    assert slow_server.page_requests == 0
+
+
+@pytest.mark.parametrize("pdf_workers", [0, 2])
+def test_unreadable_pdfs_are_skipped_and_recorded(pdf_dir, pdf_workers):
+    loader = processor(pdf_workers=pdf_workers)
+    docs = list(loader.iter_pdf_dir(pdf_dir))
+
+    assert [doc.metadata["source"] for doc in docs] == [str(pdf_dir / f"runbook-{i}.pdf") for i in range(3)]
+    assert [doc.page_content.strip() for doc in docs] == [f"restart kafka broker {i}" for i in range(3)]
+    assert list(loader.pdf_errors) == [str(pdf_dir / "runbook-1b.pdf")]
+
+
+def test_a_single_unreadable_pdf_loads_as_nothing(pdf_dir):
+    loader = processor()
+    assert loader.load_from_pdf(pdf_dir / "runbook-1b.pdf") == []
+    assert str(pdf_dir / "runbook-1b.pdf") in loader.pdf_errors
+    assert loader.load_documents([str(pdf_dir)])[0].metadata["source"] == str(pdf_dir / "runbook-0.pdf")
@@ -0,0 +1,120 @@
+import threading
+
+import pytest
+
+from aiops_rag_databricksapp.lexical import BM25Index, tokenize
+from aiops_rag_databricksapp.retrieval import reciprocal_rank_fusion
+
+SERVICES = ["kafka", "postgres", "redis", "nginx", "spark", "airflow"]
+
+
+def docs(start:int, count:int):
+    ids = [f"doc-{i}" for i in range(start, start + count)]
+    texts = [f"{SERVICES[i % len(SERVICES)]} incident {i} disk full on db-{i:02d}.prod.internal" for i in range(start, start + count)]
+    return ids, texts
+
+
+def run_concurrently(count:int, target):
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def call(i):
+        barrier.wait()
+        try:
+            target(i)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def assert_consistent(index:BM25Index):
+    assert len(index._doc_len) == len(index.ids) == len(index._deleted)
+    assert index._offsets[-1] == len(index._postings) == len(index._tfs)
+
+
+def test_concurrent_first_searches_leave_the_index_consistent():
+    for _ in range(20):
+        index = BM25Index()
+        index.add(*docs(0, 300))
+        results = [None] * 8
+        run_concurrently(8, lambda i: results.__setitem__(i, index.search("kafka disk full", k=5)))
+        assert_consistent(index)
+        assert all(result == results[0] for result in results)
+
+
+def test_searches_run_while_documents_are_added_and_removed():
+    index = BM25Index()
+    index.add(*docs(0, 100))
+
+    def work(i):
+        for round in range(20):
+            if i == 0:
+                index.add(*docs(100 + round * 10, 10))
+            elif i == 1:
+                index.remove([f"doc-{round}"])
+            else:
+                for doc_id, _ in index.search("postgres incident disk", k=10):
+                    assert doc_id.startswith("doc-")
+
+    run_concurrently(6, work)
+    assert_consistent(index)
+    assert int((~index._deleted).sum()) == 280
+    assert {doc_id for doc_id, _ in index.search("kafka", k=500)}.isdisjoint(f"doc-{i}" for i in range(20))
+
+
+def test_replacing_documents_does_not_grow_the_index(tmp_path):
+    index = BM25Index()
+    index.add(*docs(0, 50))
+    expected = sorted(index.search("redis incident 7", k=5))
+    for round in range(10):
+        # Replace ten documents with new versions, as a refresh does
+        start = round % 5 * 10
+        index.remove([f"doc-{i}" for i in range(start, start + 10)])
+        index.add(*docs(start, 10))
+    assert len(index) < 60
+    assert sorted(index.search("redis incident 7", k=5)) == expected
+
+    index.save(tmp_path / "lexical.npz")
+    assert len(index) == 50 and not index._deleted.any()
+    assert_consistent(index)
+    loaded = BM25Index.load(tmp_path / "lexical.npz")
+    assert sorted(loaded.search("redis incident 7", k=5)) == expected
+
+
+def test_compound_tokens_are_indexed_whole_and_by_their_parts():
+    assert tokenize("ORA-00942 on db-01.prod.internal") == [
+        "ora-00942", "ora", "00942", "on", "db-01.prod.internal", "db", "01", "prod", "internal",
+    ]
+    index = BM25Index()
+    index.add(*docs(0, 12))
+    assert index.search("db-07.prod.internal", k=1)[0][0] == "doc-7"
+    assert {doc_id for doc_id, _ in index.search("kafka", k=10)} == {"doc-0", "doc-6"}
+
+
+def test_saved_index_answers_like_the_original(tmp_path):
+    index = BM25Index(k1=1.2, b=0.5)
+    index.add(*docs(0, 30))
+    index.remove(["doc-3"])
+    index.save(tmp_path / "lexical.npz")
+
+    loaded = BM25Index.load(tmp_path / "lexical.npz")
+    assert (loaded.k1, loaded.b) == (1.2, 0.5)
+    assert len(loaded) == 29 and "doc-3" not in loaded.ids
+    for query in ("redis incident", "db-12.prod.internal", "disk full"):
+        assert loaded.search(query, k=5) == pytest.approx(index.search(query, k=5))
+    # A loaded index keeps taking documents
+    loaded.add(*docs(30, 2))
+    assert loaded.search("db-31.prod.internal", k=1)[0][0] == "doc-31"
+
+
+def test_reciprocal_rank_fusion_favours_ids_ranked_by_both_lists():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "b", "d"]], k=60)
+    assert [doc_id for doc_id, _ in fused] == ["c", "b", "a", "d"]
+    assert dict(fused)["b"] == pytest.approx(2 / 62)
+    assert dict(fused)["a"] == pytest.approx(1 / 61)
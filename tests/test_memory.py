@@ -0,0 +1,96 @@
+import pytest
+from langchain_core.documents import Document
+
+from aiops_rag_databricksapp.memory import ConversationMemory, SessionCheckpointer, render_turns
+from aiops_rag_databricksapp.rag_graph import RAGGraphBuilder
+from aiops_rag_databricksapp.rag_state import RAGState
+from aiops_rag_databricksapp.store import VectorStore
+
+from benchmarks.fakes import FakeChatModel, HashingEmbeddings
+
+
+def fake_llm(answer_tokens:int=30)->FakeChatModel:
+    return FakeChatModel(time_to_first_token=0, tokens_per_second=1e6, answer_tokens=answer_tokens)
+
+
+@pytest.fixture
+def store():
+    store = VectorStore()
+    store.embedding = HashingEmbeddings(size=64)
+    store.create_vectorstore([
+        Document(page_content=f"kafka broker {i} restart procedure", metadata={"source": f"runbook-{i}"}) for i in range(10)
+    ])
+    return store
+
+
+def chat(store, max_sessions:int)->RAGGraphBuilder:
+    llm = fake_llm()
+    return RAGGraphBuilder(
+        retriever=store.get_retriever(),
+        llm=llm,
+        memory=ConversationMemory(llm=llm),
+        checkpointer=SessionCheckpointer(max_sessions=max_sessions),
+    )
+
+
+def thread_keys(checkpointer:SessionCheckpointer, thread_id:str):
+    """Checkpoints, pending writes and channel blobs the saver holds for a thread"""
+    checkpoints = [cid for ns in checkpointer.storage.get(thread_id, {}).values() for cid in ns]
+    writes = [key for key in checkpointer.writes if key[0] == thread_id]
+    blobs = [key for key in checkpointer.blobs if key[0] == thread_id]
+    return checkpoints, writes, blobs
+
+
+def test_a_thread_keeps_one_checkpoint_however_many_turns_it_has(store):
+    graph = chat(store, max_sessions=10)
+    for turn in range(4):
+        graph.run(f"how do I restart kafka broker {turn}", thread_id="ops")
+
+    checkpoints, writes, blobs = thread_keys(graph.checkpointer, "ops")
+    assert len(checkpoints) == 1
+    assert all(key[2] == checkpoints[0] for key in writes)
+    # Only the channel values of the latest checkpoint are kept
+    live = graph.checkpointer.get_tuple({"configurable": {"thread_id": "ops"}}).checkpoint["channel_versions"]
+    assert {(channel, version) for _, _, channel, version in blobs} <= set(live.items())
+    assert len(graph.chat_graph.get_state({"configurable": {"thread_id": "ops"}}).values["turns"]) == 4
+
+
+def test_least_recently_used_threads_are_evicted(store):
+    graph = chat(store, max_sessions=2)
+    graph.run("how do I restart kafka broker 1", thread_id="a")
+    graph.run("how do I restart kafka broker 2", thread_id="b")
+    graph.run("and what about broker 3 then", thread_id="a")
+    graph.run("how do I restart kafka broker 4", thread_id="c")
+
+    assert thread_keys(graph.checkpointer, "b") == ([], [], [])
+    assert all(thread_keys(graph.checkpointer, thread)[0] for thread in ("a", "c"))
+    # An evicted conversation starts over
+    assert not graph.chat_graph.get_state({"configurable": {"thread_id": "b"}}).values
+
+
+def test_history_and_summary_stay_within_their_budgets():
+    memory = ConversationMemory(llm=fake_llm(answer_tokens=200), history_token_budget=120, summary_token_budget=40)
+    state = RAGState(question="")
+    for turn in range(12):
+        update = memory.remember(RAGState(
+            question=f"why is kafka broker {turn} lagging behind the others",
+            answer=f"broker {turn} is lagging because its disk is nearly full " * 2,
+            turns=state.turns,
+            summary=state.summary,
+        ))
+        state = RAGState(question="", **update)
+        assert memory.count_tokens(render_turns(state.turns)) <= memory.history_token_budget
+        assert memory.count_tokens(state.summary) <= memory.summary_token_budget
+    assert state.summary and state.turns
+
+
+def test_failed_summary_update_falls_back_to_the_questions_asked():
+    class Down(FakeChatModel):
+        def _generate(self, *args, **kwargs):
+            raise ConnectionError("provider down")
+
+    memory = ConversationMemory(llm=Down(), summary_token_budget=20)
+    summary = memory.summarize("", [(f"why is broker {i} down", "disk full") for i in range(10)])
+    assert summary.startswith("User asked:")
+    assert "broker 9" in summary
+    assert memory.count_tokens(summary) <= 20
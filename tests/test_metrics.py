@@ -0,0 +1,105 @@
+import re
+
+import httpx
+import pytest
+
+from aiops_rag_databricksapp.metrics import MetricsRegistry, RequestTrace, active_trace, finish_trace, serve_metrics, span
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})? (\S+)$')
+
+
+def parse(text:str):
+    """Metric types and samples of a text exposition, checking every line is well formed"""
+    assert text.endswith("\n")
+    types, samples = {}, {}
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            assert name not in types, f"{name} declared twice"
+            types[name] = kind
+            continue
+        match = _SAMPLE.match(line)
+        assert match, f"malformed line {line!r}"
+        name, labels, value = match.groups()
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', labels or ""))
+        samples[(name, tuple(sorted(labels.items())))] = float(value)
+    return types, samples
+
+
+def test_histograms_are_cumulative_with_sum_and_count():
+    registry = MetricsRegistry()
+    for seconds in (0.003, 0.02, 0.02, 0.7, 90.0):
+        registry.observe("rag_stage_seconds", seconds, stage="retriever")
+    registry.observe("rag_stage_seconds", 0.2, stage="generate")
+
+    types, samples = parse(registry.to_prometheus())
+    assert types == {"rag_stage_seconds": "histogram"}
+
+    def bucket(le, stage="retriever"):
+        return samples[("rag_stage_seconds_bucket", (("le", le), ("stage", stage)))]
+
+    assert [bucket("0.005"), bucket("0.025"), bucket("0.5"), bucket("1.0"), bucket("60.0"), bucket("+Inf")] == [1, 3, 3, 4, 4, 5]
+    assert samples[("rag_stage_seconds_sum", (("stage", "retriever"),))] == pytest.approx(90.743)
+    assert samples[("rag_stage_seconds_count", (("stage", "retriever"),))] == 5
+    assert bucket("0.1", "generate") == 0 and bucket("0.25", "generate") == 1
+
+
+def test_counters_and_collector_gauges_are_exported():
+    registry = MetricsRegistry()
+    registry.inc("rag_requests_total", cached="false")
+    registry.inc("rag_requests_total", 2, cached="true")
+    registry.inc("rag_route_total", route="retrieve", reason='matched "kafka"')
+    registry.register_collector("semantic_cache", lambda: {"entries": 12, "hit_rate": 0.25, "enabled": True, "model": "x"})
+    registry.register_collector("idle", lambda: None)
+
+    types, samples = parse(registry.to_prometheus())
+    assert types == {
+        "rag_requests_total": "counter",
+        "rag_route_total": "counter",
+        "rag_semantic_cache_entries": "gauge",
+        "rag_semantic_cache_hit_rate": "gauge",
+    }
+    assert samples[("rag_requests_total", (("cached", "false"),))] == 1
+    assert samples[("rag_requests_total", (("cached", "true"),))] == 2
+    # Quotes in label values would end the value early
+    assert samples[("rag_route_total", (("reason", "matched 'kafka'"), ("route", "retrieve")))] == 1
+    assert samples[("rag_semantic_cache_hit_rate", ())] == 0.25
+
+
+def test_finished_requests_and_their_stages_are_recorded():
+    registry = MetricsRegistry()
+    trace = RequestTrace(question="why is kafka lagging")
+    with active_trace(trace):
+        with span("retriever", registry=registry, docs=4):
+            pass
+    trace.add_tokens(prompt=120, completion=30)
+    trace.retrieved_docs = 4
+    trace.route = "retrieve"
+    finish_trace(trace, registry=registry)
+    finish_trace(trace, registry=registry)
+
+    assert [(item.name, item.attributes) for item in trace.spans] == [("retriever", {"docs": 4})]
+    types, samples = parse(registry.to_prometheus())
+    assert types["rag_request_seconds"] == "histogram" and types["rag_llm_tokens_total"] == "counter"
+    assert samples[("rag_requests_total", (("cached", "false"),))] == 1
+    assert samples[("rag_stage_seconds_count", (("stage", "retriever"),))] == 1
+    assert samples[("rag_retrieved_docs_total", ())] == 4
+    assert samples[("rag_llm_tokens_total", (("kind", "completion"),))] == 30
+    assert samples[("rag_route_total", (("reason", ""), ("route", "retrieve")))] == 1
+    assert [row["stage"] for row in registry.stage_summary()] == ["retriever"]
+
+
+def test_metrics_are_served_over_http():
+    registry = MetricsRegistry()
+    registry.inc("rag_requests_total", cached="false")
+    server = serve_metrics(0, registry=registry, host="127.0.0.1")
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        response = httpx.get(f"{base}/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert response.text == registry.to_prometheus()
+        assert httpx.get(f"{base}/other").status_code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from aiops_rag_databricksapp.ingest import DocumentProcessor
+from aiops_rag_databricksapp.pipeline import IngestPipeline
+from aiops_rag_databricksapp.store import VectorStore
+
+from benchmarks.fakes import HashingEmbeddings
+from benchmarks.fixtures import page_text
+
+FILES = 20
+
+
+@pytest.fixture
+def sources(tmp_path):
+    paths = []
+    for i in range(FILES):
+        path = tmp_path / f"runbook-{i}.txt"
+        path.write_text(page_text(i)["body"], encoding="utf-8")
+        paths.append(str(path))
+    return paths
+
+
+def pipeline(embedding:HashingEmbeddings, **kwargs)->IngestPipeline:
+    store = VectorStore()
+    store.embedding = embedding
+    processor = DocumentProcessor(chunk_size=200, chunk_overlap=20, data_dir=None, max_workers=4)
+    return IngestPipeline(processor=processor, store=store, embed_batch_size=8, queue_size=2, **kwargs)
+
+
+def producer_threads():
+    return [thread for thread in threading.enumerate() if "_produce" in thread.name]
+
+
+def test_every_chunk_is_indexed_with_bounded_read_ahead(sources):
+    ingest = pipeline(HashingEmbeddings(size=64, latency=0.01))
+    produced = []
+    iter_chunks = ingest.processor.iter_chunks
+
+    def counted(documents):
+        for chunk in iter_chunks(documents):
+            produced.append(chunk)
+            yield chunk
+
+    ingest.processor.iter_chunks = counted
+    ahead = []
+    add_documents = ingest.store.add_documents
+
+    def add(batch):
+        ahead.append(len(produced) - len(ingest.store.vectorstore.index_to_docstore_id if ingest.store.vectorstore else []))
+        return add_documents(batch)
+
+    ingest.store.add_documents = add
+    stats = ingest.run(sources)
+
+    assert stats.documents == FILES
+    assert stats.chunks == len(produced) == ingest.store.vectorstore.index.ntotal
+    assert stats.batches == -(-stats.chunks // 8)
+    # The queue, the batch being embedded and the one being filled
+    assert max(ahead) <= (ingest.queue_size + 2) * ingest.embed_batch_size
+
+
+def test_an_embedding_failure_stops_the_producer(sources):
+    embedding = HashingEmbeddings(size=64)
+    embed_documents = embedding.embed_documents
+
+    def failing(texts):
+        if embedding.calls == 2:
+            raise RuntimeError("provider down")
+        return embed_documents(texts)
+
+    embedding.embed_documents = failing
+    ingest = pipeline(embedding)
+    with pytest.raises(RuntimeError, match="provider down"):
+        ingest.run(sources)
+    assert not producer_threads()
+
+
+def test_a_loading_failure_reaches_the_caller(sources):
+    ingest = pipeline(HashingEmbeddings(size=64))
+    with pytest.raises(ValueError, match="Unsupported source type"):
+        ingest.run(sources + ["runbook.docx"])
+    assert not producer_threads()
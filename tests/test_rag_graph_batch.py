@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+
+from aiops_rag_databricksapp import rag_graph
+from aiops_rag_databricksapp.embedding_cache import CachedEmbeddings
+from aiops_rag_databricksapp.rag_graph import RAGGraphBuilder
+from aiops_rag_databricksapp.semantic_cache import SemanticCache
+from aiops_rag_databricksapp.store import VectorStore
+
+from benchmarks.fakes import FakeChatModel, HashingEmbeddings
+
+QUESTIONS = [f"how do I restart kafka broker {i}" for i in range(4)]
+
+
+@pytest.fixture
+def store():
+    store = VectorStore()
+    store.embedding = HashingEmbeddings(size=64)
+    store.create_vectorstore([
+        Document(page_content=f"kafka broker {i} restart procedure", metadata={"source": f"runbook-{i}"}) for i in range(10)
+    ])
+    return store
+
+
+@pytest.fixture
+def traces(monkeypatch):
+    finished = []
+    monkeypatch.setattr(rag_graph, "finish_trace", lambda trace: (finished.append(trace), setattr(trace, "total", trace.elapsed())))
+    return finished
+
+
+def builder(store, cache=None)->RAGGraphBuilder:
+    llm = FakeChatModel(time_to_first_token=0, tokens_per_second=1e6, answer_tokens=8)
+    return RAGGraphBuilder(retriever=store.get_retriever(), llm=llm, cache=cache)
+
+
+def test_questions_are_embedded_once_for_cache_and_retrieval(store, traces):
+    cache = SemanticCache(embeddings=store.embedding)
+    graph = builder(store, cache)
+    store.embedding.calls = 0
+
+    results = graph.run_batch(QUESTIONS)
+    assert [result["question"] for result in results] == QUESTIONS
+    assert all(result["answer"] and result["retrieved_docs"] for result in results)
+    assert store.embedding.calls == 1
+    assert cache.stats()["entries"] == len(QUESTIONS)
+    assert [trace.question for trace in traces] == QUESTIONS
+    assert all({"embed_queries", "cache_lookup", "node:retriever", "cache_store"} <= {span.name for span in trace.spans} for trace in traces)
+
+    again = graph.run_batch(QUESTIONS[:2] + ["where are the kafka logs"])
+    assert [result.get("cached", False) for result in again] == [True, True, False]
+    assert store.embedding.calls == 2
+    assert [trace.cache_hit for trace in traces[len(QUESTIONS):]] == [True, True, False]
+
+
+def test_async_batch_matches_the_sync_one(store, traces):
+    graph = builder(store)
+    expected = graph.run_batch(QUESTIONS)
+    store.embedding.calls = 0
+
+    results = asyncio.run(graph.arun_batch(QUESTIONS))
+    assert [result["chunk_ids"] for result in results] == [result["chunk_ids"] for result in expected]
+    assert store.embedding.calls == 1
+    assert len(traces) == 2 * len(QUESTIONS)
+
+
+def test_batch_question_vectors_are_not_written_to_the_embedding_cache(store, traces, tmp_path):
+    cached = CachedEmbeddings(underlying=store.embedding, model="hashing", path=tmp_path / "embeddings.sqlite")
+    store.embedding = cached
+
+    builder(store).run_batch(QUESTIONS)
+    assert cached.stats()["entries"] == 0
@@ -0,0 +1,44 @@
+import pytest
+from langchain_core.documents import Document
+
+from aiops_rag_databricksapp.rag_graph import RAGGraphBuilder
+from aiops_rag_databricksapp.rag_react_node import ReActRAGNodes
+from aiops_rag_databricksapp.router import FALLBACK_ROUTE, QueryRouter
+from aiops_rag_databricksapp.store import VectorStore
+
+from benchmarks.fakes import FakeChatModel, HashingEmbeddings
+
+
+@pytest.fixture
+def store():
+    store = VectorStore()
+    store.embedding = HashingEmbeddings(size=64)
+    store.create_vectorstore([
+        Document(page_content=f"kafka broker {i} restart procedure", metadata={"source": f"runbook-{i}"}) for i in range(10)
+    ])
+    return store
+
+
+def stream(store, max_steps, tool_calls):
+    llm = FakeChatModel(time_to_first_token=0, tokens_per_second=1e6, answer_tokens=8, tool_calls=tool_calls)
+    builder = RAGGraphBuilder(
+        retriever=store.get_retriever(),
+        llm=llm,
+        # Every question escalates to the agent
+        router=QueryRouter(min_top_score=2.0),
+        agent=ReActRAGNodes(retriever=store.get_retriever(), llm=llm, max_steps=max_steps),
+    )
+    events = list(builder.stream("how do I restart a kafka broker"))
+    return "".join(e["content"] for e in events if e["type"] == "token"), events[-1]
+
+
+def test_streamed_agent_answer_equals_the_final_answer(store):
+    text, done = stream(store, max_steps=6, tool_calls=1)
+    assert done["route"] == "agent"
+    assert text.strip() == done["answer"].strip()
+
+
+def test_fallback_stream_contains_only_the_classic_rag_answer(store):
+    text, done = stream(store, max_steps=1, tool_calls=3)
+    assert done["route"] == FALLBACK_ROUTE
+    assert text.strip() == done["answer"].strip()
@@ -0,0 +1,163 @@
+import pytest
+
+from aiops_rag_databricksapp import refresh
+from aiops_rag_databricksapp.dedup import NearDuplicateFilter
+from aiops_rag_databricksapp.ingest import DocumentProcessor
+from aiops_rag_databricksapp.refresh import IncrementalRefresher, RefreshReport
+from aiops_rag_databricksapp.store import VectorStore
+
+from benchmarks.fakes import HashingEmbeddings
+from benchmarks.fixtures import FixtureServer
+
+PAGES = 6
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    return tmp_path / "index"
+
+
+def refresher(index_dir, dedup:bool=False)->IncrementalRefresher:
+    """A refresher over the persisted index, reloaded as the scheduled job would"""
+    store = VectorStore()
+    store.embedding = HashingEmbeddings(size=64)
+    if store.index_exists(index_dir):
+        store.load_vectorstore(index_dir)
+    processor = DocumentProcessor(chunk_size=300, chunk_overlap=30, data_dir=None, max_workers=4)
+    return IncrementalRefresher(
+        processor=processor, store=store, index_dir=index_dir,
+        dedup=NearDuplicateFilter(threshold=0.8) if dedup else None,
+    )
+
+
+def sources_of(store:VectorStore):
+    return {doc.metadata["source"] for _, doc in store.iter_chunks()}
+
+
+def test_unchanged_sources_are_answered_with_304_and_nothing_is_embedded(fixture_server, index_dir):
+    urls = fixture_server.page_urls(PAGES)
+    initial = refresher(index_dir).run(urls)
+    assert initial.chunks_added > 0 and initial.corpus_changed
+
+    again = refresher(index_dir)
+    report = again.run(urls)
+    assert report.not_modified == PAGES
+    assert (report.chunks_added, report.chunks_removed) == (0, 0)
+    assert report.corpus_version == initial.corpus_version
+    assert again.store.embedding.calls == 0
+
+
+def test_revised_source_embeds_only_its_new_chunks(fixture_server, index_dir):
+    urls = fixture_server.page_urls(PAGES)
+    initial = refresher(index_dir).run(urls)
+
+    fixture_server.revise([2])
+    updated = refresher(index_dir)
+    report = updated.run(urls)
+    assert report.changed == [urls[2]]
+    assert report.not_modified == PAGES - 1
+    assert 0 < report.chunks_added < initial.chunks_added
+    assert report.corpus_version != initial.corpus_version
+    texts = [doc.page_content for _, doc in updated.store.iter_chunks() if doc.metadata["source"] == urls[2]]
+    assert any("Revision 1" in text for text in texts)
+    assert updated.store.vectorstore.index.ntotal == initial.chunks_added + report.chunks_added - report.chunks_removed
+
+
+def test_dropped_source_loses_its_chunks(fixture_server, index_dir):
+    urls = fixture_server.page_urls(PAGES)
+    refresher(index_dir).run(urls)
+
+    trimmed = refresher(index_dir)
+    report = trimmed.run(urls[:-1])
+    assert report.removed == [urls[-1]]
+    assert report.chunks_removed > 0
+    assert sources_of(trimmed.store) == set(urls[:-1])
+    # The removal was persisted with the index
+    assert refresher(index_dir).store.vectorstore.index.ntotal == trimmed.store.vectorstore.index.ntotal
+
+
+def test_failed_source_keeps_its_chunks_until_it_loads_again(fixture_server, index_dir, monkeypatch):
+    urls = fixture_server.page_urls(PAGES)
+    refresher(index_dir).run(urls)
+
+    load_if_modified = DocumentProcessor.load_if_modified
+
+    def flaky(self, src, validators=None):
+        if src == urls[0]:
+            raise ConnectionError("connection refused")
+        return load_if_modified(self, src, validators)
+
+    monkeypatch.setattr(DocumentProcessor, "load_if_modified", flaky)
+    failing = refresher(index_dir)
+    report = failing.run(urls)
+    assert list(report.failed) == [urls[0]]
+    assert "connection refused" in report.failed[urls[0]]
+    assert report.chunks_removed == 0
+    assert urls[0] in sources_of(failing.store)
+
+    monkeypatch.setattr(DocumentProcessor, "load_if_modified", load_if_modified)
+    report = refresher(index_dir).run(urls)
+    assert not report.failed
+    assert report.not_modified == PAGES
+
+
+@pytest.mark.parametrize("failed, status", [({}, 0), ({"https://example.com/down": "ConnectError: refused"}, 1)])
+def test_main_exits_with_a_status_instead_of_the_report(monkeypatch, capsys, failed, status):
+    calls = []
+    monkeypatch.setattr(refresh, "refresh_index", lambda index_dir, urls_file: calls.append((index_dir, urls_file)) or RefreshReport(failed=failed))
+
+    assert refresh.main(["--index-dir", "idx", "--urls-file", "urls.txt"]) == status
+    assert calls == [("idx", "urls.txt")]
+    assert "Refreshed" in capsys.readouterr().out
+
+
+def test_refreshes_do_not_leave_removed_chunks_in_the_lexical_index(fixture_server, index_dir):
+    urls = fixture_server.page_urls(PAGES)
+    refresher(index_dir).run(urls)
+
+    for page in range(3):
+        fixture_server.revise([page])
+        current = refresher(index_dir)
+        report = current.run(urls)
+        assert report.chunks_removed > 0
+        store = current.store
+        assert len(store.lexical) == store.vectorstore.index.ntotal
+        assert not store.lexical._deleted.any()
+    reloaded = refresher(index_dir).store
+    assert len(reloaded.lexical) == reloaded.vectorstore.index.ntotal
+
+
+def test_refreshed_chunks_are_deduplicated_against_the_index(index_dir):
+    server = FixtureServer(boilerplate=3).start()
+    try:
+        urls = server.page_urls(PAGES)
+        initial = refresher(index_dir, dedup=True).run(urls)
+        assert initial.duplicates > 0
+        shared = {doc_id: doc.metadata["sources"] for doc_id, doc in refresher(index_dir).store.iter_chunks() if "sources" in doc.metadata}
+        assert shared
+
+        repeated = 0
+        for page in range(3):
+            server.revise([page])
+            current = refresher(index_dir, dedup=True)
+            report = current.run(urls)
+            assert report.changed == [urls[page]]
+            repeated += report.duplicates
+        # The boilerplate after each revision was found in the index, not embedded again
+        assert repeated > 0
+    finally:
+        server.stop()
+
+    store = refresher(index_dir).store
+    chunks = list(store.iter_chunks())
+    # No chunk in the index repeats another one
+    assert len(list(NearDuplicateFilter(threshold=0.8).filter([doc.model_copy() for _, doc in chunks]))) == len(chunks)
+    # Chunks that absorbed duplicates at the first build still list every source
+    stored = dict(chunks)
+    for doc_id, sources in shared.items():
+        if doc_id in stored:
+            assert set(sources) <= set(stored[doc_id].metadata["sources"])
+    # Every source still has all of its chunks
+    state = refresher(index_dir).load_state()
+    assert set(state) == set(urls)
+    assert all(doc_id in stored for entry in state.values() for _, doc_id in entry.chunks)
@@ -0,0 +1,81 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from langchain_core.documents import Document
+
+from aiops_rag_databricksapp.rerank import mmr_select, normalize_rows
+from aiops_rag_databricksapp.store import VectorStore
+
+from benchmarks.fakes import HashingEmbeddings
+
+SOURCES = ["kafka.md", "postgres.md", "redis.md"]
+
+
+def make_store(retrieval_mode:str="dense")->VectorStore:
+    """Ten near-identical chunks per runbook, so relevance alone would take them all from one source"""
+    store = VectorStore(retrieval_mode=retrieval_mode)
+    store.embedding = HashingEmbeddings(size=128)
+    store.create_vectorstore([
+        Document(
+            id=f"{source}-{i}",
+            page_content=f"restart the {source.split('.')[0]} broker after a disk full alert, step {i}",
+            metadata={"source": source},
+        )
+        for source in SOURCES for i in range(10)
+    ])
+    return store
+
+
+def test_mmr_with_full_relevance_weight_ranks_by_relevance():
+    vectors = normalize_rows(np.random.default_rng(0).normal(size=(6, 8)))
+    relevance = np.array([0.1, 0.9, 0.5, 0.7, 0.3, 0.2])
+    assert mmr_select(relevance, vectors, k=4, lambda_mult=1.0) == [1, 3, 2, 4]
+
+
+def test_mmr_skips_candidates_that_repeat_a_pick():
+    vectors = normalize_rows(np.array([[1.0, 0.0], [1.0, 0.0], [0.6, 0.8]]))
+    relevance = np.array([1.0, 0.99, 0.6])
+    assert mmr_select(relevance, vectors, k=2, lambda_mult=0.5) == [0, 2]
+
+
+def test_mmr_takes_at_most_the_cap_from_each_group():
+    vectors = normalize_rows(np.random.default_rng(1).normal(size=(9, 8)))
+    relevance = np.linspace(1.0, 0.1, 9)
+    groups = ["a"] * 5 + ["b"] * 3 + ["c"]
+    picks = mmr_select(relevance, vectors, k=6, lambda_mult=1.0, groups=groups, per_group_cap=2)
+    assert picks == [0, 1, 5, 6, 8]
+    assert max(Counter(groups[i] for i in picks).values()) == 2
+
+
+@pytest.mark.parametrize("retrieval_mode", ["dense", "hybrid"])
+def test_retriever_caps_chunks_per_source(retrieval_mode):
+    retriever = make_store(retrieval_mode).get_retriever()
+    query = "restart the kafka broker after a disk full alert"
+
+    uncapped = retriever.invoke(query, k=6, lambda_mult=1.0)
+    assert Counter(doc.metadata["source"] for doc in uncapped)["kafka.md"] > 2
+
+    capped = retriever.invoke(query, k=6, lambda_mult=1.0, per_source_cap=2, fetch_k=30)
+    counts = Counter(doc.metadata["source"] for doc in capped)
+    assert len(capped) == 6
+    assert set(counts) == set(SOURCES) and max(counts.values()) == 2
+
+
+def test_dense_hits_below_the_threshold_are_dropped():
+    retriever = make_store().get_retriever()
+    query = "restart the redis broker after a disk full alert"
+
+    docs = retriever.invoke(query, k=20, fetch_k=30, score_threshold=0.85)
+    assert all(doc.metadata["score"] >= 0.85 for doc in docs)
+    assert sorted(doc.id for doc in docs) == sorted(f"redis.md-{i}" for i in range(10))
+    assert retriever.invoke("quarterly revenue forecast spreadsheet", k=4, score_threshold=0.85) == []
+
+
+def test_lexical_hits_survive_the_threshold():
+    retriever = make_store("hybrid").get_retriever()
+    # Only BM25 ties the step number to a chunk; its cosine similarity stays below the threshold
+    docs = retriever.invoke("7", k=4, score_threshold=0.9)
+    assert all(doc.metadata["score"] < 0.9 for doc in docs)
+    assert sorted(doc.id for doc in docs) == [f"{source}-7" for source in SOURCES]
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from aiops_rag_databricksapp.metrics import MetricsRegistry
+from aiops_rag_databricksapp.scheduler import (
+    AdmissionRejected,
+    AsyncScheduledTransport,
+    Priority,
+    RequestScheduler,
+    ScheduledTransport,
+    request_priority,
+)
+
+from benchmarks.fixtures import MockOpenAIServer
+
+
+def make_scheduler(**kwargs)->RequestScheduler:
+    options = dict(requests_per_minute=600, tokens_per_minute=0, burst_seconds=0.1, backoff_base=0.01, registry=MetricsRegistry())
+    options.update(kwargs)
+    return RequestScheduler(**options)
+
+
+@pytest.fixture
+def openai_server():
+    """Local OpenAI endpoint allowing one request per 0.2s"""
+    server = MockOpenAIServer(requests_per_minute=300, burst_seconds=0.2, latency=0.0).start()
+    yield server
+    server.stop()
+
+
+def test_requests_are_admitted_at_the_configured_rate():
+    scheduler = make_scheduler()  # one request per 0.1s, no burst beyond one
+
+    start = time.monotonic()
+    for _ in range(3):
+        scheduler.acquire()
+    assert time.monotonic() - start >= 0.18
+    assert scheduler.stats()["admitted"] == 3
+
+
+def test_interactive_requests_overtake_queued_background_ones():
+    scheduler = make_scheduler()
+    scheduler.acquire()
+    order = []
+
+    def request(priority:Priority):
+        with request_priority(priority):
+            scheduler.acquire()
+        order.append(priority)
+
+    background = threading.Thread(target=request, args=(Priority.BACKGROUND,))
+    background.start()
+    time.sleep(0.03)
+    interactive = threading.Thread(target=request, args=(Priority.INTERACTIVE,))
+    interactive.start()
+    background.join()
+    interactive.join()
+    assert order == [Priority.INTERACTIVE, Priority.BACKGROUND]
+
+
+def test_requests_that_cannot_be_admitted_in_time_are_rejected_at_once():
+    scheduler = make_scheduler(requests_per_minute=6, interactive_max_wait=1.0)
+    scheduler.acquire()
+
+    start = time.monotonic()
+    with pytest.raises(AdmissionRejected):
+        scheduler.acquire()
+    assert time.monotonic() - start < 0.5
+
+    client = httpx.Client(transport=ScheduledTransport(scheduler, transport=httpx.MockTransport(lambda request: httpx.Response(200))))
+    response = client.post("https://api.example.com/v1/embeddings", json={"input": ["disk"]})
+    assert response.status_code == 429
+    assert response.headers["x-scheduler-rejected"] == scheduler.name
+    assert scheduler.stats()["rejected"] == 2
+
+
+def test_full_queue_rejects_new_requests():
+    scheduler = make_scheduler(requests_per_minute=120, max_queue=1, interactive_max_wait=None)
+    scheduler.acquire()
+    waiting = threading.Thread(target=scheduler.acquire)
+    waiting.start()
+    time.sleep(0.05)
+    with pytest.raises(AdmissionRejected, match="already waiting"):
+        scheduler.acquire()
+    waiting.join()
+
+
+def test_provider_429s_pause_and_retry_until_served(openai_server):
+    # No local limit, so every request past the provider's burst is throttled
+    scheduler = make_scheduler(requests_per_minute=0, max_retries=10)
+    client = httpx.Client(transport=ScheduledTransport(scheduler))
+
+    statuses = [
+        client.post(f"{openai_server.base_url}/embeddings", json={"model": "embed", "input": ["disk full"]}).status_code
+        for _ in range(4)
+    ]
+    assert statuses == [200] * 4
+    assert openai_server.throttled > 0
+    stats = scheduler.stats()
+    assert stats["rate_limited"] == openai_server.throttled
+    assert stats["retries"] == openai_server.throttled
+
+
+def test_connect_errors_and_timeouts_are_retried_with_backoff():
+    scheduler = make_scheduler()
+    calls = []
+
+    def flaky(request:httpx.Request)->httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("connection refused", request=request)
+        if len(calls) == 2:
+            raise httpx.ReadTimeout("timed out", request=request)
+        return httpx.Response(200, json={"ok": True})
+
+    client = httpx.Client(transport=ScheduledTransport(scheduler, transport=httpx.MockTransport(flaky)))
+    response = client.post("https://api.example.com/v1/embeddings", json={"input": ["disk"]})
+    assert response.status_code == 200
+    assert len(calls) == 3
+    assert calls[-1].content == calls[0].content
+    assert scheduler.stats()["retries"] == 2
+    assert scheduler.stats()["admitted"] == 3
+
+
+def test_transport_errors_are_raised_once_retries_are_exhausted():
+    scheduler = make_scheduler(max_retries=2)
+    calls = []
+
+    def down(request:httpx.Request)->httpx.Response:
+        calls.append(request)
+        raise httpx.ConnectError("connection refused", request=request)
+
+    client = httpx.Client(transport=ScheduledTransport(scheduler, transport=httpx.MockTransport(down)))
+    with pytest.raises(httpx.ConnectError):
+        client.post("https://api.example.com/v1/embeddings", json={"input": ["disk"]})
+    assert len(calls) == 3
+
+
+def test_async_transport_retries_transport_errors():
+    scheduler = make_scheduler()
+    calls = []
+
+    async def flaky(request:httpx.Request)->httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectTimeout("timed out", request=request)
+        return httpx.Response(200)
+
+    async def post():
+        async with httpx.AsyncClient(transport=AsyncScheduledTransport(scheduler, transport=httpx.MockTransport(flaky))) as client:
+            return await client.post("https://api.example.com/v1/embeddings", json={"input": ["disk"]})
+
+    assert asyncio.run(post()).status_code == 200
+    assert len(calls) == 2
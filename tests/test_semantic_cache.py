@@ -0,0 +1,93 @@
+import threading
+import time
+
+from aiops_rag_databricksapp.semantic_cache import SemanticCache
+
+from benchmarks.fakes import HashingEmbeddings
+
+QUESTION = "how do I restart a kafka broker after a disk alert"
+
+
+def make_cache(**kwargs)->SemanticCache:
+    return SemanticCache(embeddings=HashingEmbeddings(size=64), threshold=0.9, corpus_version="v1", **kwargs)
+
+
+def test_a_stored_answer_is_returned_for_the_same_question():
+    cache = make_cache()
+    assert cache.lookup(QUESTION) is None
+    cache.store(QUESTION, "restart it", ["chunk-1"], [0.8], latency=2.0)
+
+    entry = cache.lookup(QUESTION)
+    assert entry.answer == "restart it" and entry.chunk_ids == ["chunk-1"]
+    assert cache.lookup("rotate the postgres credentials in the vault") is None
+    stats = cache.stats()
+    assert (stats["lookups"], stats["hits"], stats["entries"]) == (3, 1, 1)
+    assert stats["latency_saved"] > 0
+
+
+def test_answering_a_miss_does_not_embed_the_question_again():
+    cache = make_cache()
+    cache.lookup(QUESTION)
+    calls = cache.embeddings.calls
+    cache.store(QUESTION, "restart it", [], [], latency=1.0)
+    assert cache.embeddings.calls == calls
+
+
+def test_expired_entries_are_dropped(monkeypatch):
+    cache = make_cache(ttl_seconds=60)
+    cache.store(QUESTION, "restart it", [], [], latency=1.0)
+    now = time.time()
+    monkeypatch.setattr("aiops_rag_databricksapp.semantic_cache.time.time", lambda: now + 61)
+
+    assert cache.lookup(QUESTION) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_a_new_corpus_version_invalidates_every_entry():
+    cache = make_cache()
+    cache.store(QUESTION, "restart it", [], [], latency=1.0)
+    cache.set_corpus_version("v1")
+    assert cache.lookup(QUESTION) is not None
+
+    cache.set_corpus_version("v2")
+    assert cache.stats()["entries"] == 0
+    assert cache.lookup(QUESTION) is None
+    cache.store(QUESTION, "drain it first", [], [], latency=1.0)
+    assert cache.lookup(QUESTION).corpus_version == "v2"
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = make_cache(max_entries=2)
+    questions = [QUESTION, "rotate the postgres credentials stored in the vault", "why is the spark driver out of memory"]
+    cache.store(questions[0], "answer 0", [], [], latency=1.0)
+    cache.store(questions[1], "answer 1", [], [], latency=1.0)
+    assert cache.lookup(questions[0]).answer == "answer 0"
+    cache.store(questions[2], "answer 2", [], [], latency=1.0)
+
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup(questions[1]) is None
+    assert [cache.lookup(questions[i]).answer for i in (0, 2)] == ["answer 0", "answer 2"]
+
+
+def test_stats_are_consistent_under_concurrent_lookups():
+    cache = make_cache()
+    cache.store(QUESTION, "restart it", [], [], latency=1.0)
+    done = threading.Event()
+    seen = []
+
+    def read():
+        while not done.is_set():
+            stats = cache.stats()
+            seen.append(stats["hits"] <= stats["lookups"])
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    lookups = [threading.Thread(target=lambda: [cache.lookup(QUESTION) for _ in range(50)]) for _ in range(4)]
+    for thread in lookups:
+        thread.start()
+    for thread in lookups:
+        thread.join()
+    done.set()
+    reader.join()
+    assert all(seen)
+    assert cache.stats()["hits"] == cache.stats()["lookups"] == 200
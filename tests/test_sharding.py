@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+from langchain_core.documents import Document
+
+from aiops_rag_databricksapp.sharding import ShardedVectorStore, default_shard_key
+from aiops_rag_databricksapp.store import VectorStore
+
+from benchmarks.fakes import HashingEmbeddings
+
+HOSTS = ["kafka.apache.org", "www.postgresql.org", "redis.io"]
+QUERIES = ["restart the broker after a disk alert", "replication lag on the primary", "evicted keys under memory pressure"]
+
+
+def chunks():
+    topics = ["broker disk alert restart", "replication lag primary", "memory pressure evicted keys", "tls certificate rotation"]
+    return [
+        Document(
+            id=f"{host}-{i}",
+            page_content=f"{host.split('.')[-2]} runbook {i}: {topics[i % len(topics)]} step {i}",
+            metadata={"source": f"https://{host}/docs/{i}"},
+        )
+        for host in HOSTS for i in range(12)
+    ]
+
+
+def template()->VectorStore:
+    store = VectorStore(retrieval_mode="dense", retrieval_mmr_lambda=1.0)
+    store.embedding = HashingEmbeddings(size=64)
+    return store
+
+
+@pytest.fixture
+def sharded():
+    store = ShardedVectorStore(template=template())
+    store.create_vectorstore(chunks())
+    return store
+
+
+@pytest.mark.parametrize("metadata, shard", [
+    ({"source": "https://kafka.apache.org/docs/ops"}, "kafka.apache.org"),
+    ({"source": "data/runbooks/kafka.md"}, "runbooks"),
+    ({"source": "kafka.md"}, "local"),
+    ({"source": "https://kafka.apache.org/docs", "shard": "streaming"}, "streaming"),
+])
+def test_default_shard_key(metadata, shard):
+    assert default_shard_key(Document(page_content="", metadata=metadata)) == shard
+
+
+def test_fan_out_matches_a_single_index_and_tags_each_shard(sharded):
+    single = template()
+    single.create_vectorstore(chunks())
+    assert sorted(sharded.shards) == sorted(HOSTS)
+
+    for query in QUERIES:
+        merged = sharded.retrieve(query, k=5)
+        expected = single.retrieve(query, k=5)
+        scores = [doc.metadata["score"] for doc in merged]
+        assert scores == sorted(scores, reverse=True)
+        # Chunks with equal scores may come in either order
+        assert scores == pytest.approx([doc.metadata["score"] for doc in expected])
+        assert {doc.id for doc in merged} == {doc.id for doc in expected}
+        assert all(doc.metadata["shard"] == default_shard_key(doc) for doc in merged)
+
+
+def test_query_is_embedded_once_for_all_shards(sharded):
+    sharded.embedding.calls = 0
+    sharded.retrieve(QUERIES[0], k=4)
+    assert sharded.embedding.calls == 1
+
+
+def test_search_can_be_restricted_to_some_shards(sharded):
+    docs = sharded.retrieve(QUERIES[0], k=6, shards=["redis.io"])
+    assert len(docs) == 6 and {doc.metadata["shard"] for doc in docs} == {"redis.io"}
+    assert sharded.retrieve(QUERIES[0], shards=["unknown"]) == []
+
+
+def test_chunks_are_found_and_deleted_in_their_shard(sharded, tmp_path):
+    sharded.save_vectorstore(tmp_path)
+    ids = ["redis.io-3", "kafka.apache.org-0", "missing"]
+    assert [doc.id if doc else None for doc in sharded.get_chunks(ids)] == ids[:2] + [None]
+
+    assert sharded.delete_documents(ids) == 2
+    assert sharded.changed == {"redis.io", "kafka.apache.org"}
+    assert sharded.get_chunks(ids) == [None] * 3
+    assert sharded.shards["www.postgresql.org"].vectorstore.index.ntotal == 12
+
+
+def test_shards_are_saved_and_loaded_independently(sharded, tmp_path):
+    manifest = sharded.save_vectorstore(tmp_path)
+    assert sorted(manifest["shards"]) == sorted(HOSTS) and manifest["num_vectors"] == 36
+
+    sharded.build_shard("redis.io", [doc for doc in chunks() if doc.id.startswith("redis.io")][:5])
+    updated = sharded.save_shard(tmp_path, "redis.io")
+    assert updated["num_vectors"] == 29
+    assert updated["shards"]["kafka.apache.org"] == manifest["shards"]["kafka.apache.org"]
+    assert updated["shards"]["redis.io"]["corpus_version"] != manifest["shards"]["redis.io"]["corpus_version"]
+    assert json.loads((tmp_path / "shards.json").read_text()) == updated
+
+    loaded = ShardedVectorStore(template=template())
+    loaded.load_vectorstore(tmp_path, shards=["redis.io", "kafka.apache.org"])
+    assert sorted(loaded.shards) == ["kafka.apache.org", "redis.io"]
+    assert {doc.metadata["shard"] for doc in loaded.retrieve(QUERIES[2], k=10)} <= {"kafka.apache.org", "redis.io"}
+    with pytest.raises(ValueError, match="Unknown shards"):
+        ShardedVectorStore(template=template()).load_vectorstore(tmp_path, shards=["nginx.org"])
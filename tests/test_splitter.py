@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from aiops_rag_databricksapp.splitter import OffsetTextSplitter
+
+WORDS = ["kafka", "broker", "restart", "disk", "full", "replication", "lag", "on", "the", "a", "to", "postgres", "vacuum"]
+
+
+def make_text(seed:int)->str:
+    """Paragraphs of lines of words, with stray whitespace and the odd unbreakable token"""
+    rng = random.Random(seed)
+    paragraphs = []
+    for _ in range(rng.randint(1, 8)):
+        lines = []
+        for _ in range(rng.randint(1, 6)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(0, 30))]
+            if rng.random() < 0.2:
+                words.append("x" * rng.randint(20, 400))
+            lines.append(" ".join(words) + " " * rng.randint(0, 2))
+        paragraphs.append("\n".join(lines))
+    return " " * rng.randint(0, 3) + "\n\n".join(paragraphs) + "\n" * rng.randint(0, 3)
+
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(40, 0), (100, 20), (300, 30), (1000, 200)])
+def test_chunks_match_the_recursive_character_splitter(chunk_size, chunk_overlap):
+    offsets = OffsetTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    recursive = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    for seed in range(200):
+        text = make_text(seed)
+        assert offsets.split_text(text) == recursive.split_text(text), f"seed {seed}"
+
+
+def test_custom_separators_match_the_recursive_character_splitter():
+    separators = ["\n\n", ". ", ""]
+    offsets = OffsetTextSplitter(chunk_size=60, chunk_overlap=10, separators=separators)
+    recursive = RecursiveCharacterTextSplitter(chunk_size=60, chunk_overlap=10, separators=separators)
+    for seed in range(50):
+        text = make_text(seed).replace(" the ", ". ")
+        assert offsets.split_text(text) == recursive.split_text(text), f"seed {seed}"
+
+
+def test_chunks_are_slices_of_their_source():
+    source = Document(page_content=make_text(7), metadata={"source": "runbook.md"})
+    chunks = OffsetTextSplitter(chunk_size=120, chunk_overlap=20).split_documents([source])
+    assert len(chunks) > 1
+    for chunk in chunks:
+        start, end = chunk.metadata["start_index"], chunk.metadata["end_index"]
+        assert chunk.page_content == source.page_content[start:end]
+        assert chunk.metadata["source"] == "runbook.md"
+    assert [chunk.metadata["start_index"] for chunk in chunks] == sorted(chunk.metadata["start_index"] for chunk in chunks)
+
+
+def test_token_sized_chunks_stay_within_the_budget():
+    splitter = OffsetTextSplitter(chunk_size=50, chunk_overlap=10, length_unit="tokens")
+    length = splitter._length_function(make_text(3))
+    spans = splitter.split_spans(make_text(3))
+    assert len(spans) > 1
+    # Only a single unbreakable piece may exceed the budget
+    assert all(length(start, end) <= 50 or end - start == 1 for start, end in spans)
+
+
+@pytest.mark.parametrize("options", [
+    {"chunk_size": 10, "chunk_overlap": 20},
+    {"chunk_size": 100, "chunk_overlap": 10, "length_unit": "words"},
+])
+def test_invalid_settings_are_rejected(options):
+    with pytest.raises(ValueError):
+        OffsetTextSplitter(**options)
@@ -0,0 +1,220 @@
+import threading
+
+import faiss
+import numpy as np
+import pytest
+
+from langchain_core.documents import Document
+
+from aiops_rag_databricksapp.ann import ANNConfig
+from aiops_rag_databricksapp.store import VectorStore
+
+from benchmarks.fakes import HashingEmbeddings
+
+SERVICES = ["kafka", "postgres", "redis", "nginx", "spark", "airflow"]
+
+
+def chunk(i:int)->Document:
+    service = SERVICES[i % len(SERVICES)]
+    return Document(
+        id=f"chunk-{i}",
+        page_content=f"{service} runbook step {i}: restart {service} worker {i} after disk alert {i * 7}",
+        metadata={"source": f"{service}.md"},
+    )
+
+
+def make_store(index_type:str="flat", count:int=60)->VectorStore:
+    store = VectorStore(ann=ANNConfig(index_type=index_type, nlist=4, nprobe=4, train_size=count), retrieval_mode="dense")
+    store.embedding = HashingEmbeddings(size=64)
+    store.create_vectorstore([chunk(i) for i in range(count)])
+    return store
+
+
+def assert_consistent(store:VectorStore):
+    """Position i of the index holds the vector of the chunk the id map names for i"""
+    vectorstore = store.vectorstore
+    index = vectorstore.index
+    assert index.ntotal == len(vectorstore.index_to_docstore_id)
+    for pos, doc_id in vectorstore.index_to_docstore_id.items():
+        expected = store.embedding.embed_query(vectorstore.docstore.search(doc_id).page_content)
+        np.testing.assert_allclose(index.reconstruct(pos), expected, atol=1e-5)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw"])
+def test_deleted_chunks_leave_index_id_map_and_docstore(index_type):
+    store = make_store(index_type)
+    removed = [f"chunk-{i}" for i in range(0, 60, 3)]
+
+    assert store.delete_documents(removed + ["chunk-unknown"]) == 20
+    assert store.vectorstore.index.ntotal == 40
+    assert_consistent(store)
+    assert store.get_chunks(removed) == [None] * 20
+    top = store.retrieve(chunk(4).page_content, k=1)
+    assert top[0].id == "chunk-4"
+
+    # Positions stay contiguous, so later additions line up with the id map
+    store.add_documents([chunk(0), chunk(60)])
+    assert_consistent(store)
+
+
+def test_delete_leaves_a_pinned_store_intact():
+    store = make_store()
+    with store.snapshot() as (pinned, positions):
+        store.delete_documents(["chunk-1", "chunk-2"])
+        assert store.vectorstore is not pinned
+        assert pinned.index.ntotal == 60
+        assert pinned.index_to_docstore_id[positions["chunk-1"]] == "chunk-1"
+        assert isinstance(pinned.docstore.search("chunk-1"), Document)
+        assert store.vectorstore.index.ntotal == 58
+    # The last query on the old store has finished, so its removed chunks are dropped
+    assert store.get_chunks(["chunk-1", "chunk-2"]) == [None, None]
+    assert not isinstance(pinned.docstore.search("chunk-1"), Document)
+    assert_consistent(store)
+
+
+def test_delete_without_pinned_queries_edits_the_index_in_place():
+    store = make_store()
+    vectorstore, index = store.vectorstore, store.vectorstore.index
+
+    store.delete_documents(["chunk-5"])
+    assert store.vectorstore is vectorstore and store.vectorstore.index is index
+    assert "chunk-5" not in store.docstore_positions()
+    assert_consistent(store)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat"])
+def test_delete_from_a_memory_mapped_index(tmp_path, index_type):
+    make_store(index_type).save_vectorstore(tmp_path)
+    store = VectorStore(ann=ANNConfig(index_type=index_type, nlist=4, nprobe=4), retrieval_mode="dense")
+    store.embedding = HashingEmbeddings(size=64)
+    store.load_vectorstore(tmp_path, mmap=True)
+
+    assert store.delete_documents(["chunk-3", "chunk-30"]) == 2
+    assert store.vectorstore.index.ntotal == 58
+    assert_consistent(store)
+
+
+def test_add_leaves_a_pinned_store_intact():
+    store = make_store()
+    with store.snapshot() as (pinned, positions):
+        index = pinned.index
+        store.add_documents([chunk(60), chunk(61)])
+        assert store.vectorstore is not pinned
+        assert pinned.index is index and index.ntotal == 60
+        assert len(pinned.index_to_docstore_id) == 60
+        assert "chunk-60" not in positions
+    assert store.vectorstore.index.ntotal == 62
+    assert_consistent(store)
+
+    # Without pinned queries the index is extended in place
+    vectorstore, index = store.vectorstore, store.vectorstore.index
+    store.add_documents([chunk(62)])
+    assert store.vectorstore is vectorstore and store.vectorstore.index is index
+    assert_consistent(store)
+
+
+def test_queries_run_while_documents_are_added():
+    store = make_store()
+    errors = []
+    done = threading.Event()
+
+    def query():
+        while not done.is_set():
+            try:
+                with store.snapshot() as (vectorstore, positions):
+                    _, found = vectorstore.index.search(np.ones((1, 64), dtype=np.float32), 5)
+                    for pos in found[0]:
+                        doc_id = vectorstore.index_to_docstore_id[int(pos)]
+                        assert positions[doc_id] == pos
+            except Exception as e:
+                errors.append(e)
+
+    readers = [threading.Thread(target=query) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for i in range(60, 160, 4):
+        store.add_documents([chunk(j) for j in range(i, i + 4)])
+    done.set()
+    for reader in readers:
+        reader.join()
+    assert not errors
+    assert store.vectorstore.index.ntotal == 160
+    assert_consistent(store)
+
+
+def reload(path, index_type:str="flat", mmap:bool=True, **kwargs)->VectorStore:
+    store = VectorStore(ann=ANNConfig(index_type=index_type, nlist=4, nprobe=4), retrieval_mode="dense", **kwargs)
+    store.embedding = HashingEmbeddings(size=64)
+    store.load_vectorstore(path, mmap=mmap)
+    return store
+
+
+def test_saved_index_is_reloaded_memory_mapped(tmp_path):
+    store = make_store()
+    manifest = store.save_vectorstore(tmp_path / "index")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["index"]
+    assert manifest["num_vectors"] == 60 and len(manifest["content_hashes"]) == 60
+    assert manifest["corpus_version"] == manifest["corpus_hash"][:16]
+
+    loaded = reload(tmp_path / "index")
+    assert loaded.manifest == manifest
+    assert loaded._mapped
+    query = chunk(7).page_content
+    assert [doc.id for doc in loaded.retrieve(query, k=3)] == [doc.id for doc in store.retrieve(query, k=3)]
+    assert_consistent(loaded)
+
+    # The same chunks give the same corpus version; an explicit one wins
+    assert loaded.save_vectorstore(tmp_path / "copy")["corpus_version"] == manifest["corpus_version"]
+    assert loaded.save_vectorstore(tmp_path / "copy", corpus_version="2026-10")["corpus_version"] == "2026-10"
+
+
+@pytest.mark.parametrize("index_type, storage", [
+    ("flat", "float32"), ("flat", "float16"), ("flat", "sq8"),
+    ("ivf_flat", "float32"), ("ivf_pq", "float32"), ("hnsw", "float32"), ("hnsw", "sq8"),
+])
+def test_every_index_type_is_built_and_reloaded_memory_mapped(tmp_path, index_type, storage):
+    ann = ANNConfig(index_type=index_type, storage=storage, nlist=4, nprobe=4, train_size=60)
+    store = VectorStore(ann=ann, retrieval_mode="dense")
+    store.embedding = HashingEmbeddings(size=64)
+    store.create_vectorstore([chunk(i) for i in range(60)])
+    assert store.vectorstore.index.ntotal == 60
+    manifest = store.save_vectorstore(tmp_path)
+    assert manifest["index_type"] == index_type
+    assert manifest["index_factory"] == ann.factory_string(64, 60)
+
+    loaded = VectorStore(ann=ann, retrieval_mode="dense")
+    loaded.embedding = HashingEmbeddings(size=64)
+    loaded.load_vectorstore(tmp_path, mmap=True)
+    assert loaded._mapped
+    assert loaded.vectorstore.index.ntotal == 60
+    index = loaded.vectorstore.index
+    if index_type in ("ivf_flat", "ivf_pq"):
+        assert faiss.extract_index_ivf(index).nprobe == 4
+    elif index_type == "hnsw":
+        assert faiss.downcast_index(index).hnsw.efSearch == ann.ef_search
+    for i in (4, 17, 42):
+        query = chunk(i).page_content
+        assert [doc.id for doc in loaded.retrieve(query, k=3)] == [doc.id for doc in store.retrieve(query, k=3)]
+    if index_type != "ivf_pq":
+        # Compressed codes are too coarse to always rank the exact chunk first
+        assert loaded.retrieve(chunk(17).page_content, k=1)[0].id == "chunk-17"
+
+
+@pytest.mark.parametrize("options, message", [
+    ({"embedding_model": "text-embedding-3-large"}, "embedding model"),
+    ({"index_type": "hnsw"}, "index type"),
+])
+def test_index_built_with_other_settings_is_rejected(tmp_path, options, message):
+    make_store().save_vectorstore(tmp_path)
+    with pytest.raises(ValueError, match=message):
+        reload(tmp_path, **options)
+
+
+def test_inconsistent_index_is_rejected(tmp_path):
+    make_store().save_vectorstore(tmp_path)
+    with open(tmp_path / "docstore.jsonl", "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    with open(tmp_path / "docstore.jsonl", "w", encoding="utf-8") as f:
+        f.writelines(lines[:-1])
+    with pytest.raises(ValueError, match="inconsistent"):
+        reload(tmp_path)
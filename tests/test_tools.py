@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+
+from aiops_rag_databricksapp.metrics import MetricsRegistry
+from aiops_rag_databricksapp.tools import ToolExecutor, ToolPolicy, set_wikipedia_timeout
+
+from benchmarks.fixtures import local_wikipedia
+
+
+@pytest.fixture
+def executor():
+    return ToolExecutor(registry=MetricsRegistry())
+
+
+def test_repeated_queries_are_served_from_the_cache(executor):
+    calls = []
+    executor.register("echo", lambda query: calls.append(query) or f"result for {query}")
+
+    assert executor.run("echo", "Disk Full") == "result for Disk Full"
+    assert executor.run("echo", "  disk   full ") == "result for Disk Full"
+    assert calls == ["Disk Full"]
+    assert executor.stats()["echo"]["hits"] == 1
+
+
+def test_expired_results_are_recomputed(executor):
+    calls = []
+    executor.register("echo", lambda query: calls.append(query) or query, ToolPolicy(ttl_seconds=0.05))
+
+    executor.run("echo", "q")
+    time.sleep(0.1)
+    executor.run("echo", "q")
+    assert len(calls) == 2
+
+
+def test_slow_call_returns_the_fallback_and_still_fills_the_cache(executor):
+    executor.register("slow", lambda query: time.sleep(0.3) or "late answer", ToolPolicy(timeout=0.05, fallback="{name} timed out"))
+
+    assert executor.run("slow", "q") == "slow timed out"
+    assert executor.stats()["slow"]["timeouts"] == 1
+    time.sleep(0.4)
+    assert executor.run("slow", "q") == "late answer"
+
+
+def test_identical_concurrent_queries_share_one_call(executor):
+    calls = []
+    release = threading.Event()
+
+    def tool(query):
+        calls.append(query)
+        release.wait(2)
+        return "shared"
+
+    executor.register("tool", tool)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(executor.run("tool", "same query"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["shared"] * 5
+    assert len(calls) == 1
+
+
+def test_saturated_tool_rejects_without_blocking_other_tools(executor):
+    hang = threading.Event()
+    executor.register("stuck", lambda query: hang.wait(5), ToolPolicy(timeout=0.05, max_concurrency=2, fallback="{name} unavailable"))
+    executor.register("fast", lambda query: f"fast {query}")
+    try:
+        assert executor.run("stuck", "a") == "stuck unavailable"
+        assert executor.run("stuck", "b") == "stuck unavailable"
+        start = time.perf_counter()
+        assert executor.run("stuck", "c") == "stuck unavailable"
+        assert time.perf_counter() - start < 0.05
+        assert executor.stats()["stuck"]["rejected"] == 1
+        assert executor.run("fast", "q") == "fast q"
+    finally:
+        hang.set()
+
+
+def test_tool_errors_become_observations(executor):
+    def broken(query):
+        raise RuntimeError("backend down")
+
+    executor.register("broken", broken)
+    assert executor.run("broken", "q") == "The broken tool failed: backend down"
+    assert executor.stats()["broken"]["errors"] == 1
+
+
+async def _arun(executor, name, query):
+    return await executor.arun(name, query)
+
+
+def test_async_calls_share_the_cache(executor):
+    import asyncio
+
+    calls = []
+    executor.register("echo", lambda query: calls.append(query) or query.upper())
+    assert asyncio.run(_arun(executor, "echo", "q")) == "Q"
+    assert executor.run("echo", "q") == "Q"
+    assert len(calls) == 1
+
+
+@pytest.fixture
+def wikipedia_tool(fixture_server, monkeypatch):
+    import wikipedia.wikipedia as client
+    from langchain_community.tools.wikipedia.tool import WikipediaQueryRun
+    from langchain_community.utilities import WikipediaAPIWrapper
+
+    monkeypatch.setattr(client, "requests", client.requests)
+    with local_wikipedia(fixture_server.wiki_api_url):
+        yield WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper(top_k_results=1, lang="en"))
+
+
+def test_wikipedia_tool_answers_from_the_local_stand_in(executor, fixture_server, wikipedia_tool):
+    executor.register("wikipedia", wikipedia_tool.run)
+    article = fixture_server.articles[0]
+
+    assert article["title"] in executor.run("wikipedia", article["title"])
+
+
+def test_hung_wikipedia_backend_frees_the_tool_thread(executor, fixture_server, wikipedia_tool):
+    fixture_server.wiki_latency = 1.0
+    set_wikipedia_timeout(0.1)
+    executor.register("wikipedia", wikipedia_tool.run, ToolPolicy(timeout=0.5, max_concurrency=1))
+
+    result = executor.run("wikipedia", "anything")
+    assert result.startswith("The wikipedia tool failed")
+    # The timed-out request released the only slot, so the next call is admitted
+    assert executor.run("wikipedia", "something else").startswith("The wikipedia tool failed")
+    assert executor.stats()["wikipedia"]["rejected"] == 0